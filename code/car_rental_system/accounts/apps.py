@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class AccountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'accounts'
+
+    def ready(self):
+        # 注册支付记录信号（增量维护订单财务快照）和推荐缓存失效信号
+        from . import signals  # noqa: F401
@@ -0,0 +1,22 @@
+# Generated manually for keyset (cursor) pagination
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_payment_extra_fields'),
+    ]
+
+    operations = [
+        # 游标分页的排序键（支付记录、消息通知）
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['user', 'created_at'], name='payment_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'created_at'], name='notification_user_created_idx'),
+        ),
+    ]
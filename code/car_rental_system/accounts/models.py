@@ -1,6 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
+from collections import defaultdict
 from decimal import Decimal
 from vehicles.models import Vehicle
 from rentals.models import Rental
@@ -244,8 +245,33 @@ class Payment(models.Model):
             models.Index(fields=['rental']),
             models.Index(fields=['transaction_id']),
             models.Index(fields=['transaction_type']),
+            # 游标分页的排序键（支付记录）
+            models.Index(fields=['user', 'created_at'], name='payment_user_created_idx'),
         ]
     
+    @classmethod
+    def totals_by_rental(cls, rental_ids):
+        """一次分组汇总查询得到每个订单的 (已支付总额, 已退款总额)，没有支付记录的订单为 (0, 0)"""
+        totals = defaultdict(lambda: (Decimal('0.00'), Decimal('0.00')))
+        rows = cls.objects.filter(
+            models.Q(transaction_type='CHARGE', status='PAID') | models.Q(transaction_type='REFUND', status='REFUNDED'),
+            rental_id__in=rental_ids,
+        ).order_by().values('rental_id', 'transaction_type').annotate(total=models.Sum('amount'))
+        for row in rows:
+            paid, refunded = totals[row['rental_id']]
+            if row['transaction_type'] == 'CHARGE':
+                totals[row['rental_id']] = (row['total'], refunded)
+            else:
+                totals[row['rental_id']] = (paid, row['total'])
+        return totals
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 记录从数据库加载时的字段值，保存时据此计算订单财务快照的增量（见 accounts/signals.py）
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+    
     def __str__(self):
         return f"{self.user.username} - ¥{self.amount} ({self.get_status_display()})"
 
@@ -311,6 +337,8 @@ class Notification(models.Model):
         indexes = [
             models.Index(fields=['user', 'is_read']),
             models.Index(fields=['notification_type']),
+            # 游标分页的排序键（消息通知）
+            models.Index(fields=['user', 'created_at'], name='notification_user_created_idx'),
         ]
     
     def __str__(self):
@@ -0,0 +1,185 @@
+"""
+车辆推荐服务
+每个用户缓存一份比页面展示数量更长的、已排序的候选车辆列表（CANDIDATE_POOL_SIZE 个，不限车辆状态）：
+- 展示时用进程内的可用车辆集合过滤掉暂时不可用的车辆，不足时只补齐空缺，不整体重算
+- 候选列表由订单、收藏事件失效（见 accounts/signals.py），而不是固定时间过期；
+  车辆相似度全量重算、定价调整等影响所有用户的操作调用 invalidate_all_recommendations()
+候选来源依次为：车辆相似度表 → 按偏好的品牌/类型/座位数 → 时间衰减热度最高的车辆
+"""
+import time
+from collections import Counter
+
+from django.core.cache import cache
+from django.db.models import Q
+
+from rentals.models import Rental
+from rentals.popularity import top_vehicle_ids
+from vehicles.models import Vehicle
+from vehicles.similarity import similar_vehicle_ids
+
+from .models import Favorite
+
+
+# 每个用户缓存的候选车辆数（远多于页面展示的数量，车辆暂时不可用时不必重算）
+CANDIDATE_POOL_SIZE = 30
+
+# 候选列表的缓存时间（秒），正常情况下由事件失效，这里只是兜底
+CANDIDATES_TIMEOUT = 24 * 3600
+
+# 进程内可用车辆集合的有效期（秒）
+AVAILABILITY_TTL = 30
+
+# 作为推荐依据的最近订单数、收藏数
+SEED_RENTALS = 5
+SEED_FAVORITES = 10
+
+# 全局版本号：递增后所有用户的候选列表一并失效
+RECOMMENDATION_VERSION_KEY = 'user_recommendations_version'
+
+# 推荐展示时需要的车辆字段
+VEHICLE_FIELDS = (
+    'id', 'brand', 'model', 'vehicle_type', 'daily_rate', 'seats', 'license_plate', 'color', 'created_at', 'status'
+)
+
+_availability = {'ids': frozenset(), 'loaded_at': None}
+
+
+def available_vehicle_ids():
+    """进程内缓存的可用车辆ID集合，过期或车辆状态变化（见 invalidate_availability）后重新加载"""
+    loaded_at = _availability['loaded_at']
+    if loaded_at is None or time.monotonic() - loaded_at > AVAILABILITY_TTL:
+        _availability['ids'] = frozenset(
+            Vehicle.objects.filter(status='AVAILABLE').values_list('id', flat=True)
+        )
+        _availability['loaded_at'] = time.monotonic()
+    return _availability['ids']
+
+
+def invalidate_availability():
+    """车辆状态变化后使本进程的可用车辆集合失效（其他进程最迟 AVAILABILITY_TTL 秒后刷新）"""
+    _availability['loaded_at'] = None
+
+
+def _recommendation_version():
+    return cache.get_or_set(RECOMMENDATION_VERSION_KEY, 1, None)
+
+
+def _candidates_key(user_id):
+    return f'user_recommendations_{_recommendation_version()}_{user_id}'
+
+
+def invalidate_user_recommendations(user_id):
+    """用户的订单或收藏变化后删除其候选列表"""
+    if user_id:
+        cache.delete(_candidates_key(user_id))
+
+
+def invalidate_all_recommendations():
+    """使所有用户的候选列表失效（车辆相似度全量重算、价格调整等之后调用）"""
+    try:
+        cache.incr(RECOMMENDATION_VERSION_KEY)
+    except ValueError:
+        cache.set(RECOMMENDATION_VERSION_KEY, 2, None)
+
+
+def popular_vehicle_ids(limit=CANDIDATE_POOL_SIZE):
+    """时间衰减热度最高的车辆ID（按索引读取前 limit 行，见 rentals/popularity.py）"""
+    return top_vehicle_ids(limit)
+
+
+def preference_vehicle_ids(rented_vehicles, exclude_ids, limit):
+    """按用户最近租过的车辆中最常见的品牌、类型、座位数（±1）推荐（相似度表尚无数据时的冷启动方案）"""
+    preferred_brands = [v.brand for v in rented_vehicles if v.brand]
+    preferred_types = [v.vehicle_type for v in rented_vehicles if v.vehicle_type]
+    preferred_seats = [v.seats for v in rented_vehicles if v.seats]
+
+    recommendation_query = Q()
+    if preferred_brands:
+        recommendation_query |= Q(brand=Counter(preferred_brands).most_common(1)[0][0])
+    if preferred_types:
+        recommendation_query |= Q(vehicle_type=Counter(preferred_types).most_common(1)[0][0])
+    if preferred_seats:
+        top_seat = Counter(preferred_seats).most_common(1)[0][0]
+        recommendation_query |= Q(seats__gte=top_seat - 1, seats__lte=top_seat + 1)
+    if not recommendation_query:
+        return []
+
+    return list(
+        Vehicle.objects.filter(recommendation_query).exclude(
+            id__in=exclude_ids
+        ).order_by('-created_at').values_list('id', flat=True)[:limit]
+    )
+
+
+def build_candidates(user, customer):
+    """
+    计算用户的候选车辆列表
+    返回 {'ids': 按推荐度排序的车辆ID, 'exclude': 用户最近租过、不再推荐的车辆ID}
+    """
+    rented_vehicles = []
+    if customer:
+        rentals = Rental.objects.filter(
+            customer=customer,
+            status__in=['COMPLETED', 'ONGOING']
+        ).select_related('vehicle').only(
+            'vehicle__brand', 'vehicle__vehicle_type', 'vehicle__seats', 'vehicle_id'
+        ).order_by('-created_at')[:SEED_RENTALS]
+        rented_vehicles = [rental.vehicle for rental in rentals]
+    rented_ids = list(dict.fromkeys(vehicle.id for vehicle in rented_vehicles))
+    favorite_ids = list(
+        Favorite.objects.filter(user=user).values_list('vehicle_id', flat=True)[:SEED_FAVORITES]
+    )
+
+    candidates = similar_vehicle_ids(
+        rented_ids + favorite_ids, exclude_ids=rented_ids, limit=CANDIDATE_POOL_SIZE, available_only=False
+    )
+    if rented_vehicles and not candidates:
+        candidates = preference_vehicle_ids(rented_vehicles, rented_ids, CANDIDATE_POOL_SIZE)
+    if len(candidates) < CANDIDATE_POOL_SIZE:
+        seen = set(candidates) | set(rented_ids)
+        candidates += [vehicle_id for vehicle_id in popular_vehicle_ids() if vehicle_id not in seen]
+    return {'ids': candidates[:CANDIDATE_POOL_SIZE], 'exclude': rented_ids}
+
+
+def get_candidates(user, customer_lookup):
+    """读取用户的候选列表，缓存不存在时计算并缓存（customer_lookup 只在需要计算时调用）"""
+    key = _candidates_key(user.id)
+    entry = cache.get(key)
+    if entry is None:
+        entry = build_candidates(user, customer_lookup(user))
+        cache.set(key, entry, CANDIDATES_TIMEOUT)
+    return entry
+
+
+def recommend_vehicles(user, customer_lookup, limit=6):
+    """
+    返回用户的推荐车辆（只含可用车辆）
+    候选列表中的车辆按可用车辆集合过滤，数量不足时用最新上架的可用车辆补齐空缺
+    """
+    entry = get_candidates(user, customer_lookup)
+    available_ids = available_vehicle_ids()
+    chosen_ids = [vehicle_id for vehicle_id in entry['ids'] if vehicle_id in available_ids][:limit]
+
+    available_vehicles = Vehicle.objects.filter(status='AVAILABLE').only(*VEHICLE_FIELDS)
+    vehicles = available_vehicles.in_bulk(chosen_ids) if chosen_ids else {}
+    result = [vehicles[vehicle_id] for vehicle_id in chosen_ids if vehicle_id in vehicles]
+
+    if len(result) < limit:
+        result.extend(
+            available_vehicles.exclude(
+                id__in=[vehicle.id for vehicle in result] + entry['exclude']
+            ).order_by('-created_at')[:limit - len(result)]
+        )
+    return result
+
+
+def warm_recommendations(users, customer_lookup):
+    """为一批用户预先计算候选列表（已有缓存的跳过），返回新计算的用户数"""
+    keys = {_candidates_key(user.id): user for user in users}
+    cached = cache.get_many(list(keys))
+    entries = {
+        key: build_candidates(user, customer_lookup(user))
+        for key, user in keys.items() if key not in cached
+    }
+    cache.set_many(entries, CANDIDATES_TIMEOUT)
+    return len(entries)
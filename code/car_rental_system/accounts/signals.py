@@ -0,0 +1,182 @@
+"""
+支付记录信号处理
+支付记录创建、状态/金额变化或删除时，按增量更新所属订单的财务快照和每日经营汇总中的退款（见 rentals/rollups.py）：
+- amount_paid：已支付（CHARGE + PAID）金额合计
+- amount_refunded：已退款（REFUND + REFUNDED）金额合计
+- settlement_status / settled_at：根据 amount_paid 重新判定
+订单详情、支付、消费明细等页面只读取快照，不再汇总支付记录。
+快照与支付记录的一致性可用 reconcile_financials 命令批量核对。
+
+支付记录、评价增删改后在事务提交时递增相关缓存标签的版本号（见 car_rental_system/cache_tags.py）。
+
+另外负责推荐缓存的失效（见 accounts/recommendations.py）：
+- 订单、收藏变化时删除对应用户的推荐候选列表
+- 车辆保存时使本进程的可用车辆集合失效
+"""
+from decimal import Decimal
+
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from car_rental_system.cache_tags import TAG_RENTAL, TAG_REVIEW, customer_tag, register_model, vehicle_tag
+from customers.models import Customer
+from rentals.models import FINANCIAL_COLUMNS, Rental
+from rentals.rollups import REFUND_FIELDS, apply_refund_change
+from vehicles.models import Vehicle
+
+from .models import Favorite, Payment, Review
+from .recommendations import invalidate_availability, invalidate_user_recommendations
+
+
+# 决定财务快照的支付字段
+PAYMENT_FIELDS = ('rental_id', 'transaction_type', 'status', 'amount')
+
+# 影响推荐结果的订单字段
+RECOMMENDATION_RENTAL_FIELDS = {'customer', 'customer_id', 'vehicle', 'vehicle_id', 'status'}
+
+# 快照相关的订单字段（整体保存订单时不写回，见 Rental.save）
+FINANCIAL_FIELDS = FINANCIAL_COLUMNS
+
+
+def _rental_customer_id(instance):
+    """支付记录/评价所属订单的客户ID（订单已加载时不查询；订单已被级联删除时为 None）"""
+    if type(instance).rental.is_cached(instance):
+        return instance.rental.customer_id
+    return Rental.objects.filter(pk=instance.rental_id).values_list('customer_id', flat=True).first()
+
+
+register_model(Payment, lambda payment: [TAG_RENTAL, customer_tag(_rental_customer_id(payment))])
+register_model(
+    Review,
+    lambda review: [TAG_REVIEW, vehicle_tag(review.vehicle_id), customer_tag(_rental_customer_id(review))],
+)
+
+
+def payment_contribution(rental_id, transaction_type, status, amount):
+    """一笔支付记录对订单快照的贡献：(订单ID, 已支付增量, 已退款增量)"""
+    amount = amount or Decimal('0.00')
+    if transaction_type == 'CHARGE' and status == 'PAID':
+        return rental_id, amount, Decimal('0.00')
+    if transaction_type == 'REFUND' and status == 'REFUNDED':
+        return rental_id, Decimal('0.00'), amount
+    return rental_id, Decimal('0.00'), Decimal('0.00')
+
+
+def apply_financial_delta(rental_id, paid_delta, refunded_delta):
+    """
+    原子地累加订单的已支付/已退款金额，并按新的已支付金额更新结算状态
+    使用 UPDATE ... SET amount_paid = amount_paid + x，不会覆盖并发写入的其他支付。
+    返回更新后的快照字段值（订单不存在时返回 None）
+    """
+    now = timezone.now()
+    updated = Rental.objects.filter(pk=rental_id).update(
+        amount_paid=F('amount_paid') + paid_delta,
+        amount_refunded=F('amount_refunded') + refunded_delta,
+        updated_at=now,
+    )
+    if not updated:
+        return None
+
+    rental = Rental.objects.only(
+        'status', 'total_amount', 'deposit', 'cross_location_fee', 'overdue_fee',
+        'is_cross_location_return', *FINANCIAL_FIELDS
+    ).get(pk=rental_id)
+    settlement_status, settled_at = rental.settlement_for(rental.amount_paid)
+    if (settlement_status, settled_at) != (rental.settlement_status, rental.settled_at):
+        Rental.objects.filter(pk=rental_id).update(
+            settlement_status=settlement_status,
+            settled_at=settled_at,
+        )
+        rental.settlement_status, rental.settled_at = settlement_status, settled_at
+    return {field: getattr(rental, field) for field in FINANCIAL_FIELDS}
+
+
+def _apply_changes(instance, changes):
+    """按订单合并增量后写入，并同步到支付记录上已加载的订单对象（调用方后续使用的通常就是它）"""
+    deltas = {}
+    for rental_id, paid, refunded in changes:
+        if rental_id is None:
+            continue
+        total_paid, total_refunded = deltas.get(rental_id, (Decimal('0.00'), Decimal('0.00')))
+        deltas[rental_id] = (total_paid + paid, total_refunded + refunded)
+
+    for rental_id, (paid_delta, refunded_delta) in deltas.items():
+        if not paid_delta and not refunded_delta:
+            continue
+        snapshot = apply_financial_delta(rental_id, paid_delta, refunded_delta)
+        if snapshot and Payment.rental.is_cached(instance) and instance.rental.pk == rental_id:
+            for field, value in snapshot.items():
+                setattr(instance.rental, field, value)
+
+
+@receiver(post_save, sender=Payment)
+def payment_saved(sender, instance, created, **kwargs):
+    """支付记录创建或修改后，将新旧贡献之差计入订单快照和退款汇总"""
+    loaded = getattr(instance, '_loaded_values', None)
+    if not created and loaded is None:
+        # 未经数据库加载的对象直接按主键保存，无法得知原值，对所属订单全量重算
+        rental = Rental.objects.filter(pk=instance.rental_id).first()
+        if rental:
+            rental.refresh_financials()
+    else:
+        changes = [payment_contribution(*(getattr(instance, field) for field in PAYMENT_FIELDS))]
+        if not created:
+            rental_id, paid, refunded = payment_contribution(
+                *(loaded.get(field, getattr(instance, field)) for field in PAYMENT_FIELDS)
+            )
+            changes.append((rental_id, -paid, -refunded))
+        _apply_changes(instance, changes)
+        # 未经数据库加载的对象无法得知原值，退款汇总由 rebuild_rental_rollups 命令修正
+        apply_refund_change(
+            None if created else {field: loaded.get(field, getattr(instance, field)) for field in REFUND_FIELDS},
+            {field: getattr(instance, field) for field in REFUND_FIELDS},
+        )
+
+    # 保存后以当前值作为新的比较基准
+    loaded = loaded or {}
+    loaded.update({field: getattr(instance, field) for field in PAYMENT_FIELDS + REFUND_FIELDS})
+    instance._loaded_values = loaded
+
+
+@receiver(post_delete, sender=Payment)
+def payment_deleted(sender, instance, **kwargs):
+    """支付记录删除后，从订单快照和退款汇总中扣除其贡献（订单级联删除时订单已不存在，直接跳过）"""
+    rental_id, paid, refunded = payment_contribution(
+        *(getattr(instance, field) for field in PAYMENT_FIELDS)
+    )
+    _apply_changes(instance, [(rental_id, -paid, -refunded)])
+    apply_refund_change({field: getattr(instance, field) for field in REFUND_FIELDS}, None)
+
+
+def _invalidate_customer_recommendations(customer_id):
+    user_id = Customer.objects.filter(pk=customer_id).values_list('user_id', flat=True).first()
+    invalidate_user_recommendations(user_id)
+
+
+@receiver(post_save, sender=Rental)
+def rental_saved_for_recommendations(sender, instance, created, update_fields=None, **kwargs):
+    """下单、订单状态或车辆变化后，客户的推荐候选列表失效"""
+    if update_fields is not None and not RECOMMENDATION_RENTAL_FIELDS & set(update_fields):
+        return
+    _invalidate_customer_recommendations(instance.customer_id)
+
+
+@receiver(post_delete, sender=Rental)
+def rental_deleted_for_recommendations(sender, instance, **kwargs):
+    _invalidate_customer_recommendations(instance.customer_id)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+def favorite_changed(sender, instance, **kwargs):
+    """收藏或取消收藏后，用户的推荐候选列表失效"""
+    invalidate_user_recommendations(instance.user_id)
+
+
+@receiver(post_save, sender=Vehicle)
+@receiver(post_delete, sender=Vehicle)
+def vehicle_changed(sender, instance, **kwargs):
+    """车辆状态可能变化，重新加载本进程的可用车辆集合"""
+    invalidate_availability()
@@ -1,3 +1,290 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from customers.models import Customer
+from rentals.models import Rental
+from vehicles.models import Vehicle, VehicleSimilarity
+
+from .models import Favorite, Payment
+from .recommendations import recommend_vehicles
+
+
+class ConsumptionReportQueryTests(TestCase):
+    """消费明细页的查询数不随订单数量增长"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='report', password='pass12345')
+        self.customer = Customer.objects.create(
+            user=self.user,
+            name='报表客户',
+            phone='13900139000',
+            id_card='110101199001010019',
+            license_number='LICREPORT',
+        )
+        self.vehicle = Vehicle.objects.create(
+            license_plate='京B54321',
+            brand='大众',
+            model='帕萨特',
+            vehicle_type='SEDAN',
+            color='黑色',
+            daily_rate=Decimal('300.00'),
+        )
+        self.client.force_login(self.user)
+
+    def create_rentals(self, count):
+        start = date.today() - timedelta(days=400)
+        for index in range(count):
+            rental = Rental.objects.create(
+                customer=self.customer,
+                vehicle=self.vehicle,
+                start_date=start + timedelta(days=index * 3),
+                end_date=start + timedelta(days=index * 3 + 1),
+                total_amount=Decimal('600.00'),
+                deposit=Decimal('100.00'),
+                status='COMPLETED',
+            )
+            Payment.objects.create(
+                rental=rental, user=self.user, amount=Decimal('700.00'),
+                transaction_type='CHARGE', status='PAID',
+            )
+            Payment.objects.create(
+                rental=rental, user=self.user, amount=Decimal('100.00'),
+                transaction_type='REFUND', status='REFUNDED',
+            )
+
+    def count_queries(self, page=1):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('accounts:consumption_report'), {'page': page})
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_query_count_independent_of_order_count(self):
+        self.create_rentals(3)
+        small_count, _ = self.count_queries()
+
+        self.create_rentals(27)
+        large_count, response = self.count_queries()
+        last_page_count, _ = self.count_queries(page=3)
+
+        self.assertEqual(small_count, large_count)
+        self.assertEqual(large_count, last_page_count)
+        self.assertEqual(len(response.context['consumption_items']), 10)
+
+    def test_summary_matches_payments(self):
+        self.create_rentals(2)
+        _, response = self.count_queries()
+
+        for item in response.context['consumption_items']:
+            self.assertEqual(item['summary']['paid_amount'], Decimal('700.00'))
+            self.assertEqual(item['summary']['refunded_amount'], Decimal('100.00'))
+            self.assertEqual(item['summary']['net_paid'], Decimal('600.00'))
+            self.assertEqual(
+                [payment.transaction_type for payment in item['transactions']],
+                ['REFUND', 'CHARGE'],
+            )
+
+
+class FinancialSnapshotTests(TestCase):
+    """支付记录信号维护的财务快照不会被整体保存订单覆盖，订单状态、费用变化后结算状态随之更新"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='payer', password='pass12345')
+        self.customer = Customer.objects.create(
+            user=self.user,
+            name='快照客户',
+            phone='13900139001',
+            id_card='110101199001010060',
+            license_number='LICSNAP',
+        )
+        self.vehicle = Vehicle.objects.create(
+            license_plate='京E11223',
+            brand='别克',
+            model='君越',
+            vehicle_type='SEDAN',
+            color='银色',
+            daily_rate=Decimal('280.00'),
+        )
+
+    def create_rental(self, start_offset=2, status='PENDING'):
+        return Rental.objects.create(
+            customer=self.customer,
+            vehicle=self.vehicle,
+            start_date=date.today() + timedelta(days=start_offset),
+            end_date=date.today() + timedelta(days=start_offset + 2),
+            total_amount=Decimal('840.00'),
+            status=status,
+        )
+
+    def pay(self, rental, amount):
+        Payment.objects.create(
+            rental=Rental.objects.get(pk=rental.pk), user=self.user, amount=amount,
+            transaction_type='CHARGE', status='PAID',
+        )
+
+    def test_full_rental_save_keeps_payment_snapshot(self):
+        rental = self.create_rental()
+        # 视图中持有的订单对象是支付前读出的
+        stale = Rental.objects.get(pk=rental.pk)
+        self.pay(rental, Decimal('840.00'))
+
+        stale.notes = '客户要求提前取车'
+        stale.save()
+
+        rental.refresh_from_db()
+        self.assertEqual(rental.notes, '客户要求提前取车')
+        self.assertEqual(rental.amount_paid, Decimal('840.00'))
+        self.assertEqual(rental.amount_refunded, Decimal('0.00'))
+
+    def test_status_form_completion_settles_paid_rental(self):
+        rental = self.create_rental(start_offset=-2, status='ONGOING')
+        self.pay(rental, rental.calculate_order_total())
+        self.assertEqual(Rental.objects.get(pk=rental.pk).settlement_status, 'PARTIAL')
+
+        response = self.client.post(
+            reverse('rentals:rental_status_update', args=[rental.pk]), {'status': 'COMPLETED'}
+        )
+        self.assertEqual(response.status_code, 302)
+        rental.refresh_from_db()
+        self.assertEqual((rental.status, rental.settlement_status), ('COMPLETED', 'SETTLED'))
+        self.assertIsNotNone(rental.settled_at)
+
+    def test_fee_change_rechecks_settlement(self):
+        rental = self.create_rental(start_offset=-2, status='COMPLETED')
+        self.pay(rental, rental.calculate_order_total())
+        self.assertEqual(Rental.objects.get(pk=rental.pk).settlement_status, 'SETTLED')
+
+        rental = Rental.objects.get(pk=rental.pk)
+        rental.overdue_fee = Decimal('280.00')
+        rental.save()
+        self.assertEqual(Rental.objects.get(pk=rental.pk).settlement_status, 'PARTIAL')
+
+
+class HomePeriodSearchTests(TestCase):
+    """首页按租期筛选：返回该时段没有有效订单重叠的车辆（今天已租出的也算），维修中的不返回"""
+
+    def setUp(self):
+        customer = Customer.objects.create(
+            name='租期客户',
+            phone='13200132000',
+            id_card='110101199001010027',
+            license_number='LICPERIOD',
+        )
+        self.vehicles = {}
+        for index, (key, status) in enumerate([
+            ('free', 'AVAILABLE'),
+            ('rented_now', 'RENTED'),
+            ('booked', 'AVAILABLE'),
+            ('cancelled', 'AVAILABLE'),
+            ('maintenance', 'MAINTENANCE'),
+        ]):
+            self.vehicles[key] = Vehicle.objects.create(
+                license_plate=f'京P0000{index}',
+                brand='别克',
+                model='君威',
+                vehicle_type='SEDAN',
+                color='银色',
+                daily_rate=Decimal('200.00'),
+                status=status,
+            )
+        today = date.today()
+        self.start = today + timedelta(days=10)
+        for key, offset, status in [('rented_now', 0, 'ONGOING'), ('booked', 11, 'PENDING'), ('cancelled', 10, 'CANCELLED')]:
+            Rental.objects.create(
+                customer=customer,
+                vehicle=self.vehicles[key],
+                start_date=today + timedelta(days=offset),
+                end_date=today + timedelta(days=offset + 2),
+                total_amount=Decimal('600.00'),
+                status=status,
+            )
+
+    def search(self, **params):
+        response = self.client.get(reverse('accounts:home'), params)
+        self.assertEqual(response.status_code, 200)
+        return {key for key, vehicle in self.vehicles.items() if vehicle in response.context['vehicles']}
+
+    def test_period_excludes_overlapping_and_maintenance(self):
+        self.assertEqual(
+            self.search(start=self.start.isoformat(), end=(self.start + timedelta(days=1)).isoformat()),
+            {'free', 'rented_now', 'cancelled'},
+        )
+
+    def test_without_period_lists_available_vehicles(self):
+        self.assertEqual(self.search(), {'free', 'booked', 'cancelled'})
+
+    def test_invalid_period_ignored(self):
+        self.assertEqual(
+            self.search(start=self.start.isoformat(), end=(self.start - timedelta(days=1)).isoformat()),
+            {'free', 'booked', 'cancelled'},
+        )
+
+
+class RecommendationCacheTests(TestCase):
+    """推荐候选列表按用户缓存：暂时不可用的车辆在展示时过滤、只补齐空缺，收藏变化后重新计算"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='recommend', password='pass12345')
+        self.customer = Customer.objects.create(
+            user=self.user,
+            name='推荐客户',
+            phone='13800138100',
+            id_card='110101199001010086',
+            license_number='LICRECOMMEND',
+        )
+        self.vehicles = [
+            Vehicle.objects.create(
+                license_plate=f'京R0000{index}',
+                brand='红旗',
+                model=f'H{index}',
+                vehicle_type='SEDAN',
+                color='黑色',
+                daily_rate=Decimal('400.00'),
+            )
+            for index in range(5)
+        ]
+        Rental.objects.create(
+            customer=self.customer,
+            vehicle=self.vehicles[0],
+            start_date=date.today() - timedelta(days=20),
+            end_date=date.today() - timedelta(days=18),
+            total_amount=Decimal('1200.00'),
+            status='COMPLETED',
+        )
+        for neighbor, score in ((self.vehicles[1], 0.9), (self.vehicles[2], 0.5)):
+            VehicleSimilarity.objects.create(
+                vehicle=self.vehicles[0], neighbor=neighbor, score=score, co_rentals=1, built_at=timezone.now()
+            )
+        self.lookups = 0
+
+    def lookup(self, user):
+        self.lookups += 1
+        return self.customer
+
+    def recommend(self):
+        return [vehicle.pk for vehicle in recommend_vehicles(self.user, self.lookup, limit=2)]
+
+    def test_candidates_cached_and_unavailable_filtered(self):
+        self.assertEqual(self.recommend(), [self.vehicles[1].pk, self.vehicles[2].pk])
+        self.assertEqual(self.recommend(), [self.vehicles[1].pk, self.vehicles[2].pk])
+        self.assertEqual(self.lookups, 1)
+
+        self.vehicles[1].status = 'RENTED'
+        self.vehicles[1].save()
+        # 候选列表不重算，空缺用最新上架的可用车辆补齐（不含租过的车辆）
+        self.assertEqual(self.recommend(), [self.vehicles[2].pk, self.vehicles[4].pk])
+        self.assertEqual(self.lookups, 1)
 
-# Create your tests here.
+    def test_favorite_invalidates_candidates(self):
+        self.recommend()
+        Favorite.objects.create(user=self.user, vehicle=self.vehicles[3])
+        self.recommend()
+        self.assertEqual(self.lookups, 2)
@@ -4,25 +4,32 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.urls import reverse
 from django.views.decorators.http import require_http_methods
-from django.db.models import Q, Count, Sum, Avg
+from django.db.models import Q, Count, Sum, Avg, Prefetch
 from django.core.paginator import Paginator
 from django.http import JsonResponse, HttpResponse
 from django.db import transaction
 from django.utils import timezone
 from django import forms
-from django.core.cache import cache
 from datetime import date, datetime, timedelta
 from decimal import Decimal
+from car_rental_system.cache_tags import TAG_VEHICLE, cached
+from car_rental_system.pagination import paginate
 from .forms import (
     UserRegisterForm, UserLoginForm, PasswordResetRequestForm,
     PasswordResetForm, UserProfileForm, PasswordChangeFormCustom,
     ReviewForm, PaymentForm, VehicleCompareForm
 )
 from .models import UserProfile, Favorite, Review, Payment, Notification
+from .recommendations import recommend_vehicles
 from vehicles.models import Vehicle
+from vehicles.facets import get_facets, parse_seats, price_filter
+from vehicles.search import search_vehicles
 from rentals.models import Rental
 from rentals.forms import ReturnForm
-from customers.models import Customer
+from rentals.availability import filter_available_for_period
+from rentals.popularity import top as popularity_top
+from rentals.booking import BookingConflict, booking_transaction, save_booking
+from customers.models import Customer, VIP_UPGRADE_STREAK
 from .store_locations import STORE_LOCATIONS, get_all_districts
 
 
@@ -163,10 +170,11 @@ def profile_view(request):
         'total_amount': Decimal('0.00'),
     }
     if customer:
-        rental_stats = Rental.objects.filter(customer=customer).aggregate(
-            total=Count('id'),
-            total_amount=Sum('total_amount')
-        )
+        # 客户表上的订单统计列（见 customers/stats.py）
+        rental_stats = {
+            'total': customer.total_rentals,
+            'total_amount': customer.total_amount,
+        }
     
     # 获取未读通知数
     unread_notifications = Notification.objects.filter(
@@ -180,7 +188,7 @@ def profile_view(request):
         vip_upgrade_info = {
             'is_eligible': is_eligible,
             'consecutive_count': consecutive_count,
-            'remaining': max(0, 10 - consecutive_count)
+            'remaining': max(0, VIP_UPGRADE_STREAK - consecutive_count)
         }
     
     context = {
@@ -240,18 +248,15 @@ def get_order_amount_breakdown(rental):
     }
 
 
-def get_payment_summary(rental, payments=None):
-    """计算支付/退款及剩余金额汇总"""
-    if payments is None:
-        payments = Payment.objects.filter(rental=rental)
-    paid_amount = payments.filter(
-        transaction_type='CHARGE',
-        status='PAID'
-    ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-    refunded_amount = payments.filter(
-        transaction_type='REFUND',
-        status='REFUNDED'
-    ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+def get_payment_summary(rental, totals=None):
+    """
+    计算支付/退款及剩余金额汇总
+    已支付/已退款金额默认读取订单上的财务快照（由支付记录信号增量维护，见 accounts/signals.py），不查询支付记录；
+    批量页面可传入 Payment.totals_by_rental() 分组汇总得到的 (已支付, 已退款)
+    """
+    if totals is None:
+        totals = (rental.amount_paid or Decimal('0.00'), rental.amount_refunded or Decimal('0.00'))
+    paid_amount, refunded_amount = totals
     amount_breakdown = get_order_amount_breakdown(rental)
     order_total_amount = amount_breakdown['order_total_amount']
     remaining_amount = order_total_amount - paid_amount
@@ -270,130 +275,14 @@ def get_payment_summary(rental, payments=None):
 
 def get_recommended_vehicles(user, limit=6):
     """
-    获取推荐车辆（优化版本）
-    推荐策略：
-    1. 优先使用缓存的推荐结果
-    2. 基于用户历史订单推荐相似车型（相同品牌、类型、座位数等）
-    3. 基于热门车型推荐（租赁次数最多的车型）
-    4. 综合推荐结果
+    获取推荐车辆
+    推荐策略（见 accounts/recommendations.py）：
+    1. 每个用户缓存一份较长的已排序候选列表，订单、收藏变化时失效
+    2. 候选来自预计算的车辆相似度表（"租过这辆车的人也租了"），
+       相似度表尚无数据时退回按相同品牌、类型、座位数推荐，再以时间衰减热度最高的车辆补充
+    3. 展示时只过滤掉当前不可用的车辆，不足时用最新上架的可用车辆补齐
     """
-    # 尝试从缓存获取用户的推荐结果
-    cache_key = f'user_recommendations_{user.id}'
-    cached_recommendations = cache.get(cache_key)
-    if cached_recommendations:
-        # 验证缓存的车辆ID是否仍然可用
-        vehicles = Vehicle.objects.filter(id__in=cached_recommendations, status='AVAILABLE')[:limit]
-        if vehicles.count() == limit:
-            return list(vehicles)
-    
-    recommended_vehicles = []
-    
-    # 只推荐可用车辆
-    available_vehicles = Vehicle.objects.filter(status='AVAILABLE').only(
-        'id', 'brand', 'model', 'vehicle_type', 'daily_rate', 'seats', 'license_plate', 'color', 'created_at'
-    )
-    
-    # 策略1：基于用户历史订单的个性化推荐
-    customer = get_customer_for_user(user)
-    if customer:
-        # 获取用户的历史订单（只获取最近5条，减少查询）
-        user_rentals = Rental.objects.filter(
-            customer=customer,
-            status__in=['COMPLETED', 'ONGOING']
-        ).select_related('vehicle').only(
-            'vehicle__brand', 'vehicle__vehicle_type', 'vehicle__seats', 'vehicle_id'
-        ).order_by('-created_at')[:5]
-        
-        if user_rentals.exists():
-            # 分析用户偏好：品牌、类型、座位数
-            from collections import Counter
-            preferred_brands = [r.vehicle.brand for r in user_rentals if r.vehicle.brand]
-            preferred_types = [r.vehicle.vehicle_type for r in user_rentals if r.vehicle.vehicle_type]
-            preferred_seats = [r.vehicle.seats for r in user_rentals if r.vehicle.seats]
-            
-            # 根据偏好推荐相似车辆
-            if preferred_brands or preferred_types or preferred_seats:
-                # 构建推荐查询
-                recommendation_query = Q()
-                
-                # 优先匹配品牌
-                if preferred_brands:
-                    brand_counter = Counter(preferred_brands)
-                    top_brand = brand_counter.most_common(1)[0][0]
-                    recommendation_query |= Q(brand=top_brand)
-                
-                # 匹配类型
-                if preferred_types:
-                    type_counter = Counter(preferred_types)
-                    top_type = type_counter.most_common(1)[0][0]
-                    recommendation_query |= Q(vehicle_type=top_type)
-                
-                # 匹配座位数（允许±1的误差）
-                if preferred_seats:
-                    seats_counter = Counter(preferred_seats)
-                    top_seat = seats_counter.most_common(1)[0][0]
-                    recommendation_query |= Q(seats__gte=top_seat-1, seats__lte=top_seat+1)
-                
-                # 获取推荐车辆（排除用户已租过的车辆）
-                rented_vehicle_ids = [r.vehicle_id for r in user_rentals]
-                personalized_vehicles = available_vehicles.filter(
-                    recommendation_query
-                ).exclude(id__in=rented_vehicle_ids).distinct()[:limit]
-                
-                recommended_vehicles.extend(list(personalized_vehicles))
-    
-    # 策略2：基于热门车型推荐（如果个性化推荐不足）
-    if len(recommended_vehicles) < limit:
-        # 获取租赁次数最多的车辆（热门车型）
-        cache_key_popular = 'popular_vehicles'
-        popular_vehicle_ids = cache.get(cache_key_popular)
-        
-        if popular_vehicle_ids is None:
-            # 统计每个车辆的租赁次数
-            popular_vehicles = Rental.objects.filter(
-                status__in=['COMPLETED', 'ONGOING']
-            ).values('vehicle_id').annotate(
-                rental_count=Count('id')
-            ).order_by('-rental_count')[:limit*2]
-            
-            popular_vehicle_ids = [item['vehicle_id'] for item in popular_vehicles]
-            cache.set(cache_key_popular, popular_vehicle_ids, 3600)  # 缓存1小时
-        
-        # 获取热门车辆
-        if popular_vehicle_ids:
-            existing_ids = [v.id for v in recommended_vehicles]
-            popular_vehicles = available_vehicles.filter(
-                id__in=popular_vehicle_ids
-            ).exclude(id__in=existing_ids)[:limit - len(recommended_vehicles)]
-            
-            recommended_vehicles.extend(list(popular_vehicles))
-    
-    # 策略3：如果还是不足，推荐最新添加的车辆
-    if len(recommended_vehicles) < limit:
-        existing_ids = [v.id for v in recommended_vehicles]
-        new_vehicles = available_vehicles.exclude(
-            id__in=existing_ids
-        ).order_by('-created_at')[:limit - len(recommended_vehicles)]
-        
-        recommended_vehicles.extend(list(new_vehicles))
-    
-    # 去重并限制数量
-    seen_ids = set()
-    unique_vehicles = []
-    for vehicle in recommended_vehicles:
-        if vehicle.id not in seen_ids:
-            seen_ids.add(vehicle.id)
-            unique_vehicles.append(vehicle)
-        if len(unique_vehicles) >= limit:
-            break
-    
-    result = unique_vehicles[:limit]
-    
-    # 缓存推荐结果（缓存10分钟）
-    if result:
-        cache.set(cache_key, [v.id for v in result], 600)
-    
-    return result
+    return recommend_vehicles(user, get_customer_for_user, limit=limit)
 
 
 @login_required
@@ -527,23 +416,66 @@ def password_change_view(request):
 
 # ========== 车辆浏览相关视图 ==========
 
+def parse_period(start_value, end_value):
+    """解析租期筛选参数（YYYY-MM-DD），只填开始日期时按单日处理，无效时返回 (None, None)"""
+    try:
+        start_date = date.fromisoformat(start_value) if start_value else None
+        end_date = date.fromisoformat(end_value) if end_value else start_date
+    except ValueError:
+        return None, None
+    if not start_date or not end_date or end_date < start_date:
+        return None, None
+    return start_date, end_date
+
+
+def _home_vehicle_stats():
+    """首页统计：可用车辆数、平均日租金、座位数选项数和热门车型"""
+    vehicle_stats_raw = Vehicle.objects.filter(status='AVAILABLE').aggregate(
+        total=Count('id'),
+        avg_rate=Avg('daily_rate')
+    )
+    vehicle_stats = {
+        'total': vehicle_stats_raw['total'] or 0,
+        'avg_rate': (vehicle_stats_raw['avg_rate'] or Decimal('0.00')),
+        'seat_options': Vehicle.objects.filter(status='AVAILABLE').exclude(
+            seats__isnull=True
+        ).values('seats').distinct().count()
+    }
+    # 热门车型：按时间衰减热度排序，只展示当前有可用车辆的车型，不足6个时按车型名补齐
+    # （热度排名随订单变化，由5分钟缓存时间刷新）
+    available_types = set(
+        Vehicle.objects.filter(status='AVAILABLE').values_list('vehicle_type', flat=True).distinct()
+    )
+    popular_types = [
+        vehicle_type for vehicle_type, _, _ in popularity_top('VEHICLE_TYPE', limit=len(available_types))
+        if vehicle_type in available_types
+    ][:6]
+    popular_types += sorted(available_types - set(popular_types))[:6 - len(popular_types)]
+    return {'stats': vehicle_stats, 'popular_types': popular_types}
+
+
 def home_view(request):
     """用户首页视图 - 浏览可租车辆"""
-    # 只显示可用的车辆
-    vehicles = Vehicle.objects.filter(status='AVAILABLE').only(
+    # 租期筛选：指定时间段时返回该时段内没有订单冲突的车辆
+    start_param = request.GET.get('start', '')
+    end_param = request.GET.get('end', '')
+    period_start, period_end = parse_period(start_param, end_param)
+    
+    vehicles = Vehicle.objects.only(
         'id', 'license_plate', 'brand', 'model', 'vehicle_type',
         'color', 'seats', 'daily_rate', 'created_at'
     )
+    if period_start:
+        vehicles = filter_available_for_period(vehicles, period_start, period_end)
+    else:
+        # 未指定租期时只显示当前可用的车辆
+        vehicles = vehicles.filter(status='AVAILABLE')
     
     # 搜索功能
     search_query = request.GET.get('q', '')
     if search_query:
-        vehicles = vehicles.filter(
-            Q(license_plate__icontains=search_query) |
-            Q(brand__icontains=search_query) |
-            Q(model__icontains=search_query) |
-            Q(vehicle_type__icontains=search_query)
-        )
+        # 全文索引检索（车牌前缀/尾号、中文品牌任意片段、品牌拼音），其他筛选条件叠加在结果上
+        vehicles = search_vehicles(vehicles, search_query)
     
     # 筛选功能
     brand_filter = request.GET.get('brand', '')
@@ -551,6 +483,16 @@ def home_view(request):
     seats_filter = request.GET.get('seats', '')
     price_min = request.GET.get('price_min', '')
     price_max = request.GET.get('price_max', '')
+    price_range = request.GET.get('price_range', '')
+    seats = parse_seats(seats_filter)
+    price_condition = price_filter(price_min, price_max, price_range)
+    
+    # 筛选项计数：在筛选前的查询集上一条分组查询得出，按筛选条件缓存
+    facets = get_facets('home', vehicles, {
+        'q': search_query, 'start': start_param if period_start else '', 'end': end_param if period_start else '',
+        'brand': brand_filter, 'type': type_filter, 'seats': seats, 'price_min': price_min,
+        'price_max': price_max, 'price_range': price_range,
+    }, brand=brand_filter, vehicle_type=type_filter, seats=seats, price=price_condition, price_range=price_range)
     
     if brand_filter:
         vehicles = vehicles.filter(brand=brand_filter)
@@ -558,82 +500,15 @@ def home_view(request):
     if type_filter:
         vehicles = vehicles.filter(vehicle_type=type_filter)
     
-    # 座位数筛选（只有在字段存在时才执行）
-    if seats_filter:
-        try:
-            seats = int(seats_filter)
-            # 尝试使用seats字段筛选，如果字段不存在会抛出异常
-            vehicles = vehicles.filter(seats=seats)
-        except (ValueError, Exception):
-            # 如果转换失败或字段不存在，忽略筛选
-            pass
-    
-    if price_min:
-        try:
-            vehicles = vehicles.filter(daily_rate__gte=Decimal(price_min))
-        except:
-            pass
-    
-    if price_max:
-        try:
-            vehicles = vehicles.filter(daily_rate__lte=Decimal(price_max))
-        except:
-            pass
-    
-    # 获取筛选选项（使用缓存）
-    from django.core.cache import cache
-    cache_key_brands = 'user_vehicle_brands_list'
-    cache_key_types = 'user_vehicle_types_list'
-    
-    brands = cache.get(cache_key_brands)
-    if brands is None:
-        brands = list(Vehicle.objects.values_list('brand', flat=True).distinct().order_by('brand'))
-        cache.set(cache_key_brands, brands, 300)
-    
-    types = cache.get(cache_key_types)
-    if types is None:
-        types = list(Vehicle.objects.values_list('vehicle_type', flat=True).distinct().order_by('vehicle_type'))
-        cache.set(cache_key_types, types, 300)
-    
-    # 获取座位数选项（使用缓存）
-    cache_key_seats = 'user_vehicle_seats_list'
-    seats_options = cache.get(cache_key_seats)
-    if seats_options is None:
-        try:
-            # 检查字段是否存在（如果迁移未应用，会抛出异常）
-            seats_values = list(Vehicle.objects.filter(status='AVAILABLE').values_list('seats', flat=True))
-            seats_options = sorted({seat for seat in seats_values if seat})
-            cache.set(cache_key_seats, seats_options, 300)
-        except Exception:
-            # 如果字段不存在（迁移未应用），使用空列表
-            seats_options = []
-            cache.set(cache_key_seats, seats_options, 300)
-    
-    # 商务风格统计信息（使用缓存优化）
-    cache_key_stats = 'home_vehicle_stats'
-    vehicle_stats = cache.get(cache_key_stats)
-    popular_types = cache.get('home_popular_types')
-    
-    if vehicle_stats is None or popular_types is None:
-        vehicle_stats_raw = Vehicle.objects.filter(status='AVAILABLE').aggregate(
-            total=Count('id'),
-            avg_rate=Avg('daily_rate')
-        )
-        vehicle_stats = {
-            'total': vehicle_stats_raw['total'] or 0,
-            'avg_rate': (vehicle_stats_raw['avg_rate'] or Decimal('0.00')),
-            'seat_options': len(seats_options)
-        }
-        popular_types = list(
-            Vehicle.objects.filter(status='AVAILABLE')
-            .values_list('vehicle_type', flat=True)
-            .distinct()
-            .order_by('vehicle_type')[:6]
-        )
-        
-        # 缓存5分钟
-        cache.set(cache_key_stats, vehicle_stats, 300)
-        cache.set('home_popular_types', popular_types, 300)
+    if seats is not None:
+        vehicles = vehicles.filter(seats=seats)
+    
+    if price_condition is not None:
+        vehicles = vehicles.filter(price_condition)
+    
+    # 商务风格统计信息（缓存5分钟，车辆增删改后自动失效）
+    home_stats = cached('home_vehicle_stats', [TAG_VEHICLE], _home_vehicle_stats, 300)
+    vehicle_stats, popular_types = home_stats['stats'], home_stats['popular_types']
     
     # 检查用户收藏的车辆ID
     favorite_vehicle_ids = []
@@ -654,15 +529,16 @@ def home_view(request):
     
     context = {
         'vehicles': vehicles_page,
-        'brands': brands,
-        'types': types,
-        'seats_options': seats_options,
+        'facets': facets,
         'search_query': search_query,
         'brand_filter': brand_filter,
         'type_filter': type_filter,
         'seats_filter': seats_filter,
         'price_min': price_min,
         'price_max': price_max,
+        'price_range': price_range,
+        'start_date': start_param if period_start else '',
+        'end_date': end_param if period_start else '',
         'favorite_vehicle_ids': favorite_vehicle_ids,
         'recommended_vehicles': recommended_vehicles,
         'vehicle_stats': vehicle_stats,
@@ -756,14 +632,10 @@ def favorite_toggle_view(request, pk):
 @login_required
 def favorites_view(request):
     """我的收藏视图"""
-    favorites = Favorite.objects.filter(user=request.user).select_related(
-        'vehicle'
-    ).order_by('-created_at')
+    favorites = Favorite.objects.filter(user=request.user).select_related('vehicle')
     
     # 分页
-    paginator = Paginator(favorites, 12)
-    page_number = request.GET.get('page', 1)
-    favorites_page = paginator.get_page(page_number)
+    favorites_page = paginate(request, favorites, 12)
     
     context = {
         'favorites': favorites_page,
@@ -856,9 +728,7 @@ def my_orders_view(request):
         )
     
     # 分页
-    paginator = Paginator(rentals, 15)
-    page_number = request.GET.get('page', 1)
-    rentals_page = paginator.get_page(page_number)
+    rentals_page = paginate(request, rentals, 15)
     
     context = {
         'rentals': rentals_page,
@@ -891,12 +761,9 @@ def order_detail_view(request, pk):
     except Review.DoesNotExist:
         pass
     
-    # 刷新订单财务信息（确保数据是最新的）
-    rental.refresh_financials()
-    
     # 获取支付记录（包括退款记录）
     payments = Payment.objects.filter(rental=rental).order_by('-created_at')
-    payment_summary = get_payment_summary(rental, payments)
+    payment_summary = get_payment_summary(rental)
     can_pay = rental.status in ['PENDING', 'ONGOING'] and payment_summary['remaining_amount'] > Decimal('0.00')
     
     context = {
@@ -969,22 +836,21 @@ def order_create_view(request):
         form.fields['return_location'].widget.choices = return_location_choices
         
         if form.is_valid():
-            with transaction.atomic():
-                rental = form.save(commit=False)
-                
-                # 计算总费用（基础租金 + VIP折扣）
-                from rentals.views import calculate_rental_amount
-                total_amount = calculate_rental_amount(
-                    rental.customer,
-                    rental.vehicle,
-                    rental.start_date,
-                    rental.end_date
-                )
-                # 注意：异地还车费用已经在表单的clean方法中设置，不需要在这里再次计算
-                # 但总金额需要包含异地还车费用（如果需要显示的话）
-                rental.total_amount = total_amount
-                rental.save()
-                
+            rental = form.save(commit=False)
+            
+            # 计算总费用（基础租金 + VIP折扣）
+            from rentals.views import calculate_rental_amount
+            total_amount = calculate_rental_amount(
+                rental.customer,
+                rental.vehicle,
+                rental.start_date,
+                rental.end_date
+            )
+            # 注意：异地还车费用已经在表单的clean方法中设置，不需要在这里再次计算
+            # 但总金额需要包含异地还车费用（如果需要显示的话）
+            rental.total_amount = total_amount
+            
+            def finish_order(rental):
                 # 更新车辆状态
                 if rental.status == 'PENDING':
                     rental.vehicle.status = 'RENTED'
@@ -998,7 +864,14 @@ def order_create_view(request):
                     content=f'您的订单 #{rental.id} 已创建成功。',
                     related_rental=rental
                 )
-                
+            
+            # 保存订单并占用槽位（数据库唯一约束拒绝并发的重叠预订）
+            try:
+                save_booking(rental, after_save=finish_order)
+            except BookingConflict as exc:
+                form.add_error(None, str(exc))
+                messages.error(request, str(exc))
+            else:
                 messages.success(request, f'订单创建成功！订单号：{rental.id}')
                 return redirect('accounts:order_detail', pk=rental.pk)
         else:
@@ -1060,7 +933,8 @@ def order_cancel_view(request, pk):
     
     cancel_reason = request.POST.get('cancel_reason', '用户取消')
     
-    with transaction.atomic():
+    # 订单冲突时回滚并提示（见 rentals/booking.py）
+    with booking_transaction(request):
         # 获取已支付金额（扣除已退款金额）
         payment_summary = get_payment_summary(rental)
         paid_amount = payment_summary['paid_amount']
@@ -1085,9 +959,6 @@ def order_cancel_view(request, pk):
                 transaction_id=f'REF{int(timezone.now().timestamp())}'
             )
             
-            # 更新订单财务信息
-            rental.refresh_financials()
-            
             messages.success(request, f'订单已成功取消，已退还 ¥{net_paid:.2f}。')
         else:
             messages.success(request, '订单已成功取消。')
@@ -1195,7 +1066,8 @@ def order_return_view(request, pk):
             if not actual_return_location:
                 actual_return_location = rental.pickup_location
             
-            with transaction.atomic():
+            # 订单冲突时回滚并重新显示表单（见 rentals/booking.py）
+            with booking_transaction(request):
                 # 更新还车信息
                 rental.actual_return_date = actual_return_date
                 rental.actual_return_location = actual_return_location
@@ -1268,8 +1140,8 @@ def order_return_view(request, pk):
                 # 退还押金
                 deposit_refunded, deposit_refund_amount = rental.refund_deposit(user=request.user)
                 
-                # 刷新财务信息
-                rental.refresh_financials()
+                # 订单已完成，按累计支付快照刷新结算状态
+                rental.refresh_settlement()
                 
                 # 检查是否符合VIP升级条件，如果符合则自动升级
                 vip_upgraded = False
@@ -1348,7 +1220,7 @@ def payment_view(request, pk):
     # 检查是否已支付
     payments = Payment.objects.filter(rental=rental)
     recent_payments = payments.order_by('-created_at')[:5]
-    payment_summary = get_payment_summary(rental, payments)
+    payment_summary = get_payment_summary(rental)
     remaining_amount = payment_summary['remaining_amount']
     
     if remaining_amount <= 0:
@@ -1369,8 +1241,7 @@ def payment_view(request, pk):
                 payment.paid_at = timezone.now()
                 payment.description = payment.description or '线上支付'
                 payment.save()
-                
-                rental.refresh_financials()
+                # 订单的累计支付金额和结算状态由支付记录信号更新
                 
                 # 创建通知
                 Notification.objects.create(
@@ -1417,9 +1288,7 @@ def payment_history_view(request):
         payments = payments.filter(status=status_filter)
     
     # 分页
-    paginator = Paginator(payments, 15)
-    page_number = request.GET.get('page', 1)
-    payments_page = paginator.get_page(page_number)
+    payments_page = paginate(request, payments, 15)
     
     context = {
         'payments': payments_page,
@@ -1438,27 +1307,36 @@ def consumption_report_view(request):
         messages.warning(request, '请先完善客户信息以查看消费明细。')
         return redirect('accounts:customer_info')
     
+    # 分页：订单较多的客户每页只加载一部分订单及其流水
+    # 每页的查询数固定：订单分页（含车辆）+ 预取的支付流水 + 一次按订单分组的支付汇总
     rentals = Rental.objects.filter(customer=customer).select_related(
         'vehicle'
-    ).prefetch_related('payments').order_by('-start_date')
+    ).prefetch_related(
+        Prefetch(
+            'payments',
+            queryset=Payment.objects.order_by('-created_at'),
+            to_attr='ordered_payments'
+        )
+    ).order_by('-start_date', '-id')
     
-    consumption_items = []
-    for rental in rentals:
-        # 刷新订单财务信息（确保数据是最新的）
-        rental.refresh_financials()
-        
-        # 获取所有支付记录（包括退款记录）
-        rental_payments = rental.payments.all().order_by('-created_at')
-        payment_summary = get_payment_summary(rental, rental_payments)
-        consumption_items.append({
+    paginator = Paginator(rentals, 10)
+    page_obj = paginator.get_page(request.GET.get('page', 1))
+    page_rentals = list(page_obj)
+    
+    totals = Payment.totals_by_rental([rental.id for rental in page_rentals])
+    consumption_items = [
+        {
             'rental': rental,
-            'summary': payment_summary,
-            'transactions': rental_payments,
-        })
+            'summary': get_payment_summary(rental, totals[rental.id]),
+            'transactions': rental.ordered_payments,
+        }
+        for rental in page_rentals
+    ]
     
     context = {
         'customer': customer,
         'consumption_items': consumption_items,
+        'page_obj': page_obj,
     }
     
     return render(request, 'accounts/consumption_report.html', context)
@@ -1479,9 +1357,7 @@ def notifications_view(request):
         notifications = notifications.filter(is_read=False)
     
     # 分页
-    paginator = Paginator(notifications, 20)
-    page_number = request.GET.get('page', 1)
-    notifications_page = paginator.get_page(page_number)
+    notifications_page = paginate(request, notifications, 20)
     
     # 获取未读数量
     unread_count = Notification.objects.filter(user=request.user, is_read=False).count()
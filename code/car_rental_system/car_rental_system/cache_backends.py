@@ -0,0 +1,271 @@
+"""
+跨进程共享的缓存后端（SQLite 文件）
+LocMemCache 每个网站进程各有一份，某个进程里的 cache.delete / 版本号递增只对该进程生效，
+其他进程继续使用旧的品牌列表、推荐候选、订单状态更新节流标记等。
+SQLiteCache 把缓存放在本机的一个 SQLite 文件中，同一台机器上的所有网站进程和 run_scheduler 调度器共用，不需要 Redis/Memcached：
+- 整数按 INTEGER 保存，incr/decr 是一条 UPDATE ... SET value = value + ? 语句，多进程同时递增不会丢失；其他值 pickle 后保存
+- 超过 MAX_ENTRIES 时先删除过期项，再按最近访问时间删除最久未用的项（LRU）；
+  读取时最多每 TOUCH_INTERVAL 秒刷新一次访问时间，避免每次读取都写文件
+- 是否超出 MAX_ENTRIES 每 CULL_INTERVAL 次写入检查一次，条目数可能短暂超过上限
+- WAL 模式，读取不被写入阻塞；每个进程的每个线程使用独立连接
+
+配置示例（settings.CACHES，也可设置环境变量 CAR_RENTAL_CACHE=sqlite，见 settings.py）：
+    'default': {
+        'BACKEND': 'car_rental_system.cache_backends.SQLiteCache',
+        'LOCATION': BASE_DIR / 'cache.sqlite3',
+        'OPTIONS': {'MAX_ENTRIES': 5000, 'TOUCH_INTERVAL': 5, 'CULL_INTERVAL': 20},
+    }
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+
+# SQLite 单条语句的参数个数上限以内，get_many / delete_many 每批的键数
+KEY_BATCH_SIZE = 500
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache_entries ('
+    ' key TEXT PRIMARY KEY,'
+    ' value BLOB NOT NULL,'
+    ' expires REAL,'  # 过期时间戳，NULL 表示永不过期
+    ' accessed REAL NOT NULL'  # 最近访问时间戳（LRU 淘汰依据）
+    ') WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS cache_entries_accessed ON cache_entries (accessed)',
+)
+
+
+def _encode(value):
+    # 整数原样保存，incr 可以直接在 SQL 中完成；bool 是 int 的子类，按 pickle 保存以便读回 True/False
+    if type(value) is int:
+        return value
+    return sqlite3.Binary(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+
+def _decode(value):
+    if isinstance(value, (int, float)):  # incr 传入浮点增量时 SQLite 把整数变为 REAL
+        return value
+    return pickle.loads(value)
+
+
+class SQLiteCache(BaseCache):
+    """SQLite 文件缓存后端，LOCATION 为缓存文件路径"""
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = str(location)
+        self._touch_interval = float(options.get('TOUCH_INTERVAL', 5))
+        self._cull_interval = max(int(options.get('CULL_INTERVAL', 20)), 1)
+        self._busy_timeout = float(options.get('BUSY_TIMEOUT', 20))
+        self._local = threading.local()
+        self._writes = 0
+
+    # ---- 连接 ----
+
+    def _connection(self):
+        """当前线程的连接；fork 出的子进程不能沿用父进程的连接，按进程号重新打开"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self._path, timeout=self._busy_timeout, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            for statement in SCHEMA:
+                conn.execute(statement)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _written(self, conn):
+        """写入计数，每 CULL_INTERVAL 次检查一次条目数"""
+        self._writes += 1
+        if self._writes % self._cull_interval == 0:
+            self._cull(conn)
+
+    def _cull(self, conn):
+        """删除过期项；仍超过 MAX_ENTRIES 时按访问时间删除最久未用的项（CULL_FREQUENCY 为0时清空）"""
+        conn.execute('DELETE FROM cache_entries WHERE expires IS NOT NULL AND expires <= ?', (time.time(),))
+        count = conn.execute('SELECT COUNT(*) FROM cache_entries').fetchone()[0]
+        if count <= self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            conn.execute('DELETE FROM cache_entries')
+            return
+        excess = count - self._max_entries + self._max_entries // self._cull_frequency
+        conn.execute(
+            'DELETE FROM cache_entries WHERE key IN '
+            '(SELECT key FROM cache_entries ORDER BY accessed LIMIT ?)',
+            (excess,),
+        )
+
+    # ---- 读取 ----
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version)
+        conn = self._connection()
+        now = time.time()
+        row = conn.execute(
+            'SELECT value, expires, accessed FROM cache_entries WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return default
+        value, expires, accessed = row
+        if expires is not None and expires <= now:
+            conn.execute('DELETE FROM cache_entries WHERE key = ? AND expires <= ?', (key, now))
+            return default
+        if now - accessed >= self._touch_interval:
+            conn.execute('UPDATE cache_entries SET accessed = ? WHERE key = ?', (now, key))
+        return _decode(value)
+
+    def get_many(self, keys, version=None):
+        key_map = {self.make_and_validate_key(key, version): key for key in keys}
+        conn = self._connection()
+        now = time.time()
+        result = {}
+        stale = []
+        cache_keys = list(key_map)
+        for start in range(0, len(cache_keys), KEY_BATCH_SIZE):
+            batch = cache_keys[start:start + KEY_BATCH_SIZE]
+            rows = conn.execute(
+                'SELECT key, value, expires, accessed FROM cache_entries '
+                f'WHERE key IN ({", ".join("?" * len(batch))})',
+                batch,
+            )
+            for cache_key, value, expires, accessed in rows:
+                if expires is not None and expires <= now:
+                    continue
+                result[key_map[cache_key]] = _decode(value)
+                if now - accessed >= self._touch_interval:
+                    stale.append((now, cache_key))
+        if stale:
+            conn.executemany('UPDATE cache_entries SET accessed = ? WHERE key = ?', stale)
+        return result
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version)
+        row = self._connection().execute(
+            'SELECT 1 FROM cache_entries WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (key, time.time()),
+        ).fetchone()
+        return row is not None
+
+    # ---- 写入 ----
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version)
+        conn = self._connection()
+        conn.execute(
+            'INSERT INTO cache_entries (key, value, expires, accessed) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET '
+            'value = excluded.value, expires = excluded.expires, accessed = excluded.accessed',
+            (key, _encode(value), self.get_backend_timeout(timeout), time.time()),
+        )
+        self._written(conn)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        """键不存在（或已过期）时写入并返回 True；一条语句完成，多进程同时 add 只有一个成功"""
+        key = self.make_and_validate_key(key, version)
+        conn = self._connection()
+        now = time.time()
+        cursor = conn.execute(
+            'INSERT INTO cache_entries (key, value, expires, accessed) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET '
+            'value = excluded.value, expires = excluded.expires, accessed = excluded.accessed '
+            'WHERE cache_entries.expires IS NOT NULL AND cache_entries.expires <= ?',
+            (key, _encode(value), self.get_backend_timeout(timeout), now, now),
+        )
+        added = cursor.rowcount > 0
+        if added:
+            self._written(conn)
+        return added
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        conn = self._connection()
+        expires = self.get_backend_timeout(timeout)
+        now = time.time()
+        rows = [
+            (self.make_and_validate_key(key, version), _encode(value), expires, now)
+            for key, value in data.items()
+        ]
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(
+                'INSERT INTO cache_entries (key, value, expires, accessed) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (key) DO UPDATE SET '
+                'value = excluded.value, expires = excluded.expires, accessed = excluded.accessed',
+                rows,
+            )
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        self._written(conn)
+        return []
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version)
+        now = time.time()
+        cursor = self._connection().execute(
+            'UPDATE cache_entries SET expires = ?, accessed = ? '
+            'WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), now, key, now),
+        )
+        return cursor.rowcount > 0
+
+    def incr(self, key, delta=1, version=None):
+        """
+        原子递增：整数值直接在 UPDATE 语句中相加；键不存在或已过期时抛出 ValueError（与其他缓存后端一致）
+        非整数值（如浮点数）在写事务中读出、相加后写回
+        """
+        key = self.make_and_validate_key(key, version)
+        conn = self._connection()
+        now = time.time()
+        # RETURNING 语句要取完结果才会结束，写锁才会释放，因此用 fetchall
+        rows = conn.execute(
+            'UPDATE cache_entries SET value = value + ?, accessed = ? '
+            "WHERE key = ? AND typeof(value) = 'integer' AND (expires IS NULL OR expires > ?) "
+            'RETURNING value',
+            (delta, now, key, now),
+        ).fetchall()
+        if rows:
+            return rows[0][0]
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT value FROM cache_entries WHERE key = ? AND (expires IS NULL OR expires > ?)',
+                (key, now),
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            new_value = _decode(row[0]) + delta
+            conn.execute(
+                'UPDATE cache_entries SET value = ?, accessed = ? WHERE key = ?',
+                (_encode(new_value), now, key),
+            )
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return new_value
+
+    # ---- 删除 ----
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version)
+        cursor = self._connection().execute('DELETE FROM cache_entries WHERE key = ?', (key,))
+        return cursor.rowcount > 0
+
+    def delete_many(self, keys, version=None):
+        cache_keys = [self.make_and_validate_key(key, version) for key in keys]
+        conn = self._connection()
+        for start in range(0, len(cache_keys), KEY_BATCH_SIZE):
+            batch = cache_keys[start:start + KEY_BATCH_SIZE]
+            conn.execute(f'DELETE FROM cache_entries WHERE key IN ({", ".join("?" * len(batch))})', batch)
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache_entries')
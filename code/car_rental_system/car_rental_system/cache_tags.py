@@ -0,0 +1,106 @@
+"""
+按标签失效的缓存
+缓存项登记所依赖的数据标签（'vehicle'、'rental'、'customer:<id>' 等），实际的缓存键带上各标签当前的版本号；
+数据变化时只需递增相关标签的版本号（一次 cache.incr），依赖它的全部缓存项随即失效，不必逐个列举、删除缓存键，
+旧版本的缓存项不再被读取，由缓存后端按超时/容量淘汰。
+- 模型登记（register_model）后，保存、删除时在事务提交后自动递增其标签，见各应用的 signals.py
+- QuerySet.update 等绕过信号的批量写入由调用方 invalidate_tags()
+- 标签版本号永不过期；版本号被缓存后端淘汰后以当前毫秒时间戳重新开始，不会与之前用过的版本号重复
+"""
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+
+# 常用标签
+TAG_VEHICLE = 'vehicle'
+TAG_RENTAL = 'rental'
+TAG_CUSTOMER = 'customer'
+TAG_REVIEW = 'review'
+
+_VERSION_PREFIX = 'cache_tag_version:'
+
+
+def vehicle_tag(vehicle_id):
+    """单辆车的数据（车辆信息、评价）"""
+    return f'{TAG_VEHICLE}:{vehicle_id}' if vehicle_id else None
+
+
+def customer_tag(customer_id):
+    """单个客户的数据（订单、支付、评价、统计）"""
+    return f'{TAG_CUSTOMER}:{customer_id}' if customer_id else None
+
+
+def _version_key(tag):
+    return f'{_VERSION_PREFIX}{tag}'
+
+
+def _initial_version():
+    return int(time.time() * 1000)
+
+
+def tag_versions(tags):
+    """各标签当前的版本号（与 tags 顺序一致），不存在的标签初始化后返回"""
+    keys = [_version_key(tag) for tag in tags]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # 多个进程同时初始化时以先写入的为准
+            cache.add(key, _initial_version(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def tagged_key(key, tags):
+    """带标签版本号的实际缓存键；任一标签失效后得到新的键"""
+    versions = '.'.join(str(version) for version in tag_versions(tags))
+    return f'{key}:{hashlib.md5(versions.encode()).hexdigest()[:12]}'
+
+
+def cached(key, tags, compute, timeout=DEFAULT_TIMEOUT):
+    """读取依赖 tags 的缓存项，不存在时调用 compute() 计算并缓存（compute 返回 None 时不缓存）"""
+    versioned_key = tagged_key(key, tags)
+    value = cache.get(versioned_key)
+    if value is None:
+        value = compute()
+        if value is not None:
+            cache.set(versioned_key, value, timeout)
+    return value
+
+
+def set_cached(key, tags, value, timeout=DEFAULT_TIMEOUT):
+    """预先写入依赖 tags 的缓存项（缓存预热）"""
+    cache.set(tagged_key(key, tags), value, timeout)
+
+
+def invalidate_tags(*tags):
+    """递增标签版本号，依赖这些标签的缓存项全部失效"""
+    for tag in tags:
+        key = _version_key(tag)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _initial_version(), None)
+
+
+def invalidate_on_commit(*tags):
+    """在当前事务提交后失效（不在事务中时立即失效），避免其他请求在提交前按旧数据重新写入新版本的缓存"""
+    tags = {tag for tag in tags if tag}
+    if tags:
+        transaction.on_commit(lambda: invalidate_tags(*tags))
+
+
+def register_model(model, tags_for):
+    """
+    登记模型：保存、删除后自动失效 tags_for(instance) 返回的标签
+    tags_for 可以读取 instance._loaded_values（保存前的字段值）以同时失效原关联对象的标签
+    """
+    def changed(sender, instance, **kwargs):
+        invalidate_on_commit(*tags_for(instance))
+
+    post_save.connect(changed, sender=model, weak=False, dispatch_uid=f'cache_tags_save_{model._meta.label}')
+    post_delete.connect(changed, sender=model, weak=False, dispatch_uid=f'cache_tags_delete_{model._meta.label}')
@@ -0,0 +1,231 @@
+"""
+仪表板统计快照
+管理员仪表板、车辆/客户/租赁管理首页、客户统计接口共用同一份统计快照（DashboardSnapshot）：
+- 每张表一条分组查询：车辆按状态、客户按会员等级（同时统计最近30天活跃客户）、订单按状态（同时统计今日取车数）分组计数，
+  金额读取每日经营汇总（见 rentals/rollups.py）的一条条件聚合和一条按月分组
+- 快照保存在缓存中（SNAPSHOT_KEY），配置共享缓存后端（settings.CACHE_BACKEND = 'sqlite'）时各进程共用
+- 过期仍返回（stale-while-revalidate）：快照生成超过 SNAPSHOT_FRESH_SECONDS 秒，或生成后车辆/客户/订单数据有变化
+  （缓存标签版本号变化，见 car_rental_system/cache_tags.py），页面照常使用旧快照，同时启动后台线程重新生成；
+  同一时刻只有一个进程/线程在生成（REFRESH_LOCK_KEY）
+- 只有缓存中完全没有快照时（首次访问、缓存被清空）才在请求中同步生成
+- run_scheduler 按 dashboard_interval 定期重新生成，页面请求通常直接读到新快照
+"""
+import logging
+import threading
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from .cache_tags import TAG_CUSTOMER, TAG_RENTAL, TAG_VEHICLE, tag_versions
+
+logger = logging.getLogger(__name__)
+
+
+SNAPSHOT_KEY = 'dashboard_snapshot'
+
+# 快照新鲜期（秒）：超过后仍返回旧快照，同时在后台重新生成
+SNAPSHOT_FRESH_SECONDS = 30
+
+# 快照在缓存中的保留时间（秒），超过后下次访问同步生成
+SNAPSHOT_TIMEOUT = 3600
+
+# 后台生成锁，超时时间应大于一次生成的耗时
+REFRESH_LOCK_KEY = 'dashboard_snapshot_refreshing'
+REFRESH_LOCK_TIMEOUT = 120
+
+# 快照依赖的数据标签：任一标签版本号变化即视为过期
+SNAPSHOT_TAGS = (TAG_VEHICLE, TAG_CUSTOMER, TAG_RENTAL)
+
+# 活跃客户：最近多少天内下过单
+ACTIVE_CUSTOMER_DAYS = 30
+
+# 收入趋势图的月数
+CHART_MONTHS = 6
+
+
+class DashboardSnapshot:
+    """某一时刻的统计数据；属性均为普通字典/列表，可直接放入模板上下文或 JSON"""
+
+    def __init__(self, vehicle_counts, customer_counts, active_customers, rental_counts, today_pickups,
+                 revenue, monthly_revenue, built_at, versions):
+        self.vehicle_counts = vehicle_counts
+        self.customer_counts = customer_counts
+        self.active_customers = active_customers
+        self.rental_counts = rental_counts
+        self.today_pickups = today_pickups
+        self.revenue = revenue
+        self.monthly_revenue = monthly_revenue
+        self.built_at = built_at
+        self.versions = versions
+
+    def __repr__(self):
+        return f'<DashboardSnapshot built_at={self.built_at:%Y-%m-%d %H:%M:%S}>'
+
+    @classmethod
+    def build(cls):
+        """按当前数据生成快照（车辆、客户、订单各一条分组查询，每日汇总两条查询）"""
+        from customers.models import Customer  # 避免循环导入
+        from rentals.models import DailyRentalStat, Rental
+        from rentals.rollups import monthly_totals
+        from vehicles.models import Vehicle
+
+        # 先读取标签版本号：生成期间发生的变化会使快照在下次读取时被判定为过期
+        versions = tag_versions(SNAPSHOT_TAGS)
+        now = timezone.now()
+        today = timezone.localdate(now)
+
+        vehicle_counts = dict(
+            Vehicle.objects.order_by().values_list('status').annotate(count=Count('id'))
+        )
+
+        customer_counts = {}
+        active_customers = 0
+        customer_rows = Customer.objects.order_by().values('member_level').annotate(
+            count=Count('id'),
+            active=Count('id', filter=Q(last_rental_at__gte=now - timedelta(days=ACTIVE_CUSTOMER_DAYS))),
+        )
+        for row in customer_rows:
+            customer_counts[row['member_level']] = row['count']
+            active_customers += row['active']
+
+        rental_counts = {}
+        today_pickups = 0
+        rental_rows = Rental.objects.order_by().values('status').annotate(
+            count=Count('id'),
+            today=Count('id', filter=Q(start_date=today)),
+        )
+        for row in rental_rows:
+            rental_counts[row['status']] = row['count']
+            today_pickups += row['today']
+
+        month_start = today.replace(day=1)
+        week_start = today - timedelta(days=today.weekday())
+        revenue = DailyRentalStat.objects.aggregate(
+            total=Sum('revenue'),
+            monthly=Sum('revenue', filter=Q(day__gte=month_start)),
+            today=Sum('revenue', filter=Q(day=today)),
+            ordered=Sum('new_amount'),
+            week_new_rentals=Sum('new_rentals', filter=Q(day__gte=week_start)),
+        )
+        revenue = {
+            key: value or (0 if key == 'week_new_rentals' else Decimal('0.00'))
+            for key, value in revenue.items()
+        }
+
+        return cls(
+            vehicle_counts=vehicle_counts,
+            customer_counts=customer_counts,
+            active_customers=active_customers,
+            rental_counts=rental_counts,
+            today_pickups=today_pickups,
+            revenue=revenue,
+            monthly_revenue=[
+                (month.strftime('%Y-%m'), total) for month, total in monthly_totals(CHART_MONTHS, today=today)
+            ],
+            built_at=now,
+            versions=versions,
+        )
+
+    @property
+    def age(self):
+        """快照生成至今的秒数"""
+        return (timezone.now() - self.built_at).total_seconds()
+
+    def is_stale(self):
+        return self.age > SNAPSHOT_FRESH_SECONDS or tag_versions(SNAPSHOT_TAGS) != self.versions
+
+    @property
+    def vehicle_stats(self):
+        counts = self.vehicle_counts
+        return {
+            'total': sum(counts.values()),
+            'available': counts.get('AVAILABLE', 0),
+            'rented': counts.get('RENTED', 0),
+            'maintenance': counts.get('MAINTENANCE', 0),
+        }
+
+    @property
+    def customer_stats(self):
+        counts = self.customer_counts
+        total = sum(counts.values())
+        return {
+            'total': total,
+            'vip': counts.get('VIP', 0),
+            'normal': counts.get('NORMAL', 0),
+            'regular': total - counts.get('VIP', 0),
+            'active': self.active_customers,
+        }
+
+    @property
+    def rental_stats(self):
+        counts = self.rental_counts
+        return {
+            'total': sum(counts.values()),
+            'active': counts.get('ONGOING', 0) + counts.get('PENDING', 0),
+            'ongoing': counts.get('ONGOING', 0),
+            'pending': counts.get('PENDING', 0),
+            'completed': counts.get('COMPLETED', 0),
+            'overdue': counts.get('OVERDUE', 0),
+            'cancelled': counts.get('CANCELLED', 0),
+            'today': self.today_pickups,
+            'week_new': self.revenue['week_new_rentals'],
+        }
+
+    @property
+    def revenue_stats(self):
+        return {
+            'total': self.revenue['total'],
+            'monthly': self.revenue['monthly'],
+            'today': self.revenue['today'],
+            'ordered': self.revenue['ordered'],
+        }
+
+    @property
+    def monthly_labels(self):
+        return [label for label, _ in self.monthly_revenue]
+
+    @property
+    def monthly_revenue_data(self):
+        return [float(total) for _, total in self.monthly_revenue]
+
+
+def refresh_snapshot():
+    """重新生成快照并写入缓存，返回新快照"""
+    snapshot = DashboardSnapshot.build()
+    cache.set(SNAPSHOT_KEY, snapshot, SNAPSHOT_TIMEOUT)
+    return snapshot
+
+
+def _refresh_in_background():
+    try:
+        refresh_snapshot()
+    except Exception as e:
+        logger.error(f'仪表板快照后台生成失败: {e}')
+    finally:
+        cache.delete(REFRESH_LOCK_KEY)
+        # 后台线程有自己的数据库连接，结束时关闭
+        connection.close()
+
+
+def schedule_refresh():
+    """启动后台线程重新生成快照；已有进程/线程在生成时返回 False"""
+    if not cache.add(REFRESH_LOCK_KEY, True, REFRESH_LOCK_TIMEOUT):
+        return False
+    threading.Thread(target=_refresh_in_background, name='dashboard-snapshot', daemon=True).start()
+    return True
+
+
+def get_snapshot():
+    """
+    读取统计快照：缓存中没有时同步生成；已过期时返回旧快照并在后台重新生成
+    """
+    snapshot = cache.get(SNAPSHOT_KEY)
+    if snapshot is None:
+        return refresh_snapshot()
+    if snapshot.is_stale():
+        schedule_refresh()
+    return snapshot
@@ -0,0 +1,22 @@
+"""
+由查询集 UPDATE 原子维护的冗余列（车辆预订版本号、订单财务快照、客户订单统计）
+这些列由信号或辅助函数以 F() 表达式 / QuerySet.update 写入，内存中的实例值可能早已过期。
+模型混入 ManagedColumnsMixin 并在 managed_columns 中列出这些列后：
+- 整体保存已有行（save() 未指定 update_fields）时不写这些列，避免用内存中的旧值覆盖期间其他请求的原子更新；
+  对这些列的赋值在整体保存时被忽略（不报错），需要写入时显式指定 update_fields 或使用对应的辅助函数
+- 显式指定 update_fields 时照常写入列出的列
+- 新建行（以及整体保存时数据库中已没有该行而改为 INSERT）照常写入全部列
+- 只影响写入的 SQL，post_save 信号收到的 update_fields 与普通整体保存一样为 None
+"""
+
+
+class ManagedColumnsMixin:
+    """整体保存时跳过 managed_columns 中的列（放在 models.Model 之前继承）"""
+
+    # 只由原子更新维护的列名
+    managed_columns = ()
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        if update_fields is None and self.managed_columns:
+            values = [value for value in values if value[0].name not in self.managed_columns]
+        return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
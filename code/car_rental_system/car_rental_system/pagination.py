@@ -0,0 +1,243 @@
+"""
+游标分页（键集分页）
+Paginator 每页都要先 COUNT(*) 再用 OFFSET 跳过前面的行，页码越大越慢；
+游标分页记住当前页首行/末行的排序键 (created_at, id)，翻页时用 WHERE (created_at, id) < 游标 直接在索引上定位，
+第1页和第10000页的耗时相同，也不需要计数。
+- 游标是排序键值经 JSON + base64 编码的不透明字符串，页面只需原样传回；无法解析的游标按第一页处理
+- 总数可选：estimate_count=True 时给出缓存的计数（COUNT 结果缓存 COUNT_TIMEOUT 秒），否则不计数
+- 请求带 ?page=N 时仍按页码分页（旧链接、需要跳到指定页时），见 paginate()
+分页导航使用 templates/includes/pagination.html，两种模式共用。
+"""
+import base64
+import binascii
+import hashlib
+import json
+from collections.abc import Sequence
+
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+
+
+CURSOR_PARAM = 'cursor'
+PAGE_PARAM = 'page'
+
+# 默认排序键：创建时间倒序，ID 倒序保证排序唯一
+DEFAULT_ORDERING = ('-created_at', '-id')
+
+# 估计总数（缓存的 COUNT 结果）的缓存时间（秒）
+COUNT_TIMEOUT = 300
+
+# 页码模式下当前页前后显示的页码数
+PAGE_LINK_WINDOW = 2
+
+
+class InvalidCursor(ValueError):
+    """游标无法解析"""
+
+
+def encode_cursor(direction, values):
+    """把翻页方向（'next' / 'prev'）和排序键值编码为游标"""
+    payload = json.dumps(
+        [direction, [value.isoformat() if hasattr(value, 'isoformat') else value for value in values]],
+        separators=(',', ':'),
+        default=str,  # Decimal 等按字符串保存，解码时由字段的 to_python 还原
+    )
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """游标 → (方向, [排序键值的字符串/数字形式])，无法解析时抛出 InvalidCursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        direction, values = json.loads(raw)
+    except (ValueError, TypeError, binascii.Error) as exc:
+        raise InvalidCursor(cursor) from exc
+    if direction not in ('next', 'prev') or not isinstance(values, list):
+        raise InvalidCursor(cursor)
+    return direction, values
+
+
+def _parse_ordering(ordering):
+    """('-created_at', '-id') → [('created_at', True), ('id', True)]"""
+    return [(field.lstrip('-'), field.startswith('-')) for field in ordering]
+
+
+def keyset_condition(fields, values, backward=False):
+    """
+    排序键在游标之后（backward=True 时为之前）的条件，按字典序展开：
+    (a, b) 在 (x, y) 之后 ⇔ a 在 x 之后 OR (a = x AND b 在 y 之后)
+    另加第一个字段的闭区间条件（a <= x），使数据库能直接用索引范围扫描，而不是对 OR 的各分支分别检索再排序
+    """
+    condition = Q()
+    equal = Q()
+    for (name, descending), value in zip(fields, values):
+        lookup = 'lt' if descending != backward else 'gt'
+        condition |= equal & Q(**{f'{name}__{lookup}': value})
+        equal &= Q(**{name: value})
+    (first_name, first_descending), first_value = fields[0], values[0]
+    bound = 'lte' if first_descending != backward else 'gte'
+    return Q(**{f'{first_name}__{bound}': first_value}) & condition
+
+
+class CursorPage(Sequence):
+    """游标分页的一页；接口与 Django 的 Page 相近，模板可以同样使用 has_next / has_previous / object_list"""
+
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<CursorPage: {len(self.object_list)} items>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def total_count(self):
+        """估计总数（未开启 estimate_count 时为 None）"""
+        return self.paginator.estimated_count()
+
+
+class CursorPaginator:
+    """
+    按排序键翻页：ordering 中的字段必须是模型本身的字段，且组合起来唯一（最后一个一般是 id）；
+    数据库中应有与 ordering（及常用过滤条件）对应的索引
+    """
+
+    def __init__(self, queryset, per_page, ordering=DEFAULT_ORDERING, estimate_count=False):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.fields = _parse_ordering(self.ordering)
+        self.estimate_count = estimate_count
+
+    def _cursor_values(self, values):
+        """把游标中的字符串/数字转换为字段类型，类型不符时抛出 InvalidCursor"""
+        if len(values) != len(self.fields):
+            raise InvalidCursor(values)
+        model = self.queryset.model
+        converted = []
+        for (name, _), value in zip(self.fields, values):
+            try:
+                field = model._meta.pk if name in ('id', 'pk') else model._meta.get_field(name)
+                converted.append(field.to_python(value))
+            except (FieldDoesNotExist, ValidationError) as exc:
+                raise InvalidCursor(values) from exc
+        return converted
+
+    def _key(self, obj):
+        return [obj.pk if name in ('id', 'pk') else getattr(obj, name) for name, _ in self.fields]
+
+    def page(self, cursor=None):
+        """返回游标所指的一页；cursor 为空时返回第一页"""
+        direction, values = 'next', None
+        if cursor:
+            direction, values = decode_cursor(cursor)
+            values = self._cursor_values(values)
+        backward = direction == 'prev'
+
+        if backward:
+            ordering = [field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering]
+        else:
+            ordering = self.ordering
+        queryset = self.queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(keyset_condition(self.fields, values, backward))
+
+        # 多取一行判断是否还有下一页（向前翻时为上一页）
+        rows = list(queryset[:self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if values is not None and not rows:
+            # 游标之后的数据已被删除，回到第一页
+            return self.page()
+
+        if backward:
+            rows.reverse()
+            has_previous, has_next = more, True
+        else:
+            has_previous, has_next = values is not None, more
+
+        return CursorPage(
+            rows,
+            self,
+            has_next=has_next,
+            has_previous=has_previous,
+            next_cursor=encode_cursor('next', self._key(rows[-1])) if has_next and rows else None,
+            previous_cursor=encode_cursor('prev', self._key(rows[0])) if has_previous and rows else None,
+        )
+
+    def estimated_count(self):
+        """缓存的总数（COUNT 结果按查询语句缓存 COUNT_TIMEOUT 秒）；未开启 estimate_count 时返回 None"""
+        if not self.estimate_count:
+            return None
+        if not hasattr(self, '_estimated_count'):
+            queryset = self.queryset.order_by()
+            sql, params = queryset.query.sql_with_params()
+            digest = hashlib.md5(f'{sql}|{params!r}'.encode('utf-8')).hexdigest()
+            self._estimated_count = cache.get_or_set(
+                f'pagination_count_{digest}', queryset.count, COUNT_TIMEOUT
+            )
+        return self._estimated_count
+
+
+def _query_string(request, **params):
+    """当前请求的查询参数去掉分页参数后加上 params，返回链接地址"""
+    query = request.GET.copy()
+    for key in (CURSOR_PARAM, PAGE_PARAM):
+        query.pop(key, None)
+    for key, value in params.items():
+        if value is not None:
+            query[key] = value
+    encoded = query.urlencode()
+    return f'?{encoded}' if encoded else request.path
+
+
+def paginate(request, queryset, per_page, ordering=DEFAULT_ORDERING, estimate_count=False):
+    """
+    列表视图的分页入口：默认游标分页；请求带 page 参数（且没有 cursor）时按页码分页
+    返回的页对象上附带导航链接 first_query / previous_query / next_query（页码模式还有 last_query、page_links），
+    由 templates/includes/pagination.html 渲染
+    """
+    if request.GET.get(PAGE_PARAM) and not request.GET.get(CURSOR_PARAM):
+        page = Paginator(queryset.order_by(*ordering), per_page).get_page(request.GET.get(PAGE_PARAM))
+        page.is_cursor = False
+        page.total_count = page.paginator.count
+        page.first_query = _query_string(request, page=1)
+        page.last_query = _query_string(request, page=page.paginator.num_pages)
+        page.previous_query = _query_string(request, page=page.previous_page_number()) if page.has_previous() else None
+        page.next_query = _query_string(request, page=page.next_page_number()) if page.has_next() else None
+        first = max(page.number - PAGE_LINK_WINDOW, 1)
+        last = min(page.number + PAGE_LINK_WINDOW, page.paginator.num_pages)
+        page.page_links = [(number, _query_string(request, page=number)) for number in range(first, last + 1)]
+        return page
+
+    paginator = CursorPaginator(queryset, per_page, ordering, estimate_count)
+    try:
+        page = paginator.page(request.GET.get(CURSOR_PARAM))
+    except InvalidCursor:
+        page = paginator.page()
+    page.first_query = _query_string(request)
+    page.previous_query = _query_string(request, cursor=page.previous_cursor) if page.previous_cursor else None
+    page.next_query = _query_string(request, cursor=page.next_cursor) if page.next_cursor else None
+    return page
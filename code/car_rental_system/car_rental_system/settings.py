@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -138,21 +139,60 @@ HANDLER403 = 'views.permission_denied'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-# 缓存配置（使用内存缓存，提高性能）
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
-        'TIMEOUT': 300,  # 5分钟
-        'OPTIONS': {
-            'MAX_ENTRIES': 1000
+# 缓存配置
+# CACHE_BACKEND（可由环境变量 CAR_RENTAL_CACHE 指定）：
+# - 'locmem'：进程内存缓存（默认），每个网站进程各有一份，缓存失效只对处理该请求的进程生效，适合单进程开发服务器
+# - 'sqlite'：本机 SQLite 文件缓存（car_rental_system/cache_backends.py），多个网站进程和 run_scheduler 调度器共享，
+#   缓存失效、版本号递增、订单状态更新节流对所有进程生效；多进程部署（gunicorn 等）时使用
+CACHE_BACKEND = os.environ.get('CAR_RENTAL_CACHE', 'locmem')
+
+if CACHE_BACKEND == 'sqlite':
+    CACHES = {
+        'default': {
+            'BACKEND': 'car_rental_system.cache_backends.SQLiteCache',
+            'LOCATION': os.environ.get('CAR_RENTAL_CACHE_LOCATION', BASE_DIR / 'cache.sqlite3'),
+            'TIMEOUT': 300,  # 5分钟
+            'OPTIONS': {
+                'MAX_ENTRIES': 5000,
+                'TOUCH_INTERVAL': 5,   # 读取时刷新访问时间（LRU）的最小间隔（秒）
+                'CULL_INTERVAL': 20,   # 每多少次写入检查一次条目数
+            }
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'unique-snowflake',
+            'TIMEOUT': 300,  # 5分钟
+            'OPTIONS': {
+                'MAX_ENTRIES': 1000
+            }
         }
     }
-}
 
 # 数据库连接池配置（SQLite优化）
 DATABASES['default']['OPTIONS'] = {
     'timeout': 20,
+    # 事务使用默认的 DEFERRED 模式；只有预订事务以 BEGIN IMMEDIATE 开始（见 rentals/booking.py 的 immediate_transaction）
+    # WAL 模式下读操作不会被写事务阻塞
+    'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL',
+}
+
+# 订单状态自动更新
+# 部署了 run_scheduler 调度器后设为 False，页面请求中不再顺带推进订单状态
+RENTAL_AUTO_UPDATE_IN_REQUEST = True
+
+# 后台调度器（python manage.py run_scheduler）任务间隔（秒），间隔为 0 的任务不启用
+RENTAL_SCHEDULER = {
+    'transitions_interval': 60,      # 订单状态推进
+    'settlement_interval': 600,      # 已完成订单押金退还与结算
+    'cache_warmup_interval': 240,    # 列表缓存预热（仅对跨进程共享的缓存后端有效）
+    'similarity_interval': 3600,     # 推荐用车辆相似度增量计算（全量计算请每晚运行 build_vehicle_similarity）
+    'dashboard_interval': 30,        # 仪表板统计快照重新生成（仅对跨进程共享的缓存后端有效）
+    'jitter': 0.1,                   # 间隔随机抖动比例（±10%）
+    'settlement_batch_size': 200,
+    'lock_file': BASE_DIR / 'run_scheduler.lock',
 }
 
 # 日志配置（用于调试性能问题）
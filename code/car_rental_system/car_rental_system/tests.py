@@ -0,0 +1,118 @@
+import multiprocessing
+import os
+import tempfile
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+
+from .cache_backends import SQLiteCache
+from .cache_tags import cached, invalidate_on_commit, invalidate_tags, tag_versions
+
+
+def _open_cache(path, **options):
+    return SQLiteCache(path, {'TIMEOUT': 300, 'OPTIONS': options})
+
+
+def _increment(path, key, times, barrier):
+    """子进程：同时开始，对同一个键递增 times 次"""
+    cache = _open_cache(path)
+    barrier.wait()
+    for _ in range(times):
+        cache.incr(key)
+
+
+def _read_and_invalidate(path, queue):
+    """子进程：读取父进程写入的值，删除一个键并递增版本号"""
+    cache = _open_cache(path)
+    queue.put(cache.get('brands'))
+    cache.delete('brands')
+    cache.incr('facets_version')
+
+
+class SQLiteCacheMultiProcessTests(SimpleTestCase):
+    """多个进程共用同一个缓存文件，验证递增不丢失、写入和失效对其他进程可见"""
+
+    PROCESSES = 4
+    INCREMENTS = 200
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'cache.sqlite3')
+        self.cache = _open_cache(self.path)
+        self.context = multiprocessing.get_context('spawn')
+
+    def run_processes(self, target, args_list):
+        processes = [self.context.Process(target=target, args=args) for args in args_list]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(60)
+            self.assertEqual(process.exitcode, 0)
+
+    def test_concurrent_incr(self):
+        self.cache.set('counter', 0, None)
+        barrier = self.context.Barrier(self.PROCESSES)
+        self.run_processes(
+            _increment, [(self.path, 'counter', self.INCREMENTS, barrier)] * self.PROCESSES
+        )
+        self.assertEqual(self.cache.get('counter'), self.PROCESSES * self.INCREMENTS)
+
+    def test_writes_and_invalidation_visible_across_processes(self):
+        self.cache.set('brands', ['丰田', '宝马'])
+        self.cache.set('facets_version', 1, None)
+        queue = self.context.Queue()
+        self.run_processes(_read_and_invalidate, [(self.path, queue)])
+
+        self.assertEqual(queue.get(timeout=10), ['丰田', '宝马'])
+        self.assertIsNone(self.cache.get('brands'))
+        self.assertEqual(self.cache.get('facets_version'), 2)
+
+    def test_lru_eviction(self):
+        cache = _open_cache(self.path, MAX_ENTRIES=10, CULL_FREQUENCY=5, TOUCH_INTERVAL=0, CULL_INTERVAL=1)
+        for index in range(10):
+            cache.set(f'key{index}', index)
+        cache.get('key0')  # 最早写入但刚被访问，不应被淘汰
+        cache.set('key10', 10)
+
+        self.assertEqual(cache.get('key0'), 0)
+        self.assertIsNone(cache.get('key1'))
+        self.assertEqual(cache.get('key10'), 10)
+
+
+class CacheTagTests(TestCase):
+    """按标签失效：递增任一依赖标签后缓存项重新计算，其他标签的缓存项不受影响；事务中的失效在提交后生效"""
+
+    def setUp(self):
+        cache.clear()
+        self.calls = []
+
+    def compute(self, value):
+        def compute():
+            self.calls.append(value)
+            return value
+        return compute
+
+    def test_invalidate_dependent_entries_only(self):
+        self.assertEqual(cached('brands', ['vehicle'], self.compute('v1')), 'v1')
+        self.assertEqual(cached('report', ['rental', 'customer:1'], self.compute('r1')), 'r1')
+        self.assertEqual(cached('brands', ['vehicle'], self.compute('v2')), 'v1')
+
+        invalidate_tags('customer:1')
+        self.assertEqual(cached('brands', ['vehicle'], self.compute('v2')), 'v1')
+        self.assertEqual(cached('report', ['rental', 'customer:1'], self.compute('r2')), 'r2')
+        self.assertEqual(self.calls, ['v1', 'r1', 'r2'])
+
+    def test_version_restarts_after_eviction(self):
+        before, = tag_versions(['vehicle'])
+        cache.clear()
+        after, = tag_versions(['vehicle'])
+        self.assertGreaterEqual(after, before)
+
+    def test_invalidate_after_commit(self):
+        before = tag_versions(['rental'])
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            invalidate_on_commit('rental', None)
+            self.assertEqual(tag_versions(['rental']), before)
+        self.assertEqual(len(callbacks), 1)
+        self.assertNotEqual(tag_versions(['rental']), before)
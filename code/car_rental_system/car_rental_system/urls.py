@@ -21,13 +21,14 @@ from django.conf.urls.static import static
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from views import dashboard, home_redirect, page_not_found, server_error, permission_denied
+from views import dashboard, metrics_api, home_redirect, page_not_found, server_error, permission_denied
 from views import review_list_view, review_edit_view, review_delete_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', home_redirect, name='home'),  # 智能首页，根据用户身份跳转
     path('dashboard/', dashboard, name='dashboard'),  # 管理员仪表板
+    path('api/metrics/', metrics_api, name='metrics_api'),  # 经营指标时间序列（图表数据）
     path('reviews/', review_list_view, name='review_list'),
     path('reviews/<int:pk>/edit/', review_edit_view, name='review_edit'),
     path('reviews/<int:pk>/delete/', review_delete_view, name='review_delete'),
@@ -115,6 +115,14 @@ class CustomerForm(forms.ModelForm):
         return license_number
 
 
+# 客户列表的排序方式：取值 → 游标分页的排序键（各排序列均有索引）
+CUSTOMER_SORTS = {
+    '': ('-created_at', '-id'),
+    'spend': ('-total_amount', '-id'),
+    'recent': ('-last_rental_at', '-id'),
+}
+
+
 class CustomerSearchForm(forms.Form):
     """客户搜索表单"""
     search = forms.CharField(
@@ -122,7 +130,7 @@ class CustomerSearchForm(forms.Form):
         label='搜索',
         widget=forms.TextInput(attrs={
             'class': 'form-control',
-            'placeholder': '按姓名或手机号搜索'
+            'placeholder': '按姓氏、手机号（前缀或尾号）或身份证尾号搜索'
         })
     )
     member_level = forms.ChoiceField(
@@ -133,6 +141,14 @@ class CustomerSearchForm(forms.Form):
             'class': 'form-select'
         })
     )
+    sort = forms.ChoiceField(
+        required=False,
+        label='排序',
+        choices=[('', '最新注册'), ('spend', '消费金额最高'), ('recent', '最近下单')],
+        widget=forms.Select(attrs={
+            'class': 'form-select'
+        })
+    )
 
 
 class MembershipUpdateForm(forms.ModelForm):
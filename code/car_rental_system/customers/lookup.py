@@ -0,0 +1,144 @@
+"""
+客户快速检索（柜台按手机号、身份证尾号、姓名即时搜索）
+所有检索都转为索引列上的前缀范围查询（列 >= 前缀 AND 列 < 前缀 + 最大字符），不使用前导通配符的 LIKE：
+- 手机号前缀：phone 索引
+- 手机尾号、身份证尾号：倒序保存的号码列（phone_reversed / id_card_reversed），尾号检索即倒序列上的前缀检索
+- 身份证前缀：id_card 唯一索引
+- 姓名前缀（按姓氏检索）：name 索引
+即时搜索对每类检索按索引顺序各取前 limit 条即停止，客户数量增长到百万级耗时也基本不变。
+姓名、手机号另外保留包含匹配（LIKE '%...%'，需要扫描客户表）：即时搜索只在前缀/尾号结果不足 limit 条时才执行，
+客户列表页与前缀条件一起 OR 查询，保持原来“姓名或手机号包含”的检索结果（如按手机号中间几位检索）。
+"""
+import re
+
+from django.db.models import Q
+
+
+# 前缀范围查询的上界字符
+MAX_CHAR = chr(0x10FFFF)
+
+# 即时搜索返回的最大条数
+MAX_LOOKUP_LIMIT = 20
+
+# 重算倒序号码列时每批更新的行数
+REBUILD_BATCH_SIZE = 2000
+
+# 匹配类型（按展示优先级排列）：(类型, 检索列, 说明)
+MATCH_KINDS = [
+    ('phone', 'phone', '手机号'),
+    ('phone_tail', 'phone_reversed', '手机尾号'),
+    ('id_card_tail', 'id_card_reversed', '身份证尾号'),
+    ('id_card', 'id_card', '身份证号'),
+    ('name', 'name', '姓名'),
+    ('phone_contains', 'phone', '手机号包含'),
+    ('name_contains', 'name', '姓名包含'),
+]
+
+# 包含匹配（icontains，不走索引范围）的匹配类型
+CONTAINS_KINDS = {'phone_contains', 'name_contains'}
+
+_NUMBER_RE = re.compile(r'[0-9xX]+')
+
+
+def prefix_range(field, prefix):
+    """field 以 prefix 开头的范围条件（可使用 field 上的B树索引）"""
+    return Q(**{f'{field}__gte': prefix, f'{field}__lt': prefix + MAX_CHAR})
+
+
+def term_filter(kind, field, value):
+    """单类检索的条件：包含匹配为 icontains，其余为索引上的前缀范围"""
+    if kind in CONTAINS_KINDS:
+        return Q(**{f'{field}__icontains': value})
+    return prefix_range(field, value)
+
+
+def lookup_terms(query):
+    """
+    按输入内容决定检索哪些列，返回 [(匹配类型, 检索列, 前缀), ...]
+    纯数字：手机号前缀、手机尾号、身份证尾号（6位及以上时还检索身份证前缀），最后按手机号包含；
+    带X的号码只检索身份证；其他按姓名前缀，再按姓名包含
+    """
+    query = ''.join((query or '').split())
+    if not query:
+        return []
+    if _NUMBER_RE.fullmatch(query):
+        number = query.upper()
+        terms = []
+        if number.isdigit():
+            terms += [('phone', 'phone', number), ('phone_tail', 'phone_reversed', number[::-1])]
+        terms.append(('id_card_tail', 'id_card_reversed', number[::-1]))
+        if len(number) >= 6:
+            terms.append(('id_card', 'id_card', number))
+        if number.isdigit():
+            terms.append(('phone_contains', 'phone', number))
+        return terms
+    return [('name', 'name', query), ('name_contains', 'name', query)]
+
+
+def lookup_filter(query):
+    """客户列表页使用的检索条件（各索引范围条件的 OR），输入为空时返回 None"""
+    condition = Q()
+    for kind, field, prefix in lookup_terms(query):
+        condition |= term_filter(kind, field, prefix)
+    return condition or None
+
+
+def lookup_customers(query, limit=10, queryset=None):
+    """
+    即时搜索：每类检索按索引顺序取前 limit 条，合并去重后按匹配类型排序
+    返回 [(客户, 匹配类型), ...]，最多 limit 条
+    """
+    from .models import Customer  # 避免循环导入
+    if queryset is None:
+        queryset = Customer.objects.only('id', 'name', 'phone', 'id_card', 'member_level')
+
+    results = []
+    seen = set()
+    for kind, field, prefix in lookup_terms(query):
+        matches = queryset.filter(term_filter(kind, field, prefix))
+        if kind in CONTAINS_KINDS:
+            matches = matches.exclude(pk__in=seen)
+        for customer in matches.order_by(field)[:limit]:
+            if customer.pk not in seen:
+                seen.add(customer.pk)
+                results.append((customer, kind))
+        if len(results) >= limit:
+            break
+    return results[:limit]
+
+
+def mask_id_card(id_card):
+    """身份证号只显示前3位和后4位"""
+    if not id_card or len(id_card) < 8:
+        return id_card or ''
+    return f'{id_card[:3]}{"*" * (len(id_card) - 7)}{id_card[-4:]}'
+
+
+def rebuild_reversed_columns(customer_model=None, batch_size=REBUILD_BATCH_SIZE):
+    """
+    重新计算所有客户的倒序号码列（迁移中传入历史模型；QuerySet.update / bulk_create 等绕过 save() 的写入之后调用）
+    返回更新的客户数
+    """
+    from django.db import connection, transaction
+    if customer_model is None:
+        from .models import Customer as customer_model
+
+    table = connection.ops.quote_name(customer_model._meta.db_table)
+    sql = f'UPDATE {table} SET phone_reversed = %s, id_card_reversed = %s WHERE id = %s'
+    rows = customer_model.objects.order_by().values_list('id', 'phone', 'id_card', 'phone_reversed', 'id_card_reversed')
+
+    updated = 0
+    batch = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        for customer_id, phone, id_card, phone_reversed, id_card_reversed in rows.iterator(chunk_size=batch_size):
+            values = ((phone or '')[::-1], (id_card or '').upper()[::-1])
+            if values != (phone_reversed, id_card_reversed):
+                batch.append((*values, customer_id))
+            if len(batch) >= batch_size:
+                cursor.executemany(sql, batch)
+                updated += len(batch)
+                batch = []
+        if batch:
+            cursor.executemany(sql, batch)
+            updated += len(batch)
+    return updated
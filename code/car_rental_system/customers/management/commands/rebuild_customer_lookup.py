@@ -0,0 +1,19 @@
+"""
+重算客户检索用的倒序号码列
+倒序号码列在客户保存时自动维护；QuerySet.update、bulk_create 等绕过 save() 的批量写入之后运行本命令。
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from customers.lookup import rebuild_reversed_columns
+
+
+class Command(BaseCommand):
+    help = '重算所有客户的倒序手机号、倒序身份证号（按尾号检索使用）'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        updated = rebuild_reversed_columns()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'✓ 已更新 {updated} 个客户的检索列，耗时 {elapsed:.1f} 秒'))
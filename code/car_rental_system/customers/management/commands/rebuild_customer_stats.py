@@ -0,0 +1,22 @@
+"""
+全量重建客户订单统计列
+订单数、订单金额合计、未结束订单数、最近下单时间在订单保存/删除时自动维护；
+bulk_create、QuerySet.update 等绕过信号的批量写入之后，或怀疑统计与订单数据不一致时运行本命令。
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from customers.stats import rebuild_customer_stats
+
+
+class Command(BaseCommand):
+    help = '按全部订单一条分组查询，重建所有客户的订单数、订单金额合计、未结束订单数和最近下单时间'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        customers, rentals = rebuild_customer_stats()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ 已重建客户订单统计：{customers} 个客户共 {rentals} 个订单，耗时 {elapsed:.1f} 秒'
+        ))
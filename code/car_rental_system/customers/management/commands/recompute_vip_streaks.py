@@ -0,0 +1,36 @@
+"""
+全量重算客户连续诚信订单数
+VIP 升级规则调整后，或怀疑计数与订单数据不一致时运行。
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from customers.models import VIP_UPGRADE_STREAK, Customer
+from customers.streaks import recompute_all_streaks
+
+
+class Command(BaseCommand):
+    help = '按已完成订单一次流式扫描，全量重算所有客户的连续诚信订单数（VIP升级依据）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='流式读取订单时每批的行数（默认：5000）',
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        updated, scanned = recompute_all_streaks(chunk_size=options['chunk_size'])
+        elapsed = time.monotonic() - started
+
+        eligible = Customer.objects.filter(
+            consecutive_good_rentals__gte=VIP_UPGRADE_STREAK
+        ).exclude(member_level='VIP').count()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ 已重算连续诚信订单数：扫描 {scanned} 个已完成订单，{updated} 个客户计数大于0，耗时 {elapsed:.1f} 秒'
+        ))
+        self.stdout.write(f'  符合VIP升级条件但尚未升级的客户：{eligible} 个')
@@ -0,0 +1,80 @@
+# Generated manually for incremental VIP streak tracking
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+# 按计数值批量更新时每条 UPDATE 的客户ID数量（SQLite 参数个数有限制）
+UPDATE_BATCH_SIZE = 500
+
+
+def _is_good_rental(overdue_fee, actual_return_location, pickup_location, is_cross_location_return):
+    """编写迁移时的诚信订单规则（customers.models.is_good_rental 的副本，迁移不依赖之后会修改的代码）"""
+    if overdue_fee and overdue_fee > 0:
+        return False
+    if actual_return_location and pickup_location:
+        actual_is_cross = actual_return_location.strip() != pickup_location.strip()
+        if actual_is_cross != is_cross_location_return:
+            return False
+    return True
+
+
+def populate_streaks(apps, schema_editor):
+    """
+    按现有已完成订单计算每个客户的连续诚信订单数
+    按 (客户, 创建时间倒序) 顺序扫描，每个客户数到第一个不满足条件的订单为止，再按计数值分组批量 UPDATE
+    """
+    Customer = apps.get_model('customers', 'Customer')
+    Rental = apps.get_model('rentals', 'Rental')
+    rows = Rental.objects.filter(
+        status='COMPLETED',
+        actual_return_date__isnull=False,
+    ).order_by('customer_id', '-created_at', '-id').values_list(
+        'customer_id', 'overdue_fee', 'actual_return_location', 'pickup_location', 'is_cross_location_return'
+    )
+
+    streaks = {}
+    current_customer = None
+    counting = False
+    for customer_id, *fields in rows.iterator(chunk_size=5000):
+        if customer_id != current_customer:
+            current_customer = customer_id
+            counting = True
+        if not counting:
+            continue
+        if _is_good_rental(*fields):
+            streaks[customer_id] = streaks.get(customer_id, 0) + 1
+        else:
+            counting = False
+
+    by_value = defaultdict(list)
+    for customer_id, value in streaks.items():
+        by_value[value].append(customer_id)
+    for value, customer_ids in by_value.items():
+        for start in range(0, len(customer_ids), UPDATE_BATCH_SIZE):
+            Customer.objects.filter(
+                pk__in=customer_ids[start:start + UPDATE_BATCH_SIZE]
+            ).update(consecutive_good_rentals=value)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0004_add_credit_score'),
+        ('rentals', '0006_rentalslot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='consecutive_good_rentals',
+            field=models.PositiveIntegerField(
+                default=0,
+                editable=False,
+                help_text='最近连续无超时、异地还车诚信的已完成订单数（订单完成时增量更新，用于VIP升级判断）',
+                verbose_name='连续诚信订单数'
+            ),
+        ),
+        migrations.RunPython(populate_streaks, migrations.RunPython.noop),
+    ]
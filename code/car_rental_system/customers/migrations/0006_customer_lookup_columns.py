@@ -0,0 +1,63 @@
+# Generated manually for indexed customer lookup
+
+from django.db import migrations, models
+
+
+# 每批写入的客户数
+BATCH_SIZE = 2000
+
+
+def populate_reversed_columns(apps, schema_editor):
+    """按编写迁移时的规则（customers.lookup.rebuild_reversed_columns 的副本）填充倒序号码列"""
+    Customer = apps.get_model('customers', 'Customer')
+    connection = schema_editor.connection
+    table = connection.ops.quote_name(Customer._meta.db_table)
+    sql = f'UPDATE {table} SET phone_reversed = %s, id_card_reversed = %s WHERE id = %s'
+    rows = Customer.objects.order_by().values_list('id', 'phone', 'id_card')
+
+    batch = []
+    with connection.cursor() as cursor:
+        for customer_id, phone, id_card in rows.iterator(chunk_size=BATCH_SIZE):
+            batch.append(((phone or '')[::-1], (id_card or '').upper()[::-1], customer_id))
+            if len(batch) >= BATCH_SIZE:
+                cursor.executemany(sql, batch)
+                batch = []
+        if batch:
+            cursor.executemany(sql, batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0005_customer_consecutive_good_rentals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='phone_reversed',
+            field=models.CharField(
+                blank=True,
+                db_index=True,
+                default='',
+                editable=False,
+                help_text='倒序保存的手机号（保存时自动维护），按手机尾号检索时走索引',
+                max_length=20,
+                verbose_name='反转手机号'
+            ),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='id_card_reversed',
+            field=models.CharField(
+                blank=True,
+                db_index=True,
+                default='',
+                editable=False,
+                help_text='倒序保存的身份证号（保存时自动维护），按身份证尾号检索时走索引',
+                max_length=18,
+                verbose_name='反转身份证号'
+            ),
+        ),
+        migrations.RunPython(populate_reversed_columns, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,105 @@
+# Generated manually for denormalized customer rental statistics
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Q, Sum
+
+
+# 编写迁移时的未结束订单状态（rentals.availability.ACTIVE_RENTAL_STATUSES 的副本，迁移不依赖之后会修改的代码）
+ACTIVE_RENTAL_STATUSES = ('PENDING', 'ONGOING', 'OVERDUE')
+
+# 每批写入的客户数
+BATCH_SIZE = 500
+
+STATS_COLUMNS = ['total_rentals', 'total_amount', 'active_rentals', 'last_rental_at']
+
+
+def populate_stats(apps, schema_editor):
+    """按现有订单一条分组查询计算每个客户的订单统计（新增列默认值即没有订单的客户的统计）"""
+    Customer = apps.get_model('customers', 'Customer')
+    Rental = apps.get_model('rentals', 'Rental')
+    rows = Rental.objects.order_by().values('customer_id').annotate(
+        total_rentals=Count('id'),
+        total_amount=Sum('total_amount'),
+        active_rentals=Count('id', filter=Q(status__in=ACTIVE_RENTAL_STATUSES)),
+        last_rental_at=Max('created_at'),
+    )
+    customers = []
+    for row in rows:
+        customers.append(Customer(
+            pk=row['customer_id'],
+            total_rentals=row['total_rentals'] or 0,
+            total_amount=row['total_amount'] or Decimal('0.00'),
+            active_rentals=row['active_rentals'] or 0,
+            last_rental_at=row['last_rental_at'],
+        ))
+        if len(customers) >= BATCH_SIZE:
+            Customer.objects.bulk_update(customers, STATS_COLUMNS)
+            customers = []
+    if customers:
+        Customer.objects.bulk_update(customers, STATS_COLUMNS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0006_customer_lookup_columns'),
+        ('rentals', '0008_rental_cursor_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='total_rentals',
+            field=models.PositiveIntegerField(
+                default=0,
+                editable=False,
+                help_text='客户的全部订单数（订单增删改时自动维护，见 customers/stats.py）',
+                verbose_name='订单数'
+            ),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='total_amount',
+            field=models.DecimalField(
+                decimal_places=2,
+                default=0,
+                editable=False,
+                help_text='客户全部订单的租金合计（订单增删改时自动维护）',
+                max_digits=12,
+                verbose_name='订单金额合计'
+            ),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='active_rentals',
+            field=models.PositiveIntegerField(
+                default=0,
+                editable=False,
+                help_text='预订中、进行中、已超时的订单数（订单增删改时自动维护）',
+                verbose_name='未结束订单数'
+            ),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='last_rental_at',
+            field=models.DateTimeField(
+                blank=True,
+                editable=False,
+                help_text='客户最近一个订单的创建时间（订单增删改时自动维护）',
+                null=True,
+                verbose_name='最近下单时间'
+            ),
+        ),
+        # 按消费额、最近下单排序（客户列表）
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['total_amount', 'id'], name='idx_customer_total_amount'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['last_rental_at', 'id'], name='idx_customer_last_rental'),
+        ),
+        migrations.RunPython(populate_stats, migrations.RunPython.noop),
+    ]
@@ -3,8 +3,37 @@ from django.core.validators import RegexValidator
 from django.contrib.auth.models import User
 import re
 
+from car_rental_system.managed_columns import ManagedColumnsMixin
+
+
+# VIP 升级所需的连续诚信订单数
+VIP_UPGRADE_STREAK = 10
+
+# 订单统计列：只由订单信号原子更新（见 customers/stats.py，连续诚信订单数见 _set_vip_streak），保存客户资料时不写回
+STATS_COLUMNS = ('total_rentals', 'total_amount', 'active_rentals', 'last_rental_at', 'consecutive_good_rentals')
+
+
+def is_good_rental(overdue_fee, actual_return_location, pickup_location, is_cross_location_return):
+    """
+    已完成订单是否计入连续诚信订单：
+    1. 没有超时归还（overdue_fee == 0）
+    2. 没有不诚信的异地还车（选择了异地还车实际也异地还车，或没选择异地还车实际也没异地还车）
+    """
+    # 检查是否超时归还
+    if overdue_fee and overdue_fee > 0:
+        return False
+    
+    # 检查是否不诚信的异地还车
+    if actual_return_location and pickup_location:
+        actual_is_cross = actual_return_location.strip() != pickup_location.strip()
+        if actual_is_cross != is_cross_location_return:
+            return False
+    return True
+
+
+class Customer(ManagedColumnsMixin, models.Model):
+    managed_columns = STATS_COLUMNS
 
-class Customer(models.Model):
     MEMBER_LEVEL_CHOICES = [
         ('NORMAL', '普通会员'),
         ('VIP', 'VIP会员'),
@@ -82,6 +111,57 @@ class Customer(models.Model):
         default=100,
         help_text='客户信用评分（0-100，初始100，用于押金计算）'
     )
+    consecutive_good_rentals = models.PositiveIntegerField(
+        '连续诚信订单数',
+        default=0,
+        editable=False,
+        help_text='最近连续无超时、异地还车诚信的已完成订单数（订单完成时增量更新，用于VIP升级判断）'
+    )
+    total_rentals = models.PositiveIntegerField(
+        '订单数',
+        default=0,
+        editable=False,
+        help_text='客户的全部订单数（订单增删改时自动维护，见 customers/stats.py）'
+    )
+    total_amount = models.DecimalField(
+        '订单金额合计',
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        editable=False,
+        help_text='客户全部订单的租金合计（订单增删改时自动维护）'
+    )
+    active_rentals = models.PositiveIntegerField(
+        '未结束订单数',
+        default=0,
+        editable=False,
+        help_text='预订中、进行中、已超时的订单数（订单增删改时自动维护）'
+    )
+    last_rental_at = models.DateTimeField(
+        '最近下单时间',
+        blank=True,
+        null=True,
+        editable=False,
+        help_text='客户最近一个订单的创建时间（订单增删改时自动维护）'
+    )
+    phone_reversed = models.CharField(
+        '反转手机号',
+        max_length=20,
+        blank=True,
+        default='',
+        editable=False,
+        db_index=True,
+        help_text='倒序保存的手机号（保存时自动维护），按手机尾号检索时走索引'
+    )
+    id_card_reversed = models.CharField(
+        '反转身份证号',
+        max_length=18,
+        blank=True,
+        default='',
+        editable=False,
+        db_index=True,
+        help_text='倒序保存的身份证号（保存时自动维护），按身份证尾号检索时走索引'
+    )
     created_at = models.DateTimeField(
         '创建时间',
         auto_now_add=True
@@ -105,53 +185,90 @@ class Customer(models.Model):
             models.Index(fields=['created_at'], name='idx_created_at'),
             # 复合索引：用于搜索优化
             models.Index(fields=['name', 'member_level'], name='idx_name_level'),
+            # 按消费额、最近下单排序（客户列表）
+            models.Index(fields=['total_amount', 'id'], name='idx_customer_total_amount'),
+            models.Index(fields=['last_rental_at', 'id'], name='idx_customer_last_rental'),
         ]
     
+    def save(self, *args, **kwargs):
+        # 维护倒序号码列（按尾号检索用，见 customers/lookup.py）
+        self.phone_reversed = (self.phone or '')[::-1]
+        self.id_card_reversed = (self.id_card or '').upper()[::-1]
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if 'phone' in update_fields:
+                update_fields.add('phone_reversed')
+            if 'id_card' in update_fields:
+                update_fields.add('id_card_reversed')
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+    
     def check_vip_upgrade_eligibility(self):
         """
         检查客户是否符合VIP升级条件
-        条件：连续10个已完成订单都满足：
-        1. 没有超时归还（overdue_fee == 0）
-        2. 没有不诚信的异地还车（选择了异地还车实际也异地还车，或没选择异地还车实际也没异地还车）
+        条件：最近连续10个已完成订单都满足 is_good_rental 的要求
+        连续诚信订单数保存在 consecutive_good_rentals 中，订单完成时增量更新，这里不再扫描历史订单
         
         返回：(是否符合条件, 连续诚信订单数)
         """
-        from rentals.models import Rental
-        from decimal import Decimal
+        consecutive_good_count = self.consecutive_good_rentals
         
-        # 获取所有已完成的订单，按创建时间倒序排列（最新的在前）
+        # 如果连续10个订单都满足条件
+        is_eligible = consecutive_good_count >= VIP_UPGRADE_STREAK
+        return is_eligible, consecutive_good_count
+    
+    def _set_vip_streak(self, value):
+        """写入连续诚信订单数（value 可以是 F 表达式），并同步到当前对象"""
+        Customer.objects.filter(pk=self.pk).update(consecutive_good_rentals=value)
+        if isinstance(value, int):
+            self.consecutive_good_rentals = value
+        else:
+            self.consecutive_good_rentals = Customer.objects.filter(pk=self.pk).values_list(
+                'consecutive_good_rentals', flat=True
+            ).first() or 0
+    
+    def record_completed_rental(self, rental):
+        """
+        订单完成时增量更新连续诚信订单数（O(1)）
+        完成的订单是该客户最新的已完成订单时：诚信则计数加一，否则清零；
+        较早创建的订单晚于更新的订单完成时，连续区间可能改变，此时重新计算。
+        """
+        from rentals.models import Rental
+        has_newer = Rental.objects.filter(
+            customer_id=self.pk,
+            status='COMPLETED',
+            actual_return_date__isnull=False,
+            created_at__gt=rental.created_at,
+        ).exists()
+        if has_newer:
+            self.recompute_vip_streak()
+        elif is_good_rental(
+            rental.overdue_fee, rental.actual_return_location,
+            rental.pickup_location, rental.is_cross_location_return
+        ):
+            self._set_vip_streak(models.F('consecutive_good_rentals') + 1)
+        else:
+            self._set_vip_streak(0)
+    
+    def recompute_vip_streak(self):
+        """从已完成订单重新计算连续诚信订单数（从最近的订单开始，遇到不满足条件的订单即停止）"""
+        from rentals.models import Rental
         completed_rentals = Rental.objects.filter(
-            customer=self,
+            customer_id=self.pk,
             status='COMPLETED',
             actual_return_date__isnull=False
-        ).order_by('-created_at')
+        ).order_by('-created_at', '-id').values_list(
+            'overdue_fee', 'actual_return_location', 'pickup_location', 'is_cross_location_return'
+        )
         
         consecutive_good_count = 0
-        
-        # 从最近的订单开始检查，连续计数满足条件的订单
-        for rental in completed_rentals:
-            # 检查是否超时归还
-            has_overdue = rental.overdue_fee and rental.overdue_fee > Decimal('0.00')
-            
-            # 检查是否不诚信的异地还车
-            is_dishonest_cross_location = False
-            if rental.actual_return_location and rental.pickup_location:
-                actual_is_cross = rental.actual_return_location.strip() != rental.pickup_location.strip()
-                expected_is_cross = rental.is_cross_location_return
-                # 如果不匹配，说明不诚信
-                if actual_is_cross != expected_is_cross:
-                    is_dishonest_cross_location = True
-            
-            # 如果订单满足条件（没有超时且诚信）
-            if not has_overdue and not is_dishonest_cross_location:
-                consecutive_good_count += 1
-            else:
-                # 一旦遇到不满足条件的订单，就中断计数
+        for row in completed_rentals.iterator(chunk_size=100):
+            if not is_good_rental(*row):
                 break
-        
-        # 如果连续10个订单都满足条件
-        is_eligible = consecutive_good_count >= 10
-        return is_eligible, consecutive_good_count
+            consecutive_good_count += 1
+        self._set_vip_streak(consecutive_good_count)
+        return consecutive_good_count
     
     def upgrade_to_vip(self):
         """将客户升级为VIP"""
@@ -0,0 +1,11 @@
+"""
+客户信号处理
+客户增删改后在事务提交时递增 'customer' 及该客户的缓存标签版本号（见 car_rental_system/cache_tags.py）。
+订单统计列等通过 QuerySet.update 维护的字段不触发信号，依赖它们的缓存应同时登记订单标签。
+"""
+from car_rental_system.cache_tags import TAG_CUSTOMER, customer_tag, register_model
+
+from .models import Customer
+
+
+register_model(Customer, lambda customer: [TAG_CUSTOMER, customer_tag(customer.pk)])
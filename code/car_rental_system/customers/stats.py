@@ -0,0 +1,131 @@
+"""
+客户订单统计（冗余列）
+Customer 上保存订单数 total_rentals、订单金额合计 total_amount、未结束订单数 active_rentals、最近下单时间 last_rental_at，
+客户列表、客户详情、个人中心直接读取，不再每次对订单做 JOIN + GROUP BY；按消费额、最近下单排序走索引。
+- 订单创建、同一客户的订单金额/状态变化：按新旧字段值之差原子地增量更新（UPDATE ... SET total_rentals = total_rentals + 1）
+- 订单删除、改派客户、创建时间被修改：对相关客户按其订单重新聚合（客户订单索引上的一条查询）
+维护入口在 rentals/signals.py；bulk_create、QuerySet.update 等绕过信号的写入后运行 rebuild_customer_stats 命令。
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DateTimeField, F, Max, Q, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from rentals.availability import ACTIVE_RENTAL_STATUSES
+
+
+# 影响客户统计的订单字段
+STATS_FIELDS = ('customer_id', 'total_amount', 'status', 'created_at')
+
+# 全量重建时每批写入的客户数
+REBUILD_BATCH_SIZE = 500
+
+EMPTY_STATS = {
+    'total_rentals': 0,
+    'total_amount': Decimal('0.00'),
+    'active_rentals': 0,
+    'last_rental_at': None,
+}
+
+
+def _aggregates():
+    return {
+        'total_rentals': Count('id'),
+        'total_amount': Sum('total_amount'),
+        'active_rentals': Count('id', filter=Q(status__in=ACTIVE_RENTAL_STATUSES)),
+        'last_rental_at': Max('created_at'),
+    }
+
+
+def _normalize(row):
+    return {
+        'total_rentals': row['total_rentals'] or 0,
+        'total_amount': row['total_amount'] or Decimal('0.00'),
+        'active_rentals': row['active_rentals'] or 0,
+        'last_rental_at': row['last_rental_at'],
+    }
+
+
+def recompute_customer_stats(customer_id):
+    """按客户的全部订单重新聚合并写入统计列"""
+    from rentals.models import Rental  # 避免循环导入
+    from .models import Customer
+    if not customer_id:
+        return
+    row = Rental.objects.filter(customer_id=customer_id).aggregate(**_aggregates())
+    Customer.objects.filter(pk=customer_id).update(**_normalize(row))
+
+
+def _is_active(values):
+    return values['status'] in ACTIVE_RENTAL_STATUSES
+
+
+def apply_rental_change(old, new):
+    """
+    按订单新旧字段值（STATS_FIELDS 组成的字典，新建订单 old 为 None，删除订单 new 为 None）更新客户统计
+    """
+    from .models import Customer  # 避免循环导入
+    if old is not None and new is not None and old == new:
+        return
+
+    if old is None and new is not None:
+        amount = new['total_amount'] or Decimal('0.00')
+        created_at = new['created_at']
+        Customer.objects.filter(pk=new['customer_id']).update(
+            total_rentals=F('total_rentals') + 1,
+            total_amount=F('total_amount') + amount,
+            active_rentals=F('active_rentals') + int(_is_active(new)),
+            last_rental_at=Greatest(
+                Coalesce('last_rental_at', Value(created_at, output_field=DateTimeField())),
+                Value(created_at, output_field=DateTimeField()),
+            ),
+        )
+        return
+
+    if (
+        old is not None and new is not None
+        and old['customer_id'] == new['customer_id']
+        and old['created_at'] == new['created_at']
+    ):
+        amount_delta = (new['total_amount'] or Decimal('0.00')) - (old['total_amount'] or Decimal('0.00'))
+        active_delta = int(_is_active(new)) - int(_is_active(old))
+        if amount_delta or active_delta:
+            Customer.objects.filter(pk=new['customer_id']).update(
+                total_amount=F('total_amount') + amount_delta,
+                active_rentals=F('active_rentals') + active_delta,
+            )
+        return
+
+    # 删除订单、改派客户、修改创建时间：最近下单时间无法增量得出，重新聚合
+    customer_ids = {values['customer_id'] for values in (old, new) if values is not None}
+    for customer_id in customer_ids:
+        recompute_customer_stats(customer_id)
+
+
+def rebuild_customer_stats(customer_model=None, rental_model=None):
+    """
+    按全部订单一条分组查询重建所有客户的统计列（迁移中传入历史模型）
+    返回 (有订单的客户数, 订单数)
+    """
+    if customer_model is None:
+        from .models import Customer as customer_model
+    if rental_model is None:
+        from rentals.models import Rental as rental_model
+
+    rows = rental_model.objects.order_by().values('customer_id').annotate(**_aggregates())
+    stats = {row['customer_id']: _normalize(row) for row in rows}
+
+    with transaction.atomic():
+        customer_model.objects.exclude(total_rentals=0, active_rentals=0, last_rental_at__isnull=True).update(
+            **EMPTY_STATS
+        )
+        customers = []
+        for customer_id, values in stats.items():
+            customers.append(customer_model(pk=customer_id, **values))
+            if len(customers) >= REBUILD_BATCH_SIZE:
+                customer_model.objects.bulk_update(customers, list(EMPTY_STATS))
+                customers = []
+        if customers:
+            customer_model.objects.bulk_update(customers, list(EMPTY_STATS))
+    return len(stats), sum(values['total_rentals'] for values in stats.values())
@@ -0,0 +1,76 @@
+"""
+全量重算客户连续诚信订单数
+按 (客户, 创建时间倒序) 一次顺序扫描全部已完成订单，每个客户数到第一个不满足条件的订单为止；
+写入时先整体清零，再按计数值分组批量 UPDATE（不同计数值很少），避免逐客户保存。
+规则调整（修改 is_good_rental 或 VIP_UPGRADE_STREAK）后运行 recompute_vip_streaks 命令即可重新评分。
+"""
+from collections import defaultdict
+
+from .models import is_good_rental
+
+
+# 按计数值批量更新时每条 UPDATE 的客户ID数量（SQLite 参数个数有限制）
+UPDATE_BATCH_SIZE = 500
+
+
+def compute_all_streaks(rental_model, chunk_size=5000):
+    """
+    流式计算每个客户的连续诚信订单数
+    返回 ({客户ID: 连续诚信订单数}（只含大于0的客户）, 扫描的订单数)
+    """
+    rows = rental_model.objects.filter(
+        status='COMPLETED',
+        actual_return_date__isnull=False,
+    ).order_by('customer_id', '-created_at', '-id').values_list(
+        'customer_id', 'overdue_fee', 'actual_return_location', 'pickup_location', 'is_cross_location_return'
+    )
+
+    streaks = {}
+    scanned = 0
+    current_customer = None
+    counting = False
+    for customer_id, *fields in rows.iterator(chunk_size=chunk_size):
+        scanned += 1
+        if customer_id != current_customer:
+            current_customer = customer_id
+            counting = True
+        if not counting:
+            # 该客户已遇到不满足条件的订单，跳过其更早的订单
+            continue
+        if is_good_rental(*fields):
+            streaks[customer_id] = streaks.get(customer_id, 0) + 1
+        else:
+            counting = False
+    return streaks, scanned
+
+
+def write_all_streaks(customer_model, streaks):
+    """整体清零后按计数值分组批量写入，返回计数大于0的客户数"""
+    by_value = defaultdict(list)
+    for customer_id, value in streaks.items():
+        by_value[value].append(customer_id)
+
+    customer_model.objects.exclude(consecutive_good_rentals=0).update(consecutive_good_rentals=0)
+    for value, customer_ids in by_value.items():
+        for start in range(0, len(customer_ids), UPDATE_BATCH_SIZE):
+            customer_model.objects.filter(
+                pk__in=customer_ids[start:start + UPDATE_BATCH_SIZE]
+            ).update(consecutive_good_rentals=value)
+    return len(streaks)
+
+
+def recompute_all_streaks(customer_model=None, rental_model=None, chunk_size=5000):
+    """
+    全量重算所有客户的连续诚信订单数（迁移中传入历史模型）
+    返回 (计数大于0的客户数, 扫描的订单数)
+    """
+    from django.db import transaction
+    if customer_model is None:
+        from .models import Customer as customer_model
+    if rental_model is None:
+        from rentals.models import Rental as rental_model
+
+    streaks, scanned = compute_all_streaks(rental_model, chunk_size)
+    with transaction.atomic():
+        updated = write_all_streaks(customer_model, streaks)
+    return updated, scanned
@@ -1,3 +1,340 @@
-from django.test import TestCase
+from datetime import date, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import F
+from django.db.models.signals import post_save
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+
+from car_rental_system.pagination import CursorPaginator, decode_cursor, encode_cursor, paginate
+
+from rentals.models import Rental
+from vehicles.models import Vehicle
+
+from .models import STATS_COLUMNS, Customer
+from .stats import rebuild_customer_stats
+from .streaks import compute_all_streaks
+
+
+class CustomerLookupApiTests(TestCase):
+    """客户即时搜索接口只对管理员开放，姓名支持包含匹配"""
+
+    def setUp(self):
+        Customer.objects.create(
+            name='张三丰',
+            phone='13600136000',
+            id_card='110101199001010035',
+            license_number='LICLOOKUP1',
+        )
+        Customer.objects.create(
+            name='李张伟',
+            phone='13600136001',
+            id_card='110101199001010043',
+            license_number='LICLOOKUP2',
+        )
+        self.url = reverse('customers:customer_lookup')
+
+    def test_anonymous_forbidden(self):
+        response = self.client.get(self.url, {'q': '136'})
+        self.assertEqual(response.status_code, 403)
+
+    def test_non_staff_forbidden(self):
+        user = User.objects.create_user(username='member', password='pass12345')
+        self.client.force_login(user)
+        response = self.client.get(self.url, {'q': '136'})
+        self.assertEqual(response.status_code, 403)
+
+    def test_staff_name_prefix_then_substring(self):
+        staff = User.objects.create_user(username='clerk', password='pass12345', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(self.url, {'q': '张'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(item['name'], item['match']) for item in response.json()['results']],
+            [('张三丰', 'name'), ('李张伟', 'name_contains')],
+        )
+
+    def test_staff_phone_middle_digits(self):
+        staff = User.objects.create_user(username='clerk', password='pass12345', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(self.url, {'q': '0013'})
+        self.assertEqual(
+            sorted((item['name'], item['match']) for item in response.json()['results']),
+            [('张三丰', 'phone_contains'), ('李张伟', 'phone_contains')],
+        )
+
+
+class CustomerListSearchTests(TestCase):
+    """客户列表页按手机号中间几位、姓名中间的字检索（与原来的包含匹配一致）"""
+
+    def setUp(self):
+        self.customers = [
+            Customer.objects.create(
+                name=name,
+                phone=phone,
+                id_card=id_card,
+                license_number=f'LICLIST{index}',
+            )
+            for index, (name, phone, id_card) in enumerate([
+                ('王小明', '13800138001', '110101199001010086'),
+                ('赵小红', '13900139002', '110101199001010094'),
+                ('孙大伟', '15000150003', '11010119900101010X'),
+            ])
+        ]
+
+    def search(self, query):
+        response = self.client.get(reverse('customers:customer_list'), {'search': query})
+        self.assertEqual(response.status_code, 200)
+        return sorted(customer.name for customer in response.context['page_obj'])
+
+    def test_phone_middle_digits(self):
+        self.assertEqual(self.search('0013'), ['王小明', '赵小红'])
+        self.assertEqual(self.search('8001'), ['王小明'])
+
+    def test_phone_prefix_and_tail(self):
+        self.assertEqual(self.search('150'), ['孙大伟'])
+        self.assertEqual(self.search('9002'), ['赵小红'])
+
+    def test_name_substring(self):
+        self.assertEqual(self.search('小'), ['王小明', '赵小红'])
+
+class ManagedColumnsTests(TestCase):
+    """整体保存跳过原子维护的列：对这些列的赋值被忽略，显式 update_fields 照常写入，行已删除时改为 INSERT"""
+
+    def setUp(self):
+        self.customer = Customer.objects.create(
+            name='周统计',
+            phone='13700137000',
+            id_card='110101199001010051',
+            license_number='LICMANAGED',
+        )
+
+    def test_full_save_keeps_concurrent_update(self):
+        stale = Customer.objects.get(pk=self.customer.pk)
+        Customer.objects.filter(pk=self.customer.pk).update(total_rentals=F('total_rentals') + 3)
+        stale.name = '周改名'
+        stale.save()
+        self.customer.refresh_from_db()
+        self.assertEqual((self.customer.name, self.customer.total_rentals), ('周改名', 3))
+
+    def test_full_save_drops_assignment(self):
+        self.customer.total_amount = Decimal('999.00')
+        self.customer.save()
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.total_amount, Decimal('0.00'))
+
+    def test_explicit_update_fields_writes(self):
+        self.customer.total_amount = Decimal('999.00')
+        self.customer.save(update_fields=['total_amount'])
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.total_amount, Decimal('999.00'))
+
+    def test_full_save_of_deleted_row_inserts(self):
+        pk = self.customer.pk
+        self.customer.total_rentals = 2
+        Customer.objects.filter(pk=pk).delete()
+        self.customer.save()
+        self.assertEqual(Customer.objects.get(pk=pk).total_rentals, 2)
+
+    def test_signal_sees_full_save(self):
+        received = []
+
+        def receiver(sender, update_fields=None, **kwargs):
+            received.append(update_fields)
+
+        post_save.connect(receiver, sender=Customer)
+        self.addCleanup(post_save.disconnect, receiver, sender=Customer)
+        self.customer.save()
+        self.assertEqual(received, [None])
+
+
+class VipStreakTests(TestCase):
+    """连续诚信订单数在订单完成时增量累加，修改已完成订单后与全量重算一致"""
+
+    def setUp(self):
+        self.customer = Customer.objects.create(
+            name='连续客户',
+            phone='13500135100',
+            id_card='110101199001010078',
+            license_number='LICSTREAK',
+        )
+        vehicle = Vehicle.objects.create(
+            license_plate='京V10001',
+            brand='沃尔沃',
+            model='S60',
+            vehicle_type='SEDAN',
+            color='蓝色',
+            daily_rate=Decimal('300.00'),
+        )
+        start = date.today() - timedelta(days=40)
+        self.rentals = []
+        for index in range(4):
+            rental = Rental.objects.create(
+                customer=self.customer,
+                vehicle=vehicle,
+                start_date=start + timedelta(days=index * 5),
+                end_date=start + timedelta(days=index * 5 + 1),
+                total_amount=Decimal('600.00'),
+                pickup_location='朝阳门店',
+                status='ONGOING',
+            )
+            # 与订单流程一样：读出订单后办理还车
+            rental = Rental.objects.get(pk=rental.pk)
+            rental.status = 'COMPLETED'
+            rental.actual_return_date = rental.end_date
+            rental.actual_return_location = '朝阳门店'
+            rental.save()
+            self.rentals.append(rental)
+
+    def streak(self):
+        return Customer.objects.get(pk=self.customer.pk).consecutive_good_rentals
+
+    def assert_matches_full_recompute(self):
+        streaks, _ = compute_all_streaks(Rental)
+        self.assertEqual(self.streak(), streaks.get(self.customer.pk, 0))
+
+    def test_completions_increment(self):
+        self.assertEqual(self.streak(), 4)
+        self.assert_matches_full_recompute()
+
+    def test_edit_completed_rental(self):
+        rental = Rental.objects.get(pk=self.rentals[2].pk)
+        rental.overdue_fee = Decimal('150.00')
+        rental.save()
+        self.assertEqual(self.streak(), 1)
+        self.assert_matches_full_recompute()
+
+        rental = Rental.objects.get(pk=rental.pk)
+        rental.overdue_fee = Decimal('0.00')
+        rental.save()
+        self.assertEqual(self.streak(), 4)
+        self.assert_matches_full_recompute()
+
+    def test_dishonest_cross_location_return_resets(self):
+        rental = Rental.objects.get(pk=self.rentals[3].pk)
+        rental.actual_return_location = '海淀门店'
+        rental.save()
+        self.assertEqual(self.streak(), 0)
+        self.assert_matches_full_recompute()
+
+
+class CursorPaginationTests(TestCase):
+    """游标翻页前后往返得到同一页，页码参数仍按页码分页，无法解析的游标回到第一页"""
+
+    def setUp(self):
+        cache.clear()
+        for index in range(7):
+            Customer.objects.create(
+                name=f'分页客户{index}',
+                phone=f'1370013700{index}',
+                id_card=f'11010119900101{index:03d}1',
+                license_number=f'LICPAGE{index}',
+            )
+        self.ordered = list(Customer.objects.order_by('-created_at', '-id'))
+        self.factory = RequestFactory()
+
+    def page(self, **params):
+        return paginate(self.factory.get('/customers/', params), Customer.objects.all(), 3)
+
+    def test_cursor_round_trip(self):
+        direction, values = decode_cursor(encode_cursor('next', [self.ordered[0].created_at, 42]))
+        self.assertEqual((direction, values[1]), ('next', 42))
+
+        pages = [self.page()]
+        while pages[-1].next_cursor:
+            pages.append(self.page(cursor=pages[-1].next_cursor))
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual([customer for page in pages for customer in page], self.ordered)
+        self.assertFalse(pages[0].has_previous())
+        self.assertFalse(pages[-1].has_next())
+
+        previous = self.page(cursor=pages[2].previous_cursor)
+        self.assertEqual(list(previous), list(pages[1]))
+        self.assertEqual(previous.next_cursor, pages[1].next_cursor)
+        self.assertEqual(list(self.page(cursor=previous.previous_cursor)), list(pages[0]))
+
+    def test_page_number_fallback(self):
+        page = self.page(page=2)
+        self.assertFalse(page.is_cursor)
+        self.assertEqual(list(page), self.ordered[3:6])
+        self.assertEqual(page.total_count, 7)
+        self.assertEqual(page.next_query, '?page=3')
+
+    def test_invalid_cursor_returns_first_page(self):
+        self.assertEqual(list(self.page(cursor='not-a-cursor')), self.ordered[:3])
+
+    def test_estimated_count(self):
+        page = CursorPaginator(Customer.objects.all(), 3, estimate_count=True).page()
+        self.assertEqual(page.total_count, 7)
+        self.assertIsNone(CursorPaginator(Customer.objects.all(), 3).page().total_count)
+
+
+class CustomerStatsTests(TestCase):
+    """订单增删改时增量维护的客户统计与全量重算一致（改派客户、取消、删除）"""
+
+    def setUp(self):
+        self.alice, self.bob = [
+            Customer.objects.create(
+                name=name,
+                phone=phone,
+                id_card=id_card,
+                license_number=license_number,
+            )
+            for name, phone, id_card, license_number in (
+                ('统计甲', '13300133100', '110101199001010108', 'LICSTATSA'),
+                ('统计乙', '13300133200', '110101199001010116', 'LICSTATSB'),
+            )
+        ]
+        vehicle = Vehicle.objects.create(
+            license_plate='京Z20001',
+            brand='比亚迪',
+            model='汉',
+            vehicle_type='SEDAN',
+            color='黑色',
+            daily_rate=Decimal('260.00'),
+        )
+        start = date.today() + timedelta(days=2)
+        self.rentals = [
+            Rental.objects.create(
+                customer=self.alice,
+                vehicle=vehicle,
+                start_date=start + timedelta(days=index * 4),
+                end_date=start + timedelta(days=index * 4 + 1),
+                total_amount=amount,
+            )
+            for index, amount in enumerate((Decimal('520.00'), Decimal('780.00')))
+        ]
+
+    def stats(self, customer):
+        return Customer.objects.filter(pk=customer.pk).values_list(*STATS_COLUMNS[:4]).get()
+
+    def assert_matches_rebuild(self):
+        incremental = [self.stats(self.alice), self.stats(self.bob)]
+        rebuild_customer_stats()
+        self.assertEqual(incremental, [self.stats(self.alice), self.stats(self.bob)])
+
+    def test_create(self):
+        self.assertEqual(self.stats(self.alice)[:3], (2, Decimal('1300.00'), 2))
+        self.assert_matches_rebuild()
+
+    def test_reassign_to_other_customer(self):
+        rental = Rental.objects.get(pk=self.rentals[1].pk)
+        rental.customer = self.bob
+        rental.save()
+        self.assertEqual(self.stats(self.alice)[:3], (1, Decimal('520.00'), 1))
+        self.assertEqual(self.stats(self.bob)[:3], (1, Decimal('780.00'), 1))
+        self.assert_matches_rebuild()
+
+    def test_cancel_and_delete(self):
+        rental = Rental.objects.get(pk=self.rentals[0].pk)
+        rental.status = 'CANCELLED'
+        rental.save()
+        self.assertEqual(self.stats(self.alice)[:3], (2, Decimal('1300.00'), 1))
+        self.assert_matches_rebuild()
+
+        Rental.objects.get(pk=self.rentals[1].pk).delete()
+        self.assertEqual(self.stats(self.alice)[:3], (1, Decimal('520.00'), 0))
+        self.assertEqual(self.stats(self.alice)[3], Rental.objects.get(pk=self.rentals[0].pk).created_at)
+        self.assert_matches_rebuild()
@@ -16,4 +16,5 @@ urlpatterns = [
     path('<int:pk>/delete/', views.customer_delete, name='customer_delete'),
     path('<int:pk>/membership/', views.customer_membership_update, name='customer_membership_update'),
     path('api/statistics/', views.get_customer_statistics, name='get_customer_statistics'),
+    path('api/lookup/', views.customer_lookup_api, name='customer_lookup'),
 ]
\ No newline at end of file
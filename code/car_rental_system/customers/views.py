@@ -1,31 +1,35 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.http import JsonResponse
 from django.core.paginator import Paginator
-from django.db.models import Q, Count, Sum, Prefetch
+from django.db.models import Q, Count, Prefetch
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib import messages
 from django.urls import reverse
 from decimal import Decimal
 import json
-from .models import Customer
-from .forms import CustomerForm, CustomerSearchForm, MembershipUpdateForm
+import time
+
+from car_rental_system.dashboard import get_snapshot
+from car_rental_system.pagination import paginate
+from .models import Customer, VIP_UPGRADE_STREAK
+from .lookup import MATCH_KINDS, MAX_LOOKUP_LIMIT, lookup_customers, lookup_filter, mask_id_card
+from .forms import CUSTOMER_SORTS, CustomerForm, CustomerSearchForm, MembershipUpdateForm
 from rentals.models import Rental
 
 
 def index(request):
     """客户管理首页"""
-    customer_count = Customer.objects.count()
-    vip_count = Customer.objects.filter(member_level='VIP').count()
-    normal_count = Customer.objects.filter(member_level='NORMAL').count()
+    # 客户数读取仪表板统计快照（见 car_rental_system/dashboard.py）
+    customer_stats = get_snapshot().customer_stats
     
     # 最近添加的客户
     recent_customers = Customer.objects.all()[:5]
     
     context = {
-        'customer_count': customer_count,
-        'vip_count': vip_count,
-        'normal_count': normal_count,
+        'customer_count': customer_stats['total'],
+        'vip_count': customer_stats['vip'],
+        'normal_count': customer_stats['normal'],
         'recent_customers': recent_customers,
     }
     return render(request, 'customers/index.html', context)
@@ -36,8 +40,9 @@ def customer_list(request):
     # 只选择必要的字段，避免加载不需要的数据
     customers = Customer.objects.only(
         'id', 'name', 'phone', 'email', 'id_card', 'license_number', 
-        'license_type', 'member_level'
+        'license_type', 'member_level', 'total_rentals', 'total_amount', 'created_at'
     )
+    ordering = CUSTOMER_SORTS['']
     
     # 处理搜索和筛选
     search_form = CustomerSearchForm(request.GET)
@@ -46,27 +51,25 @@ def customer_list(request):
         member_level = search_form.cleaned_data.get('member_level')
         
         if search:
-            customers = customers.filter(
-                Q(name__icontains=search) | 
-                Q(phone__icontains=search)
-            )
+            # 手机号前缀/尾号、身份证尾号、姓名前缀，均为索引上的范围查询（见 customers/lookup.py）
+            condition = lookup_filter(search)
+            if condition is not None:
+                customers = customers.filter(condition)
         
         if member_level:
             customers = customers.filter(member_level=member_level)
+        
+        sort = search_form.cleaned_data.get('sort') or ''
+        ordering = CUSTOMER_SORTS[sort]
+        if sort == 'recent':
+            # 没有订单的客户没有最近下单时间，按最近下单排序时不列出
+            customers = customers.filter(last_rental_at__isnull=False)
     
-    # 使用聚合查询获取统计信息（移除 prefetch_related，列表页不需要访问租赁详情）
-    customers = customers.annotate(
-        total_rentals=Count('rentals'),
-        total_amount=Sum('rentals__total_amount')
-    )
-    
-    # 分页（每页10条）
-    paginator = Paginator(customers, 10)
-    page_number = request.GET.get('page', 1)
-    page_obj = paginator.get_page(page_number)
+    # 分页（每页10条）：按排序键游标翻页（排序列均有索引），总数为缓存的估计值
+    # 订单数、订单金额合计直接读取客户表上的统计列（见 customers/stats.py）
+    page_obj = paginate(request, customers, 10, ordering=ordering, estimate_count=True)
     
-    # 优化：使用 paginator.count 统一计数，避免重复查询
-    total_customers = page_obj.paginator.count
+    total_customers = page_obj.total_count
     
     context = {
         'page_obj': page_obj,
@@ -76,18 +79,57 @@ def customer_list(request):
     return render(request, 'customers/customer_list.html', context)
 
 
+@require_http_methods(["GET"])
+def customer_lookup_api(request):
+    """
+    客户即时搜索API（柜台输入手机号、身份证尾号或姓氏时逐字调用）
+    GET 参数：q 检索内容，limit 返回条数（默认10，最多20）
+    返回客户手机号等个人信息，仅管理员可用。
+    """
+    if not request.user.is_authenticated or not request.user.is_staff:
+        return JsonResponse({'error': '没有管理员权限'}, status=403)
+    query = request.GET.get('q', '').strip()
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), MAX_LOOKUP_LIMIT)
+    except ValueError:
+        limit = 10
+    
+    started = time.perf_counter()
+    matches = lookup_customers(query, limit=limit)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    
+    match_labels = {kind: label for kind, _, label in MATCH_KINDS}
+    results = [
+        {
+            'id': customer.id,
+            'name': customer.name,
+            'phone': customer.phone,
+            'id_card': mask_id_card(customer.id_card),
+            'member_level': customer.member_level,
+            'member_level_display': customer.get_member_level_display(),
+            'match': kind,
+            'match_display': match_labels[kind],
+            'url': reverse('customers:customer_detail', args=[customer.id]),
+        }
+        for customer, kind in matches
+    ]
+    return JsonResponse({
+        'query': query,
+        'results': results,
+        'elapsed_ms': round(elapsed_ms, 2),
+    })
+
+
 def customer_detail(request, pk):
     """客户详情页 - 增强版(支持分页、筛选、排序)"""
     customer = get_object_or_404(Customer, pk=pk)
     
-    # 获取客户的所有租赁记录(用于统计)
+    # 获取客户的所有租赁记录
     all_rentals = customer.rentals.all().select_related('vehicle')
     
-    # 计算总体统计信息(不受筛选影响)
-    total_rentals = all_rentals.count()
-    total_amount = all_rentals.aggregate(
-        total=Sum('total_amount')
-    )['total'] or 0
+    # 总体统计信息(不受筛选影响)：直接读取客户表上的统计列
+    total_rentals = customer.total_rentals
+    total_amount = customer.total_amount
     
     # 计算各状态订单数量(用于筛选器徽章)
     status_counts = {'all': total_rentals}
@@ -115,7 +157,7 @@ def customer_detail(request, pk):
         vip_upgrade_info = {
             'is_eligible': is_eligible,
             'consecutive_count': consecutive_count,
-            'remaining': max(0, 10 - consecutive_count)
+            'remaining': max(0, VIP_UPGRADE_STREAK - consecutive_count)
         }
     
     # === 分页、筛选、排序功能 ===
@@ -298,31 +340,17 @@ def customer_membership_update(request, pk):
 
 def get_customer_statistics(request):
     """获取客户统计信息的API端点"""
-    total_customers = Customer.objects.count()
-    vip_count = Customer.objects.filter(member_level='VIP').count()
-    normal_count = Customer.objects.filter(member_level='NORMAL').count()
-    
-    # 租赁统计
-    total_rentals = Rental.objects.count()
-    total_revenue = Rental.objects.aggregate(
-        total=Sum('total_amount')
-    )['total'] or 0
-    
-    # 活跃客户（最近30天有租赁的客户）
-    from django.utils import timezone
-    from datetime import timedelta
-    recent_date = timezone.now().date() - timedelta(days=30)
-    active_customers = Customer.objects.filter(
-        rentals__start_date__gte=recent_date
-    ).distinct().count()
+    # 读取仪表板统计快照（见 car_rental_system/dashboard.py）：客户数、活跃客户（最近30天下过单）、订单数和订单金额合计
+    snapshot = get_snapshot()
+    customer_stats = snapshot.customer_stats
     
     data = {
-        'total_customers': total_customers,
-        'vip_count': vip_count,
-        'normal_count': normal_count,
-        'total_rentals': total_rentals,
-        'total_revenue': float(total_revenue),
-        'active_customers': active_customers,
+        'total_customers': customer_stats['total'],
+        'vip_count': customer_stats['vip'],
+        'normal_count': customer_stats['normal'],
+        'total_rentals': snapshot.rental_stats['total'],
+        'total_revenue': float(snapshot.revenue_stats['ordered']),
+        'active_customers': customer_stats['active'],
     }
     
     return JsonResponse(data)
\ No newline at end of file
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class RentalsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'rentals'
+
+    def ready(self):
+        # 注册订单信号（维护车辆可用性索引、预订槽位、VIP连续订单数和热度）
+        from . import signals  # noqa: F401
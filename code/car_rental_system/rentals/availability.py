@@ -0,0 +1,226 @@
+"""
+车辆可用性索引
+按车辆维护有效订单（预订中、进行中、已超时未归还）的时间区间索引，
+以对数时间回答"车辆在某时间段是否空闲"和"哪些订单与该时间段冲突"。
+
+索引按进程懒加载：首次查询某辆车时从数据库读取其有效订单区间，
+之后由订单的保存/删除信号（见 rentals/signals.py）在事务提交后失效重建。
+跨进程一致性以数据库中车辆的预订版本号（Vehicle.booking_version）为准：
+任何进程修改了某辆车的订单，都会在同一事务中递增该版本号（touch_vehicle_bookings），
+每次查询先按主键读取版本号（调用方已加载车辆时直接传入其版本号，省去这次查询），
+与区间表加载时的版本不一致即重新加载；不依赖进程内缓存（LocMemCache 下各进程的缓存互不可见）。
+每个进程最多保留 MAX_TIMELINES 辆车的区间表，超出时淘汰最久未使用的车辆。
+"""
+import threading
+from collections import OrderedDict
+from bisect import bisect_left, bisect_right
+
+from django.db.models import F
+from django.utils import timezone
+
+
+# 占用车辆的订单状态（预订中、进行中、已超时未归还）
+ACTIVE_RENTAL_STATUSES = ('PENDING', 'ONGOING', 'OVERDUE')
+
+# 每个进程最多缓存的车辆区间表数量（按最近使用淘汰）
+MAX_TIMELINES = 2000
+
+
+class BookingInterval:
+    """一个有效订单占用的日期区间（闭区间）"""
+    __slots__ = ('rental_id', 'start_date', 'end_date')
+
+    def __init__(self, rental_id, start_date, end_date):
+        self.rental_id = rental_id
+        self.start_date = start_date
+        self.end_date = end_date
+
+    def __repr__(self):
+        return f"<BookingInterval: #{self.rental_id} {self.start_date}~{self.end_date}>"
+
+
+class VehicleTimeline:
+    """
+    单辆车的订单区间表
+    区间按开始日期排序，并维护结束日期的前缀最大值：
+    - 开始日期 <= 查询结束日期 的区间是 intervals[:k]（二分查找得到 k）
+    - 其中是否存在结束日期 >= 查询开始日期 的区间，只需看 max_ends[k-1]
+    因此空闲判断为 O(log n)，冲突列表的查找与冲突数量成正比。
+    """
+    __slots__ = ('intervals', 'starts', 'max_ends', 'version')
+
+    def __init__(self, rows, version=None):
+        self.intervals = sorted(
+            (BookingInterval(*row) for row in rows),
+            key=lambda interval: (interval.start_date, interval.end_date)
+        )
+        self.starts = [interval.start_date for interval in self.intervals]
+        self.max_ends = []
+        running_max = None
+        for interval in self.intervals:
+            if running_max is None or interval.end_date > running_max:
+                running_max = interval.end_date
+            self.max_ends.append(running_max)
+        self.version = version
+
+    def __len__(self):
+        return len(self.intervals)
+
+    def conflicts(self, start_date, end_date, exclude_rental_id=None):
+        """返回与 [start_date, end_date] 重叠的订单区间"""
+        upper = bisect_right(self.starts, end_date)
+        if upper == 0 or self.max_ends[upper - 1] < start_date:
+            return []
+        # max_ends 单调不减，第一个可能重叠的位置同样可以二分得到
+        lower = bisect_left(self.max_ends, start_date, 0, upper)
+        return [
+            interval for interval in self.intervals[lower:upper]
+            if interval.end_date >= start_date and interval.rental_id != exclude_rental_id
+        ]
+
+    def is_free(self, start_date, end_date, exclude_rental_id=None):
+        """判断 [start_date, end_date] 是否没有任何冲突订单"""
+        upper = bisect_right(self.starts, end_date)
+        if upper == 0 or self.max_ends[upper - 1] < start_date:
+            return True
+        if exclude_rental_id is None:
+            return False
+        return not self.conflicts(start_date, end_date, exclude_rental_id)
+
+
+class AvailabilityIndex:
+    """按车辆分片的可用性索引（进程内单例，线程安全，最多缓存 max_timelines 辆车）"""
+
+    def __init__(self, max_timelines=MAX_TIMELINES):
+        self._lock = threading.Lock()
+        self._timelines = OrderedDict()
+        self._rental_vehicles = {}
+        self.max_timelines = max_timelines
+
+    def _version(self, vehicle_id):
+        """数据库中车辆当前的预订版本号（车辆不存在时为 None）"""
+        from vehicles.models import Vehicle  # 避免循环导入
+        return Vehicle.objects.filter(pk=vehicle_id).values_list('booking_version', flat=True).first()
+
+    def _discard(self, vehicle_id):
+        """移除车辆的区间表及其订单的反查记录（调用方持有锁）"""
+        timeline = self._timelines.pop(vehicle_id, None)
+        if timeline is not None:
+            for interval in timeline.intervals:
+                if self._rental_vehicles.get(interval.rental_id) == vehicle_id:
+                    del self._rental_vehicles[interval.rental_id]
+
+    def _load(self, vehicle_id, version):
+        from .models import Rental  # 避免循环导入
+        rows = list(
+            Rental.objects.filter(
+                vehicle_id=vehicle_id,
+                status__in=ACTIVE_RENTAL_STATUSES
+            ).values_list('id', 'start_date', 'end_date')
+        )
+        timeline = VehicleTimeline(rows, version=version)
+        with self._lock:
+            self._discard(vehicle_id)
+            self._timelines[vehicle_id] = timeline
+            for rental_id, _, _ in rows:
+                self._rental_vehicles[rental_id] = vehicle_id
+            while len(self._timelines) > self.max_timelines:
+                self._discard(next(iter(self._timelines)))
+        return timeline
+
+    def timeline(self, vehicle_id, version=None):
+        """
+        获取车辆的区间表，数据库中的预订版本号变化后自动重新加载
+        version：调用方刚从数据库加载的车辆预订版本号（vehicle.booking_version），不传时按主键查询
+        """
+        if version is None:
+            version = self._version(vehicle_id)
+        with self._lock:
+            timeline = self._timelines.get(vehicle_id)
+            if timeline is not None:
+                self._timelines.move_to_end(vehicle_id)
+        if timeline is None or timeline.version != version:
+            timeline = self._load(vehicle_id, version)
+        return timeline
+
+    def is_available(self, vehicle_id, start_date, end_date, exclude_rental_id=None, version=None):
+        """车辆在 [start_date, end_date] 是否没有有效订单"""
+        return self.timeline(vehicle_id, version).is_free(start_date, end_date, exclude_rental_id)
+
+    def find_conflicts(self, vehicle_id, start_date, end_date, exclude_rental_id=None, version=None):
+        """返回车辆在 [start_date, end_date] 内冲突的订单区间列表"""
+        return self.timeline(vehicle_id, version).conflicts(start_date, end_date, exclude_rental_id)
+
+    def busy_intervals(self, vehicle_id, version=None):
+        """返回车辆全部有效订单区间（按开始日期排序）"""
+        return list(self.timeline(vehicle_id, version).intervals)
+
+    def invalidate(self, vehicle_id):
+        """使本进程中某辆车的区间表失效（其他进程通过数据库中的预订版本号失效）"""
+        with self._lock:
+            self._discard(vehicle_id)
+
+    def invalidate_rental(self, rental_id, vehicle_id):
+        """订单变更后失效其当前车辆以及索引中记录的原车辆（订单可能被改派车辆）"""
+        with self._lock:
+            previous_vehicle_id = self._rental_vehicles.pop(rental_id, None)
+        self.invalidate(vehicle_id)
+        if previous_vehicle_id is not None and previous_vehicle_id != vehicle_id:
+            self.invalidate(previous_vehicle_id)
+
+    def clear(self):
+        """清空本进程的全部索引"""
+        with self._lock:
+            self._timelines.clear()
+            self._rental_vehicles.clear()
+
+
+availability_index = AvailabilityIndex()
+
+
+def filter_available_for_period(vehicles, start_date, end_date):
+    """
+    筛选在 [start_date, end_date] 内没有任何有效订单重叠的车辆
+    先用 状态+结束日期 覆盖索引一次范围扫描出该时段被占用的车辆集合，
+    再以 NOT IN 反连接排除，不逐车检查；
+    维修中的车辆不可预订，其余车辆即使今天已租出，只要该时间段空闲也会返回。
+    """
+    from .models import Rental  # 避免循环导入
+    busy_vehicle_ids = Rental.objects.filter(
+        status__in=ACTIVE_RENTAL_STATUSES,
+        end_date__gte=start_date,
+        start_date__lte=end_date,
+    ).values('vehicle_id')
+    return vehicles.exclude(status='MAINTENANCE').exclude(pk__in=busy_vehicle_ids)
+
+
+def touch_vehicle_bookings(vehicle_ids):
+    """车辆订单占用情况变化：递增预订版本号并记录变更时间（日历接口据此生成 ETag/Last-Modified）"""
+    from vehicles.models import Vehicle  # 避免循环导入
+    vehicle_ids = [vehicle_id for vehicle_id in set(vehicle_ids) if vehicle_id is not None]
+    if vehicle_ids:
+        Vehicle.objects.filter(pk__in=vehicle_ids).update(
+            booking_version=F('booking_version') + 1,
+            bookings_changed_at=timezone.now(),
+        )
+
+
+def merge_busy_ranges(rows, window_start, window_end):
+    """
+    将 (vehicle_id, start_date, end_date) 行（按车辆、开始日期排序）合并为每辆车的忙碌区间
+    重叠或首尾相接的订单合并为一个区间，并裁剪到 [window_start, window_end] 内。
+    返回 {vehicle_id: [(start_date, end_date), ...]}
+    """
+    ranges = {}
+    for vehicle_id, start_date, end_date in rows:
+        start_date = max(start_date, window_start)
+        end_date = min(end_date, window_end)
+        if start_date > end_date:
+            continue
+        vehicle_ranges = ranges.setdefault(vehicle_id, [])
+        if vehicle_ranges and start_date.toordinal() <= vehicle_ranges[-1][1].toordinal() + 1:
+            if end_date > vehicle_ranges[-1][1]:
+                vehicle_ranges[-1] = (vehicle_ranges[-1][0], end_date)
+        else:
+            vehicle_ranges.append((start_date, end_date))
+    return ranges
@@ -0,0 +1,123 @@
+"""
+并发安全的预订
+车辆的占用日写入 RentalSlot 表，(车辆, 日期) 唯一约束在数据库层拒绝重叠预订；
+预订在一个短事务中完成（事务开始即获取写锁），遇到 SQLite 写锁竞争时指数退避重试。
+其他修改订单的视图用 booking_transaction 包裹，占用冲突时回滚并提示，不返回500。
+"""
+import logging
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib import messages
+from django.db import IntegrityError, OperationalError, connection, transaction
+
+from .availability import ACTIVE_RENTAL_STATUSES
+from .models import RentalSlot
+
+logger = logging.getLogger(__name__)
+
+# 写锁竞争时的重试次数和基础退避时间（秒）
+BOOKING_MAX_RETRIES = 6
+BOOKING_RETRY_BASE_DELAY = 0.02
+
+
+class BookingConflict(Exception):
+    """预订时间段与其他订单冲突（由数据库唯一约束检测）"""
+
+
+def rental_days(rental):
+    """订单占用的全部日期"""
+    return [rental.start_date + timedelta(days=offset) for offset in range(rental.rental_days)]
+
+
+def sync_rental_slots(rental):
+    """
+    按订单当前的车辆、状态和起止日期重建其占用槽位
+    有效订单写入每一天的槽位，已完成/已取消订单释放全部槽位；
+    槽位已被其他订单占用时抛出 BookingConflict（调用方所在事务应随之回滚）。
+    """
+    with transaction.atomic():
+        RentalSlot.objects.filter(rental=rental).delete()
+        if rental.status not in ACTIVE_RENTAL_STATUSES or not (rental.start_date and rental.end_date):
+            return
+        slots = [
+            RentalSlot(rental=rental, vehicle_id=rental.vehicle_id, day=day)
+            for day in rental_days(rental)
+        ]
+        try:
+            with transaction.atomic():
+                RentalSlot.objects.bulk_create(slots)
+        except IntegrityError:
+            raise BookingConflict(
+                f'车辆 {rental.vehicle.license_plate} 在 {rental.start_date} 至 {rental.end_date} 时间段已被租赁'
+            )
+
+
+def is_lock_error(exc):
+    """SQLite 写锁竞争（database is locked / database table is locked）"""
+    return 'locked' in str(exc)
+
+
+@contextmanager
+def immediate_transaction():
+    """
+    以 BEGIN IMMEDIATE 开始的事务：开始即获取写锁，并发预订在 busy timeout 内排队等待，
+    不会先读后升级写锁失败（database is locked）。只作用于最外层事务的开始，
+    其他事务仍使用 SQLite 默认的 DEFERRED；已在事务中或不是 SQLite 时等同 transaction.atomic()。
+    """
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        with transaction.atomic():
+            yield
+        return
+    connection.ensure_connection()
+    previous_mode = connection.transaction_mode
+    connection.transaction_mode = 'IMMEDIATE'
+    try:
+        with transaction.atomic():
+            connection.transaction_mode = previous_mode
+            yield
+    finally:
+        connection.transaction_mode = previous_mode
+
+
+@contextmanager
+def booking_transaction(request):
+    """
+    视图中修改订单（还车、取消、改状态等）的事务
+    订单保存信号重建槽位时发现时间段冲突（BookingConflict）则整个事务回滚，
+    冲突原因作为错误消息提示，程序从 with 语句之后继续执行（通常重新显示表单或跳回详情页）。
+    """
+    try:
+        with transaction.atomic():
+            yield
+    except BookingConflict as exc:
+        messages.error(request, str(exc))
+
+
+def save_booking(rental, after_save=None, max_retries=BOOKING_MAX_RETRIES):
+    """
+    在一个事务中保存订单并占用槽位（槽位由订单保存信号写入）
+    - 时间段冲突：抛出 BookingConflict，事务回滚，不重试
+    - 写锁竞争：回滚后指数退避（带随机抖动）重试
+    after_save(rental) 在同一事务内执行，用于更新车辆状态、创建通知等。
+    """
+    is_new = rental._state.adding
+    for attempt in range(max_retries):
+        try:
+            with immediate_transaction():
+                rental.save()
+                if after_save:
+                    after_save(rental)
+            return rental
+        except OperationalError as exc:
+            if not is_lock_error(exc) or attempt == max_retries - 1:
+                raise
+            if is_new:
+                # 回滚后重新按新订单插入
+                rental.pk = None
+                rental._state.adding = True
+            delay = BOOKING_RETRY_BASE_DELAY * (2 ** attempt) * (1 + random.random())
+            logger.warning(f'预订写锁竞争，{delay:.3f}秒后重试（第{attempt + 1}次）')
+            time.sleep(delay)
@@ -0,0 +1,136 @@
+"""
+门店间车辆流向（异地还车的起止门店矩阵）
+- 起点：取车门店 pickup_location；终点：实际还车门店 actual_return_location（已还车），
+  否则异地还车订单的计划还车门店 return_location，否则为取车门店（原店还车，不产生流动）
+- 只统计起点与终点不同的订单（车辆从一个门店流到另一个门店）；已取消的订单不计，
+  预订中、进行中的订单按计划还车门店计入（运营据此提前调度）
+- 订单按取车日期计入时间窗口和月份
+- 门店按 accounts/store_locations.STORE_LOCATIONS 的区、门店顺序排列，不在列表中的地点合并为 OTHER_LOCATION
+- 一条分组查询（起点 × 终点 × 月份）得到订单数和异地还车费用合计，其余在 Python 中汇总；结果按 rental 缓存标签缓存
+"""
+from decimal import Decimal
+
+from django.db.models import Case, CharField, Count, F, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, NullIf, TruncMonth
+
+from accounts.store_locations import STORE_LOCATIONS
+from car_rental_system.cache_tags import TAG_RENTAL, cached
+
+
+# 不在门店列表中的取车/还车地点
+OTHER_LOCATION = '其他地点'
+
+# 流向报表的缓存时间（秒）；订单变化时按缓存标签提前失效
+FLOW_CACHE_TIMEOUT = 1800
+
+
+def store_order():
+    """矩阵的门店顺序：按区排列的全部门店，最后是 OTHER_LOCATION"""
+    return [store for stores in STORE_LOCATIONS.values() for store in stores] + [OTHER_LOCATION]
+
+
+def _destination():
+    """订单的还车门店：实际还车门店 > 异地还车的计划还车门店 > 取车门店"""
+    return Coalesce(
+        NullIf('actual_return_location', Value('')),
+        Case(
+            When(is_cross_location_return=True, return_location__gt='', then=F('return_location')),
+            default=F('pickup_location'),
+            output_field=CharField(),
+        ),
+        output_field=CharField(),
+    )
+
+
+def _flow_rows(start, end):
+    """(起点, 终点, 月份, 订单数, 异地还车费用) 的分组查询"""
+    from .models import Rental  # 避免循环导入
+    return Rental.objects.filter(
+        start_date__gte=start, start_date__lte=end,
+    ).exclude(status='CANCELLED').annotate(
+        destination=_destination(),
+    ).exclude(
+        destination=F('pickup_location'),
+    ).annotate(
+        month=TruncMonth('start_date'),
+    ).values('pickup_location', 'destination', 'month').annotate(
+        trips=Count('id'),
+        fee=Sum('cross_location_fee', filter=Q(is_cross_location_return=True)),
+    ).order_by()
+
+
+def compute_flows(start, end):
+    """
+    窗口 [start, end]（按取车日期）内的门店流向：
+    {'from', 'to', 'stores': [门店...], 'periods': ['YYYY-MM', ...],
+     'matrix': [[起点行 × 终点列的订单数]], 'fee_matrix': [[费用]],
+     'pairs': [{'origin', 'destination', 'trips', 'fee', 'periods': {'YYYY-MM': {'trips', 'fee'}}}]（按订单数降序）,
+     'balance': [{'store', 'outflow', 'inflow', 'net', 'fee'}]（net = 流入 - 流出，按 net 升序，车辆净流出最多的在前）,
+     'total': {'trips', 'fee'}}
+    """
+    stores = store_order()
+    index = {store: position for position, store in enumerate(stores)}
+    size = len(stores)
+    matrix = [[0] * size for _ in range(size)]
+    fee_matrix = [[Decimal('0.00')] * size for _ in range(size)]
+    pairs = {}
+    periods = set()
+
+    for row in _flow_rows(start, end):
+        origin = row['pickup_location'] if row['pickup_location'] in index else OTHER_LOCATION
+        destination = row['destination'] if row['destination'] in index else OTHER_LOCATION
+        if origin == destination:
+            # 两个不在列表中的地点之间的流动
+            continue
+        trips, fee = row['trips'], row['fee'] or Decimal('0.00')
+        period = row['month'].strftime('%Y-%m')
+        periods.add(period)
+        matrix[index[origin]][index[destination]] += trips
+        fee_matrix[index[origin]][index[destination]] += fee
+
+        pair = pairs.setdefault(
+            (origin, destination),
+            {'origin': origin, 'destination': destination, 'trips': 0, 'fee': Decimal('0.00'), 'periods': {}},
+        )
+        pair['trips'] += trips
+        pair['fee'] += fee
+        by_period = pair['periods'].setdefault(period, {'trips': 0, 'fee': Decimal('0.00')})
+        by_period['trips'] += trips
+        by_period['fee'] += fee
+
+    balance = []
+    for position, store in enumerate(stores):
+        outflow = sum(matrix[position])
+        inflow = sum(matrix[other][position] for other in range(size))
+        if not outflow and not inflow:
+            continue
+        balance.append({
+            'store': store,
+            'outflow': outflow,
+            'inflow': inflow,
+            'net': inflow - outflow,
+            'fee': sum(fee_matrix[position], Decimal('0.00')),
+        })
+    balance.sort(key=lambda item: (item['net'], item['store']))
+
+    return {
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'stores': stores,
+        'periods': sorted(periods),
+        'matrix': matrix,
+        'fee_matrix': fee_matrix,
+        'pairs': sorted(pairs.values(), key=lambda pair: (-pair['trips'], pair['origin'], pair['destination'])),
+        'balance': balance,
+        'total': {
+            'trips': sum(pair['trips'] for pair in pairs.values()),
+            'fee': sum((pair['fee'] for pair in pairs.values()), Decimal('0.00')),
+        },
+    }
+
+
+def store_flows(start, end):
+    """compute_flows 的缓存版本（订单变化后重新计算）"""
+    return cached(
+        f'store_flows:{start}:{end}', [TAG_RENTAL], lambda: compute_flows(start, end), FLOW_CACHE_TIMEOUT
+    )
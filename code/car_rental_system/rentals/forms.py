@@ -1,6 +1,7 @@
 from django import forms
 from django.core.exceptions import ValidationError
 from .models import Rental
+from .availability import availability_index
 from customers.models import Customer
 from vehicles.models import Vehicle
 from datetime import date
@@ -268,18 +269,18 @@ class RentalForm(forms.ModelForm):
         # 因此不检查客户时间冲突
         
         # 检查车辆时间冲突（同一辆车在同一时间段只能租给一个客户）
+        # 使用车辆可用性索引（预订中、进行中或已超时未归还的订单），二分查找冲突区间
         if vehicle and start_date and end_date:
-            conflicts = Rental.objects.filter(
-                vehicle=vehicle,
-                status__in=['PENDING', 'ONGOING', 'OVERDUE']  # 预订中、进行中或已超时未归还的订单
-            ).exclude(pk=self.instance.pk)
-            
-            for rental in conflicts:
-                # 检查时间是否重叠
-                if not (end_date < rental.start_date or start_date > rental.end_date):
-                    raise ValidationError(
-                        f'车辆 {vehicle.license_plate} 在 {rental.start_date} 至 {rental.end_date} 时间段已被租赁'
-                    )
+            conflicts = availability_index.find_conflicts(
+                vehicle.pk, start_date, end_date,
+                exclude_rental_id=self.instance.pk,
+                version=vehicle.booking_version
+            )
+            if conflicts:
+                rental = conflicts[0]
+                raise ValidationError(
+                    f'车辆 {vehicle.license_plate} 在 {rental.start_date} 至 {rental.end_date} 时间段已被租赁'
+                )
         
         return cleaned_data
 
@@ -6,7 +6,7 @@
 from django.core.management.base import BaseCommand
 from vehicles.models import Vehicle
 from decimal import Decimal
-from django.core.cache import cache
+from accounts.recommendations import invalidate_all_recommendations
 
 
 class Command(BaseCommand):
@@ -159,13 +159,8 @@ class Command(BaseCommand):
                         )
                     )
         
-        # 清除相关缓存
-        cache.delete('user_vehicle_brands_list')
-        cache.delete('user_vehicle_types_list')
-        cache.delete('user_vehicle_seats_list')
-        cache.delete('popular_vehicles')
-        # 清除所有用户的推荐缓存
-        cache.delete_pattern('user_recommendations_*')
+        # 清除所有用户的推荐缓存（筛选项计数由车辆保存信号失效）
+        invalidate_all_recommendations()
         
         self.stdout.write(
             self.style.SUCCESS(
@@ -0,0 +1,76 @@
+"""
+订单列表分页性能基准
+对比页码分页（COUNT(*) + OFFSET）和游标分页（按 (created_at, id) 定位）取第 N 页的耗时和 SQL 语句数，
+查询集与订单列表页相同（关联客户、车辆）。只读取数据，不修改数据库。
+"""
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from car_rental_system.pagination import DEFAULT_ORDERING, CursorPaginator, encode_cursor
+from rentals.models import Rental
+
+
+class Command(BaseCommand):
+    help = '对比订单列表页码分页与游标分页取不同页的耗时（只读）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--pages',
+            default='1,10,100,1000,10000',
+            help='页码列表，逗号分隔（默认：1,10,100,1000,10000）'
+        )
+        parser.add_argument('--per-page', type=int, default=15, help='每页条数（默认：15，与订单列表相同）')
+        parser.add_argument('--repeat', type=int, default=5, help='每项重复测量次数，取中位数（默认：5）')
+
+    def handle(self, *args, **options):
+        per_page = options['per_page']
+        pages = [int(page) for page in options['pages'].split(',') if page.strip()]
+        queryset = Rental.objects.select_related('customer', 'vehicle')
+        total = Rental.objects.count()
+
+        self.stdout.write('=' * 60)
+        self.stdout.write(f'订单列表分页基准测试（订单数 {total}，每页 {per_page} 条）')
+        self.stdout.write('=' * 60)
+        self.stdout.write(f'{"页码":>8} {"页码分页(ms)":>14} {"SQL数":>6} {"游标分页(ms)":>14} {"SQL数":>6}')
+
+        for number in pages:
+            offset = (number - 1) * per_page
+            if offset >= total:
+                self.stdout.write(f'{number:>8} {"超出订单数，跳过":>20}')
+                continue
+            offset_ms, offset_queries = self._measure(
+                lambda: list(Paginator(queryset.order_by(*DEFAULT_ORDERING), per_page).page(number)),
+                options['repeat'],
+            )
+            paginator = CursorPaginator(queryset, per_page)
+            cursor = self._cursor_for_page(paginator, offset)
+            cursor_ms, cursor_queries = self._measure(lambda: list(paginator.page(cursor)), options['repeat'])
+            self.stdout.write(
+                f'{number:>8} {offset_ms:>14.1f} {offset_queries:>6} {cursor_ms:>14.1f} {cursor_queries:>6}'
+            )
+
+        self.stdout.write(self.style.SUCCESS('\n基准测试完成'))
+
+    def _cursor_for_page(self, paginator, offset):
+        """第 N 页的游标：指向前一页最后一行（正常翻页时由上一页给出，这里直接定位，不计入耗时）"""
+        if offset == 0:
+            return None
+        previous = Rental.objects.order_by(*paginator.ordering).only('id', 'created_at')[offset - 1]
+        return encode_cursor('next', paginator._key(previous))
+
+    def _measure(self, fetch, repeat):
+        """重复执行 fetch，返回 (耗时中位数毫秒, 单次SQL语句数)"""
+        timings = []
+        queries = 0
+        for _ in range(max(repeat, 1)):
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                fetch()
+                timings.append((time.perf_counter() - started) * 1000)
+            queries = len(captured)
+        return statistics.median(timings), queries
@@ -0,0 +1,112 @@
+"""
+订单状态批量推进性能基准
+在事务中临时插入不同数量的到期订单，测量 Rental.transition_statuses() 的耗时和 SQL 语句数，
+测量完成后回滚，不修改数据库中的数据。
+"""
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from customers.models import Customer
+from rentals.models import Rental
+from vehicles.models import Vehicle
+
+
+class BenchmarkRollback(Exception):
+    """用于回滚基准测试数据"""
+
+
+class Command(BaseCommand):
+    help = '测量订单状态批量推进在不同到期订单数量下的耗时（数据在事务中回滚）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            default='10,100,1000,10000,100000',
+            help='到期订单数量列表，逗号分隔（默认：10,100,1000,10000,100000）'
+        )
+        parser.add_argument(
+            '--legacy-max',
+            type=int,
+            default=1000,
+            help='对不超过该数量的规模同时测量逐条保存的旧实现（默认：1000，0 表示不测量）'
+        )
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        customer = Customer.objects.first()
+        vehicle_ids = list(Vehicle.objects.values_list('id', flat=True)[:1000])
+        if not customer or not vehicle_ids:
+            self.stdout.write(self.style.ERROR('需要至少一个客户和一辆车辆才能运行基准测试'))
+            return
+
+        self.stdout.write('=' * 60)
+        self.stdout.write('订单状态批量推进基准测试')
+        self.stdout.write('=' * 60)
+        self.stdout.write(f'{"到期订单":>10} {"批量耗时(ms)":>14} {"SQL数":>6} {"逐条耗时(ms)":>14} {"SQL数":>6}')
+
+        for size in sizes:
+            bulk_ms, bulk_queries = self._measure(size, customer, vehicle_ids, legacy=False)
+            if options['legacy_max'] and size <= options['legacy_max']:
+                legacy_ms, legacy_queries = self._measure(size, customer, vehicle_ids, legacy=True)
+                legacy = f'{legacy_ms:>14.1f} {legacy_queries:>6}'
+            else:
+                legacy = f'{"-":>14} {"-":>6}'
+            self.stdout.write(f'{size:>10} {bulk_ms:>14.1f} {bulk_queries:>6} {legacy}')
+
+        self.stdout.write(self.style.SUCCESS('\n基准测试完成，测试数据已回滚'))
+
+    def _seed(self, size, customer, vehicle_ids):
+        """插入 size 个到期订单：一半到达开始日期的预订中订单，一半已过结束日期的进行中订单"""
+        today = date.today()
+        rentals = []
+        for index in range(size):
+            pending = index % 2 == 0
+            start_date = today - timedelta(days=1 if pending else 10)
+            rentals.append(Rental(
+                customer=customer,
+                vehicle_id=vehicle_ids[index % len(vehicle_ids)],
+                start_date=start_date,
+                end_date=today + timedelta(days=3) if pending else today - timedelta(days=2),
+                total_amount=Decimal('100.00'),
+                status='PENDING' if pending else 'ONGOING',
+            ))
+        # bulk_create 不触发保存信号，不写入预订槽位
+        Rental.objects.bulk_create(rentals, batch_size=2000)
+
+    def _legacy_transition(self, today):
+        """改造前的实现：逐条保存订单和车辆"""
+        for rental in Rental.objects.filter(status='PENDING', start_date__lte=today).select_related('vehicle'):
+            rental.status = 'ONGOING'
+            rental.save(update_fields=['status', 'updated_at'])
+            if rental.vehicle.status == 'AVAILABLE':
+                rental.vehicle.status = 'RENTED'
+                rental.vehicle.save(update_fields=['status'])
+        for rental in Rental.objects.filter(status='ONGOING', end_date__lt=today):
+            rental.status = 'OVERDUE'
+            rental.save(update_fields=['status', 'updated_at'])
+
+    def _measure(self, size, customer, vehicle_ids, legacy):
+        """在回滚事务中插入数据并测量一次状态推进，返回 (毫秒, SQL语句数)"""
+        result = None
+        try:
+            with transaction.atomic():
+                # 先推进库中已有的到期订单，使被测的只有本轮插入的订单
+                Rental.transition_statuses()
+                self._seed(size, customer, vehicle_ids)
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    if legacy:
+                        self._legacy_transition(date.today())
+                    else:
+                        Rental.transition_statuses()
+                    elapsed_ms = (time.perf_counter() - started) * 1000
+                result = (elapsed_ms, len(queries))
+                raise BenchmarkRollback()
+        except BenchmarkRollback:
+            pass
+        return result
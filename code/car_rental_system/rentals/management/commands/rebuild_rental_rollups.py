@@ -0,0 +1,28 @@
+"""
+全量重建每日经营汇总
+汇总表由订单、支付记录信号增量维护；bulk_create、QuerySet.update 等绕过信号的批量写入之后，
+修改车辆车型之后，或怀疑汇总与订单数据不一致时运行本命令。
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from rentals.rollups import rebuild_rollups, summarize
+
+
+class Command(BaseCommand):
+    help = '按全部订单和退款记录全量重建每日经营汇总（日期 × 取车门店 × 车型）'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        rows, scanned = rebuild_rollups()
+        elapsed = time.monotonic() - started
+        totals = summarize()
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ 已重建每日经营汇总：{scanned} 个订单，写入 {rows} 行，耗时 {elapsed:.1f} 秒'
+        ))
+        self.stdout.write(
+            f'  新订单 {totals["new_rentals"]} 个，已完成 {totals["completed_rentals"]} 个，'
+            f'营业收入 ¥{totals["revenue"]}，已取消 {totals["cancelled_rentals"]} 个，'
+            f'退款 {totals["refunds"]} 笔 ¥{totals["refund_amount"]}'
+        )
@@ -0,0 +1,85 @@
+"""
+核对订单财务快照
+订单上的 amount_paid / amount_refunded / settlement_status 由支付记录信号增量维护，
+本命令按订单ID分块，用分组汇总查询重新计算并与快照比对，报告（或用 --fix 修复）不一致的订单。
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rentals.backfill import apply_chunk, chunk_bounds, compute_chunk, phase_queryset
+from rentals.models import Rental
+
+
+class Command(BaseCommand):
+    help = '批量核对订单财务快照（已支付/已退款/结算状态）与支付记录是否一致，可选自动修复'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='按支付记录修复不一致的订单快照',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='每块核对的订单数（默认：2000）',
+        )
+        parser.add_argument(
+            '--show',
+            type=int,
+            default=20,
+            help='最多列出的不一致订单数（默认：20）',
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        if chunk_size <= 0:
+            raise CommandError('--chunk-size 必须大于 0')
+
+        total = phase_queryset('financials').count()
+        self.stdout.write(f'开始核对 {total} 个订单的财务快照...')
+
+        scanned = mismatched = shown = 0
+        started = time.monotonic()
+        for start_id, end_id in chunk_bounds('financials', 0, chunk_size):
+            result = compute_chunk('financials', start_id, end_id)
+            scanned += result['scanned']
+            mismatched += len(result['financials'])
+
+            if shown < options['show'] and result['financials']:
+                shown += self._show_mismatches(result['financials'][:options['show'] - shown])
+            if options['fix'] and result['financials']:
+                apply_chunk(result)
+
+        elapsed = time.monotonic() - started
+        rate = scanned / elapsed if elapsed > 0 else 0
+        self.stdout.write(f'核对完成：扫描 {scanned} 个订单，耗时 {elapsed:.1f} 秒（{rate:,.0f} 行/秒）')
+        if not mismatched:
+            self.stdout.write(self.style.SUCCESS('✓ 所有订单的财务快照与支付记录一致'))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS(f'✓ 已修复 {mismatched} 个不一致的订单'))
+        else:
+            self.stdout.write(self.style.WARNING(
+                f'⚠ 发现 {mismatched} 个不一致的订单，使用 --fix 参数按支付记录修复'
+            ))
+
+    def _show_mismatches(self, rows):
+        """列出不一致订单的快照值与按支付记录计算的值"""
+        current = {
+            rental.id: rental
+            for rental in Rental.objects.filter(id__in=[row[0] for row in rows]).only(
+                'amount_paid', 'amount_refunded', 'settlement_status'
+            )
+        }
+        for rental_id, amount_paid, amount_refunded, settlement_status, _ in rows:
+            rental = current.get(rental_id)
+            if rental is None:
+                continue
+            self.stdout.write(self.style.WARNING(
+                f'  订单 #{rental_id}: 快照 已支付¥{rental.amount_paid} 已退款¥{rental.amount_refunded} '
+                f'{rental.settlement_status} → 实际 已支付¥{amount_paid:.2f} 已退款¥{amount_refunded:.2f} '
+                f'{settlement_status}'
+            ))
+        return len(rows)
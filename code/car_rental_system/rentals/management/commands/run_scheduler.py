@@ -0,0 +1,76 @@
+"""
+常驻后台调度器
+按 settings.RENTAL_SCHEDULER 配置的间隔（带随机抖动）执行订单状态推进、押金结算、缓存预热和车辆相似度增量计算，
+通过文件锁保证同一时间只有一个调度器实例运行。
+配合 RENTAL_AUTO_UPDATE_IN_REQUEST = False 可完全关闭页面请求中的状态自动更新。
+"""
+import signal
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from rentals.scheduler import SchedulerLock, build_tasks, scheduler_settings
+
+
+class Command(BaseCommand):
+    help = '常驻运行订单状态推进、押金结算、缓存预热和仪表板统计快照等定时任务（单实例）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='立即执行一遍全部任务后退出（可用于系统计划任务）'
+        )
+        parser.add_argument(
+            '--lock-file',
+            help='单实例锁文件路径（默认使用 RENTAL_SCHEDULER["lock_file"]）'
+        )
+
+    def handle(self, *args, **options):
+        scheduler_options = scheduler_settings()
+        lock = SchedulerLock(options['lock_file'] or scheduler_options['lock_file'])
+        if not lock.acquire():
+            raise CommandError(f'已有调度器实例在运行（锁文件：{lock.path}）')
+
+        self._stopping = False
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGTERM, self._stop)
+
+        tasks = build_tasks(scheduler_options)
+        try:
+            if options['once']:
+                for task in tasks:
+                    self._run(task)
+                return
+
+            self.stdout.write(self.style.SUCCESS('调度器已启动：'))
+            for task in tasks:
+                self.stdout.write(f'  - {task.name}: 每 {task.interval} 秒（抖动 ±{task.jitter:.0%}）')
+
+            while not self._stopping:
+                now = time.monotonic()
+                for task in tasks:
+                    if task.is_due(now) and not self._stopping:
+                        self._run(task)
+                next_run = min(task.next_run for task in tasks) if tasks else now + 60
+                # 分段休眠，以便及时响应退出信号
+                time.sleep(min(max(next_run - time.monotonic(), 0.1), 1.0))
+        finally:
+            lock.release()
+            self.stdout.write('调度器已停止')
+
+    def _stop(self, signum, frame):
+        self._stopping = True
+
+    def _run(self, task):
+        """执行单个任务，前后清理失效的数据库连接（常驻进程不经过请求周期）"""
+        close_old_connections()
+        started = time.monotonic()
+        result = task.run()
+        close_old_connections()
+        elapsed_ms = (time.monotonic() - started) * 1000
+        if result is None:
+            self.stdout.write(self.style.ERROR(f'[{task.name}] 执行失败（详见日志）'))
+        else:
+            self.stdout.write(f'[{task.name}] {result}（{elapsed_ms:.0f}ms）')
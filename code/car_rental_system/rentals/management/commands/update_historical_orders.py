@@ -1,14 +1,25 @@
-from django.core.management.base import BaseCommand
-from django.db import transaction
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import date
-from decimal import Decimal
-from django.utils import timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from rentals.backfill import Checkpoint, apply_chunk, chunk_bounds, compute_chunk, init_worker, phase_queryset
 from rentals.models import Rental
-from vehicles.models import Vehicle
+
+
+# 回填阶段：(阶段名, 标题)
+PHASES = [
+    ('deposit', '退还已完成订单的押金'),
+    ('cancelled', '退还已取消订单的已支付金额'),
+    ('financials', '刷新订单财务信息'),
+]
 
 
 class Command(BaseCommand):
-    help = '批量更新历史订单记录：更新订单状态、退还押金、刷新财务信息'
+    help = '批量更新历史订单记录：更新订单状态、退还押金、刷新财务信息（分块处理，可断点续跑、多进程计算）'
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -31,57 +42,100 @@ class Command(BaseCommand):
             action='store_true',
             help='跳过财务信息刷新',
         )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='每块处理的订单数，每块在独立事务中写入（默认：1000）',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=0,
+            help='计算阶段使用的进程数，0 表示在当前进程中计算（默认：0）',
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='从检查点文件记录的位置继续上次中断的更新',
+        )
+        parser.add_argument(
+            '--checkpoint-file',
+            default=str(settings.BASE_DIR / 'update_historical_orders.checkpoint.json'),
+            help='检查点文件路径（默认：项目目录下 update_historical_orders.checkpoint.json）',
+        )
 
     def handle(self, *args, **options):
         dry_run = options['dry_run']
-        skip_status = options['skip_status']
-        skip_deposit = options['skip_deposit']
-        skip_financials = options['skip_financials']
-        
+        chunk_size = options['chunk_size']
+        workers = options['workers']
+        if chunk_size <= 0:
+            raise CommandError('--chunk-size 必须大于 0')
+
         today = date.today()
-        
+
+        checkpoint = Checkpoint(options['checkpoint_file'])
+        if options['resume']:
+            checkpoint.load()
+
         self.stdout.write(self.style.WARNING('\n' + '='*70))
         self.stdout.write(self.style.WARNING('开始批量更新历史订单记录'))
         self.stdout.write(self.style.WARNING('='*70))
         self.stdout.write(f'当前日期: {today}')
+        self.stdout.write(f'分块大小: {chunk_size}，计算进程数: {workers or 1}')
         if dry_run:
             self.stdout.write(self.style.WARNING('【预览模式】不会实际修改数据'))
+        if options['resume']:
+            self.stdout.write(f'从检查点继续: {checkpoint.path}')
         self.stdout.write('')
-        
+
         total_updates = {
             'status_updates': 0,
             'deposit_refunds': 0,
             'financial_updates': 0,
         }
-        
+
         # ====================
-        # 1. 更新订单状态
+        # 1. 更新订单状态（批量 UPDATE，无需分块）
         # ====================
-        if not skip_status:
+        if not options['skip_status']:
             self.stdout.write(self.style.WARNING('[1] 更新订单状态'))
-            status_updates = self._update_order_status(today, dry_run)
-            total_updates['status_updates'] = status_updates
+            total_updates['status_updates'] = self._update_order_status(today, dry_run)
             self.stdout.write('')
-        
-        # ====================
-        # 2. 退还已完成订单的押金
-        # ====================
-        if not skip_deposit:
-            self.stdout.write(self.style.WARNING('[2] 退还已完成订单的押金和已取消订单的已支付金额'))
-            deposit_refunds = self._refund_completed_orders_deposits(dry_run)
-            cancelled_refunds = self._refund_cancelled_orders_payments(dry_run)
-            total_updates['deposit_refunds'] = deposit_refunds + cancelled_refunds
-            self.stdout.write('')
-        
+
         # ====================
-        # 3. 刷新所有订单的财务信息
+        # 2/3. 退款与财务刷新（分块、可续跑）
         # ====================
-        if not skip_financials:
-            self.stdout.write(self.style.WARNING('[3] 刷新订单财务信息'))
-            financial_updates = self._refresh_all_financials(dry_run)
-            total_updates['financial_updates'] = financial_updates
-            self.stdout.write('')
-        
+        phases = []
+        if not options['skip_deposit']:
+            phases += ['deposit', 'cancelled']
+        if not options['skip_financials']:
+            phases.append('financials')
+
+        executor = None
+        if workers > 0 and phases:
+            # 子进程各自建立数据库连接，fork 前先关闭主进程连接
+            connections.close_all()
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker)
+        try:
+            for index, (phase, title) in enumerate(PHASES, start=2):
+                if phase not in phases:
+                    continue
+                self.stdout.write(self.style.WARNING(f'[{index}] {title}'))
+                stats = self._run_phase(phase, checkpoint, chunk_size, executor, workers, dry_run)
+                if phase == 'financials':
+                    total_updates['financial_updates'] += stats['financials']
+                else:
+                    total_updates['deposit_refunds'] += stats['refunds']
+                self.stdout.write('')
+        finally:
+            if executor:
+                executor.shutdown(cancel_futures=True)
+
+        if not dry_run:
+            # 全部阶段完成，检查点不再需要
+            checkpoint.delete()
+
         # 输出执行摘要
         self.stdout.write(self.style.SUCCESS('='*70))
         self.stdout.write(self.style.SUCCESS('批量更新完成!'))
@@ -92,219 +146,94 @@ class Command(BaseCommand):
         if dry_run:
             self.stdout.write(self.style.WARNING('\n【预览模式】未实际修改数据，请移除 --dry-run 参数执行实际更新'))
         self.stdout.write(self.style.SUCCESS('='*70 + '\n'))
-    
+
     def _update_order_status(self, today, dry_run):
         """更新订单状态：PENDING->ONGOING, ONGOING->OVERDUE"""
-        updates_count = 0
-        
-        # 1. 激活预订中订单（PENDING -> ONGOING）
-        pending_rentals = Rental.objects.filter(
-            status='PENDING',
-            start_date__lte=today
-        ).select_related('vehicle')
-        
-        pending_count = pending_rentals.count()
-        if pending_count > 0:
-            self.stdout.write(f'  发现 {pending_count} 个需要激活的预订中订单...')
-            
-            if not dry_run:
-                with transaction.atomic():
-                    for rental in pending_rentals:
-                        rental.status = 'ONGOING'
-                        rental.save(update_fields=['status', 'updated_at'])
-                        
-                        # 更新车辆状态为已租
-                        if rental.vehicle.status == 'AVAILABLE':
-                            rental.vehicle.status = 'RENTED'
-                            rental.vehicle.save(update_fields=['status'])
-                        
-                        updates_count += 1
-                        self.stdout.write(
-                            self.style.SUCCESS(
-                                f'  ✓ 订单 #{rental.id} ({rental.customer.name}) - 状态更新为"进行中"'
-                            )
-                        )
-            else:
-                for rental in pending_rentals:
-                    updates_count += 1
-                    self.stdout.write(
-                        f'  [预览] 订单 #{rental.id} ({rental.customer.name}) - 将更新为"进行中"'
-                    )
-        
-        # 2. 更新过期订单（ONGOING -> OVERDUE）
-        overdue_rentals = Rental.objects.filter(
-            status='ONGOING',
-            end_date__lt=today
-        )
-        
-        overdue_count = overdue_rentals.count()
-        if overdue_count > 0:
-            self.stdout.write(f'  发现 {overdue_count} 个已过期的进行中订单...')
-            
-            if not dry_run:
-                with transaction.atomic():
-                    for rental in overdue_rentals:
-                        rental.status = 'OVERDUE'
-                        rental.save(update_fields=['status', 'updated_at'])
-                        updates_count += 1
-                        self.stdout.write(
-                            self.style.WARNING(
-                                f'  ✓ 订单 #{rental.id} ({rental.customer.name}) - 状态更新为"已超时未归还"'
-                            )
-                        )
-            else:
-                for rental in overdue_rentals:
-                    updates_count += 1
-                    self.stdout.write(
-                        f'  [预览] 订单 #{rental.id} ({rental.customer.name}) - 将更新为"已超时未归还"'
-                    )
-        
-        if updates_count == 0:
-            self.stdout.write('  没有需要更新的订单状态')
-        
-        return updates_count
-    
-    def _refund_completed_orders_deposits(self, dry_run):
-        """退还已完成订单的押金"""
-        completed_rentals = Rental.objects.filter(
-            status='COMPLETED'
-        ).select_related('customer')
-        
-        refunds_count = 0
-        
-        for rental in completed_rentals:
-            deposit_amount = rental.deposit or Decimal('0.00')
-            if deposit_amount <= Decimal('0.00'):
-                continue
-            
-            # 尝试退还押金
-            if not dry_run:
-                refunded, refund_amount = rental.refund_deposit()
-                if refunded:
-                    refunds_count += 1
-                    self.stdout.write(
-                        self.style.SUCCESS(
-                            f'  ✓ 订单 #{rental.id} ({rental.customer.name}) - 退还押金 ¥{refund_amount:.2f}'
-                        )
-                    )
-            else:
-                # 预览模式：检查是否需要退还
-                from accounts.models import Payment
-                from django.db.models import Sum
-                
-                refunded_amount = Payment.objects.filter(
-                    rental=rental,
-                    transaction_type='REFUND',
-                    status='REFUNDED'
-                ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-                
-                refundable = deposit_amount - refunded_amount
-                if refundable > Decimal('0.00'):
-                    refunds_count += 1
-                    self.stdout.write(
-                        f'  [预览] 订单 #{rental.id} ({rental.customer.name}) - 将退还押金 ¥{refundable:.2f}'
-                    )
-        
-        if refunds_count == 0:
-            self.stdout.write('  没有需要退还押金的已完成订单')
-        
-        return refunds_count
-    
-    def _refund_cancelled_orders_payments(self, dry_run):
-        """退还已取消订单的已支付金额"""
-        from accounts.models import Payment
-        from accounts.views import get_payment_summary
-        
-        cancelled_rentals = Rental.objects.filter(
-            status='CANCELLED'
-        ).select_related('customer')
-        
-        refunds_count = 0
-        
-        for rental in cancelled_rentals:
-            # 获取已支付金额（扣除已退款金额）
-            payment_summary = get_payment_summary(rental)
-            paid_amount = payment_summary['paid_amount']
-            refunded_amount = payment_summary['refunded_amount']
-            net_paid = paid_amount - refunded_amount
-            
-            # 如果有已支付金额且未退还，创建退款记录
-            if net_paid <= Decimal('0.00'):
-                continue
-            
-            if not dry_run:
-                # 获取退款用户
-                payment_user = Payment.objects.filter(
-                    rental=rental,
-                    transaction_type='CHARGE',
-                    status='PAID'
-                ).order_by('created_at').first()
-                refund_user = payment_user.user if payment_user else None
-                if not refund_user and rental.customer and rental.customer.user:
-                    refund_user = rental.customer.user
-                
-                if refund_user:
-                    Payment.objects.create(
-                        rental=rental,
-                        user=refund_user,
-                        amount=net_paid,
-                        payment_method='BANK',
-                        transaction_type='REFUND',
-                        status='REFUNDED',
-                        description=f'订单取消，退还已支付金额 ¥{net_paid:.2f}',
-                        paid_at=timezone.now(),
-                        transaction_id=f'REF{int(timezone.now().timestamp())}'
-                    )
-                    
-                    # 更新订单财务信息
-                    rental.refresh_financials()
-                    
-                    refunds_count += 1
-                    self.stdout.write(
-                        self.style.SUCCESS(
-                            f'  ✓ 已取消订单 #{rental.id} ({rental.customer.name}) - 退还已支付金额 ¥{net_paid:.2f}'
-                        )
-                    )
-                else:
-                    self.stdout.write(
-                        self.style.WARNING(
-                            f'  ⚠ 已取消订单 #{rental.id} ({rental.customer.name}) - 未找到退款用户，退款金额：¥{net_paid:.2f}'
-                        )
-                    )
-            else:
-                # 预览模式
-                refunds_count += 1
-                self.stdout.write(
-                    f'  [预览] 已取消订单 #{rental.id} ({rental.customer.name}) - 将退还已支付金额 ¥{net_paid:.2f}'
-                )
-        
-        if refunds_count == 0:
-            self.stdout.write('  没有需要退款的已取消订单')
-        
-        return refunds_count
-    
-    def _refresh_all_financials(self, dry_run):
-        """刷新所有订单的财务信息"""
-        all_rentals = Rental.objects.all()
-        total_count = all_rentals.count()
-        
-        self.stdout.write(f'  刷新 {total_count} 个订单的财务信息...')
-        
-        updates_count = 0
-        
-        for rental in all_rentals:
+        if dry_run:
+            pending_count = Rental.objects.filter(status='PENDING', start_date__lte=today).count()
+            overdue_count = Rental.objects.filter(status='ONGOING', end_date__lt=today).count()
+            self.stdout.write(f'  [预览] {pending_count} 个预订中订单将更新为"进行中"')
+            self.stdout.write(f'  [预览] {overdue_count} 个进行中订单将更新为"已超时未归还"')
+            return pending_count + overdue_count
+
+        counts = Rental.transition_statuses(today)
+        self.stdout.write(self.style.SUCCESS(f'  ✓ {counts["activated"]} 个订单状态更新为"进行中"'))
+        self.stdout.write(self.style.SUCCESS(f'  ✓ {counts["overdue"]} 个订单状态更新为"已超时未归还"'))
+        self.stdout.write(self.style.SUCCESS(f'  ✓ {counts["vehicles_rented"]} 辆车辆状态更新为"已租"'))
+        return counts['activated'] + counts['overdue']
+
+    def _run_phase(self, phase, checkpoint, chunk_size, executor, workers, dry_run):
+        """
+        分块执行一个回填阶段
+        计算（只读）可在进程池中并行，写入由主进程按块顺序执行；
+        结果按块顺序写入，因此检查点记录的ID之前的订单都已处理完成。
+        """
+        state = checkpoint.phase(phase)
+        if state['done']:
+            self.stdout.write('  检查点显示该阶段已完成，跳过')
+            return {'refunds': 0, 'financials': 0}
+
+        after_id = state['last_id']
+        total = phase_queryset(phase).filter(id__gt=after_id).count()
+        self.stdout.write(f'  待处理 {total} 个订单' + (f'（从订单ID {after_id} 之后继续）' if after_id else ''))
+
+        stats = {'scanned': 0, 'refunds': 0, 'financials': 0, 'missing_user': 0}
+        started = last_report = time.monotonic()
+
+        def handle_result(result):
+            nonlocal last_report
             if not dry_run:
-                rental.refresh_financials()
-                updates_count += 1
-            else:
-                updates_count += 1
-        
+                apply_chunk(result)
+                state['last_id'] = result['end_id']
+                checkpoint.save()
+            stats['scanned'] += result['scanned']
+            stats['refunds'] += len(result['refunds'])
+            stats['financials'] += len(result['financials'])
+            stats['missing_user'] += len(result['missing_user'])
+            for rental_id, amount in result['missing_user']:
+                self.stdout.write(self.style.WARNING(
+                    f'  ⚠ 订单 #{rental_id} 未找到退款用户，退款金额：¥{amount:.2f}'
+                ))
+            now = time.monotonic()
+            if now - last_report >= 1 or stats['scanned'] >= total:
+                last_report = now
+                self._report_progress(stats['scanned'], total, now - started, result['end_id'])
+
+        bounds = chunk_bounds(phase, after_id, chunk_size)
+        if executor is None:
+            for start_id, end_id in bounds:
+                handle_result(compute_chunk(phase, start_id, end_id))
+        else:
+            # 保持少量预先提交的计算任务，结果按提交顺序写入
+            pending = deque()
+            for start_id, end_id in bounds:
+                pending.append(executor.submit(compute_chunk, phase, start_id, end_id))
+                if len(pending) >= workers * 2:
+                    handle_result(pending.popleft().result())
+            while pending:
+                handle_result(pending.popleft().result())
+
         if not dry_run:
-            self.stdout.write(
-                self.style.SUCCESS(f'  ✓ 已刷新 {updates_count} 个订单的财务信息')
-            )
+            state['done'] = True
+            checkpoint.save()
+
+        elapsed = time.monotonic() - started
+        prefix = '  [预览] 将' if dry_run else '  ✓ 已'
+        if phase == 'financials':
+            self.stdout.write(self.style.SUCCESS(
+                f'{prefix}刷新 {stats["financials"]} 个订单的财务信息（扫描 {stats["scanned"]} 个，耗时 {elapsed:.1f} 秒）'
+            ))
         else:
-            self.stdout.write(f'  [预览] 将刷新 {updates_count} 个订单的财务信息')
-        
-        return updates_count
+            self.stdout.write(self.style.SUCCESS(
+                f'{prefix}创建 {stats["refunds"]} 条退款记录（扫描 {stats["scanned"]} 个，耗时 {elapsed:.1f} 秒）'
+            ))
+        if stats['missing_user']:
+            self.stdout.write(self.style.WARNING(f'  ⚠ {stats["missing_user"]} 个订单未找到退款用户，已跳过'))
+        return stats
 
+    def _report_progress(self, done, total, elapsed, last_id):
+        rate = done / elapsed if elapsed > 0 else 0
+        percent = done * 100 / total if total else 100
+        self.stdout.write(
+            f'  进度: {done}/{total} ({percent:.1f}%)，{rate:,.0f} 行/秒，当前订单ID {last_id}'
+        )
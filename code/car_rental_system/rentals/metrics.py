@@ -0,0 +1,228 @@
+"""
+经营指标时间序列（/api/metrics/，供仪表板等图表按任意时间范围、粒度绘制）
+- 指标（series）：每日经营汇总的各项指标（见 rentals/rollups.py 的 METRICS），如 revenue、new_rentals、refund_amount
+- 粒度（grain）：day / week / month，按自然日、自然周（周一开始）、自然月分桶，桶的日期为该桶第一天；
+  首尾两个桶可能只包含查询范围内的部分日期
+- 分组（group_by）：store（取车门店）、type（车型）直接读取每日经营汇总，一条 GROUP BY 查询；
+  brand（品牌）汇总表中没有，改为在订单表（退款指标为支付记录表）上按下单时间的本地日期、品牌一条 GROUP BY 查询，
+  再按粒度合并到桶中；SQLite 上时区换算是逐行调用的 Python 函数，查询范围内本地时区与 UTC 的时差不变时
+  （无夏令时切换）改用 SQLite 自带的 date(时间, '+N minutes') 换算
+- 没有数据的桶补 0，各分组的序列长度与 labels 一致
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import connection
+from django.db.models import DateField, Sum
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import TruncDate, TruncDay, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from .rollups import (
+    AMOUNT_METRICS, METRICS, REFUND_METRICS, month_start, refund_aggregates, rental_aggregates,
+)
+
+
+GRAINS = ('day', 'week', 'month')
+
+# 分组参数 → 每日经营汇总的字段（None 表示汇总表中没有，需要查询明细表）
+GROUP_FIELDS = {
+    'store': 'pickup_location',
+    'type': 'vehicle_type',
+    'brand': None,
+}
+
+# 单次查询最多返回的桶数（按天约两年）
+MAX_BUCKETS = 731
+
+# 未指定起始日期时默认查询的桶数
+DEFAULT_BUCKETS = {'day': 30, 'week': 12, 'month': 6}
+
+_TRUNC = {'day': TruncDay, 'week': TruncWeek, 'month': TruncMonth}
+
+
+class MetricsQueryError(ValueError):
+    """查询参数不合法（提示信息可直接返回给调用方）"""
+
+
+def bucket_start(day, grain):
+    """day 所在桶的第一天"""
+    if grain == 'week':
+        return day - timedelta(days=day.weekday())
+    if grain == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(start, grain):
+    """下一个桶的第一天"""
+    if grain == 'week':
+        return start + timedelta(days=7)
+    if grain == 'month':
+        return month_start(start, -1)
+    return start + timedelta(days=1)
+
+
+def buckets(start, end, grain):
+    """覆盖日期区间 [start, end] 的全部桶（第一天），按时间升序"""
+    result = []
+    current = bucket_start(start, grain)
+    while current <= end:
+        result.append(current)
+        current = next_bucket(current, grain)
+    return result
+
+
+def bucket_label(start, grain):
+    return start.strftime('%Y-%m') if grain == 'month' else start.isoformat()
+
+
+def default_start(end, grain):
+    """未指定起始日期时：截止日期往前 DEFAULT_BUCKETS 个桶"""
+    count = DEFAULT_BUCKETS[grain]
+    if grain == 'month':
+        return month_start(end, count - 1)
+    if grain == 'week':
+        return bucket_start(end, grain) - timedelta(weeks=count - 1)
+    return end - timedelta(days=count - 1)
+
+
+def parse_query(params, today=None):
+    """
+    校验、补全查询参数（request.GET），返回 (series, grain, start, end, group_by)
+    参数不合法时抛出 MetricsQueryError
+    """
+    series = params.get('series') or 'revenue'
+    if series not in METRICS:
+        raise MetricsQueryError(f'不支持的指标，可选：{", ".join(METRICS)}')
+    grain = params.get('grain') or 'month'
+    if grain not in GRAINS:
+        raise MetricsQueryError(f'不支持的粒度，可选：{", ".join(GRAINS)}')
+    group_by = params.get('group_by') or None
+    if group_by is not None and group_by not in GROUP_FIELDS:
+        raise MetricsQueryError(f'不支持的分组，可选：{", ".join(GROUP_FIELDS)}')
+
+    try:
+        end = datetime.strptime(params['to'], '%Y-%m-%d').date() if params.get('to') else None
+        start = datetime.strptime(params['from'], '%Y-%m-%d').date() if params.get('from') else None
+    except ValueError:
+        raise MetricsQueryError('日期格式应为 YYYY-MM-DD')
+    end = end or today or timezone.localdate()
+    start = start or default_start(end, grain)
+    if end < start:
+        raise MetricsQueryError('结束日期不能早于开始日期')
+    if len(buckets(start, end, grain)) > MAX_BUCKETS:
+        raise MetricsQueryError(f'时间范围过大，最多{MAX_BUCKETS}个时间段，请选择更粗的粒度')
+    return series, grain, start, end, group_by
+
+
+def _rollup_rows(series, grain, start, end, group_field):
+    """从每日经营汇总读取 (桶, 分组, 合计)"""
+    from .models import DailyRentalStat  # 避免循环导入
+    columns = ['bucket', group_field] if group_field else ['bucket']
+    rows = DailyRentalStat.objects.filter(day__gte=start, day__lte=end).annotate(
+        bucket=_TRUNC[grain]('day')
+    ).values(*columns).annotate(total=Sum(series)).order_by()
+    for row in rows:
+        yield row['bucket'], row[group_field] if group_field else '', row['total']
+
+
+def _local_bounds(start, end):
+    """本地日期区间 [start, end] 对应的时间范围 [起始时刻, 结束次日零点)"""
+    current_timezone = timezone.get_current_timezone()
+    return (
+        timezone.make_aware(datetime.combine(start, time.min), current_timezone),
+        timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min), current_timezone),
+    )
+
+
+def _fixed_offset_minutes(lower, upper):
+    """时间范围内本地时区与 UTC 的时差（分钟）；范围内有夏令时切换时返回 None"""
+    current_timezone = timezone.get_current_timezone()
+    offsets = set()
+    moment = lower
+    while moment <= upper:
+        offsets.add(moment.astimezone(current_timezone).utcoffset())
+        moment += timedelta(days=1)
+    if len(offsets) != 1:
+        return None
+    return int(offsets.pop().total_seconds() // 60)
+
+
+def _local_date(model, lower, upper):
+    """created_at 的本地日期表达式"""
+    offset = _fixed_offset_minutes(lower, upper) if connection.vendor == 'sqlite' else None
+    if offset is None:
+        return TruncDate('created_at')
+    column = f'{connection.ops.quote_name(model._meta.db_table)}.{connection.ops.quote_name("created_at")}'
+    return RawSQL(f'date({column}, %s)', [f'{offset:+d} minutes'], output_field=DateField())
+
+
+def _brand_rows(series, grain, start, end):
+    """按品牌分组：在订单表（退款指标为支付记录表）上按下单/退款时间的本地日期、品牌分组，再合并到桶"""
+    from accounts.models import Payment  # 避免循环导入
+    from .models import Rental
+
+    lower, upper = _local_bounds(start, end)
+    if series in REFUND_METRICS:
+        queryset = Payment.objects.filter(transaction_type='REFUND', status='REFUNDED')
+        brand_field = 'rental__vehicle__brand'
+        aggregate = refund_aggregates()[series]
+    else:
+        queryset = Rental.objects.all()
+        brand_field = 'vehicle__brand'
+        aggregate = rental_aggregates()[series]
+    rows = queryset.filter(created_at__gte=lower, created_at__lt=upper).annotate(
+        day=_local_date(queryset.model, lower, upper)
+    ).values('day', brand_field).annotate(total=aggregate).order_by()
+    for row in rows:
+        yield bucket_start(row['day'], grain), row[brand_field], row['total']
+
+
+def _number(value, series):
+    if series in AMOUNT_METRICS:
+        return float(value or Decimal('0.00'))
+    return int(value or 0)
+
+
+def time_series(series, grain, start, end, group_by=None):
+    """
+    按粒度分桶的指标序列：
+    {'series', 'grain', 'from', 'to', 'group_by', 'labels': [...], 'buckets': [桶第一天, ...],
+     'datasets': [{'key': 分组值（不分组时为空字符串）, 'total': 区间合计, 'data': [...]}, ...]}
+    分组按区间合计从大到小排列
+    """
+    bucket_list = buckets(start, end, grain)
+    positions = {bucket: index for index, bucket in enumerate(bucket_list)}
+
+    if group_by is not None and GROUP_FIELDS[group_by] is None:
+        rows = _brand_rows(series, grain, start, end)
+    else:
+        rows = _rollup_rows(series, grain, start, end, GROUP_FIELDS.get(group_by))
+
+    values = {}
+    for bucket, key, total in rows:
+        data = values.setdefault(key or '', [0] * len(bucket_list))
+        data[positions[bucket]] += total or 0
+    if group_by is None and not values:
+        values[''] = [0] * len(bucket_list)
+
+    datasets = [
+        {
+            'key': key,
+            'total': _number(sum(data), series),
+            'data': [_number(value, series) for value in data],
+        }
+        for key, data in values.items()
+    ]
+    datasets.sort(key=lambda dataset: (-dataset['total'], dataset['key']))
+    return {
+        'series': series,
+        'grain': grain,
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'group_by': group_by,
+        'labels': [bucket_label(bucket, grain) for bucket in bucket_list],
+        'buckets': [bucket.isoformat() for bucket in bucket_list],
+        'datasets': datasets,
+    }
@@ -0,0 +1,21 @@
+# Generated manually for date-range vehicle availability search
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rentals', '0004_add_return_location_fields'),
+    ]
+
+    operations = [
+        # 覆盖索引：按租期检索可用车辆时，一次范围扫描取出该时段被占用的车辆
+        migrations.AddIndex(
+            model_name='rental',
+            index=models.Index(
+                fields=['status', 'end_date', 'start_date', 'vehicle'],
+                name='rentals_status_b1f4f1_idx'
+            ),
+        ),
+    ]
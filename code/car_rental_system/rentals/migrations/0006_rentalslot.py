@@ -0,0 +1,54 @@
+# Generated manually for race-free concurrent booking
+
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_slots(apps, schema_editor):
+    """为现有的有效订单生成占用槽位（历史数据中已重叠的日期保留先写入的订单）"""
+    Rental = apps.get_model('rentals', 'Rental')
+    RentalSlot = apps.get_model('rentals', 'RentalSlot')
+    active_rentals = Rental.objects.filter(
+        status__in=['PENDING', 'ONGOING', 'OVERDUE']
+    ).order_by('created_at').values_list('id', 'vehicle_id', 'start_date', 'end_date')
+    slots = []
+    for rental_id, vehicle_id, start_date, end_date in active_rentals.iterator():
+        for offset in range((end_date - start_date).days + 1):
+            slots.append(RentalSlot(
+                rental_id=rental_id,
+                vehicle_id=vehicle_id,
+                day=start_date + timedelta(days=offset)
+            ))
+        if len(slots) >= 5000:
+            RentalSlot.objects.bulk_create(slots, ignore_conflicts=True)
+            slots = []
+    RentalSlot.objects.bulk_create(slots, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rentals', '0005_add_vehicle_period_index'),
+        ('vehicles', '0004_add_booking_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RentalSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(help_text='车辆被该订单占用的日期', verbose_name='占用日期')),
+                ('rental', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slots', to='rentals.rental', verbose_name='订单')),
+                ('vehicle', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rental_slots', to='vehicles.vehicle', verbose_name='车辆')),
+            ],
+            options={
+                'verbose_name': '预订槽位',
+                'verbose_name_plural': '预订槽位',
+                'db_table': 'rental_slots',
+                'constraints': [models.UniqueConstraint(fields=('vehicle', 'day'), name='uniq_rental_slot_vehicle_day')],
+            },
+        ),
+        migrations.RunPython(populate_slots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,86 @@
+# Generated manually for the time-decayed popularity ranking
+
+from collections import defaultdict
+from datetime import datetime, time as dt_time, timezone as dt_timezone
+
+from django.db import migrations, models
+
+
+# 以下为编写迁移时 rentals.popularity 中热度公式的副本（迁移不依赖之后会修改的代码）
+HALF_LIFE_DAYS = 30
+DECAY_EPOCH = datetime(2020, 1, 1, tzinfo=dt_timezone.utc)
+CREATE_WEIGHT = 1.0
+COMPLETE_WEIGHT = 1.0
+
+
+def growth(moment):
+    """基准时间之后 moment 时刻事件的折算系数"""
+    if not isinstance(moment, datetime):
+        moment = datetime.combine(moment, dt_time.min, tzinfo=dt_timezone.utc)
+    elif moment.tzinfo is None:
+        moment = moment.replace(tzinfo=dt_timezone.utc)
+    return 2.0 ** ((moment - DECAY_EPOCH).total_seconds() / (HALF_LIFE_DAYS * 86400))
+
+
+def populate_popularity(apps, schema_editor):
+    """按全部未取消订单计算各维度的热度"""
+    PopularityScore = apps.get_model('rentals', 'PopularityScore')
+    Rental = apps.get_model('rentals', 'Rental')
+
+    totals = defaultdict(lambda: [0.0, 0])
+    rows = Rental.objects.exclude(status='CANCELLED').order_by().values_list(
+        'vehicle_id', 'vehicle__vehicle_type', 'pickup_location', 'status', 'created_at', 'actual_return_date'
+    )
+    for vehicle_id, vehicle_type, pickup_location, status, created_at, actual_return_date in rows.iterator(
+        chunk_size=5000
+    ):
+        contribution = 0.0
+        if created_at is not None:
+            contribution = CREATE_WEIGHT * growth(created_at)
+            if status == 'COMPLETED' and actual_return_date:
+                contribution += COMPLETE_WEIGHT * growth(actual_return_date)
+        keys = [('VEHICLE', str(vehicle_id))]
+        if vehicle_type:
+            keys.append(('VEHICLE_TYPE', vehicle_type))
+        if pickup_location:
+            keys.append(('STORE', pickup_location))
+        for dimension_key in keys:
+            totals[dimension_key][0] += contribution
+            totals[dimension_key][1] += 1
+
+    PopularityScore.objects.bulk_create(
+        [
+            PopularityScore(dimension=dimension, key=key, score=score, rental_count=rental_count)
+            for (dimension, key), (score, rental_count) in totals.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rentals', '0006_rentalslot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PopularityScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('VEHICLE', '车辆'), ('VEHICLE_TYPE', '车型'), ('STORE', '门店')], max_length=20, verbose_name='维度')),
+                ('key', models.CharField(help_text='车辆ID、车型代码或取车门店', max_length=200, verbose_name='键')),
+                ('score', models.FloatField(default=0.0, help_text='折算到基准时间的累计热度，当前热度 = score × 衰减因子', verbose_name='热度')),
+                ('rental_count', models.IntegerField(default=0, help_text='计入热度的订单数（不含已取消订单）', verbose_name='订单数')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+            ],
+            options={
+                'verbose_name': '热度',
+                'verbose_name_plural': '热度',
+                'db_table': 'popularity_scores',
+                'indexes': [models.Index(fields=['dimension', '-score'], name='popularity_dimension_score_idx')],
+                'constraints': [models.UniqueConstraint(fields=('dimension', 'key'), name='uniq_popularity_dimension_key')],
+            },
+        ),
+        migrations.RunPython(populate_popularity, migrations.RunPython.noop),
+    ]
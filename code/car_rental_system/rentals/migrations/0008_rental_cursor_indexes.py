@@ -0,0 +1,22 @@
+# Generated manually for keyset (cursor) pagination
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rentals', '0007_popularityscore'),
+    ]
+
+    operations = [
+        # 游标分页的排序键（订单列表、我的订单）
+        migrations.AddIndex(
+            model_name='rental',
+            index=models.Index(fields=['created_at', 'id'], name='rental_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rental',
+            index=models.Index(fields=['customer', 'created_at'], name='rental_customer_created_idx'),
+        ),
+    ]
@@ -0,0 +1,92 @@
+# Generated manually for the daily revenue rollups
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+
+
+# 以下为编写迁移时 rentals.rollups 中汇总口径的副本（迁移不依赖之后会修改的代码）
+RENTAL_METRICS = ('new_rentals', 'new_amount', 'completed_rentals', 'revenue', 'cancelled_rentals')
+REFUND_METRICS = ('refunds', 'refund_amount')
+AMOUNT_METRICS = {'new_amount', 'revenue', 'refund_amount'}
+
+
+def _zero(metric):
+    return Decimal('0.00') if metric in AMOUNT_METRICS else 0
+
+
+def populate_rollups(apps, schema_editor):
+    """按全部订单、已完成退款两条分组查询生成每日汇总行"""
+    DailyRentalStat = apps.get_model('rentals', 'DailyRentalStat')
+    Rental = apps.get_model('rentals', 'Rental')
+    Payment = apps.get_model('accounts', 'Payment')
+
+    totals = defaultdict(lambda: {metric: _zero(metric) for metric in RENTAL_METRICS + REFUND_METRICS})
+    rental_rows = Rental.objects.order_by().annotate(day=TruncDate('created_at')).values(
+        'day', 'pickup_location', 'vehicle__vehicle_type'
+    ).annotate(
+        new_rentals=Count('id'),
+        new_amount=Sum('total_amount'),
+        completed_rentals=Count('id', filter=Q(status='COMPLETED')),
+        revenue=Sum('total_amount', filter=Q(status='COMPLETED')),
+        cancelled_rentals=Count('id', filter=Q(status='CANCELLED')),
+    )
+    for row in rental_rows:
+        key = (row['day'], row['pickup_location'] or '', row['vehicle__vehicle_type'] or '')
+        for metric in RENTAL_METRICS:
+            totals[key][metric] += row[metric] or _zero(metric)
+
+    refund_rows = Payment.objects.filter(
+        transaction_type='REFUND', status='REFUNDED'
+    ).order_by().annotate(day=TruncDate('created_at')).values(
+        'day', 'rental__pickup_location', 'rental__vehicle__vehicle_type'
+    ).annotate(refunds=Count('id'), refund_amount=Sum('amount'))
+    for row in refund_rows:
+        key = (row['day'], row['rental__pickup_location'] or '', row['rental__vehicle__vehicle_type'] or '')
+        for metric in REFUND_METRICS:
+            totals[key][metric] += row[metric] or _zero(metric)
+
+    DailyRentalStat.objects.bulk_create(
+        [
+            DailyRentalStat(day=day, pickup_location=pickup_location, vehicle_type=vehicle_type, **metrics)
+            for (day, pickup_location, vehicle_type), metrics in totals.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rentals', '0008_rental_cursor_indexes'),
+        ('accounts', '0003_cursor_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRentalStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='日期')),
+                ('pickup_location', models.CharField(blank=True, default='', max_length=200, verbose_name='取车门店')),
+                ('vehicle_type', models.CharField(blank=True, default='', max_length=20, verbose_name='车型')),
+                ('new_rentals', models.IntegerField(default=0, verbose_name='新订单数')),
+                ('new_amount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14, verbose_name='新订单金额')),
+                ('completed_rentals', models.IntegerField(default=0, help_text='当日下单且已完成的订单数', verbose_name='已完成订单数')),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), help_text='当日下单且已完成的订单金额', max_digits=14, verbose_name='营业收入')),
+                ('cancelled_rentals', models.IntegerField(default=0, verbose_name='已取消订单数')),
+                ('refunds', models.IntegerField(default=0, verbose_name='退款笔数')),
+                ('refund_amount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14, verbose_name='退款金额')),
+            ],
+            options={
+                'verbose_name': '每日经营汇总',
+                'verbose_name_plural': '每日经营汇总',
+                'db_table': 'daily_rental_stats',
+                'constraints': [models.UniqueConstraint(fields=('day', 'pickup_location', 'vehicle_type'), name='uniq_daily_stat_day_store_type')],
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
@@ -5,11 +5,19 @@ from django.core.exceptions import ValidationError
 from datetime import date
 from decimal import Decimal
 from django.utils import timezone
+from car_rental_system.managed_columns import ManagedColumnsMixin
 from customers.models import Customer
 from vehicles.models import Vehicle
 
 
-class Rental(models.Model):
+# 由支付记录信号以查询集 UPDATE 增量维护的财务快照列（见 accounts/signals.py），整体保存订单时不写回；
+# 需要写入快照时显式指定 update_fields（见 refresh_settlement / refresh_financials）
+FINANCIAL_COLUMNS = ('amount_paid', 'amount_refunded', 'settlement_status', 'settled_at')
+
+
+class Rental(ManagedColumnsMixin, models.Model):
+    managed_columns = FINANCIAL_COLUMNS
+
     RENTAL_STATUS_CHOICES = [
         ('PENDING', '预订中'),
         ('ONGOING', '进行中'),
@@ -166,66 +174,102 @@ class Rental(models.Model):
             models.Index(fields=['status']),
             models.Index(fields=['customer', 'status']),
             models.Index(fields=['vehicle', 'status']),
+            # 覆盖索引：按租期检索可用车辆时，一次范围扫描取出该时段被占用的车辆
+            models.Index(fields=['status', 'end_date', 'start_date', 'vehicle']),
+            # 游标分页的排序键（订单列表、我的订单）
+            models.Index(fields=['created_at', 'id'], name='rental_created_id_idx'),
+            models.Index(fields=['customer', 'created_at'], name='rental_customer_created_idx'),
         ]
     
     @classmethod
-    def auto_update_status(cls):
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 记录从数据库加载时的字段值，保存时据此判断哪些字段发生了变化（见 rentals/signals.py）
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+    
+    @classmethod
+    def transition_statuses(cls, today=None):
+        """
+        按日期批量推进订单状态（每一步都是一条 UPDATE ... WHERE 语句，耗时不随订单数逐行增长）
+        - 车辆：即将激活订单所用的可用车辆 → 已租
+        - 订单：预订中 → 进行中（已到开始日期）
+        - 订单：进行中 → 已超时未归还（已过结束日期）
+        返回各步骤更新的行数：{'activated': 订单数, 'vehicles_rented': 车辆数, 'overdue': 订单数}
+        三种状态都属于有效订单，车辆占用区间不变，因此无需逐条触发保存信号；
+        有更新时在提交后统一失效订单、车辆相关缓存（见 car_rental_system/cache_tags.py）。
+        """
+        from django.db import transaction
+        from car_rental_system.cache_tags import TAG_RENTAL, TAG_VEHICLE, invalidate_on_commit
+        
+        today = today or date.today()
+        now = timezone.now()
+        
+        with transaction.atomic():
+            due_pending = cls.objects.filter(status='PENDING', start_date__lte=today)
+            
+            # 1. 更新车辆状态为已租（须在订单状态改变前按预订中订单筛选）
+            vehicles_rented = Vehicle.objects.filter(
+                status='AVAILABLE',
+                pk__in=due_pending.values('vehicle_id')
+            ).update(status='RENTED')
+            
+            # 2. 激活预订中订单（预订中 → 进行中）
+            activated = due_pending.update(status='ONGOING', updated_at=now)
+            
+            # 3. 更新过期订单（进行中 → 已超时未归还）
+            overdue = cls.objects.filter(
+                status='ONGOING',
+                end_date__lt=today
+            ).update(status='OVERDUE', updated_at=now)
+            
+            invalidate_on_commit(
+                TAG_RENTAL if activated or overdue else None,
+                TAG_VEHICLE if vehicles_rented else None,
+            )
+        
+        return {
+            'activated': activated,
+            'vehicles_rented': vehicles_rented,
+            'overdue': overdue,
+        }
+    
+    @classmethod
+    def auto_update_status(cls, force=False):
         """
         自动更新订单状态
         - 预订中 → 进行中：当到达开始日期时
         - 进行中 → 已超时未归还：当超过结束日期时
-        使用缓存避免频繁更新（每5分钟最多更新一次）
+        使用缓存避免频繁更新（每5分钟最多更新一次，force=True 时忽略）
+        settings.RENTAL_AUTO_UPDATE_IN_REQUEST = False 时由 run_scheduler 调度器负责，此处不再执行
+        返回 transition_statuses() 的更新计数；跳过或失败时返回 None
         """
+        from django.conf import settings
         from django.core.cache import cache
-        from django.db import transaction
+        
+        if not force and not getattr(settings, 'RENTAL_AUTO_UPDATE_IN_REQUEST', True):
+            return None
         
         cache_key = 'rental_status_auto_update'
         last_update = cache.get(cache_key)
         
         # 如果5分钟内已更新过，跳过
-        if last_update:
-            return
-        
-        today = date.today()
-        updated_count = 0
+        if last_update and not force:
+            return None
         
         try:
-            with transaction.atomic():
-                # 1. 激活预订中订单（预订中 → 进行中）
-                pending_rentals = cls.objects.filter(
-                    status='PENDING',
-                    start_date__lte=today
-                ).select_related('vehicle')
-                
-                for rental in pending_rentals:
-                    rental.status = 'ONGOING'
-                    rental.save(update_fields=['status', 'updated_at'])
-                    updated_count += 1
-                    
-                    # 更新车辆状态为已租
-                    if rental.vehicle.status == 'AVAILABLE':
-                        rental.vehicle.status = 'RENTED'
-                        rental.vehicle.save(update_fields=['status'])
-                
-                # 2. 更新过期订单（进行中 → 已超时未归还）
-                overdue_rentals = cls.objects.filter(
-                    status='ONGOING',
-                    end_date__lt=today
-                )
-                
-                for rental in overdue_rentals:
-                    rental.status = 'OVERDUE'
-                    rental.save(update_fields=['status', 'updated_at'])
-                    updated_count += 1
+            counts = cls.transition_statuses()
             
             # 设置缓存，5分钟内不再更新
             cache.set(cache_key, timezone.now(), 300)  # 5分钟缓存
+            return counts
             
         except Exception as e:
             # 更新失败不影响正常流程
             import logging
             logger = logging.getLogger(__name__)
             logger.error(f'自动更新订单状态失败: {e}')
+            return None
     
     def clean(self):
         """自定义验证方法"""
@@ -266,7 +310,7 @@ class Rental(models.Model):
             # 默认异地还车费用为日租金的50%（可根据实际业务调整）
             if self.vehicle:
                 self.cross_location_fee = self.vehicle.daily_rate * Decimal('0.5')
-        
+
         super().save(*args, **kwargs)
     
     def __str__(self):
@@ -404,8 +448,26 @@ class Rental(models.Model):
             cross_location_fee = Decimal('0.00')
         return base_amount + deposit_amount + cross_location_fee + overdue_fee
     
+    def settlement_for(self, paid_total):
+        """根据累计已支付金额计算结算状态，返回 (settlement_status, settled_at)"""
+        order_total = self.calculate_order_total()
+        if self.status == 'COMPLETED' and order_total <= paid_total:
+            return 'SETTLED', self.settled_at or timezone.now()
+        if paid_total > Decimal('0.00'):
+            return 'PARTIAL', self.settled_at
+        return 'UNSETTLED', None
+    
+    def refresh_settlement(self, save=True):
+        """
+        根据订单上的累计支付快照（amount_paid）刷新结算状态，不查询支付记录
+        用于订单状态或费用变化后（如还车完成）；支付记录变化时快照由 accounts/signals.py 增量维护
+        """
+        self.settlement_status, self.settled_at = self.settlement_for(self.amount_paid or Decimal('0.00'))
+        if save:
+            self.save(update_fields=['settlement_status', 'settled_at', 'updated_at'])
+    
     def refresh_financials(self, save=True):
-        """根据支付记录刷新累计支付/退款信息"""
+        """根据支付记录重新汇总累计支付/退款信息（全量重算，用于修复快照；日常由支付记录信号增量维护）"""
         from accounts.models import Payment  # 避免循环导入
         paid_total = Payment.objects.filter(
             rental=self,
@@ -422,16 +484,7 @@ class Rental(models.Model):
         self.amount_refunded = refunded_total
         
         # 根据支付情况更新结算状态
-        order_total = self.calculate_order_total()
-        if self.status == 'COMPLETED' and order_total <= paid_total:
-            self.settlement_status = 'SETTLED'
-            if not self.settled_at:
-                self.settled_at = timezone.now()
-        elif paid_total > Decimal('0.00'):
-            self.settlement_status = 'PARTIAL'
-        else:
-            self.settlement_status = 'UNSETTLED'
-            self.settled_at = None
+        self.settlement_status, self.settled_at = self.settlement_for(paid_total)
         
         if save:
             self.save(update_fields=[
@@ -497,9 +550,7 @@ class Rental(models.Model):
             paid_at=timezone.now(),
             transaction_id=f'REF{int(timezone.now().timestamp())}'
         )
-        
-        # 刷新财务信息
-        self.refresh_financials()
+        # 累计退款金额和结算状态由支付记录信号更新（同时同步到当前订单对象）
         
         return True, refundable
     
@@ -509,3 +560,155 @@ class Rental(models.Model):
         order_total = self.calculate_order_total()
         remaining = order_total - self.amount_paid
         return remaining if remaining > Decimal('0.00') else Decimal('0.00')
+
+
+class RentalSlot(models.Model):
+    """
+    车辆占用日（预订槽位）
+    有效订单（预订中、进行中、已超时未归还）的每一天对应一行，
+    (车辆, 日期) 唯一约束由数据库保证同一辆车同一天只能被一个订单占用，
+    并发预订时后提交的订单会因唯一约束冲突而被拒绝。
+    """
+    rental = models.ForeignKey(
+        Rental,
+        on_delete=models.CASCADE,
+        related_name='slots',
+        verbose_name='订单'
+    )
+    vehicle = models.ForeignKey(
+        Vehicle,
+        on_delete=models.CASCADE,
+        related_name='rental_slots',
+        verbose_name='车辆'
+    )
+    day = models.DateField(
+        '占用日期',
+        help_text='车辆被该订单占用的日期'
+    )
+    
+    class Meta:
+        db_table = 'rental_slots'
+        verbose_name = '预订槽位'
+        verbose_name_plural = '预订槽位'
+        constraints = [
+            models.UniqueConstraint(fields=['vehicle', 'day'], name='uniq_rental_slot_vehicle_day'),
+        ]
+    
+    def __str__(self):
+        return f"{self.vehicle_id} @ {self.day} (订单 #{self.rental_id})"
+
+
+class PopularityScore(models.Model):
+    """
+    时间衰减热度（每辆车、每个车型、每个门店一行）
+    每个订单在创建和完成时各贡献一次热度，贡献随时间按半衰期指数衰减。
+    score 保存的是折算到固定基准时间之后的值（见 rentals/popularity.py），
+    所有行的衰减因子相同，按 score 排序即为按当前热度排序，取前N名只需读取N行。
+    """
+    DIMENSION_CHOICES = [
+        ('VEHICLE', '车辆'),
+        ('VEHICLE_TYPE', '车型'),
+        ('STORE', '门店'),
+    ]
+    
+    dimension = models.CharField(
+        '维度',
+        max_length=20,
+        choices=DIMENSION_CHOICES
+    )
+    key = models.CharField(
+        '键',
+        max_length=200,
+        help_text='车辆ID、车型代码或取车门店'
+    )
+    score = models.FloatField(
+        '热度',
+        default=0.0,
+        help_text='折算到基准时间的累计热度，当前热度 = score × 衰减因子'
+    )
+    rental_count = models.IntegerField(
+        '订单数',
+        default=0,
+        help_text='计入热度的订单数（不含已取消订单）'
+    )
+    updated_at = models.DateTimeField(
+        '更新时间',
+        auto_now=True
+    )
+    
+    class Meta:
+        db_table = 'popularity_scores'
+        verbose_name = '热度'
+        verbose_name_plural = '热度'
+        constraints = [
+            models.UniqueConstraint(fields=['dimension', 'key'], name='uniq_popularity_dimension_key'),
+        ]
+        indexes = [
+            models.Index(fields=['dimension', '-score'], name='popularity_dimension_score_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_dimension_display()} {self.key}: {self.score:.3g}"
+
+
+class DailyRentalStat(models.Model):
+    """
+    每日经营汇总（按 日期 × 取车门店 × 车型 一行）
+    订单按下单日期计入：新订单数和金额，其中已完成订单的数量和金额（营业收入）、已取消订单数；
+    退款按退款记录的创建日期计入所属订单的门店、车型。
+    由订单、支付记录信号增量维护（见 rentals/rollups.py），rebuild_rental_rollups 命令可全量重建；
+    仪表板等统计只需读取汇总行，行数随天数增长，与订单数无关。
+    """
+    day = models.DateField('日期')
+    pickup_location = models.CharField(
+        '取车门店',
+        max_length=200,
+        blank=True,
+        default=''
+    )
+    vehicle_type = models.CharField(
+        '车型',
+        max_length=20,
+        blank=True,
+        default=''
+    )
+    new_rentals = models.IntegerField('新订单数', default=0)
+    new_amount = models.DecimalField(
+        '新订单金额',
+        max_digits=14,
+        decimal_places=2,
+        default=Decimal('0.00')
+    )
+    completed_rentals = models.IntegerField(
+        '已完成订单数',
+        default=0,
+        help_text='当日下单且已完成的订单数'
+    )
+    revenue = models.DecimalField(
+        '营业收入',
+        max_digits=14,
+        decimal_places=2,
+        default=Decimal('0.00'),
+        help_text='当日下单且已完成的订单金额'
+    )
+    cancelled_rentals = models.IntegerField('已取消订单数', default=0)
+    refunds = models.IntegerField('退款笔数', default=0)
+    refund_amount = models.DecimalField(
+        '退款金额',
+        max_digits=14,
+        decimal_places=2,
+        default=Decimal('0.00')
+    )
+    
+    class Meta:
+        db_table = 'daily_rental_stats'
+        verbose_name = '每日经营汇总'
+        verbose_name_plural = '每日经营汇总'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'pickup_location', 'vehicle_type'], name='uniq_daily_stat_day_store_type'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.day} {self.pickup_location or '-'} {self.vehicle_type or '-'}"
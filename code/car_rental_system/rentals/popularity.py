@@ -0,0 +1,170 @@
+"""
+时间衰减热度
+每个订单在创建时贡献 CREATE_WEIGHT，完成（已还车）时再贡献 COMPLETE_WEIGHT，
+贡献随时间按半衰期 HALF_LIFE_DAYS 指数衰减：t 时刻的事件在 now 时刻的热度为 w × 2^(-(now - t) / 半衰期)。
+
+为了不必定期给所有行乘衰减因子，表中保存的是折算到基准时间 DECAY_EPOCH 之后的值：
+    score = Σ w × 2^((t - 基准时间) / 半衰期)
+    当前热度 = score × 2^(-(now - 基准时间) / 半衰期)
+所有行的衰减因子相同，按 score 排序即为按当前热度排序（索引 (dimension, -score) 直接取前N名）。
+
+订单的贡献只取决于订单本身的字段（创建时间、状态、实际还车日期、车辆、取车门店），
+订单保存/删除时按新旧贡献之差增量更新（见 rentals/signals.py），
+rebuild_popularity 按同样的公式全量重算，两者结果一致。
+"""
+from collections import defaultdict
+from datetime import datetime, time as dt_time, timezone as dt_timezone
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+
+# 半衰期（天）
+HALF_LIFE_DAYS = 30
+
+# 衰减基准时间（score 的折算时间点）；约每80年需要重新选取并运行 rebuild_popularity
+DECAY_EPOCH = datetime(2020, 1, 1, tzinfo=dt_timezone.utc)
+
+# 订单创建、完成各自贡献的热度
+CREATE_WEIGHT = 1.0
+COMPLETE_WEIGHT = 1.0
+
+# 影响热度贡献的订单字段
+POPULARITY_FIELDS = ('vehicle_id', 'status', 'created_at', 'actual_return_date', 'pickup_location')
+
+_SECONDS_PER_HALF_LIFE = HALF_LIFE_DAYS * 86400
+
+
+def growth(moment):
+    """基准时间之后 moment 时刻事件的折算系数 2^((moment - 基准时间) / 半衰期)"""
+    if not isinstance(moment, datetime):
+        moment = datetime.combine(moment, dt_time.min, tzinfo=dt_timezone.utc)
+    elif timezone.is_naive(moment):
+        moment = moment.replace(tzinfo=dt_timezone.utc)
+    return 2.0 ** ((moment - DECAY_EPOCH).total_seconds() / _SECONDS_PER_HALF_LIFE)
+
+
+def decay_factor(now=None):
+    """把折算后的 score 换算为 now 时刻热度的系数"""
+    return 1.0 / growth(now or timezone.now())
+
+
+def rental_contribution(status, created_at, actual_return_date):
+    """单个订单的折算热度；已取消订单不计热度"""
+    if status == 'CANCELLED' or created_at is None:
+        return 0.0
+    score = CREATE_WEIGHT * growth(created_at)
+    if status == 'COMPLETED' and actual_return_date:
+        score += COMPLETE_WEIGHT * growth(actual_return_date)
+    return score
+
+
+def rental_keys(vehicle_id, vehicle_type, pickup_location):
+    """订单计入的各维度键"""
+    keys = [('VEHICLE', str(vehicle_id))]
+    if vehicle_type:
+        keys.append(('VEHICLE_TYPE', vehicle_type))
+    if pickup_location:
+        keys.append(('STORE', pickup_location))
+    return keys
+
+
+def apply_delta(dimension, key, score_delta, count_delta, score_model=None):
+    """原子地累加一行的热度（行不存在时创建；并发创建冲突时改为累加）"""
+    if score_model is None:
+        from .models import PopularityScore as score_model
+    rows = score_model.objects.filter(dimension=dimension, key=key)
+    if rows.update(score=F('score') + score_delta, rental_count=F('rental_count') + count_delta):
+        return
+    try:
+        with transaction.atomic():
+            score_model.objects.create(
+                dimension=dimension, key=key, score=score_delta, rental_count=count_delta
+            )
+    except IntegrityError:
+        rows.update(score=F('score') + score_delta, rental_count=F('rental_count') + count_delta)
+
+
+def _vehicle_type(vehicle_id):
+    from vehicles.models import Vehicle  # 避免循环导入
+    return Vehicle.objects.filter(pk=vehicle_id).values_list('vehicle_type', flat=True).first()
+
+
+def apply_rental_change(old, new, vehicle_type=None):
+    """
+    按订单新旧字段值（POPULARITY_FIELDS 组成的字典，新建订单 old 为 None，删除订单 new 为 None）增量更新热度
+    vehicle_type 为新车辆的车型（未传入时按车辆ID查询）
+    """
+    vehicle_types = {new['vehicle_id']: vehicle_type} if new is not None and vehicle_type is not None else {}
+    deltas = defaultdict(lambda: [0.0, 0])
+    for values, sign in ((old, -1), (new, 1)):
+        if values is None:
+            continue
+        contribution = rental_contribution(values['status'], values['created_at'], values['actual_return_date'])
+        if not contribution:
+            continue
+        vehicle_id = values['vehicle_id']
+        if vehicle_id not in vehicle_types:
+            vehicle_types[vehicle_id] = _vehicle_type(vehicle_id)
+        for dimension_key in rental_keys(vehicle_id, vehicle_types[vehicle_id], values['pickup_location']):
+            deltas[dimension_key][0] += sign * contribution
+            deltas[dimension_key][1] += sign
+
+    for (dimension, key), (score_delta, count_delta) in deltas.items():
+        if score_delta or count_delta:
+            apply_delta(dimension, key, score_delta, count_delta)
+
+
+def top(dimension, limit=10, now=None):
+    """
+    热度前 limit 名，返回 [(键, 当前热度, 订单数), ...]
+    只按索引读取 limit 行
+    """
+    from .models import PopularityScore  # 避免循环导入
+    factor = decay_factor(now)
+    rows = PopularityScore.objects.filter(
+        dimension=dimension, rental_count__gt=0
+    ).order_by('-score', 'key').values_list('key', 'score', 'rental_count')[:limit]
+    return [(key, score * factor, rental_count) for key, score, rental_count in rows]
+
+
+def top_vehicle_ids(limit=10):
+    """热度最高的车辆ID"""
+    return [int(key) for key, _, _ in top('VEHICLE', limit)]
+
+
+def rebuild_popularity(score_model=None, rental_model=None, chunk_size=5000):
+    """
+    按全部订单全量重算热度表（迁移中传入历史模型）
+    返回 (写入的行数, 扫描的订单数)
+    """
+    if score_model is None:
+        from .models import PopularityScore as score_model
+    if rental_model is None:
+        from .models import Rental as rental_model
+
+    totals = defaultdict(lambda: [0.0, 0])
+    scanned = 0
+    rows = rental_model.objects.exclude(status='CANCELLED').order_by().values_list(
+        'vehicle_id', 'vehicle__vehicle_type', 'pickup_location', 'status', 'created_at', 'actual_return_date'
+    )
+    for vehicle_id, vehicle_type, pickup_location, status, created_at, actual_return_date in rows.iterator(
+        chunk_size=chunk_size
+    ):
+        scanned += 1
+        contribution = rental_contribution(status, created_at, actual_return_date)
+        for dimension_key in rental_keys(vehicle_id, vehicle_type, pickup_location):
+            totals[dimension_key][0] += contribution
+            totals[dimension_key][1] += 1
+
+    with transaction.atomic():
+        score_model.objects.all().delete()
+        score_model.objects.bulk_create(
+            [
+                score_model(dimension=dimension, key=key, score=score, rental_count=rental_count)
+                for (dimension, key), (score, rental_count) in totals.items()
+            ],
+            batch_size=1000,
+        )
+    return len(totals), scanned
@@ -0,0 +1,306 @@
+"""
+每日经营汇总（DailyRentalStat：日期 × 取车门店 × 车型）
+仪表板、租赁管理首页、客户统计接口原本每次对订单表做十几次 COUNT/SUM，耗时随订单数增长；
+改为读取按天汇总的行，行数只随天数、门店数、车型数增长。
+- 订单按下单日期（本地时区）计入：新订单数/金额、已完成订单数/金额（营业收入）、已取消订单数
+- 退款（REFUND + REFUNDED）按退款记录的创建日期计入所属订单的门店、车型
+- 订单、支付记录保存/删除时按新旧贡献之差增量更新（见 rentals/signals.py、accounts/signals.py）
+- 预订中 → 进行中 → 已超时未归还的批量状态推进不影响汇总（汇总不区分这几种状态），
+  这几种状态的订单数直接按 status 索引统计
+- 汇总按车辆当前车型计（与全量重建一致）：车辆修改车型时把该车全部订单、退款的贡献移到新车型行（move_vehicle_type）
+- 订单改派车辆或门店后，已有退款仍计在原门店、车型下；bulk_create、QuerySet.update 等绕过信号的写入
+  或怀疑数据不一致时运行 rebuild_rental_rollups 命令全量重建（批量回填的退款由 apply_new_refunds 计入）
+"""
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+
+from .availability import ACTIVE_RENTAL_STATUSES
+
+
+# 影响汇总的订单字段
+ROLLUP_FIELDS = ('vehicle_id', 'pickup_location', 'status', 'total_amount', 'created_at')
+
+# 影响退款汇总的支付记录字段
+REFUND_FIELDS = ('rental_id', 'transaction_type', 'status', 'amount', 'created_at')
+
+# 汇总指标
+METRICS = (
+    'new_rentals', 'new_amount', 'completed_rentals', 'revenue',
+    'cancelled_rentals', 'refunds', 'refund_amount',
+)
+AMOUNT_METRICS = {'new_amount', 'revenue', 'refund_amount'}
+
+# 按订单统计的指标和按退款记录统计的指标
+RENTAL_METRICS = ('new_rentals', 'new_amount', 'completed_rentals', 'revenue', 'cancelled_rentals')
+REFUND_METRICS = ('refunds', 'refund_amount')
+
+
+def _zero(metric):
+    return Decimal('0.00') if metric in AMOUNT_METRICS else 0
+
+
+def local_day(moment):
+    """时间点所在的本地日期"""
+    if moment is None:
+        return None
+    if timezone.is_aware(moment):
+        return timezone.localdate(moment)
+    return moment.date()
+
+
+def rental_contribution(status, total_amount):
+    """单个订单对其下单日汇总行的贡献"""
+    amount = total_amount or Decimal('0.00')
+    completed = status == 'COMPLETED'
+    return {
+        'new_rentals': 1,
+        'new_amount': amount,
+        'completed_rentals': int(completed),
+        'revenue': amount if completed else Decimal('0.00'),
+        'cancelled_rentals': int(status == 'CANCELLED'),
+    }
+
+
+def refund_contribution(transaction_type, status, amount):
+    """单条支付记录对退款汇总的贡献（不是已完成的退款时为 None）"""
+    if transaction_type == 'REFUND' and status == 'REFUNDED':
+        return {'refunds': 1, 'refund_amount': amount or Decimal('0.00')}
+    return None
+
+
+def apply_delta(key, deltas, stat_model=None):
+    """原子地累加一行的各项指标（行不存在时创建；并发创建冲突时改为累加）"""
+    if stat_model is None:
+        from .models import DailyRentalStat as stat_model
+    deltas = {metric: value for metric, value in deltas.items() if value}
+    if not deltas:
+        return
+    day, pickup_location, vehicle_type = key
+    rows = stat_model.objects.filter(day=day, pickup_location=pickup_location, vehicle_type=vehicle_type)
+    increments = {metric: F(metric) + value for metric, value in deltas.items()}
+    if rows.update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            stat_model.objects.create(
+                day=day, pickup_location=pickup_location, vehicle_type=vehicle_type, **deltas
+            )
+    except IntegrityError:
+        rows.update(**increments)
+
+
+def _apply_deltas(deltas):
+    for key, metrics in deltas.items():
+        apply_delta(key, metrics)
+
+
+def rental_aggregates():
+    """订单表上各项订单指标的聚合表达式（全量重建汇总、按汇总表没有的维度统计时使用）"""
+    return {
+        'new_rentals': Count('id'),
+        'new_amount': Sum('total_amount'),
+        'completed_rentals': Count('id', filter=Q(status='COMPLETED')),
+        'revenue': Sum('total_amount', filter=Q(status='COMPLETED')),
+        'cancelled_rentals': Count('id', filter=Q(status='CANCELLED')),
+    }
+
+
+def refund_aggregates():
+    """已完成退款记录（调用方先按 REFUND + REFUNDED 过滤）上各项退款指标的聚合表达式"""
+    return {'refunds': Count('id'), 'refund_amount': Sum('amount')}
+
+
+def _vehicle_type(vehicle_id):
+    from vehicles.models import Vehicle  # 避免循环导入
+    return Vehicle.objects.filter(pk=vehicle_id).values_list('vehicle_type', flat=True).first()
+
+
+def apply_rental_change(old, new, vehicle_type=None):
+    """
+    按订单新旧字段值（ROLLUP_FIELDS 组成的字典，新建订单 old 为 None，删除订单 new 为 None）增量更新汇总
+    vehicle_type 为新车辆的车型（未传入时按车辆ID查询）
+    """
+    vehicle_types = {new['vehicle_id']: vehicle_type} if new is not None and vehicle_type is not None else {}
+    deltas = defaultdict(lambda: defaultdict(int))
+    for values, sign in ((old, -1), (new, 1)):
+        if values is None or values['created_at'] is None:
+            continue
+        vehicle_id = values['vehicle_id']
+        if vehicle_id not in vehicle_types:
+            vehicle_types[vehicle_id] = _vehicle_type(vehicle_id)
+        key = (local_day(values['created_at']), values['pickup_location'] or '', vehicle_types[vehicle_id] or '')
+        for metric, value in rental_contribution(values['status'], values['total_amount']).items():
+            deltas[key][metric] += sign * value
+    _apply_deltas(deltas)
+
+
+def apply_refund_change(old, new):
+    """按支付记录新旧字段值（REFUND_FIELDS 组成的字典）增量更新退款汇总；所属订单已不存在时跳过"""
+    from .models import Rental  # 避免循环导入
+    dimensions = {}
+    deltas = defaultdict(lambda: defaultdict(int))
+    for values, sign in ((old, -1), (new, 1)):
+        if values is None or values['created_at'] is None:
+            continue
+        contribution = refund_contribution(values['transaction_type'], values['status'], values['amount'])
+        if contribution is None:
+            continue
+        rental_id = values['rental_id']
+        if rental_id not in dimensions:
+            dimensions[rental_id] = Rental.objects.filter(pk=rental_id).values_list(
+                'pickup_location', 'vehicle__vehicle_type'
+            ).first()
+        if dimensions[rental_id] is None:
+            continue
+        pickup_location, vehicle_type = dimensions[rental_id]
+        key = (local_day(values['created_at']), pickup_location or '', vehicle_type or '')
+        for metric, value in contribution.items():
+            deltas[key][metric] += sign * value
+    _apply_deltas(deltas)
+
+
+def apply_new_refunds(payments):
+    """
+    批量新建（bulk_create，不触发信号）的支付记录计入退款汇总
+    所属订单的门店、车型一次查询取出，按汇总行合并后累加
+    """
+    from .models import Rental  # 避免循环导入
+    dimensions = {
+        rental_id: (pickup_location, vehicle_type)
+        for rental_id, pickup_location, vehicle_type in Rental.objects.filter(
+            pk__in={payment.rental_id for payment in payments}
+        ).values_list('id', 'pickup_location', 'vehicle__vehicle_type')
+    }
+    deltas = defaultdict(lambda: defaultdict(int))
+    for payment in payments:
+        contribution = refund_contribution(payment.transaction_type, payment.status, payment.amount)
+        if contribution is None or payment.created_at is None or payment.rental_id not in dimensions:
+            continue
+        pickup_location, vehicle_type = dimensions[payment.rental_id]
+        key = (local_day(payment.created_at), pickup_location or '', vehicle_type or '')
+        for metric, value in contribution.items():
+            deltas[key][metric] += value
+    _apply_deltas(deltas)
+
+
+def move_vehicle_type(vehicle_id, old_type, new_type):
+    """
+    车辆修改车型后，把该车全部订单和退款的汇总贡献从原车型行移到新车型行
+    之后订单变化时按车辆当前车型扣减的原贡献即落在新车型行上，不会在原车型留下多余的值、在新车型出现负数
+    """
+    from accounts.models import Payment  # 避免循环导入
+    from .models import Rental
+    moved = defaultdict(lambda: defaultdict(int))
+    rental_rows = Rental.objects.filter(vehicle_id=vehicle_id).order_by().annotate(
+        day=TruncDate('created_at')
+    ).values('day', 'pickup_location').annotate(**rental_aggregates())
+    for row in rental_rows:
+        for metric in RENTAL_METRICS:
+            moved[(row['day'], row['pickup_location'] or '')][metric] += row[metric] or _zero(metric)
+    refund_rows = Payment.objects.filter(
+        rental__vehicle_id=vehicle_id, transaction_type='REFUND', status='REFUNDED'
+    ).order_by().annotate(day=TruncDate('created_at')).values('day', 'rental__pickup_location').annotate(
+        **refund_aggregates()
+    )
+    for row in refund_rows:
+        for metric in REFUND_METRICS:
+            moved[(row['day'], row['rental__pickup_location'] or '')][metric] += row[metric] or _zero(metric)
+
+    for (day, pickup_location), metrics in moved.items():
+        apply_delta((day, pickup_location, old_type or ''), {metric: -value for metric, value in metrics.items()})
+        apply_delta((day, pickup_location, new_type or ''), metrics)
+
+
+def rebuild_rollups(stat_model=None, rental_model=None, payment_model=None):
+    """
+    按全部订单、退款记录两条分组查询全量重建汇总表（迁移中传入历史模型）
+    返回 (汇总行数, 订单数)
+    """
+    if stat_model is None:
+        from .models import DailyRentalStat as stat_model
+    if rental_model is None:
+        from .models import Rental as rental_model
+    if payment_model is None:
+        from accounts.models import Payment as payment_model  # 避免循环导入
+
+    totals = defaultdict(lambda: {metric: _zero(metric) for metric in METRICS})
+    rental_rows = rental_model.objects.order_by().annotate(day=TruncDate('created_at')).values(
+        'day', 'pickup_location', 'vehicle__vehicle_type'
+    ).annotate(**rental_aggregates())
+    scanned = 0
+    for row in rental_rows:
+        key = (row['day'], row['pickup_location'] or '', row['vehicle__vehicle_type'] or '')
+        for metric in RENTAL_METRICS:
+            totals[key][metric] += row[metric] or _zero(metric)
+        scanned += row['new_rentals']
+
+    refund_rows = payment_model.objects.filter(
+        transaction_type='REFUND', status='REFUNDED'
+    ).order_by().annotate(day=TruncDate('created_at')).values(
+        'day', 'rental__pickup_location', 'rental__vehicle__vehicle_type'
+    ).annotate(**refund_aggregates())
+    for row in refund_rows:
+        key = (row['day'], row['rental__pickup_location'] or '', row['rental__vehicle__vehicle_type'] or '')
+        for metric in REFUND_METRICS:
+            totals[key][metric] += row[metric] or _zero(metric)
+
+    with transaction.atomic():
+        stat_model.objects.all().delete()
+        stat_model.objects.bulk_create(
+            [
+                stat_model(day=day, pickup_location=pickup_location, vehicle_type=vehicle_type, **metrics)
+                for (day, pickup_location, vehicle_type), metrics in totals.items()
+            ],
+            batch_size=1000,
+        )
+    return len(totals), scanned
+
+
+def summarize(start=None, end=None, **filters):
+    """日期区间 [start, end]（可只给一端）内各项指标的合计；filters 可按 pickup_location / vehicle_type 过滤"""
+    from .models import DailyRentalStat  # 避免循环导入
+    rows = DailyRentalStat.objects.filter(**filters)
+    if start is not None:
+        rows = rows.filter(day__gte=start)
+    if end is not None:
+        rows = rows.filter(day__lte=end)
+    totals = rows.aggregate(**{metric: Sum(metric) for metric in METRICS})
+    return {metric: totals[metric] or _zero(metric) for metric in METRICS}
+
+
+def month_start(day, months_back=0):
+    """day 所在月往前 months_back 个月的1日"""
+    month_index = day.year * 12 + day.month - 1 - months_back
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def monthly_totals(months=6, metric='revenue', today=None):
+    """最近 months 个自然月（含本月）每月的指标合计，返回 [(月份1日, 合计), ...]，按月份升序"""
+    from .models import DailyRentalStat  # 避免循环导入
+    today = today or timezone.localdate()
+    first = month_start(today, months - 1)
+    rows = DailyRentalStat.objects.filter(day__gte=first, day__lte=today).annotate(
+        month=TruncMonth('day')
+    ).values('month').annotate(total=Sum(metric)).order_by()
+    totals = {row['month']: row['total'] for row in rows}
+    return [
+        (month, totals.get(month) or _zero(metric))
+        for month in (month_start(today, back) for back in range(months - 1, -1, -1))
+    ]
+
+
+def active_status_counts():
+    """预订中、进行中、已超时未归还的订单数 {状态: 数量}（按状态索引分组计数，只读取这几种状态的索引项）"""
+    from .models import Rental  # 避免循环导入
+    counts = dict.fromkeys(ACTIVE_RENTAL_STATUSES, 0)
+    rows = Rental.objects.filter(status__in=ACTIVE_RENTAL_STATUSES).order_by().values('status').annotate(
+        count=Count('id')
+    )
+    counts.update({row['status']: row['count'] for row in rows})
+    return counts
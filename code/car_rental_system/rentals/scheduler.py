@@ -0,0 +1,236 @@
+"""
+后台定时任务
+由 run_scheduler 管理命令常驻运行，把原本在页面请求中顺带执行的维护工作移出请求路径：
+- 订单状态推进（预订中 → 进行中 → 已超时未归还）
+- 已完成订单的押金退还与结算状态刷新
+- 车辆筛选选项等列表缓存的预热
+- 推荐用车辆相似度的增量计算
+- 仪表板统计快照的重新生成
+每个任务返回处理数量，便于命令输出日志。
+"""
+import logging
+import os
+import random
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import F
+
+from car_rental_system.cache_tags import TAG_CUSTOMER, TAG_VEHICLE, set_cached
+
+logger = logging.getLogger(__name__)
+
+
+# 默认任务间隔（秒）和随机抖动比例，可通过 settings.RENTAL_SCHEDULER 覆盖
+DEFAULT_SCHEDULER_SETTINGS = {
+    'transitions_interval': 60,
+    'settlement_interval': 600,
+    'cache_warmup_interval': 240,
+    'similarity_interval': 3600,
+    'dashboard_interval': 30,
+    'jitter': 0.1,
+    'settlement_batch_size': 200,
+    'lock_file': os.path.join(settings.BASE_DIR, 'run_scheduler.lock'),
+}
+
+# 缓存预热写入的有效期（秒），略长于预热间隔，保证预热期间缓存不会过期
+CACHE_WARMUP_TIMEOUT = 300
+
+
+def scheduler_settings():
+    """合并默认配置与 settings.RENTAL_SCHEDULER"""
+    options = dict(DEFAULT_SCHEDULER_SETTINGS)
+    options.update(getattr(settings, 'RENTAL_SCHEDULER', {}))
+    return options
+
+
+def run_status_transitions():
+    """推进到期订单状态，返回各步骤更新数量"""
+    from .models import Rental  # 避免循环导入
+    return Rental.transition_statuses()
+
+
+def settle_completed_deposits(batch_size=200, after_id=0):
+    """
+    退还已完成订单尚未退还的押金，并刷新结算状态
+    只扫描 押金 > 已退款金额 的已完成订单，按ID从 after_id 之后每次最多处理 batch_size 个；
+    无法退款（如找不到退款账号）的订单不会阻塞后续订单，下一轮从返回的 last_id 继续。
+    返回 {'refunded': 退款订单数, 'amount': 退款总额, 'last_id': 本轮最后处理的订单ID，扫描完一遍时为0}
+    """
+    from .models import Rental  # 避免循环导入
+    rentals = list(
+        Rental.objects.filter(
+            status='COMPLETED',
+            deposit__gt=F('amount_refunded'),
+            id__gt=after_id,
+        ).select_related('customer__user').order_by('id')[:batch_size]
+    )
+
+    refunded_count = 0
+    refunded_amount = Decimal('0.00')
+    for rental in rentals:
+        try:
+            refunded, amount = rental.refund_deposit()
+        except Exception as e:
+            logger.error(f'订单 #{rental.id} 押金退还失败: {e}')
+            continue
+        if refunded:
+            refunded_count += 1
+            refunded_amount += amount
+        else:
+            # 押金可能已通过其他途径退还，刷新累计金额使其不再被扫描
+            rental.refresh_financials()
+
+    last_id = rentals[-1].id if len(rentals) == batch_size else 0
+    return {'refunded': refunded_count, 'amount': refunded_amount, 'last_id': last_id}
+
+
+def warm_caches():
+    """
+    预先计算订单筛选页使用的列表缓存和近期活跃用户的推荐候选列表，返回写入的缓存键数量
+    本地内存缓存只在当前进程内可见，对网站进程没有意义，此时跳过预热并返回0。
+    """
+    backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+    if backend.endswith('LocMemCache'):
+        return 0
+
+    from customers.models import Customer
+    from vehicles.models import Vehicle
+
+    # 车辆浏览页的筛选项计数按筛选条件缓存（见 vehicles/facets.py），缓存时间很短，不做预热
+    # 订单管理筛选（rentals.views.rental_list），按当前标签版本写入
+    set_cached(
+        'rental_filter_customers', [TAG_CUSTOMER],
+        list(Customer.objects.only('id', 'name').order_by('name')[:100]),
+        CACHE_WARMUP_TIMEOUT,
+    )
+    set_cached(
+        'rental_filter_vehicles', [TAG_VEHICLE],
+        list(Vehicle.objects.only('id', 'license_plate', 'brand', 'model').order_by('license_plate')[:100]),
+        CACHE_WARMUP_TIMEOUT,
+    )
+    return 2 + warm_user_recommendations()
+
+
+def warm_user_recommendations(days=1, limit=200):
+    """为最近登录过的用户预先计算推荐候选列表（已有缓存的跳过），返回新计算的用户数"""
+    from datetime import timedelta
+
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+
+    from accounts.recommendations import warm_recommendations
+    from customers.models import Customer
+
+    users = User.objects.filter(
+        last_login__gte=timezone.now() - timedelta(days=days)
+    ).order_by('-last_login')[:limit]
+    return warm_recommendations(users, lambda user: Customer.objects.filter(user=user).first())
+
+
+def refresh_vehicle_similarity():
+    """增量重算有新订单变化的车辆的相似车辆，返回更新的车辆数"""
+    from vehicles.similarity import build_similarity
+    return build_similarity(incremental=True)['vehicles']
+
+
+def refresh_dashboard_snapshot():
+    """
+    重新生成仪表板统计快照，返回1（见 car_rental_system/dashboard.py）
+    本地内存缓存只在当前进程内可见，此时跳过并返回0，由网站进程在快照过期时自行后台生成。
+    """
+    backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+    if backend.endswith('LocMemCache'):
+        return 0
+
+    from car_rental_system.dashboard import refresh_snapshot
+    refresh_snapshot()
+    return 1
+
+
+class SchedulerLock:
+    """
+    基于文件锁的单实例锁（进程退出时操作系统自动释放）
+    POSIX 使用 fcntl.flock，Windows 使用 msvcrt.locking。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def acquire(self):
+        """非阻塞获取锁，已有其他实例持有时返回 False"""
+        self._file = open(self.path, 'a+')
+        try:
+            try:
+                import fcntl
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except ImportError:
+                import msvcrt
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            self._file.close()
+            self._file = None
+            return False
+        self._file.seek(0)
+        self._file.truncate()
+        self._file.write(str(os.getpid()))
+        self._file.flush()
+        return True
+
+    def release(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class ScheduledTask:
+    """按固定间隔（带随机抖动）重复执行的任务"""
+
+    def __init__(self, name, func, interval, jitter=0.0):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        # 启动时也加入抖动，避免多个任务在同一时刻集中执行
+        self.next_run = time.monotonic() + random.uniform(0, interval * jitter)
+
+    def schedule_next(self):
+        spread = self.interval * self.jitter
+        self.next_run = time.monotonic() + self.interval + random.uniform(-spread, spread)
+
+    def is_due(self, now):
+        return self.interval > 0 and now >= self.next_run
+
+    def run(self):
+        """执行一次任务，异常只记录日志，不中断调度循环"""
+        try:
+            return self.func()
+        except Exception as e:
+            logger.error(f'定时任务 {self.name} 执行失败: {e}')
+            return None
+        finally:
+            self.schedule_next()
+
+
+def build_tasks(options=None):
+    """按配置创建全部定时任务，间隔为 0 的任务不启用"""
+    options = options or scheduler_settings()
+    jitter = options['jitter']
+    settlement_state = {'last_id': 0}
+
+    def settlement():
+        result = settle_completed_deposits(options['settlement_batch_size'], settlement_state['last_id'])
+        settlement_state['last_id'] = result['last_id']
+        return result
+
+    tasks = [
+        ScheduledTask('transitions', run_status_transitions, options['transitions_interval'], jitter),
+        ScheduledTask('settlement', settlement, options['settlement_interval'], jitter),
+        ScheduledTask('cache_warmup', warm_caches, options['cache_warmup_interval'], jitter),
+        ScheduledTask('similarity', refresh_vehicle_similarity, options['similarity_interval'], jitter),
+        ScheduledTask('dashboard', refresh_dashboard_snapshot, options['dashboard_interval'], jitter),
+    ]
+    return [task for task in tasks if task.interval > 0]
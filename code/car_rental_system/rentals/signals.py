@@ -0,0 +1,253 @@
+"""
+租赁订单信号处理
+订单保存或删除后：
+- 在事务提交时同步车辆可用性索引
+- 订单占用情况（车辆、是否有效、起止日期）变化时重建预订槽位，并递增车辆的预订版本号
+- 订单完成或已完成订单被修改时，更新客户的连续诚信订单数（VIP升级依据）
+- 按订单新旧热度贡献之差，增量更新车辆、车型、门店的时间衰减热度
+- 更新客户的订单数、订单金额合计、未结束订单数、最近下单时间
+- 订单状态或费用变化后，按数据库中的累计支付金额重新判定结算状态（支付记录变化时由 accounts/signals.py 判定）
+- 按新旧汇总贡献之差，增量更新每日经营汇总（见 rentals/rollups.py）；车辆修改车型时把该车的汇总移到新车型下
+- 事务提交后递增 'rental' 及订单客户（含改派前客户）的缓存标签版本号（见 car_rental_system/cache_tags.py）
+"""
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from car_rental_system.cache_tags import TAG_RENTAL, customer_tag, register_model
+from customers.models import Customer
+from customers.stats import STATS_FIELDS, apply_rental_change as apply_stats_change, recompute_customer_stats
+from vehicles.models import Vehicle
+
+from .availability import ACTIVE_RENTAL_STATUSES, availability_index, touch_vehicle_bookings
+from .booking import sync_rental_slots
+from .models import Rental
+from .popularity import POPULARITY_FIELDS, apply_rental_change
+from .rollups import ROLLUP_FIELDS, apply_rental_change as apply_rollup_change, move_vehicle_type
+
+
+# 决定车辆占用情况的订单字段
+BOOKING_FIELDS = ('vehicle_id', 'status', 'start_date', 'end_date')
+BOOKING_FIELD_NAMES = {'vehicle', 'vehicle_id', 'status', 'start_date', 'end_date'}
+
+# 决定客户连续诚信订单数（VIP升级）的订单字段
+VIP_FIELDS = (
+    'customer_id', 'status', 'actual_return_date', 'overdue_fee',
+    'actual_return_location', 'pickup_location', 'is_cross_location_return', 'created_at',
+)
+VIP_FIELD_NAMES = set(VIP_FIELDS) | {'customer'}
+
+# 决定结算状态（订单总额、是否已完成）的订单字段
+SETTLEMENT_FIELDS = ('status', 'total_amount', 'deposit', 'cross_location_fee', 'overdue_fee', 'is_cross_location_return')
+
+
+def _rental_cache_tags(rental):
+    loaded = getattr(rental, '_loaded_values', None) or {}
+    return [TAG_RENTAL, customer_tag(rental.customer_id), customer_tag(loaded.get('customer_id'))]
+
+
+# 须在 rental_saved 之前登记：rental_saved 结束时会把 _loaded_values 重置为保存后的值，之后就读不到改派前的客户
+register_model(Rental, _rental_cache_tags)
+
+
+def _booking_value(field, value):
+    """字段对车辆占用情况的影响：有效状态之间的流转（预订中/进行中/已超时）不改变占用"""
+    if field == 'status':
+        return value in ACTIVE_RENTAL_STATUSES
+    return value
+
+
+def _changed_booking_vehicles(instance, created, update_fields):
+    """返回占用情况发生变化的车辆ID（新车辆及改派前的原车辆），无变化时返回空列表"""
+    if created:
+        return [instance.vehicle_id]
+    if update_fields is not None and not BOOKING_FIELD_NAMES & set(update_fields):
+        return []
+    loaded = getattr(instance, '_loaded_values', None)
+    if loaded is None:
+        return [instance.vehicle_id]
+    unchanged = all(
+        _booking_value(field, loaded.get(field, getattr(instance, field)))
+        == _booking_value(field, getattr(instance, field))
+        for field in BOOKING_FIELDS
+    )
+    if unchanged:
+        return []
+    return [instance.vehicle_id, loaded.get('vehicle_id')]
+
+
+def _is_counted_for_vip(status, actual_return_date):
+    """已完成且已还车的订单才计入连续诚信订单数"""
+    return status == 'COMPLETED' and actual_return_date is not None
+
+
+def _customer_for(instance):
+    """优先使用订单上已加载的客户对象，使调用方随后的 VIP 判断读到最新计数"""
+    if Rental.customer.is_cached(instance) and instance.customer is not None:
+        return instance.customer
+    return Customer.objects.filter(pk=instance.customer_id).first()
+
+
+def _update_vip_streak(instance, created, update_fields):
+    """
+    维护客户的连续诚信订单数
+    - 订单刚完成：增量更新（O(1)）
+    - 已完成订单被修改（超时费、还车地点、状态回退、改派客户等）：对相关客户重新计算
+    """
+    if update_fields is not None and not VIP_FIELD_NAMES & set(update_fields):
+        return
+    loaded = {} if created else getattr(instance, '_loaded_values', None)
+    if loaded is None:
+        # 未经数据库加载的对象，无法判断变化，直接重算
+        customer = _customer_for(instance)
+        if customer:
+            customer.recompute_vip_streak()
+        return
+    
+    was_counted = not created and _is_counted_for_vip(loaded.get('status'), loaded.get('actual_return_date'))
+    is_counted = _is_counted_for_vip(instance.status, instance.actual_return_date)
+    if not was_counted and not is_counted:
+        return
+    if not created and all(loaded.get(field, getattr(instance, field)) == getattr(instance, field) for field in VIP_FIELDS):
+        return
+    
+    customer = _customer_for(instance)
+    if is_counted and not was_counted:
+        if customer:
+            customer.record_completed_rental(instance)
+    elif customer:
+        customer.recompute_vip_streak()
+    
+    previous_customer_id = loaded.get('customer_id')
+    if was_counted and previous_customer_id and previous_customer_id != instance.customer_id:
+        previous_customer = Customer.objects.filter(pk=previous_customer_id).first()
+        if previous_customer:
+            previous_customer.recompute_vip_streak()
+
+
+def _update_popularity(instance, created, update_fields):
+    """按订单新旧热度贡献之差更新热度表"""
+    if update_fields is not None and not {'vehicle', *POPULARITY_FIELDS} & set(update_fields):
+        return
+    loaded = getattr(instance, '_loaded_values', None)
+    if not created and loaded is None:
+        # 未经数据库加载的对象无法得知原贡献，由 rebuild_popularity 命令修正
+        return
+    old = None if created else {field: loaded.get(field, getattr(instance, field)) for field in POPULARITY_FIELDS}
+    new = {field: getattr(instance, field) for field in POPULARITY_FIELDS}
+    if old == new:
+        return
+    vehicle_type = instance.vehicle.vehicle_type if Rental.vehicle.is_cached(instance) else None
+    apply_rental_change(old, new, vehicle_type)
+
+
+def _update_customer_stats(instance, created, update_fields):
+    """按订单新旧字段值更新客户的订单统计"""
+    if update_fields is not None and not {'customer', *STATS_FIELDS} & set(update_fields):
+        return
+    loaded = getattr(instance, '_loaded_values', None)
+    new = {field: getattr(instance, field) for field in STATS_FIELDS}
+    if created:
+        apply_stats_change(None, new)
+    elif loaded is None:
+        # 未经数据库加载的对象无法得知原值，直接重新聚合该客户
+        recompute_customer_stats(instance.customer_id)
+    else:
+        apply_stats_change({field: loaded.get(field, new[field]) for field in STATS_FIELDS}, new)
+
+
+def _update_rollups(instance, created, update_fields):
+    """按订单新旧汇总贡献之差更新每日经营汇总"""
+    if update_fields is not None and not {'vehicle', *ROLLUP_FIELDS} & set(update_fields):
+        return
+    loaded = getattr(instance, '_loaded_values', None)
+    if not created and loaded is None:
+        # 未经数据库加载的对象无法得知原贡献，由 rebuild_rental_rollups 命令修正
+        return
+    old = None if created else {field: loaded.get(field, getattr(instance, field)) for field in ROLLUP_FIELDS}
+    new = {field: getattr(instance, field) for field in ROLLUP_FIELDS}
+    if old == new:
+        return
+    vehicle_type = instance.vehicle.vehicle_type if Rental.vehicle.is_cached(instance) else None
+    apply_rollup_change(old, new, vehicle_type)
+
+
+def _update_settlement(instance, created, update_fields):
+    """订单状态或费用变化后重新判定结算状态（如全额支付的订单改为已完成即为已结清）"""
+    if created or (update_fields is not None and not set(SETTLEMENT_FIELDS) & set(update_fields)):
+        return
+    loaded = getattr(instance, '_loaded_values', None)
+    if loaded is not None and all(
+        loaded.get(field, getattr(instance, field)) == getattr(instance, field) for field in SETTLEMENT_FIELDS
+    ):
+        return
+    # 内存中的累计支付金额可能早于期间的支付记录，以数据库为准
+    snapshot = Rental.objects.filter(pk=instance.pk).values_list(
+        'amount_paid', 'settlement_status', 'settled_at'
+    ).first()
+    if snapshot is None:
+        return
+    instance.amount_paid, instance.settlement_status, instance.settled_at = snapshot
+    settlement_status, settled_at = instance.settlement_for(instance.amount_paid)
+    if (settlement_status, settled_at) != (instance.settlement_status, instance.settled_at):
+        Rental.objects.filter(pk=instance.pk).update(settlement_status=settlement_status, settled_at=settled_at)
+        instance.settlement_status, instance.settled_at = settlement_status, settled_at
+
+
+@receiver(post_save, sender=Rental)
+def rental_saved(sender, instance, created, update_fields=None, **kwargs):
+    """订单创建/修改（含状态变化）后同步预订槽位，更新车辆预订版本号、结算状态、客户连续诚信订单数、订单统计、热度和每日汇总，并失效可用性索引"""
+    changed_vehicle_ids = _changed_booking_vehicles(instance, created, update_fields)
+    if changed_vehicle_ids:
+        # 槽位冲突时抛出 BookingConflict，由调用方事务回滚
+        sync_rental_slots(instance)
+        touch_vehicle_bookings(changed_vehicle_ids)
+    
+    _update_settlement(instance, created, update_fields)
+    _update_vip_streak(instance, created, update_fields)
+    _update_popularity(instance, created, update_fields)
+    _update_customer_stats(instance, created, update_fields)
+    _update_rollups(instance, created, update_fields)
+    
+    # 保存后以当前值作为新的比较基准
+    loaded = getattr(instance, '_loaded_values', None) or {}
+    loaded.update({
+        field: getattr(instance, field)
+        for field in BOOKING_FIELDS + SETTLEMENT_FIELDS + VIP_FIELDS + POPULARITY_FIELDS + STATS_FIELDS + ROLLUP_FIELDS
+    })
+    instance._loaded_values = loaded
+    
+    rental_id, vehicle_id = instance.pk, instance.vehicle_id
+    transaction.on_commit(lambda: availability_index.invalidate_rental(rental_id, vehicle_id))
+
+
+@receiver(post_delete, sender=Rental)
+def rental_deleted(sender, instance, **kwargs):
+    """订单删除后更新车辆预订版本号、客户连续诚信订单数、订单统计、热度和每日汇总，并失效可用性索引"""
+    touch_vehicle_bookings([instance.vehicle_id])
+    apply_stats_change({field: getattr(instance, field) for field in STATS_FIELDS}, None)
+    # 车辆被级联删除时车型查不到，计入空车型，留待 rebuild_rental_rollups 修正
+    apply_rollup_change({field: getattr(instance, field) for field in ROLLUP_FIELDS}, None)
+    # 车辆被级联删除时车型查不到，车型热度留待 rebuild_popularity 修正
+    apply_rental_change({field: getattr(instance, field) for field in POPULARITY_FIELDS}, None)
+    if _is_counted_for_vip(instance.status, instance.actual_return_date):
+        # 客户被级联删除时查不到客户，直接跳过
+        customer = Customer.objects.filter(pk=instance.customer_id).first()
+        if customer:
+            customer.recompute_vip_streak()
+    rental_id, vehicle_id = instance.pk, instance.vehicle_id
+    transaction.on_commit(lambda: availability_index.invalidate_rental(rental_id, vehicle_id))
+
+
+@receiver(post_save, sender=Vehicle)
+def vehicle_type_saved(sender, instance, created, update_fields=None, **kwargs):
+    """车辆车型变化后，把该车订单和退款的每日汇总从原车型移到新车型"""
+    if created or (update_fields is not None and 'vehicle_type' not in update_fields):
+        return
+    loaded = getattr(instance, '_loaded_values', None)
+    if loaded is None or 'vehicle_type' not in loaded:
+        # 未经数据库加载的对象无法得知原车型，由 rebuild_rental_rollups 命令修正
+        return
+    if loaded['vehicle_type'] != instance.vehicle_type:
+        move_vehicle_type(instance.pk, loaded['vehicle_type'], instance.vehicle_type)
+    loaded['vehicle_type'] = instance.vehicle_type
@@ -1,3 +1,1061 @@
-from django.test import TestCase
+import csv
+import io
+import os
+import tempfile
+import threading
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import Payment
+
+from car_rental_system.cache_tags import customer_tag, tag_versions
+from car_rental_system.dashboard import get_snapshot, refresh_snapshot
+from customers.models import Customer
+from vehicles.models import Vehicle
+
+from .availability import AvailabilityIndex, availability_index, touch_vehicle_bookings
+from .backfill import Checkpoint, apply_chunk
+from .booking import BookingConflict, save_booking
+from .flows import OTHER_LOCATION, compute_flows, store_flows
+from .models import DailyRentalStat, PopularityScore, Rental, RentalSlot
+from .popularity import rebuild_popularity, top
+from .rollups import METRICS, rebuild_rollups
+from .scheduler import ScheduledTask, SchedulerLock
+from .utilization import utilization_report, write_csv
+
+
+class ConcurrentBookingTests(TransactionTestCase):
+    """多线程同时预订同一辆车，验证不会产生重叠的有效订单"""
+
+    THREADS = 12
+
+    def setUp(self):
+        self.vehicle = Vehicle.objects.create(
+            license_plate='京A12345',
+            brand='丰田',
+            model='卡罗拉',
+            vehicle_type='SEDAN',
+            color='白色',
+            daily_rate=Decimal('200.00'),
+        )
+        self.customers = [
+            Customer.objects.create(
+                name=f'并发客户{index}',
+                phone=f'138001380{index:02d}',
+                id_card=f'1101011990010100{index:02d}',
+                license_number=f'LIC{index:04d}',
+            )
+            for index in range(self.THREADS)
+        ]
+
+    def run_bookings(self, periods):
+        """每个线程用独立的数据库连接预订一个时间段，返回成功的订单号和冲突次数"""
+        barrier = threading.Barrier(len(periods))
+        booked, conflicts, errors = [], [], []
+
+        def book(customer, start_date, end_date):
+            try:
+                rental = Rental(
+                    customer=customer,
+                    vehicle_id=self.vehicle.pk,
+                    start_date=start_date,
+                    end_date=end_date,
+                    total_amount=Decimal('200.00'),
+                    status='PENDING',
+                )
+                barrier.wait()
+                save_booking(rental)
+                booked.append(rental.pk)
+            except BookingConflict:
+                conflicts.append(1)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=book, args=(customer, start_date, end_date))
+            for customer, (start_date, end_date) in zip(self.customers, periods)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        return booked, len(conflicts)
+
+    def assert_no_overlaps(self):
+        rentals = list(
+            Rental.objects.filter(vehicle=self.vehicle).order_by('start_date')
+        )
+        for previous, current in zip(rentals, rentals[1:]):
+            self.assertLess(previous.end_date, current.start_date)
+        self.assertEqual(
+            RentalSlot.objects.filter(vehicle=self.vehicle).count(),
+            sum(rental.rental_days for rental in rentals),
+        )
+
+    def test_same_period_only_one_succeeds(self):
+        start_date = date.today() + timedelta(days=10)
+        end_date = start_date + timedelta(days=3)
+        booked, conflicts = self.run_bookings([(start_date, end_date)] * self.THREADS)
+
+        self.assertEqual(len(booked), 1)
+        self.assertEqual(conflicts, self.THREADS - 1)
+        self.assertEqual(Rental.objects.filter(vehicle=self.vehicle).count(), 1)
+        self.assert_no_overlaps()
+
+    def test_overlapping_periods_never_double_book(self):
+        base = date.today() + timedelta(days=10)
+        periods = [
+            (base + timedelta(days=index), base + timedelta(days=index + 2))
+            for index in range(self.THREADS)
+        ]
+        booked, conflicts = self.run_bookings(periods)
+
+        self.assertGreaterEqual(len(booked), 1)
+        self.assertEqual(len(booked) + conflicts, self.THREADS)
+        self.assert_no_overlaps()
+
+    def test_cancelled_rental_releases_slots(self):
+        start_date = date.today() + timedelta(days=10)
+        end_date = start_date + timedelta(days=2)
+        rental = save_booking(Rental(
+            customer=self.customers[0],
+            vehicle=self.vehicle,
+            start_date=start_date,
+            end_date=end_date,
+            total_amount=Decimal('600.00'),
+        ))
+        self.assertEqual(RentalSlot.objects.filter(rental=rental).count(), 3)
+
+        rental.status = 'CANCELLED'
+        rental.save()
+        self.assertFalse(RentalSlot.objects.filter(rental=rental).exists())
+
+        booked, conflicts = self.run_bookings([(start_date, end_date)] * 2)
+        self.assertEqual((len(booked), conflicts), (1, 1))
+
+
+class AvailabilityIndexTests(TestCase):
+    """区间表按预订版本号重新加载（其他进程修改订单时本进程的信号不会触发）；调用方传入版本号时不再查询；超出上限时淘汰最久未使用的车辆"""
+
+    def test_reload_after_booking_version_changes(self):
+        vehicle = Vehicle.objects.create(
+            license_plate='京D13579',
+            brand='日产',
+            model='轩逸',
+            vehicle_type='SEDAN',
+            color='蓝色',
+            daily_rate=Decimal('180.00'),
+        )
+        customer = Customer.objects.create(
+            name='索引客户',
+            phone='13500135000',
+            id_card='110101199001010051',
+            license_number='LICINDEX',
+        )
+        start_date = date.today() + timedelta(days=3)
+        end_date = start_date + timedelta(days=1)
+        self.assertTrue(availability_index.is_available(vehicle.pk, start_date, end_date))
+
+        # 模拟另一个进程：直接写入订单（不经过本进程的保存信号），并递增预订版本号
+        Rental.objects.bulk_create([Rental(
+            customer=customer,
+            vehicle=vehicle,
+            start_date=start_date,
+            end_date=end_date,
+            total_amount=Decimal('360.00'),
+            status='PENDING',
+        )])
+        touch_vehicle_bookings([vehicle.pk])
+
+        self.assertFalse(availability_index.is_available(vehicle.pk, start_date, end_date))
+
+    def test_known_version_skips_query(self):
+        vehicle = Vehicle.objects.create(
+            license_plate='京D13580',
+            brand='日产',
+            model='天籁',
+            vehicle_type='SEDAN',
+            color='黑色',
+            daily_rate=Decimal('200.00'),
+        )
+        index = AvailabilityIndex()
+        start_date = date.today() + timedelta(days=3)
+        with self.assertNumQueries(1):
+            self.assertTrue(index.is_available(vehicle.pk, start_date, start_date, version=vehicle.booking_version))
+        with self.assertNumQueries(0):
+            self.assertTrue(index.is_available(vehicle.pk, start_date, start_date, version=vehicle.booking_version))
+        # 版本号变化：只重新加载区间表，不再查询版本号
+        with self.assertNumQueries(1):
+            index.busy_intervals(vehicle.pk, vehicle.booking_version + 1)
+
+    def test_least_recently_used_timeline_evicted(self):
+        customer = Customer.objects.create(
+            name='淘汰客户',
+            phone='13500135001',
+            id_card='110101199001010052',
+            license_number='LICEVICT',
+        )
+        vehicles = []
+        for number in range(3):
+            vehicle = Vehicle.objects.create(
+                license_plate=f'京D2000{number}',
+                brand='日产',
+                model='轩逸',
+                vehicle_type='SEDAN',
+                color='白色',
+                daily_rate=Decimal('180.00'),
+            )
+            Rental.objects.create(
+                customer=customer,
+                vehicle=vehicle,
+                start_date=date.today() + timedelta(days=3),
+                end_date=date.today() + timedelta(days=4),
+                total_amount=Decimal('360.00'),
+                status='PENDING',
+            )
+            vehicles.append(Vehicle.objects.get(pk=vehicle.pk))
+
+        index = AvailabilityIndex(max_timelines=2)
+        for vehicle in (vehicles[0], vehicles[1], vehicles[0], vehicles[2]):
+            index.busy_intervals(vehicle.pk, vehicle.booking_version)
+        self.assertEqual(list(index._timelines), [vehicles[0].pk, vehicles[2].pk])
+        self.assertEqual(set(index._rental_vehicles.values()), {vehicles[0].pk, vehicles[2].pk})
+
+        index.invalidate(vehicles[0].pk)
+        self.assertEqual(index._rental_vehicles, {
+            rental_id: vehicles[2].pk
+            for rental_id in Rental.objects.filter(vehicle=vehicles[2]).values_list('pk', flat=True)
+        })
+
+
+class VehicleCalendarTests(TestCase):
+    """预订后日历接口的 ETag 必须变化，整体保存车辆不能把预订版本号写回旧值；超出单页上限时按游标分页"""
+
+    def setUp(self):
+        self.vehicle = Vehicle.objects.create(
+            license_plate='京C24680',
+            brand='本田',
+            model='雅阁',
+            vehicle_type='SEDAN',
+            color='灰色',
+            daily_rate=Decimal('250.00'),
+        )
+        self.customer = Customer.objects.create(
+            name='日历客户',
+            phone='13700137000',
+            id_card='110101199001010027',
+            license_number='LICCAL',
+        )
+        self.start_date = date.today() + timedelta(days=5)
+        self.end_date = self.start_date + timedelta(days=2)
+
+    def load_calendar(self, **headers):
+        return self.client.get(
+            reverse('rentals:vehicle_calendar'),
+            {'vehicle_ids': str(self.vehicle.pk), 'from': self.start_date.isoformat(), 'to': self.end_date.isoformat()},
+            **headers,
+        )
+
+    def test_booking_then_full_vehicle_save_changes_calendar(self):
+        before = self.load_calendar()
+        self.assertEqual(before.json()['vehicles'][0]['busy'], [])
+
+        # 订单流程中持有的车辆实例是预订前读出的
+        vehicle = Vehicle.objects.get(pk=self.vehicle.pk)
+        rental = save_booking(Rental(
+            customer=self.customer,
+            vehicle=vehicle,
+            start_date=self.start_date,
+            end_date=self.end_date,
+            total_amount=Decimal('750.00'),
+        ))
+        vehicle.status = 'RENTED'
+        vehicle.save()
+
+        self.assertEqual(Vehicle.objects.get(pk=vehicle.pk).status, 'RENTED')
+        self.assertGreater(Vehicle.objects.get(pk=vehicle.pk).booking_version, 0)
+        after = self.load_calendar(HTTP_IF_NONE_MATCH=before['ETag'])
+        self.assertEqual(after.status_code, 200)
+        self.assertNotEqual(after['ETag'], before['ETag'])
+        self.assertEqual(
+            after.json()['vehicles'][0]['busy'],
+            [[rental.start_date.isoformat(), rental.end_date.isoformat()]],
+        )
+
+    def test_pages_with_cursor_instead_of_truncating(self):
+        for number in range(2):
+            Vehicle.objects.create(
+                license_plate=f'京C2469{number}',
+                brand='本田',
+                model='思域',
+                vehicle_type='SEDAN',
+                color='白色',
+                daily_rate=Decimal('200.00'),
+            )
+        vehicle_ids = list(Vehicle.objects.order_by('pk').values_list('pk', flat=True))
+        params = {'from': self.start_date.isoformat(), 'to': self.end_date.isoformat()}
+        url = reverse('rentals:vehicle_calendar')
+
+        with mock.patch('rentals.views.CALENDAR_MAX_VEHICLES', 2):
+            first = self.client.get(url, params).json()
+            self.assertTrue(first['truncated'])
+            self.assertEqual(first['next_cursor'], vehicle_ids[1])
+            self.assertEqual([vehicle['vehicle_id'] for vehicle in first['vehicles']], vehicle_ids[:2])
+
+            second = self.client.get(url, {**params, 'cursor': first['next_cursor']}).json()
+            self.assertFalse(second['truncated'])
+            self.assertIsNone(second['next_cursor'])
+            self.assertEqual([vehicle['vehicle_id'] for vehicle in second['vehicles']], vehicle_ids[2:])
+
+            self.assertEqual(self.client.get(url, {**params, 'cursor': 'x'}).status_code, 400)
+
+
+class RollupConsistencyTests(TestCase):
+    """增量维护的每日汇总与全量重建结果一致"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='rollup', password='pass12345')
+        self.vehicle = Vehicle.objects.create(
+            license_plate='京F97531',
+            brand='马自达',
+            model='CX-5',
+            vehicle_type='SEDAN',
+            color='红色',
+            daily_rate=Decimal('220.00'),
+        )
+        self.customer = Customer.objects.create(
+            user=self.user,
+            name='汇总客户',
+            phone='13400134000',
+            id_card='110101199001010078',
+            license_number='LICROLLUP',
+        )
+        self.rental = Rental.objects.create(
+            customer=self.customer,
+            vehicle=self.vehicle,
+            start_date=date.today(),
+            end_date=date.today() + timedelta(days=1),
+            total_amount=Decimal('440.00'),
+            pickup_location='朝阳门店',
+            status='ONGOING',
+        )
+
+    def snapshot(self):
+        return {
+            (row.day, row.pickup_location, row.vehicle_type): tuple(getattr(row, metric) for metric in METRICS)
+            for row in DailyRentalStat.objects.all()
+            if any(getattr(row, metric) for metric in METRICS)
+        }
+
+    def assert_matches_rebuild(self):
+        incremental = self.snapshot()
+        rebuild_rollups()
+        self.assertEqual(incremental, self.snapshot())
+
+    def test_vehicle_type_change_moves_rollups(self):
+        vehicle = Vehicle.objects.get(pk=self.vehicle.pk)
+        vehicle.vehicle_type = 'SUV'
+        vehicle.save()
+
+        rental = Rental.objects.get(pk=self.rental.pk)
+        rental.status = 'COMPLETED'
+        rental.save()
+
+        self.assertFalse(DailyRentalStat.objects.filter(new_rentals__lt=0).exists())
+        self.assertEqual(set(DailyRentalStat.objects.filter(new_rentals__gt=0).values_list('vehicle_type', flat=True)), {'SUV'})
+        self.assert_matches_rebuild()
+
+    def test_backfilled_refunds_counted(self):
+        apply_chunk({
+            'end_id': self.rental.pk,
+            'scanned': 1,
+            'refunds': [(self.rental.pk, self.user.pk, Decimal('100.00'), '订单完成，押金自动退还')],
+            'missing_user': [],
+            'financials': [],
+        })
+
+        self.assertEqual(Payment.objects.filter(transaction_type='REFUND').count(), 1)
+        self.assert_matches_rebuild()
+
+
+class UtilizationReportTests(TestCase):
+    """利用率：重叠订单只算一次、已取消订单不计，与逐日计数结果一致；CSV 与报表页面"""
+
+    def setUp(self):
+        self.today = date.today()
+        self.start, self.end = self.today, self.today + timedelta(days=9)
+        self.busy = Vehicle.objects.create(
+            license_plate='京H11111',
+            brand='丰田',
+            model='卡罗拉',
+            vehicle_type='SEDAN',
+            color='白色',
+            daily_rate=Decimal('150.00'),
+        )
+        self.idle = Vehicle.objects.create(
+            license_plate='京H22222',
+            brand='大众',
+            model='途观',
+            vehicle_type='SUV',
+            color='黑色',
+            daily_rate=Decimal('260.00'),
+        )
+        customer = Customer.objects.create(
+            name='利用率客户',
+            phone='13300133000',
+            id_card='110101199001010019',
+            license_number='LICUTIL',
+        )
+        # 导入的数据中同一辆车的订单可能重叠（bulk_create 不经过预订冲突检查）
+        Rental.objects.bulk_create([
+            Rental(
+                customer=customer,
+                vehicle=self.busy,
+                start_date=self.today + timedelta(days=offset),
+                end_date=self.today + timedelta(days=offset + length),
+                total_amount=Decimal('300.00'),
+                pickup_location=store,
+                status=status,
+            )
+            for offset, length, status, store in [
+                (1, 2, 'PENDING', '朝阳门店'),
+                (2, 3, 'PENDING', '海淀门店'),
+                (7, 1, 'CANCELLED', '朝阳门店'),
+                (8, 5, 'PENDING', '海淀门店'),
+            ]
+        ])
+
+    def naive_booked_days(self, vehicle):
+        """逐个订单、逐日计数的参照结果"""
+        days = set()
+        for rental in Rental.objects.filter(vehicle=vehicle).exclude(status='CANCELLED'):
+            day = rental.start_date
+            while day <= rental.end_date:
+                if self.start <= day <= self.end:
+                    days.add(day)
+                day += timedelta(days=1)
+        return len(days)
+
+    def test_matches_naive_count(self):
+        report = utilization_report(self.start, self.end, self.today)
+        details = {item['vehicle_id']: item for item in report['vehicle']}
+        self.assertEqual(details[self.busy.pk]['booked_days'], self.naive_booked_days(self.busy))
+        self.assertEqual(details[self.busy.pk]['booked_days'], 7)
+        self.assertEqual(details[self.busy.pk]['available_days'], 10)
+        self.assertEqual(details[self.busy.pk]['utilization'], 0.7)
+        self.assertEqual(details[self.busy.pk]['store'], '海淀门店')
+        self.assertEqual(
+            (details[self.idle.pk]['booked_days'], details[self.idle.pk]['store']), (0, '')
+        )
+        self.assertEqual(report['overall']['booked_days'], 7)
+        self.assertEqual(report['overall']['available_days'], 20)
+        self.assertEqual(
+            [(group['key'], group['utilization']) for group in report['brand']],
+            [('丰田', 0.7), ('大众', 0.0)],
+        )
+
+    def test_write_csv(self):
+        report = utilization_report(self.start, self.end, self.today)
+        stream = io.StringIO()
+        write_csv(report, 'vehicle_type', stream)
+        rows = list(csv.reader(io.StringIO(stream.getvalue())))
+        self.assertEqual(rows, [
+            ['key', 'vehicles', 'booked_days', 'available_days', 'utilization'],
+            ['SEDAN', '1', '7', '10', '0.7'],
+            ['SUV', '1', '0', '10', '0.0'],
+        ])
+
+    def test_view_staff_only(self):
+        url = reverse('rentals:utilization')
+        params = {'from': self.start.isoformat(), 'to': self.end.isoformat()}
+        self.client.force_login(User.objects.create_user(username='member', password='pass12345'))
+        self.assertEqual(self.client.get(url, params).status_code, 302)
+
+        self.client.force_login(User.objects.create_user(username='ops', password='pass12345', is_staff=True))
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['report']['overall']['booked_days'], 7)
+
+        response = self.client.get(url, {**params, 'format': 'csv', 'by': 'vehicle'})
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.reader(io.StringIO(response.content.decode('utf-8-sig'))))
+        self.assertEqual(rows[0][:2], ['vehicle_id', 'license_plate'])
+        self.assertEqual([row[1] for row in rows[1:]], ['京H11111', '京H22222'])
+
+
+class _Rollback(Exception):
+    pass
+
+
+class StatusTransitionTests(TestCase):
+    """批量 UPDATE 推进状态的结果与原来逐条保存的循环一致"""
+
+    def setUp(self):
+        customer = Customer.objects.create(
+            name='状态客户',
+            phone='13100131000',
+            id_card='110101199001010035',
+            license_number='LICSTATUS',
+        )
+        today = date.today()
+        cases = [
+            # (车辆状态, 订单状态, 开始日期偏移, 结束日期偏移)
+            ('AVAILABLE', 'PENDING', -1, 2),     # 到期激活，车辆改为已租
+            ('AVAILABLE', 'PENDING', 0, 0),      # 今天开始
+            ('AVAILABLE', 'PENDING', 3, 5),      # 未到开始日期
+            ('MAINTENANCE', 'PENDING', -1, 1),   # 激活，维修中的车辆状态不变
+            ('AVAILABLE', 'PENDING', -5, -2),    # 激活后同一轮即超时
+            ('RENTED', 'ONGOING', -4, -1),       # 超时未归还
+            ('RENTED', 'ONGOING', -1, 1),        # 进行中
+            ('AVAILABLE', 'COMPLETED', -9, -7),  # 已完成不变
+        ]
+        for index, (vehicle_status, status, start_offset, end_offset) in enumerate(cases):
+            vehicle = Vehicle.objects.create(
+                license_plate=f'京S0000{index}',
+                brand='现代',
+                model='伊兰特',
+                vehicle_type='SEDAN',
+                color='白色',
+                daily_rate=Decimal('120.00'),
+                status=vehicle_status,
+            )
+            Rental.objects.create(
+                customer=customer,
+                vehicle=vehicle,
+                start_date=today + timedelta(days=start_offset),
+                end_date=today + timedelta(days=end_offset),
+                total_amount=Decimal('360.00'),
+                status=status,
+            )
+
+    def snapshot(self):
+        return (
+            dict(Rental.objects.values_list('pk', 'status')),
+            dict(Vehicle.objects.values_list('pk', 'status')),
+        )
+
+    def legacy_transition(self, today):
+        """原 auto_update_status 的逐条保存循环"""
+        for rental in Rental.objects.filter(status='PENDING', start_date__lte=today).select_related('vehicle'):
+            rental.status = 'ONGOING'
+            rental.save(update_fields=['status', 'updated_at'])
+            if rental.vehicle.status == 'AVAILABLE':
+                rental.vehicle.status = 'RENTED'
+                rental.vehicle.save(update_fields=['status'])
+        for rental in Rental.objects.filter(status='ONGOING', end_date__lt=today):
+            rental.status = 'OVERDUE'
+            rental.save(update_fields=['status', 'updated_at'])
+
+    def test_matches_per_row_loop(self):
+        today = date.today()
+        try:
+            with transaction.atomic():
+                self.legacy_transition(today)
+                expected = self.snapshot()
+                raise _Rollback
+        except _Rollback:
+            pass
+
+        counts = Rental.transition_statuses(today)
+        self.assertEqual(self.snapshot(), expected)
+        self.assertEqual(counts, {'activated': 4, 'vehicles_rented': 3, 'overdue': 2})
+
+
+@override_settings(RENTAL_SCHEDULER={
+    'settlement_interval': 0, 'cache_warmup_interval': 0, 'similarity_interval': 0, 'dashboard_interval': 0,
+})
+class SchedulerTests(TestCase):
+    """调度器单实例锁、--once 执行状态推进；关闭请求内自动更新后页面请求不再推进状态"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.lock_path = os.path.join(directory.name, 'run_scheduler.lock')
+        vehicle = Vehicle.objects.create(
+            license_plate='京T12345',
+            brand='起亚',
+            model='K5',
+            vehicle_type='SEDAN',
+            color='白色',
+            daily_rate=Decimal('160.00'),
+        )
+        customer = Customer.objects.create(
+            name='调度客户',
+            phone='13000130000',
+            id_card='110101199001010043',
+            license_number='LICSCHED',
+        )
+        self.rental = Rental.objects.create(
+            customer=customer,
+            vehicle=vehicle,
+            start_date=date.today(),
+            end_date=date.today() + timedelta(days=2),
+            total_amount=Decimal('480.00'),
+            status='PENDING',
+        )
+
+    def test_single_instance_lock(self):
+        first, second = SchedulerLock(self.lock_path), SchedulerLock(self.lock_path)
+        self.assertTrue(first.acquire())
+        self.assertFalse(second.acquire())
+        first.release()
+        self.assertTrue(second.acquire())
+        second.release()
+
+    def test_once_runs_transitions(self):
+        out = io.StringIO()
+        call_command('run_scheduler', '--once', lock_file=self.lock_path, stdout=out)
+        self.assertIn('[transitions]', out.getvalue())
+        self.rental.refresh_from_db()
+        self.assertEqual(self.rental.status, 'ONGOING')
+
+    @override_settings(RENTAL_AUTO_UPDATE_IN_REQUEST=False)
+    def test_request_path_skips_when_disabled(self):
+        self.assertIsNone(Rental.auto_update_status())
+        self.rental.refresh_from_db()
+        self.assertEqual(self.rental.status, 'PENDING')
+
+    def test_failing_task_rescheduled(self):
+        def fail():
+            raise RuntimeError('boom')
+
+        task = ScheduledTask('failing', fail, interval=60)
+        with self.assertLogs('rentals.scheduler', 'ERROR'):
+            self.assertIsNone(task.run())
+        self.assertFalse(task.is_due(task.next_run - 1))
+
+
+class HistoricalBackfillTests(TestCase):
+    """update_historical_orders 分块退还押金：从检查点继续时只处理之后的订单，重复运行不会重复退款"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.checkpoint_path = os.path.join(directory.name, 'checkpoint.json')
+        user = User.objects.create_user(username='backfill', password='pass12345')
+        customer = Customer.objects.create(
+            user=user,
+            name='回填客户',
+            phone='13600136100',
+            id_card='110101199001010051',
+            license_number='LICBACKFILL',
+        )
+        vehicle = Vehicle.objects.create(
+            license_plate='京U54321',
+            brand='斯柯达',
+            model='明锐',
+            vehicle_type='SEDAN',
+            color='白色',
+            daily_rate=Decimal('140.00'),
+        )
+        start = date.today() - timedelta(days=60)
+        self.rentals = [
+            Rental.objects.create(
+                customer=customer,
+                vehicle=vehicle,
+                start_date=start + timedelta(days=index * 5),
+                end_date=start + timedelta(days=index * 5 + 1),
+                total_amount=Decimal('280.00'),
+                deposit=Decimal('200.00'),
+                status='COMPLETED',
+            )
+            for index in range(3)
+        ]
+
+    def run_backfill(self, *args):
+        call_command(
+            'update_historical_orders', '--skip-status', '--skip-financials', '--chunk-size', '1',
+            '--checkpoint-file', self.checkpoint_path, *args, stdout=io.StringIO(),
+        )
+
+    def refunded_rental_ids(self):
+        return sorted(Payment.objects.filter(transaction_type='REFUND').values_list('rental_id', flat=True))
+
+    def test_resume_from_checkpoint(self):
+        # 模拟上次运行在处理完前两个订单后中断
+        checkpoint = Checkpoint(self.checkpoint_path)
+        checkpoint.phase('deposit')['last_id'] = self.rentals[1].pk
+        checkpoint.save()
+
+        self.run_backfill('--resume')
+
+        self.assertEqual(self.refunded_rental_ids(), [self.rentals[2].pk])
+        self.assertFalse(os.path.exists(self.checkpoint_path))
+
+    def test_rerun_does_not_refund_twice(self):
+        self.run_backfill()
+        self.run_backfill()
+        self.assertEqual(self.refunded_rental_ids(), [rental.pk for rental in self.rentals])
+        self.assertEqual(
+            set(Payment.objects.filter(transaction_type='REFUND').values_list('amount', flat=True)),
+            {Decimal('200.00')},
+        )
+
+
+class PopularityConsistencyTests(TestCase):
+    """增量维护的热度与全量重算一致；已取消订单不计热度"""
+
+    def setUp(self):
+        self.customer = Customer.objects.create(
+            name='热度客户',
+            phone='13900139100',
+            id_card='110101199001010094',
+            license_number='LICPOPULAR',
+        )
+        self.sedan, self.suv = [
+            Vehicle.objects.create(
+                license_plate=plate,
+                brand='长安',
+                model='CS75',
+                vehicle_type=vehicle_type,
+                color='灰色',
+                daily_rate=Decimal('180.00'),
+            )
+            for plate, vehicle_type in (('京X10001', 'SEDAN'), ('京X10002', 'SUV'))
+        ]
+        self.rental = Rental.objects.create(
+            customer=self.customer,
+            vehicle=self.sedan,
+            start_date=date.today() + timedelta(days=1),
+            end_date=date.today() + timedelta(days=3),
+            total_amount=Decimal('540.00'),
+            pickup_location='朝阳门店',
+        )
+
+    def snapshot(self):
+        return {
+            (dimension, key): (round(score, 6), rental_count)
+            for dimension, key, score, rental_count in PopularityScore.objects.values_list(
+                'dimension', 'key', 'score', 'rental_count'
+            )
+            if rental_count
+        }
+
+    def assert_matches_rebuild(self):
+        incremental = self.snapshot()
+        rebuild_popularity()
+        self.assertEqual(incremental, self.snapshot())
+
+    def test_reassign_complete_and_delete(self):
+        rental = Rental.objects.get(pk=self.rental.pk)
+        rental.vehicle = self.suv
+        rental.pickup_location = '海淀门店'
+        rental.save()
+        self.assertEqual([key for key, _, _ in top('VEHICLE_TYPE')], ['SUV'])
+        self.assert_matches_rebuild()
+
+        rental = Rental.objects.get(pk=self.rental.pk)
+        rental.status = 'COMPLETED'
+        rental.actual_return_date = date.today()
+        rental.save()
+        self.assert_matches_rebuild()
+
+        Rental.objects.get(pk=self.rental.pk).delete()
+        self.assertEqual(self.snapshot(), {})
+
+    def test_cancelled_rental_not_counted(self):
+        rental = Rental.objects.get(pk=self.rental.pk)
+        rental.status = 'CANCELLED'
+        rental.save()
+        self.assertEqual(top('VEHICLE'), [])
+        self.assert_matches_rebuild()
+
+
+class RentalCacheTagTests(TestCase):
+    """订单改派客户后，提交时原客户和新客户的缓存标签都失效"""
+
+    def test_reassign_invalidates_both_customers(self):
+        customers = [
+            Customer.objects.create(
+                name=f'标签客户{index}',
+                phone=f'1310013100{index}',
+                id_card=f'11010119900101{index:03d}2',
+                license_number=f'LICTAG{index}',
+            )
+            for index in range(3)
+        ]
+        vehicle = Vehicle.objects.create(
+            license_plate='京Q30001',
+            brand='理想',
+            model='L7',
+            vehicle_type='SUV',
+            color='灰色',
+            daily_rate=Decimal('450.00'),
+        )
+        rental = Rental.objects.create(
+            customer=customers[0],
+            vehicle=vehicle,
+            start_date=date.today() + timedelta(days=1),
+            end_date=date.today() + timedelta(days=2),
+            total_amount=Decimal('900.00'),
+        )
+        tags = ['rental'] + [customer_tag(customer.pk) for customer in customers]
+        before = tag_versions(tags)
+
+        rental = Rental.objects.get(pk=rental.pk)
+        rental.customer = customers[1]
+        with self.captureOnCommitCallbacks(execute=True):
+            rental.save()
+
+        changed = [old != new for old, new in zip(before, tag_versions(tags))]
+        self.assertEqual(changed, [True, True, True, False])
+
+
+class DashboardSnapshotTests(TestCase):
+    """仪表板快照的各项计数与逐项查询一致；数据变化后返回旧快照并在后台重新生成"""
+
+    def setUp(self):
+        cache.clear()
+        customer = Customer.objects.create(
+            name='快照客户',
+            phone='13600136200',
+            id_card='110101199001010124',
+            license_number='LICSNAPSHOT',
+            member_level='VIP',
+        )
+        self.vehicles = [
+            Vehicle.objects.create(
+                license_plate=f'京K0000{index}',
+                brand='蔚来',
+                model='ET5',
+                vehicle_type='SEDAN',
+                color='白色',
+                daily_rate=Decimal('300.00'),
+                status=status,
+            )
+            for index, status in enumerate(('AVAILABLE', 'RENTED', 'MAINTENANCE'))
+        ]
+        for vehicle, status, offset in ((self.vehicles[0], 'COMPLETED', -3), (self.vehicles[1], 'ONGOING', 0)):
+            Rental.objects.create(
+                customer=customer,
+                vehicle=vehicle,
+                start_date=date.today() + timedelta(days=offset),
+                end_date=date.today() + timedelta(days=offset + 1),
+                total_amount=Decimal('600.00'),
+                status=status,
+            )
+
+    def test_counts(self):
+        snapshot = get_snapshot()
+        self.assertEqual(snapshot.vehicle_stats, {'total': 3, 'available': 1, 'rented': 1, 'maintenance': 1})
+        self.assertEqual(
+            {key: snapshot.customer_stats[key] for key in ('total', 'vip', 'active')},
+            {'total': 1, 'vip': 1, 'active': 1},
+        )
+        self.assertEqual(
+            {key: snapshot.rental_stats[key] for key in ('total', 'ongoing', 'completed', 'today')},
+            {'total': 2, 'ongoing': 1, 'completed': 1, 'today': 1},
+        )
+        # 订单按下单日期计入汇总：两单都是今天创建
+        self.assertEqual(snapshot.revenue_stats['today'], Decimal('600.00'))
+        self.assertEqual(snapshot.revenue_stats['ordered'], Decimal('1200.00'))
+
+    def test_stale_snapshot_served_while_refreshing(self):
+        snapshot = get_snapshot()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_snapshot().built_at, snapshot.built_at)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vehicles[2].status = 'AVAILABLE'
+            self.vehicles[2].save()
+        with mock.patch('car_rental_system.dashboard.schedule_refresh') as schedule_refresh:
+            stale = get_snapshot()
+        schedule_refresh.assert_called_once_with()
+        self.assertEqual(stale.vehicle_stats['maintenance'], 1)
+
+        refresh_snapshot()
+        self.assertEqual(get_snapshot().vehicle_stats['maintenance'], 0)
+
+
+class MetricsApiTests(TestCase):
+    """经营指标按本地日期落入自然月的桶；按品牌分组的序列与不分组的合计一致"""
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(username='metrics', password='pass12345', is_staff=True)
+        customer = Customer.objects.create(
+            name='指标客户',
+            phone='13600136300',
+            id_card='110101199001010125',
+            license_number='LICMETRICS',
+        )
+        vehicles = {
+            brand: Vehicle.objects.create(
+                license_plate=f'京M0000{index}',
+                brand=brand,
+                model='测试',
+                vehicle_type='SEDAN',
+                color='白色',
+                daily_rate=Decimal('100.00'),
+            )
+            for index, brand in enumerate(('宝马', '丰田'))
+        }
+        current_timezone = timezone.get_current_timezone()
+        for index, (brand, status, amount, created_at) in enumerate([
+            ('宝马', 'COMPLETED', '100.00', datetime(2026, 1, 15, 10, 0)),
+            # 本地 2 月 1 日凌晨，UTC 仍是 1 月 31 日
+            ('宝马', 'COMPLETED', '200.00', datetime(2026, 2, 1, 0, 30)),
+            ('丰田', 'CANCELLED', '999.00', datetime(2026, 2, 10, 12, 0)),
+            ('丰田', 'COMPLETED', '50.00', datetime(2026, 3, 31, 23, 59)),
+        ]):
+            rental = Rental.objects.create(
+                customer=customer,
+                vehicle=vehicles[brand],
+                start_date=date(2026, 1, 1) + timedelta(days=index * 3),
+                end_date=date(2026, 1, 2) + timedelta(days=index * 3),
+                total_amount=Decimal(amount),
+                status=status,
+            )
+            Rental.objects.filter(pk=rental.pk).update(
+                created_at=timezone.make_aware(created_at, current_timezone)
+            )
+        rebuild_rollups()
+        self.client.force_login(self.admin)
+
+    def fetch(self, **params):
+        params = {'series': 'revenue', 'grain': 'month', 'from': '2026-01-20', 'to': '2026-03-31', **params}
+        response = self.client.get(reverse('metrics_api'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_month_buckets(self):
+        data = self.fetch()
+        self.assertEqual(data['labels'], ['2026-01', '2026-02', '2026-03'])
+        self.assertEqual(data['buckets'], ['2026-01-01', '2026-02-01', '2026-03-01'])
+        self.assertEqual(data['datasets'], [{'key': '', 'total': 250.0, 'data': [0.0, 200.0, 50.0]}])
+
+    def test_group_by_brand(self):
+        data = self.fetch(group_by='brand')
+        self.assertEqual(data['datasets'], [
+            {'key': '宝马', 'total': 200.0, 'data': [0.0, 200.0, 0.0]},
+            {'key': '丰田', 'total': 50.0, 'data': [0.0, 0.0, 50.0]},
+        ])
+        self.assertEqual(
+            [sum(values) for values in zip(*(dataset['data'] for dataset in data['datasets']))],
+            self.fetch()['datasets'][0]['data'],
+        )
+
+        counts = self.fetch(group_by='brand', series='new_rentals')
+        self.assertEqual(
+            {dataset['key']: dataset['data'] for dataset in counts['datasets']},
+            {'宝马': [0, 1, 0], '丰田': [0, 1, 1]},
+        )
+
+    def test_invalid_grain(self):
+        response = self.client.get(reverse('metrics_api'), {'grain': 'year'})
+        self.assertEqual(response.status_code, 400)
+
+
+class StoreFlowTests(TestCase):
+    """门店流向：还车门店的取值顺序、不计入的订单、各门店的流入流出与合计"""
+
+    HUBIN, WULIN, WENSAN = '上城区湖滨门店', '下城区武林门店', '西湖区文三路门店'
+
+    def setUp(self):
+        cache.clear()
+        customer = Customer.objects.create(
+            name='流向客户',
+            phone='13600136400',
+            id_card='110101199001010126',
+            license_number='LICFLOWS',
+        )
+        vehicle = Vehicle.objects.create(
+            license_plate='京N00001',
+            brand='比亚迪',
+            model='汉',
+            vehicle_type='SEDAN',
+            color='白色',
+            daily_rate=Decimal('200.00'),
+        )
+        self.rentals = [
+            # 进行中的异地还车按计划还车门店计入
+            (self.HUBIN, {'is_cross_location_return': True, 'return_location': self.WULIN,
+                          'cross_location_fee': Decimal('50.00'), 'status': 'ONGOING'}, date(2026, 1, 10)),
+            # 实际还车门店优先于计划还车门店
+            (self.HUBIN, {'is_cross_location_return': True, 'return_location': self.WENSAN,
+                          'actual_return_location': self.WULIN, 'cross_location_fee': Decimal('30.00'),
+                          'status': 'COMPLETED'}, date(2026, 2, 3)),
+            # 未登记异地还车但实际在其他门店还车：计入流动，不计费用
+            (self.WULIN, {'actual_return_location': self.WENSAN, 'cross_location_fee': Decimal('20.00'),
+                          'status': 'COMPLETED'}, date(2026, 2, 6)),
+            # 原店还车、已取消的订单不计
+            (self.WENSAN, {'actual_return_location': self.WENSAN, 'status': 'COMPLETED'}, date(2026, 2, 9)),
+            (self.HUBIN, {'is_cross_location_return': True, 'return_location': self.WENSAN,
+                          'cross_location_fee': Decimal('40.00'), 'status': 'CANCELLED'}, date(2026, 2, 12)),
+            # 不在门店列表中的地点合并为“其他地点”
+            (self.HUBIN, {'actual_return_location': '萧山机场', 'status': 'COMPLETED'}, date(2026, 2, 15)),
+        ]
+        for pickup_location, fields, start in self.rentals:
+            Rental.objects.create(
+                customer=customer,
+                vehicle=vehicle,
+                start_date=start,
+                end_date=start + timedelta(days=1),
+                total_amount=Decimal('400.00'),
+                pickup_location=pickup_location,
+                **fields,
+            )
+        self.customer, self.vehicle = customer, vehicle
+
+    def test_pairs_balance_and_totals(self):
+        flows = compute_flows(date(2026, 1, 1), date(2026, 2, 28))
+        stores = flows['stores']
+        self.assertEqual(flows['periods'], ['2026-01', '2026-02'])
+        self.assertEqual(
+            {(pair['origin'], pair['destination']): (pair['trips'], pair['fee']) for pair in flows['pairs']},
+            {
+                (self.HUBIN, self.WULIN): (2, Decimal('80.00')),
+                (self.WULIN, self.WENSAN): (1, Decimal('0.00')),
+                (self.HUBIN, OTHER_LOCATION): (1, Decimal('0.00')),
+            },
+        )
+        self.assertEqual(flows['pairs'][0]['periods'], {
+            '2026-01': {'trips': 1, 'fee': Decimal('50.00')},
+            '2026-02': {'trips': 1, 'fee': Decimal('30.00')},
+        })
+        self.assertEqual(flows['matrix'][stores.index(self.HUBIN)][stores.index(self.WULIN)], 2)
+
+        balance = {item['store']: (item['outflow'], item['inflow'], item['net'], item['fee']) for item in flows['balance']}
+        self.assertEqual(balance, {
+            self.HUBIN: (3, 0, -3, Decimal('80.00')),
+            self.WULIN: (1, 2, 1, Decimal('0.00')),
+            self.WENSAN: (0, 1, 1, Decimal('0.00')),
+            OTHER_LOCATION: (0, 1, 1, Decimal('0.00')),
+        })
+        self.assertEqual(flows['balance'][0]['store'], self.HUBIN)
+        self.assertEqual(sum(item['net'] for item in flows['balance']), 0)
+        self.assertEqual(flows['total'], {'trips': 4, 'fee': Decimal('80.00')})
+
+    def test_window_by_start_date(self):
+        flows = compute_flows(date(2026, 2, 1), date(2026, 2, 28))
+        self.assertEqual(flows['periods'], ['2026-02'])
+        self.assertEqual(flows['total'], {'trips': 3, 'fee': Decimal('30.00')})
+
+    def test_cached_result_invalidated_by_new_rental(self):
+        start, end = date(2026, 1, 1), date(2026, 2, 28)
+        self.assertEqual(store_flows(start, end)['total']['trips'], 4)
+        with self.captureOnCommitCallbacks(execute=True):
+            Rental.objects.create(
+                customer=self.customer,
+                vehicle=self.vehicle,
+                start_date=date(2026, 2, 20),
+                end_date=date(2026, 2, 21),
+                total_amount=Decimal('400.00'),
+                pickup_location=self.WENSAN,
+                is_cross_location_return=True,
+                return_location=self.HUBIN,
+                cross_location_fee=Decimal('60.00'),
+            )
+        self.assertEqual(store_flows(start, end)['total'], {'trips': 5, 'fee': Decimal('140.00')})
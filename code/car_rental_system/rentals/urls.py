@@ -16,7 +16,10 @@ urlpatterns = [
     path('<int:pk>/status/', views.rental_status_update, name='rental_status_update'),
     path('<int:pk>/return/', views.rental_return, name='rental_return'),
     path('<int:pk>/cancel/', views.rental_cancel, name='rental_cancel'),
+    path('utilization/', views.utilization_view, name='utilization'),
+    path('flows/', views.store_flow_view, name='store_flows'),
     
     # AJAX接口
     path('vehicle-dates/', views.get_vehicle_available_dates, name='vehicle_available_dates'),
+    path('api/calendar/', views.vehicle_calendar, name='vehicle_calendar'),
 ]
\ No newline at end of file
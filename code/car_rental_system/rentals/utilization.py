@@ -0,0 +1,225 @@
+"""
+车队利用率（出租天数 ÷ 可用天数），按车辆、车型、品牌、门店汇总，时间窗口任意
+- 出租天数：窗口内被订单占用的日期数（同一辆车的订单重叠时只算一次）；
+  占用区间为取车日期至还车日期（含两端），已完成订单有实际归还日期时以实际归还日期为准，
+  已超时未归还的订单占用至今天；已取消的订单不计
+- 可用天数：窗口内车辆入库（created_at 的本地日期）之后的天数；
+  历史订单早于入库日期（导入的旧数据）时从最早占用日期起算。没有保养记录，保养中的日期仍计为可用
+- 门店：车辆在窗口内最近一个订单的取车门店（窗口内没有订单的车辆门店为空）
+计算方式：窗口内的订单区间一次查询读出（只取车辆ID、两个日期和取车门店，不构造模型实例），
+用 numpy 转为数组（np.fromiter 一次转换），按车辆 × 日期做差分数组扫描（区间起点 +1、终点次日 -1，按行累加后 > 0 的日期即被占用），
+没有逐订单的 Python 循环；车辆多、窗口长时按车辆分块，单块不超过 SWEEP_CELL_LIMIT 个格子。
+"""
+import csv
+
+import numpy as np
+from django.db import connection
+from django.db.models import Case, CharField, DateField, F, Q, Value, When
+from django.db.models.functions import Cast, Greatest
+from django.utils import timezone
+
+from .availability import ACTIVE_RENTAL_STATUSES
+
+
+# 占用车辆的订单状态
+OCCUPYING_STATUSES = ACTIVE_RENTAL_STATUSES + ('COMPLETED',)
+
+# 报表的汇总维度（vehicle 为逐车明细）
+DIMENSIONS = ('vehicle', 'vehicle_type', 'brand', 'store')
+
+# 时间窗口最多天数
+MAX_WINDOW_DAYS = 3660
+
+# 差分数组单块最多的格子数（车辆数 × 天数），约 40MB
+SWEEP_CELL_LIMIT = 5_000_000
+
+
+def _occupied_until(today):
+    """订单实际占用车辆的最后一天"""
+    return Case(
+        When(status='COMPLETED', actual_return_date__isnull=False, then=F('actual_return_date')),
+        When(status='OVERDUE', then=Greatest(F('end_date'), Value(today, output_field=DateField()))),
+        default=F('end_date'),
+        output_field=DateField(),
+    )
+
+
+def _window_rentals(start, end, today):
+    """与窗口 [start, end] 有交集的占用订单，附带实际占用截止日期 occupied_until"""
+    from .models import Rental  # 避免循环导入
+    return Rental.objects.filter(
+        Q(end_date__gte=start) | Q(status='OVERDUE') | Q(actual_return_date__gte=start),
+        status__in=OCCUPYING_STATUSES,
+        start_date__lte=end,
+    ).annotate(occupied_until=_occupied_until(today))
+
+
+def load_vehicles(start):
+    """车辆列表（按ID排序）：[(车辆ID, 车牌, 品牌, 车型, 入库日期), ...]"""
+    from vehicles.models import Vehicle  # 避免循环导入
+    rows = Vehicle.objects.order_by('pk').values_list('pk', 'license_plate', 'brand', 'vehicle_type', 'created_at')
+    return [
+        (pk, plate, brand, vehicle_type, timezone.localdate(created_at) if created_at else start)
+        for pk, plate, brand, vehicle_type, created_at in rows
+    ]
+
+
+def _raw_rows(queryset):
+    """按查询集生成的 SQL 直接读取元组，跳过 Django 逐行的结果处理"""
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def _sweep(vehicle_ids, rows, start, days):
+    """
+    差分数组扫描，返回每辆车的 (出租天数数组, 首个占用日序号数组（没有占用为 days）, 门店列表)
+    rows 为 (车辆ID, 开始日期, 占用截止日期, 取车门店)，日期可以是 date 或 ISO 字符串
+    """
+    booked = np.zeros(len(vehicle_ids), dtype=np.int64)
+    first_booked = np.full(len(vehicle_ids), days, dtype=np.int64)
+    stores = [''] * len(vehicle_ids)
+    if not rows or not len(vehicle_ids):
+        return booked, first_booked, stores
+
+    rentals = np.fromiter(
+        rows,
+        dtype=[('vehicle', np.int64), ('start', 'datetime64[D]'), ('end', 'datetime64[D]'), ('store', object)],
+        count=len(rows),
+    )
+    window_start = np.datetime64(start, 'D')
+    raw_begin = (rentals['start'] - window_start).astype(np.int64)
+    # 终点取占用最后一天的次日（左闭右开）
+    finish = np.clip((rentals['end'] - window_start).astype(np.int64) + 1, 0, days)
+    begin = np.clip(raw_begin, 0, days)
+    positions = np.minimum(np.searchsorted(vehicle_ids, rentals['vehicle']), len(vehicle_ids) - 1)
+    keep = (begin < finish) & (vehicle_ids[positions] == rentals['vehicle'])
+
+    # 按车辆、开始日期、截止日期排序：每辆车的最后一个订单即窗口内最近的订单
+    raw_finish = (rentals['end'] - window_start).astype(np.int64)
+    order = np.lexsort((raw_finish[keep], raw_begin[keep], positions[keep]))
+    positions = positions[keep][order]
+    begin, finish = begin[keep][order], finish[keep][order]
+    store_values = rentals['store'][keep][order]
+    if len(positions):
+        last = np.flatnonzero(np.append(positions[1:] != positions[:-1], True))
+        for position, store in zip(positions[last].tolist(), store_values[last].tolist()):
+            stores[position] = store or ''
+
+    width = days + 1
+    chunk = max(SWEEP_CELL_LIMIT // width, 1)
+    for first in range(0, len(vehicle_ids), chunk):
+        last = min(first + chunk, len(vehicle_ids))
+        lo, hi = np.searchsorted(positions, [first, last])
+        if lo == hi:
+            continue
+        local = positions[lo:hi] - first
+        cells = (last - first) * width
+        diff = (
+            np.bincount(local * width + begin[lo:hi], minlength=cells)
+            - np.bincount(local * width + finish[lo:hi], minlength=cells)
+        ).reshape(last - first, width)[:, :days]
+        occupied = np.cumsum(diff, axis=1) > 0
+        booked[first:last] = occupied.sum(axis=1)
+        any_booked = occupied.any(axis=1)
+        first_booked[first:last] = np.where(any_booked, occupied.argmax(axis=1), days)
+    return booked, first_booked, stores
+
+
+def _ratio(booked, available):
+    return round(booked / available, 4) if available else 0.0
+
+
+def _group(vehicles, field):
+    """按 field 汇总逐车明细：[{key, vehicles, booked_days, available_days, utilization}, ...]，按利用率降序"""
+    groups = {}
+    for vehicle in vehicles:
+        group = groups.setdefault(
+            vehicle[field], {'key': vehicle[field], 'vehicles': 0, 'booked_days': 0, 'available_days': 0}
+        )
+        group['vehicles'] += 1
+        group['booked_days'] += vehicle['booked_days']
+        group['available_days'] += vehicle['available_days']
+    result = list(groups.values())
+    for group in result:
+        group['utilization'] = _ratio(group['booked_days'], group['available_days'])
+    result.sort(key=lambda group: (-group['utilization'], group['key']))
+    return result
+
+
+def utilization_report(start, end, today=None):
+    """
+    窗口 [start, end]（含两端）的利用率报表：
+    {'from', 'to', 'days', 'overall': {...},
+     'vehicle': [逐车明细], 'vehicle_type': [...], 'brand': [...], 'store': [...]}
+    """
+    if end < start:
+        raise ValueError('结束日期不能早于开始日期')
+    days = (end - start).days + 1
+    if days > MAX_WINDOW_DAYS:
+        raise ValueError(f'时间窗口不能超过{MAX_WINDOW_DAYS}天')
+    today = today or timezone.localdate()
+
+    vehicles = load_vehicles(start)
+    # 日期在查询中转为 ISO 字符串：避免数据库驱动逐行构造 date 对象，np.fromiter 直接解析字符串
+    rows = _raw_rows(
+        _window_rentals(start, end, today).order_by().annotate(
+            begin=Cast('start_date', CharField()), until=Cast('occupied_until', CharField())
+        ).values_list('vehicle_id', 'begin', 'until', 'pickup_location')
+    )
+    vehicle_ids = [vehicle[0] for vehicle in vehicles]
+
+    booked, first_booked, stores = _sweep(np.array(vehicle_ids, dtype=np.int64), rows, start, days)
+    added = np.array([(vehicle[4] - start).days for vehicle in vehicles], dtype=np.int64)
+    available_from = np.clip(np.minimum(added, first_booked), 0, days)
+    available = (days - available_from).tolist()
+    booked = booked.tolist()
+
+    details = [
+        {
+            'vehicle_id': pk,
+            'license_plate': plate,
+            'brand': brand,
+            'vehicle_type': vehicle_type,
+            'store': store,
+            'booked_days': booked_days,
+            'available_days': available_days,
+            'utilization': _ratio(booked_days, available_days),
+        }
+        for (pk, plate, brand, vehicle_type, _), store, booked_days, available_days
+        in zip(vehicles, stores, booked, available)
+    ]
+    total_booked = sum(booked)
+    total_available = sum(available)
+    return {
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'days': days,
+        'overall': {
+            'vehicles': len(details),
+            'booked_days': total_booked,
+            'available_days': total_available,
+            'utilization': _ratio(total_booked, total_available),
+        },
+        'vehicle': sorted(details, key=lambda item: (-item['utilization'], item['vehicle_id'])),
+        'vehicle_type': _group(details, 'vehicle_type'),
+        'brand': _group(details, 'brand'),
+        'store': _group(details, 'store'),
+    }
+
+
+# CSV 列：逐车明细与汇总维度各自的列
+CSV_COLUMNS = {
+    'vehicle': ('vehicle_id', 'license_plate', 'brand', 'vehicle_type', 'store', 'booked_days', 'available_days', 'utilization'),
+    'group': ('key', 'vehicles', 'booked_days', 'available_days', 'utilization'),
+}
+
+
+def write_csv(report, dimension, stream):
+    """把报表的一个维度写成 CSV（是否加 UTF-8 BOM 由调用方决定）"""
+    columns = CSV_COLUMNS['vehicle' if dimension == 'vehicle' else 'group']
+    writer = csv.writer(stream)
+    writer.writerow(columns)
+    for item in report[dimension]:
+        writer.writerow([item[column] for column in columns])
@@ -1,15 +1,25 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.http import HttpResponse, JsonResponse
 from django.contrib import messages
-from django.core.paginator import Paginator
-from django.db import transaction
-from django.db.models import Q, Count, Sum
+from django.contrib.auth.decorators import login_required
+from django.db.models import Q
+from django.core.cache import cache
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, quote_etag
+from django.utils.http import http_date
 from datetime import date, datetime, timedelta
 from decimal import Decimal
+import hashlib
 
+from car_rental_system.cache_tags import TAG_CUSTOMER, TAG_RENTAL, TAG_VEHICLE, cached
+from car_rental_system.dashboard import get_snapshot
+from car_rental_system.pagination import paginate
 from .models import Rental
+from .availability import ACTIVE_RENTAL_STATUSES, availability_index, merge_busy_ranges
+from .booking import BookingConflict, booking_transaction, save_booking
+from .flows import store_flows
 from .forms import RentalForm, RentalStatusForm, ReturnForm, CancelForm
+from .utilization import DIMENSIONS, utilization_report, write_csv
 from customers.models import Customer
 from vehicles.models import Vehicle
 
@@ -19,32 +29,17 @@ def index(request):
     # 自动更新订单状态
     Rental.auto_update_status()
     
-    today = date.today()
-    this_month_start = today.replace(day=1)
-    
-    # 使用单个聚合查询优化统计数据
-    rental_counts = Rental.objects.aggregate(
-        total=Count('id'),
-        pending=Count('id', filter=Q(status='PENDING')),
-        ongoing=Count('id', filter=Q(status='ONGOING')),
-        completed=Count('id', filter=Q(status='COMPLETED')),
-        today=Count('id', filter=Q(start_date=today)),
-    )
-    
-    this_month_revenue = Rental.objects.filter(
-        status='COMPLETED',
-        start_date__gte=this_month_start
-    ).aggregate(
-        total=Sum('total_amount')
-    )['total'] or Decimal('0.00')
+    # 统计数据读取仪表板统计快照（见 car_rental_system/dashboard.py）
+    snapshot = get_snapshot()
+    rental_stats = snapshot.rental_stats
     
     stats = {
-        'total_rentals': rental_counts['total'] or 0,
-        'pending_rentals': rental_counts['pending'] or 0,
-        'ongoing_rentals': rental_counts['ongoing'] or 0,
-        'completed_rentals': rental_counts['completed'] or 0,
-        'today_rentals': rental_counts['today'] or 0,
-        'this_month_revenue': this_month_revenue,
+        'total_rentals': rental_stats['total'],
+        'pending_rentals': rental_stats['pending'],
+        'ongoing_rentals': rental_stats['ongoing'],
+        'completed_rentals': rental_stats['completed'],
+        'today_rentals': rental_stats['today'],
+        'this_month_revenue': snapshot.revenue_stats['monthly'],
     }
     
     # 最近订单
@@ -92,26 +87,20 @@ def rental_list(request):
             Q(pk__icontains=search_query)
         )
     
-    # 分页
-    paginator = Paginator(queryset.order_by('-created_at'), 15)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    
-    # 获取筛选选项 - 使用缓存提高性能
-    from django.core.cache import cache
-    
-    cache_key_customers = 'rental_filter_customers'
-    cache_key_vehicles = 'rental_filter_vehicles'
-    
-    customers = cache.get(cache_key_customers)
-    if customers is None:
-        customers = list(Customer.objects.only('id', 'name').order_by('name')[:100])
-        cache.set(cache_key_customers, customers, 300)  # 缓存5分钟
+    # 分页：按 (created_at, id) 游标翻页，总数为缓存的估计值
+    page_obj = paginate(request, queryset, 15, estimate_count=True)
     
-    vehicles = cache.get(cache_key_vehicles)
-    if vehicles is None:
-        vehicles = list(Vehicle.objects.only('id', 'license_plate', 'brand', 'model').order_by('license_plate')[:100])
-        cache.set(cache_key_vehicles, vehicles, 300)  # 缓存5分钟
+    # 获取筛选选项 - 使用缓存提高性能（客户、车辆增删改后自动失效）
+    customers = cached(
+        'rental_filter_customers', [TAG_CUSTOMER],
+        lambda: list(Customer.objects.only('id', 'name').order_by('name')[:100]),
+        300,  # 缓存5分钟
+    )
+    vehicles = cached(
+        'rental_filter_vehicles', [TAG_VEHICLE],
+        lambda: list(Vehicle.objects.only('id', 'license_plate', 'brand', 'model').order_by('license_plate')[:100]),
+        300,  # 缓存5分钟
+    )
     
     context = {
         'page_obj': page_obj,
@@ -156,24 +145,29 @@ def rental_create(request):
     if request.method == 'POST':
         form = RentalForm(request.POST)
         if form.is_valid():
-            with transaction.atomic():
-                rental = form.save(commit=False)
-                
-                # 计算并设置总费用
-                total_amount = calculate_rental_amount(
-                    rental.customer,
-                    rental.vehicle,
-                    rental.start_date,
-                    rental.end_date
-                )
-                rental.total_amount = total_amount
-                rental.save()
-                
+            rental = form.save(commit=False)
+            
+            # 计算并设置总费用
+            total_amount = calculate_rental_amount(
+                rental.customer,
+                rental.vehicle,
+                rental.start_date,
+                rental.end_date
+            )
+            rental.total_amount = total_amount
+            
+            def mark_vehicle_rented(rental):
                 # 更新车辆状态
                 if rental.status == 'PENDING':
                     rental.vehicle.status = 'RENTED'
                     rental.vehicle.save()
-                
+            
+            # 保存订单并占用槽位（数据库唯一约束拒绝并发的重叠预订）
+            try:
+                save_booking(rental, after_save=mark_vehicle_rented)
+            except BookingConflict as exc:
+                form.add_error(None, str(exc))
+            else:
                 messages.success(request, f'租赁订单创建成功！订单号：{rental.id}')
                 return redirect('rentals:rental_detail', pk=rental.pk)
     else:
@@ -202,24 +196,29 @@ def rental_update(request, pk):
             form.data['vehicle'] = rental.vehicle.pk
         
         if form.is_valid():
-            with transaction.atomic():
-                rental = form.save(commit=False)
-                
-                # 重新计算费用
-                total_amount = calculate_rental_amount(
-                    rental.customer,
-                    rental.vehicle,
-                    rental.start_date,
-                    rental.end_date
-                )
-                rental.total_amount = total_amount
-                rental.save()
-                
+            rental = form.save(commit=False)
+            
+            # 重新计算费用
+            total_amount = calculate_rental_amount(
+                rental.customer,
+                rental.vehicle,
+                rental.start_date,
+                rental.end_date
+            )
+            rental.total_amount = total_amount
+            
+            def mark_vehicle_rented(rental):
                 # 如果状态从非预订变为预订中，更新车辆状态
                 if rental.status == 'PENDING' and rental.vehicle.status == 'AVAILABLE':
                     rental.vehicle.status = 'RENTED'
                     rental.vehicle.save()
-                
+            
+            # 保存订单并重建占用槽位（日期或车辆变化时由数据库唯一约束检查冲突）
+            try:
+                save_booking(rental, after_save=mark_vehicle_rented)
+            except BookingConflict as exc:
+                form.add_error(None, str(exc))
+            else:
                 messages.success(request, '租赁订单修改成功！')
                 return redirect('rentals:rental_detail', pk=rental.pk)
     else:
@@ -244,35 +243,44 @@ def rental_status_update(request, pk):
     rental = get_object_or_404(Rental, pk=pk)
     
     if request.method == 'POST':
+        # 表单校验时会把新状态写入 instance，先记下原状态
+        old_status = rental.status
         form = RentalStatusForm(request.POST, instance=rental)
         if form.is_valid():
-            old_status = rental.status
-            rental = form.save()
+            rental = form.save(commit=False)
+            notices = []
             
-            # 根据状态变化更新车辆状态
-            with transaction.atomic():
+            def update_vehicle_status(rental):
+                # 根据状态变化更新车辆状态
                 if old_status == 'PENDING' and rental.status == 'ONGOING':
                     # 预订中 → 进行中
                     rental.vehicle.status = 'RENTED'
                     rental.vehicle.save()
-                    messages.success(request, '订单状态已更新为进行中')
+                    notices.append('订单状态已更新为进行中')
                 
                 elif old_status in ['PENDING', 'ONGOING'] and rental.status == 'COMPLETED':
                     # 预订中/进行中 → 已完成
                     rental.vehicle.status = 'AVAILABLE'
                     rental.vehicle.save()
-                    messages.success(request, '订单已完成，车辆已归还')
+                    notices.append('订单已完成，车辆已归还')
                 
                 elif rental.status == 'CANCELLED':
                     # 任何状态 → 已取消
                     if rental.vehicle.status == 'RENTED':
                         rental.vehicle.status = 'AVAILABLE'
                         rental.vehicle.save()
-                    messages.success(request, '订单已取消')
+                    notices.append('订单已取消')
                 else:
-                    messages.success(request, '状态更新成功')
+                    notices.append('状态更新成功')
             
-            return redirect('rentals:rental_detail', pk=rental.pk)
+            # 与车辆状态在同一事务中保存（占用槽位冲突时整体回滚并显示表单错误）
+            try:
+                save_booking(rental, after_save=update_vehicle_status)
+            except BookingConflict as exc:
+                form.add_error(None, str(exc))
+            else:
+                messages.success(request, notices[-1])
+                return redirect('rentals:rental_detail', pk=rental.pk)
     else:
         form = RentalStatusForm(instance=rental)
     
@@ -306,7 +314,8 @@ def rental_return(request, pk):
             if not actual_return_location:
                 actual_return_location = rental.pickup_location
             
-            with transaction.atomic():
+            # 订单冲突时回滚并重新显示表单（见 rentals/booking.py）
+            with booking_transaction(request):
                 # 更新还车信息
                 rental.actual_return_date = actual_return_date
                 rental.actual_return_location = actual_return_location
@@ -383,8 +392,8 @@ def rental_return(request, pk):
                     refund_user = rental.customer.user
                 deposit_refunded, deposit_refund_amount = rental.refund_deposit(user=refund_user)
                 
-                # 刷新财务信息
-                rental.refresh_financials()
+                # 订单已完成，按累计支付快照刷新结算状态
+                rental.refresh_settlement()
                 
                 # 检查是否符合VIP升级条件，如果符合则自动升级
                 vip_upgraded = False
@@ -440,7 +449,8 @@ def rental_cancel(request, pk):
         if form.is_valid():
             cancel_reason = form.cleaned_data['cancel_reason']
             
-            with transaction.atomic():
+            # 订单冲突时回滚并重新显示表单（见 rentals/booking.py）
+            with booking_transaction(request):
                 # 获取已支付金额（扣除已退款金额）
                 payment_summary = get_payment_summary(rental)
                 paid_amount = payment_summary['paid_amount']
@@ -476,9 +486,6 @@ def rental_cancel(request, pk):
                             transaction_id=f'REF{int(timezone.now().timestamp())}'
                         )
                         
-                        # 更新订单财务信息
-                        rental.refresh_financials()
-                        
                         messages.success(request, f'订单已成功取消，已退还 ¥{net_paid:.2f} 给 {refund_user.username}。')
                     else:
                         messages.warning(request, f'订单已成功取消，但未找到退款用户，退款金额：¥{net_paid:.2f}，请手动处理。')
@@ -577,16 +584,12 @@ def get_vehicle_available_dates(request):
     
     try:
         vehicle = Vehicle.objects.get(id=vehicle_id)
-        # 检查车辆是否有预订中、进行中或已超时未归还的订单
-        rentals = vehicle.rentals.filter(
-            status__in=['PENDING', 'ONGOING', 'OVERDUE']
-        ).order_by('start_date')
         
+        # 忙碌区间来自可用性索引，这里按天展开以兼容前端
         busy_dates = []
-        for rental in rentals:
-            current_date = rental.start_date
-            end_date = rental.end_date
-            while current_date <= end_date:
+        for interval in availability_index.busy_intervals(vehicle.pk, vehicle.booking_version):
+            current_date = interval.start_date
+            while current_date <= interval.end_date:
                 busy_dates.append(current_date.isoformat())
                 current_date += timedelta(days=1)
         
@@ -596,4 +599,219 @@ def get_vehicle_available_dates(request):
             'is_available': vehicle.status == 'AVAILABLE'
         })
     except Vehicle.DoesNotExist:
-        return JsonResponse({'error': '车辆不存在'}, status=404)
\ No newline at end of file
+        return JsonResponse({'error': '车辆不存在'}, status=404)
+
+
+# 日历接口单次最多查询的车辆数和天数
+CALENDAR_MAX_VEHICLES = 500
+CALENDAR_MAX_DAYS = 366
+
+
+def vehicle_calendar(request):
+    """
+    多车辆可用性日历接口
+    参数：vehicle_ids=1,2,3（可选，缺省为全部车辆，最多500辆）、from=YYYY-MM-DD、to=YYYY-MM-DD、
+    cursor=车辆ID（可选，只返回ID大于它的车辆）
+    返回每辆车在时间窗口内合并后的忙碌区间，按车辆ID升序每次最多500辆；还有更多车辆时
+    truncated 为 true，next_cursor 为下一页的 cursor 参数（否则为 null）。
+    响应带 ETag/Last-Modified，由各车辆的预订版本号生成，订单未变化时轮询直接返回 304。
+    """
+    today = date.today()
+    try:
+        window_start = date.fromisoformat(request.GET['from']) if request.GET.get('from') else today
+        window_end = date.fromisoformat(request.GET['to']) if request.GET.get('to') else window_start + timedelta(days=89)
+    except ValueError:
+        return JsonResponse({'error': '日期格式应为 YYYY-MM-DD'}, status=400)
+    if window_end < window_start:
+        return JsonResponse({'error': '结束日期不能早于开始日期'}, status=400)
+    if (window_end - window_start).days >= CALENDAR_MAX_DAYS:
+        return JsonResponse({'error': f'时间窗口不能超过{CALENDAR_MAX_DAYS}天'}, status=400)
+    
+    vehicles = Vehicle.objects.order_by('pk')
+    vehicle_ids_param = request.GET.get('vehicle_ids', '')
+    if vehicle_ids_param:
+        try:
+            vehicle_ids = [int(value) for value in vehicle_ids_param.split(',') if value.strip()]
+        except ValueError:
+            return JsonResponse({'error': '车辆ID格式错误'}, status=400)
+        if len(vehicle_ids) > CALENDAR_MAX_VEHICLES:
+            return JsonResponse({'error': f'单次最多查询{CALENDAR_MAX_VEHICLES}辆车'}, status=400)
+        vehicles = vehicles.filter(pk__in=vehicle_ids)
+    cursor = request.GET.get('cursor', '')
+    if cursor:
+        try:
+            vehicles = vehicles.filter(pk__gt=int(cursor))
+        except ValueError:
+            return JsonResponse({'error': '分页参数格式错误'}, status=400)
+    # 多取一辆判断是否还有下一页
+    versions = list(
+        vehicles.values_list('pk', 'booking_version', 'bookings_changed_at')[:CALENDAR_MAX_VEHICLES + 1]
+    )
+    truncated = len(versions) > CALENDAR_MAX_VEHICLES
+    versions = versions[:CALENDAR_MAX_VEHICLES]
+    next_cursor = versions[-1][0] if truncated else None
+    
+    # 由时间窗口、是否有下一页和各车辆的预订版本号生成 ETag，最近一次预订变更时间作为 Last-Modified
+    signature = f'{window_start}:{window_end}:{int(truncated)}:' + ','.join(f'{pk}.{version}' for pk, version, _ in versions)
+    etag = hashlib.md5(signature.encode()).hexdigest()
+    changed_times = [changed_at for _, _, changed_at in versions if changed_at]
+    last_modified = int(max(changed_times).timestamp()) if changed_times else None
+    
+    not_modified = get_conditional_response(request, etag=quote_etag(etag), last_modified=last_modified)
+    if not_modified is not None:
+        return not_modified
+    
+    # 相同版本的日历结果在进程间共享，避免每次轮询都重新计算
+    cache_key = f'rental_calendar_{etag}'
+    data = cache.get(cache_key)
+    if data is None:
+        vehicle_ids = [pk for pk, _, _ in versions]
+        rows = Rental.objects.filter(
+            vehicle_id__in=vehicle_ids,
+            status__in=ACTIVE_RENTAL_STATUSES,
+            start_date__lte=window_end,
+            end_date__gte=window_start,
+        ).order_by('vehicle_id', 'start_date').values_list('vehicle_id', 'start_date', 'end_date')
+        busy_ranges = merge_busy_ranges(rows, window_start, window_end)
+        data = {
+            'from': window_start.isoformat(),
+            'to': window_end.isoformat(),
+            'truncated': truncated,
+            'next_cursor': next_cursor,
+            'vehicles': [
+                {
+                    'vehicle_id': pk,
+                    'version': version,
+                    'busy': [
+                        [start_date.isoformat(), end_date.isoformat()]
+                        for start_date, end_date in busy_ranges.get(pk, [])
+                    ],
+                }
+                for pk, version, _ in versions
+            ],
+        }
+        cache.set(cache_key, data, 300)
+    
+    response = JsonResponse(data)
+    response['ETag'] = quote_etag(etag)
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+# 利用率报表的缓存时间（秒）；订单、车辆变化时按缓存标签提前失效
+UTILIZATION_CACHE_TIMEOUT = 1800
+
+# 利用率报表页面列出的逐车明细数（利用率最低的车辆），完整明细请下载 CSV
+UTILIZATION_VEHICLE_ROWS = 50
+
+
+@login_required(login_url='/accounts/login/')
+def utilization_view(request):
+    """
+    车队利用率报表（管理员）
+    参数：from、to（YYYY-MM-DD，默认最近30天）；format=csv&by=vehicle|vehicle_type|brand|store 下载 CSV
+    报表按窗口和当天日期缓存（已超时未归还的订单占用至今天），订单、车辆变化后重新计算。
+    """
+    if not request.user.is_staff:
+        messages.error(request, '访问被拒绝：您没有管理员权限。')
+        return redirect('accounts:home')
+    
+    today = timezone.localdate()
+    error = None
+    try:
+        end = date.fromisoformat(request.GET['to']) if request.GET.get('to') else today
+        start = date.fromisoformat(request.GET['from']) if request.GET.get('from') else end - timedelta(days=29)
+    except ValueError:
+        error = '日期格式应为 YYYY-MM-DD'
+        start, end = today - timedelta(days=29), today
+    
+    report = None
+    if error is None:
+        try:
+            report = cached(
+                f'utilization:{start}:{end}:{today}', [TAG_RENTAL, TAG_VEHICLE],
+                lambda: utilization_report(start, end, today),
+                UTILIZATION_CACHE_TIMEOUT,
+            )
+        except ValueError as e:
+            error = str(e)
+    
+    if report is not None and request.GET.get('format') == 'csv':
+        dimension = request.GET.get('by') if request.GET.get('by') in DIMENSIONS else 'vehicle'
+        response = HttpResponse(content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="utilization_{dimension}_{start}_{end}.csv"'
+        # 带 BOM，Excel 直接打开不乱码
+        response.write('\ufeff')
+        write_csv(report, dimension, response)
+        return response
+    
+    context = {
+        'report': report,
+        'error': error,
+        'start': start,
+        'end': end,
+        'groups': [
+            (dimension, title, report[dimension])
+            for dimension, title in (('vehicle_type', '按车型'), ('brand', '按品牌'), ('store', '按门店'))
+        ] if report else [],
+        'idle_vehicles': sorted(
+            report['vehicle'], key=lambda item: (item['utilization'], item['vehicle_id'])
+        )[:UTILIZATION_VEHICLE_ROWS] if report else [],
+    }
+    return render(request, 'rentals/utilization_report.html', context)
+
+
+@login_required(login_url='/accounts/login/')
+def store_flow_view(request):
+    """
+    门店间车辆流向（管理员）：各门店流出、流入、净流入，以及起止门店矩阵
+    参数：from、to（YYYY-MM-DD，按取车日期，默认最近90天）；结果缓存，订单变化后重新计算（见 rentals/flows.py）
+    """
+    if not request.user.is_staff:
+        messages.error(request, '访问被拒绝：您没有管理员权限。')
+        return redirect('accounts:home')
+    
+    today = timezone.localdate()
+    error = None
+    try:
+        end = date.fromisoformat(request.GET['to']) if request.GET.get('to') else today
+        start = date.fromisoformat(request.GET['from']) if request.GET.get('from') else end - timedelta(days=89)
+    except ValueError:
+        error = '日期格式应为 YYYY-MM-DD'
+        start, end = today - timedelta(days=89), today
+    if error is None and end < start:
+        error = '结束日期不能早于开始日期'
+    
+    flows = store_flows(start, end) if error is None else None
+    
+    matrix_rows = []
+    matrix_stores = []
+    if flows:
+        # 矩阵只显示有流动的门店
+        active = [
+            position for position, _ in enumerate(flows['stores'])
+            if any(flows['matrix'][position]) or any(row[position] for row in flows['matrix'])
+        ]
+        matrix_stores = [flows['stores'][position] for position in active]
+        matrix_rows = [
+            {
+                'store': flows['stores'][origin],
+                'cells': [
+                    {'trips': flows['matrix'][origin][destination], 'fee': flows['fee_matrix'][origin][destination]}
+                    for destination in active
+                ],
+            }
+            for origin in active
+        ]
+    
+    context = {
+        'flows': flows,
+        'error': error,
+        'start': start,
+        'end': end,
+        'matrix_stores': matrix_stores,
+        'matrix_rows': matrix_rows,
+    }
+    return render(request, 'rentals/store_flows.html', context)
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class VehiclesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'vehicles'
+
+    def ready(self):
+        # 注册车辆信号（维护全文检索索引）
+        from . import signals  # noqa: F401
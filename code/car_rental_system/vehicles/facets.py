@@ -0,0 +1,176 @@
+"""
+车辆筛选项计数（分面统计）
+筛选栏的品牌、车型、座位数、租金区间各选项后显示按当前条件可选到的车辆数，例如"宝马 (23)"。
+- 一条分组查询：在基础查询集（租期/状态、关键词等非分面条件）上按 (品牌, 车型, 座位数, 租金区间, 是否在价格范围内) 分组计数，
+  各分面的计数在 Python 中由分组结果汇总：某一分面的计数套用其他分面的已选条件、不套用自身条件
+  （选中"宝马"后品牌栏仍显示其他品牌的数量，便于切换）
+- 结果按规范化的筛选条件签名缓存 FACETS_TIMEOUT 秒，登记 'vehicle' 标签：车辆增删改后全部计数失效
+  （见 car_rental_system/cache_tags.py），批量更新车辆状态等绕过信号的写入由较短的缓存时间兜底
+"""
+import hashlib
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Case, Count, IntegerField, Q, Value, When
+
+from car_rental_system.cache_tags import TAG_VEHICLE, cached
+
+
+# 分面计数的缓存时间（秒）
+FACETS_TIMEOUT = 60
+
+# 租金区间（元/天）：(下限, 上限)，下限含、上限不含，None 表示不限
+PRICE_BUCKETS = [
+    (None, 200),
+    (200, 400),
+    (400, 700),
+    (700, None),
+]
+
+
+def price_bucket_value(low, high):
+    """租金区间在表单中的取值，例如 "200-400"、"700-" """
+    return f'{low or ""}-{high or ""}'
+
+
+def price_bucket_label(low, high):
+    if low is None:
+        return f'¥{high}以下'
+    if high is None:
+        return f'¥{low}以上'
+    return f'¥{low}-{high}'
+
+
+def parse_price(value):
+    try:
+        return Decimal(value) if value else None
+    except (InvalidOperation, ValueError):
+        return None
+
+
+def parse_seats(value):
+    try:
+        return int(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def price_filter(price_min='', price_max='', price_range=''):
+    """
+    租金筛选条件：price_min / price_max 为手动输入的价格（含两端），
+    price_range 为租金区间取值（下限含、上限不含，与分面计数的分组一致）；没有价格条件时返回 None
+    """
+    condition = Q()
+    low, high = parse_price(price_min), parse_price(price_max)
+    if low is not None:
+        condition &= Q(daily_rate__gte=low)
+    if high is not None:
+        condition &= Q(daily_rate__lte=high)
+    if price_range:
+        range_low, _, range_high = price_range.partition('-')
+        range_low, range_high = parse_price(range_low), parse_price(range_high)
+        if range_low is not None:
+            condition &= Q(daily_rate__gte=range_low)
+        if range_high is not None:
+            condition &= Q(daily_rate__lt=range_high)
+    return condition or None
+
+
+def _price_bucket_expression():
+    whens = [
+        When(daily_rate__lt=high, then=Value(index))
+        for index, (_, high) in enumerate(PRICE_BUCKETS) if high is not None
+    ]
+    return Case(*whens, default=Value(len(PRICE_BUCKETS) - 1), output_field=IntegerField())
+
+
+def filter_signature(scope, params):
+    """
+    规范化的筛选条件签名：scope 区分页面，params 为全部筛选参数（关键词、租期、状态、品牌、价格等）
+    取值去掉首尾空白、合并空格并转小写，忽略空值，参数顺序、空值写法不同的同一组条件得到同一签名
+    """
+    normalized = {
+        key: ' '.join(str(value).split()).lower()
+        for key, value in params.items() if value not in (None, '')
+    }
+    signature = json.dumps({'scope': scope, 'params': normalized}, sort_keys=True, ensure_ascii=False)
+    return hashlib.md5(signature.encode('utf-8')).hexdigest()
+
+
+def _options(counts, selected, sort_key=None):
+    """{取值: 数量} → 选项列表；已选中的取值即使数量为0也保留，方便取消"""
+    if selected is not None and selected not in counts:
+        counts[selected] = 0
+    return [
+        {'value': value, 'count': count, 'selected': value == selected}
+        for value, count in sorted(counts.items(), key=sort_key or (lambda item: item[0]))
+    ]
+
+
+def compute_facets(base_queryset, brand=None, vehicle_type=None, seats=None, price=None, price_range=''):
+    """
+    在基础查询集上执行一条分组查询，汇总各分面的选项计数
+    price 为租金筛选条件（见 price_filter），price_range 为当前选中的租金区间取值
+    返回 {'brands', 'types', 'seats', 'price_buckets', 'total'}，前四项为 [{'value', 'count', 'selected', ...}, ...]，
+    total 为满足全部条件的车辆数
+    """
+    rows = base_queryset.order_by().annotate(
+        price_bucket=_price_bucket_expression(),
+        in_price=Case(
+            When(price, then=Value(1)), default=Value(0), output_field=IntegerField()
+        ) if price is not None else Value(1, output_field=IntegerField()),
+    ).values('brand', 'vehicle_type', 'seats', 'price_bucket', 'in_price').annotate(count=Count('id'))
+
+    brand_counts, type_counts, seat_counts, bucket_counts = {}, {}, {}, {}
+    total = 0
+    for row in rows:
+        matches = {
+            'brand': brand is None or row['brand'] == brand,
+            'type': vehicle_type is None or row['vehicle_type'] == vehicle_type,
+            'seats': seats is None or row['seats'] == seats,
+            'price': bool(row['in_price']),
+        }
+        count = row['count']
+        for facet, counts, value in (
+            ('brand', brand_counts, row['brand']),
+            ('type', type_counts, row['vehicle_type']),
+            ('seats', seat_counts, row['seats']),
+            ('price', bucket_counts, row['price_bucket']),
+        ):
+            if value in (None, ''):
+                continue
+            if all(matched for other, matched in matches.items() if other != facet):
+                counts[value] = counts.get(value, 0) + count
+        if all(matches.values()):
+            total += count
+
+    price_buckets = []
+    for index, (low, high) in enumerate(PRICE_BUCKETS):
+        value = price_bucket_value(low, high)
+        price_buckets.append({
+            'value': value,
+            'label': price_bucket_label(low, high),
+            'count': bucket_counts.get(index, 0),
+            'selected': value == price_range,
+        })
+
+    return {
+        'brands': _options(brand_counts, brand),
+        'types': _options(type_counts, vehicle_type),
+        'seats': _options(seat_counts, seats),
+        'price_buckets': price_buckets,
+        'total': total,
+    }
+
+
+def get_facets(scope, base_queryset, params, brand='', vehicle_type='', seats=None, price=None, price_range=''):
+    """
+    按筛选条件签名读取分面计数，缓存不存在时计算并缓存
+    params 为页面的全部筛选参数（只用于生成签名），其余参数见 compute_facets
+    """
+    return cached(
+        f'vehicle_facets_{filter_signature(scope, params)}',
+        [TAG_VEHICLE],
+        lambda: compute_facets(base_queryset, brand or None, vehicle_type or None, seats, price, price_range),
+        FACETS_TIMEOUT,
+    )
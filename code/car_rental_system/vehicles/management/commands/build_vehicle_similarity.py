@@ -0,0 +1,50 @@
+"""
+计算车辆相似度（推荐用）
+根据历史订单计算 车辆×车辆 的余弦相似度，每辆车保存前K个邻居到 VehicleSimilarity 表。
+建议每晚全量运行一次；白天可用 --incremental 只重算有新订单变化的车辆（run_scheduler 会定时执行增量计算）。
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.recommendations import invalidate_all_recommendations
+from vehicles.similarity import TOP_K, build_similarity
+
+
+class Command(BaseCommand):
+    help = '根据历史订单计算车辆之间的相似度（物品-物品协同过滤），用于个性化推荐'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help='只重算上次计算之后有订单变化的车辆（表为空时自动全量计算）',
+        )
+        parser.add_argument(
+            '--top-k',
+            type=int,
+            default=TOP_K,
+            help=f'每辆车保留的相似车辆数（默认：{TOP_K}）',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='流式读取订单时每批的行数（默认：5000）',
+        )
+
+    def handle(self, *args, **options):
+        if options['top_k'] <= 0:
+            raise CommandError('--top-k 必须大于 0')
+
+        result = build_similarity(
+            incremental=options['incremental'],
+            top_k=options['top_k'],
+            chunk_size=options['chunk_size'],
+        )
+        if result['mode'] == 'full':
+            # 全量重算后所有用户的推荐候选列表都可能变化
+            invalidate_all_recommendations()
+        mode = '增量' if result['mode'] == 'incremental' else '全量'
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {mode}计算完成：{result['customers']} 个客户参与计算，"
+            f"更新 {result['vehicles']} 辆车的相似车辆，写入 {result['rows']} 行，耗时 {result['elapsed']:.1f} 秒"
+        ))
@@ -0,0 +1,22 @@
+"""
+重建车辆全文检索索引
+索引由车辆信号同步维护；批量导入（bulk_create / update）等绕过信号的写入后运行本命令。
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from vehicles.search import create_index, rebuild_index
+
+
+class Command(BaseCommand):
+    help = '清空并按全部车辆重建全文检索索引（SQLite FTS5）'
+
+    def handle(self, *args, **options):
+        if not create_index():
+            raise CommandError('当前数据库不支持 FTS5 全文索引（非 SQLite 或 SQLite 未编译 FTS5），车辆检索将使用 icontains 查询')
+
+        started = time.monotonic()
+        indexed = rebuild_index()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'✓ 已重建车辆检索索引：{indexed} 辆车，耗时 {elapsed:.1f} 秒'))
@@ -0,0 +1,34 @@
+# Generated manually for the availability calendar API
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicles', '0003_add_vehicle_value'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vehicle',
+            name='booking_version',
+            field=models.PositiveIntegerField(
+                default=0,
+                editable=False,
+                help_text='车辆订单占用情况每变化一次加1（用于日历接口的ETag）',
+                verbose_name='预订版本号'
+            ),
+        ),
+        migrations.AddField(
+            model_name='vehicle',
+            name='bookings_changed_at',
+            field=models.DateTimeField(
+                blank=True,
+                editable=False,
+                help_text='车辆订单占用情况最近一次变化的时间（用于日历接口的Last-Modified）',
+                null=True,
+                verbose_name='预订变更时间'
+            ),
+        ),
+    ]
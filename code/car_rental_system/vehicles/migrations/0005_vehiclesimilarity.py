@@ -0,0 +1,38 @@
+# Generated manually for the item-to-item vehicle recommender
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicles', '0004_add_booking_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VehicleSimilarity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(help_text='余弦相似度：共同租客数 / sqrt(两车各自租客数之积)', verbose_name='相似度')),
+                ('co_rentals', models.PositiveIntegerField(default=0, verbose_name='共同租客数')),
+                ('built_at', models.DateTimeField(help_text='本行所属车辆最近一次计算的开始时间（增量计算的水位线）', verbose_name='计算时间')),
+                ('neighbor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='vehicles.vehicle', verbose_name='相似车辆')),
+                ('vehicle', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_vehicles', to='vehicles.vehicle', verbose_name='车辆')),
+            ],
+            options={
+                'verbose_name': '车辆相似度',
+                'verbose_name_plural': '车辆相似度',
+                'db_table': 'vehicle_similarities',
+                'ordering': ['vehicle', '-score'],
+                'indexes': [
+                    models.Index(fields=['vehicle', '-score'], name='vehicle_sim_vehicle_score_idx'),
+                    models.Index(fields=['built_at'], name='vehicle_sim_built_at_idx'),
+                ],
+                'constraints': [
+                    models.UniqueConstraint(fields=('vehicle', 'neighbor'), name='uniq_vehicle_similarity_pair'),
+                ],
+            },
+        ),
+    ]
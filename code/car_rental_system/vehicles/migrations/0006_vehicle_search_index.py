@@ -0,0 +1,117 @@
+# Generated manually for the vehicle full-text search index
+
+import re
+
+from django.db import OperationalError, migrations
+
+try:
+    from pypinyin import Style, lazy_pinyin
+except ImportError:  # 可选依赖
+    lazy_pinyin = None
+
+
+# 以下为编写迁移时 vehicles.search 中索引结构和分词规则的副本（迁移不依赖之后会修改的代码）
+SEARCH_TABLE = 'vehicle_search'
+
+BATCH_SIZE = 2000
+
+BRAND_ALIASES = {
+    '宝马': 'baoma bm bmw',
+    '奔驰': 'benchi bc benz mercedes',
+    '奥迪': 'aodi ad audi',
+    '大众': 'dazhong dz volkswagen vw',
+    '丰田': 'fengtian ft toyota',
+    '本田': 'bentian bt honda',
+    '日产': 'richan rc nissan',
+    '马自达': 'mazida mzd mazda',
+    '福特': 'fute ft ford',
+    '别克': 'bieke bk buick',
+    '雪佛兰': 'xuefolan xfl chevrolet',
+    '通用': 'tongyong ty gm',
+    '现代': 'xiandai xd hyundai',
+    '起亚': 'qiya qy kia',
+    '斯柯达': 'sikeda skd skoda',
+    '特斯拉': 'tesila tsl tesla',
+    '比亚迪': 'biyadi byd',
+    '理想': 'lixiang lx',
+    '小鹏': 'xiaopeng xp xpeng',
+    '蔚来': 'weilai wl nio',
+    '吉利': 'jili jl geely',
+    '长安': 'changan ca',
+    '哈弗': 'hafu hf haval',
+    '红旗': 'hongqi hq',
+    '沃尔沃': 'woerwo wew volvo',
+    '雷克萨斯': 'leikesasi lkss lexus',
+}
+
+_TOKEN_RE = re.compile(r'[\u3400-\u9fff\uf900-\ufaff]|[0-9a-z]+')
+_CJK_RE = re.compile(r'[\u3400-\u9fff\uf900-\ufaff]+')
+_ALNUM_RE = re.compile(r'[0-9a-z]+')
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall((text or '').lower())
+
+
+def document(license_plate, brand, model, vehicle_type):
+    """一辆车在索引中的三列内容：词、车牌尾号后缀、拼音"""
+    words = ' '.join(tokenize(' '.join(filter(None, [license_plate, brand, model, vehicle_type]))))
+    tail = ''.join(_ALNUM_RE.findall((license_plate or '').lower()))
+    suffixes = ' '.join(tail[start:] for start in range(len(tail) - 1))
+    terms = []
+    for text in (brand, model):
+        for chinese in _CJK_RE.findall(text or ''):
+            if chinese in BRAND_ALIASES:
+                terms.append(BRAND_ALIASES[chinese])
+            if lazy_pinyin is not None:
+                terms.append(''.join(lazy_pinyin(chinese)))
+                terms.append(''.join(lazy_pinyin(chinese, style=Style.FIRST_LETTER)))
+    return words, suffixes, ' '.join(terms)
+
+
+def create_search_index(apps, schema_editor):
+    """创建 FTS5 虚拟表并写入全部车辆（非 SQLite 或 SQLite 未编译 FTS5 时跳过，检索退回 icontains）"""
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+                "words, plate_suffixes, pinyin, tokenize='unicode61', prefix='1 2 3')"
+            )
+    except OperationalError:
+        return
+
+    Vehicle = apps.get_model('vehicles', 'Vehicle')
+    rows = Vehicle.objects.order_by('id').values_list('id', 'license_plate', 'brand', 'model', 'vehicle_type')
+    sql = f'INSERT INTO {SEARCH_TABLE} (rowid, words, plate_suffixes, pinyin) VALUES (%s, %s, %s, %s)'
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        batch = []
+        for vehicle_id, *fields in rows.iterator(chunk_size=BATCH_SIZE):
+            batch.append((vehicle_id, *document(*fields)))
+            if len(batch) >= BATCH_SIZE:
+                cursor.executemany(sql, batch)
+                batch = []
+        if batch:
+            cursor.executemany(sql, batch)
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicles', '0005_vehiclesimilarity'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
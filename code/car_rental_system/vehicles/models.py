@@ -2,8 +2,17 @@ from django.db import models
 from django.core.validators import MinValueValidator
 from decimal import Decimal
 
+from car_rental_system.managed_columns import ManagedColumnsMixin
+
+
+# 由订单变更以查询集 UPDATE 维护的预订列（见 rentals/availability.touch_vehicle_bookings），整体保存车辆时不写回
+# （如订单流程中修改车辆状态时，避免用内存中的旧版本号覆盖期间其他订单的递增，导致日历 ETag 回退、返回过期的缓存结果）
+BOOKING_COLUMNS = ('booking_version', 'bookings_changed_at')
+
+
+class Vehicle(ManagedColumnsMixin, models.Model):
+    managed_columns = BOOKING_COLUMNS
 
-class Vehicle(models.Model):
     VEHICLE_STATUS_CHOICES = [
         ('AVAILABLE', '可用'),
         ('RENTED', '已租'),
@@ -64,6 +73,19 @@ class Vehicle(models.Model):
         default='AVAILABLE',
         help_text='当前车辆状态'
     )
+    booking_version = models.PositiveIntegerField(
+        '预订版本号',
+        default=0,
+        editable=False,
+        help_text='车辆订单占用情况每变化一次加1（用于日历接口的ETag）'
+    )
+    bookings_changed_at = models.DateTimeField(
+        '预订变更时间',
+        blank=True,
+        null=True,
+        editable=False,
+        help_text='车辆订单占用情况最近一次变化的时间（用于日历接口的Last-Modified）'
+    )
     created_at = models.DateTimeField(
         '创建时间',
         auto_now_add=True
@@ -85,8 +107,63 @@ class Vehicle(models.Model):
             models.Index(fields=['seats']),  # 为座位数添加索引，优化搜索性能
         ]
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 记录从数据库加载时的字段值，保存时据此判断车型是否变化（见 rentals/signals.py）
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+    
     def __str__(self):
         return f"{self.brand} {self.model} ({self.license_plate})"
     
     def __repr__(self):
         return f"<Vehicle: {self.license_plate}>"
+
+
+class VehicleSimilarity(models.Model):
+    """
+    车辆相似度（物品-物品协同过滤）
+    由 build_vehicle_similarity 命令根据历史订单离线计算，每辆车只保存相似度最高的前K个邻居，
+    推荐时按用户租过的车辆直接查表，无需在请求中分析偏好。
+    """
+    vehicle = models.ForeignKey(
+        Vehicle,
+        on_delete=models.CASCADE,
+        related_name='similar_vehicles',
+        verbose_name='车辆'
+    )
+    neighbor = models.ForeignKey(
+        Vehicle,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='相似车辆'
+    )
+    score = models.FloatField(
+        '相似度',
+        help_text='余弦相似度：共同租客数 / sqrt(两车各自租客数之积)'
+    )
+    co_rentals = models.PositiveIntegerField(
+        '共同租客数',
+        default=0
+    )
+    built_at = models.DateTimeField(
+        '计算时间',
+        help_text='本行所属车辆最近一次计算的开始时间（增量计算的水位线）'
+    )
+    
+    class Meta:
+        db_table = 'vehicle_similarities'
+        verbose_name = '车辆相似度'
+        verbose_name_plural = '车辆相似度'
+        ordering = ['vehicle', '-score']
+        constraints = [
+            models.UniqueConstraint(fields=['vehicle', 'neighbor'], name='uniq_vehicle_similarity_pair'),
+        ]
+        indexes = [
+            models.Index(fields=['vehicle', '-score'], name='vehicle_sim_vehicle_score_idx'),
+            models.Index(fields=['built_at'], name='vehicle_sim_built_at_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.vehicle_id} ~ {self.neighbor_id}: {self.score:.3f}"
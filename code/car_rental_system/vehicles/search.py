@@ -0,0 +1,224 @@
+"""
+车辆全文检索（SQLite FTS5）
+vehicle_search 虚拟表以车辆ID为 rowid，每辆车一行，分词在 Python 中完成后写入，FTS5 只按空格切分：
+- words：车牌、品牌、型号、车型的词；汉字逐字切分（"宝马" → "宝 马"），
+  查询时按短语匹配相邻的字，因此任意连续汉字片段都能命中
+- plate_suffixes：车牌字母数字部分的全部后缀（"a12345 12345 2345 ..."），支持按车牌尾号检索
+- pinyin：中文品牌的拼音/英文别名（内置常见品牌；安装了 pypinyin 时对所有中文自动生成全拼和首字母）
+查询词同样分词后逐个转为前缀短语（"京A1" → "京 a1"*），多个查询词之间为"与"关系，
+结果以 id IN (SELECT rowid ...) 的形式接在原查询集上，其他筛选条件照常叠加。
+前缀匹配找不到词中间的片段（型号 "X300L" 中的 "300"），型号另外保留 icontains 包含匹配（SUBSTRING_FIELDS），与全文检索取"或"。
+索引由车辆信号同步维护（见 vehicles/signals.py），bulk_create 等绕过信号的批量写入后运行 rebuild_vehicle_search。
+非 SQLite 数据库或 SQLite 未编译 FTS5 时退回 icontains 查询。
+"""
+import re
+
+from django.db import OperationalError, connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+try:
+    from pypinyin import Style, lazy_pinyin
+except ImportError:  # 可选依赖
+    lazy_pinyin = None
+
+
+SEARCH_TABLE = 'vehicle_search'
+
+# 使用全文索引时仍按 icontains 包含匹配的字段（型号常按中间的数字片段检索）
+SUBSTRING_FIELDS = ('model',)
+
+# 常见品牌的拼音及英文别名（未安装 pypinyin 时也能按拼音/英文检索）
+BRAND_ALIASES = {
+    '宝马': 'baoma bm bmw',
+    '奔驰': 'benchi bc benz mercedes',
+    '奥迪': 'aodi ad audi',
+    '大众': 'dazhong dz volkswagen vw',
+    '丰田': 'fengtian ft toyota',
+    '本田': 'bentian bt honda',
+    '日产': 'richan rc nissan',
+    '马自达': 'mazida mzd mazda',
+    '福特': 'fute ft ford',
+    '别克': 'bieke bk buick',
+    '雪佛兰': 'xuefolan xfl chevrolet',
+    '通用': 'tongyong ty gm',
+    '现代': 'xiandai xd hyundai',
+    '起亚': 'qiya qy kia',
+    '斯柯达': 'sikeda skd skoda',
+    '特斯拉': 'tesila tsl tesla',
+    '比亚迪': 'biyadi byd',
+    '理想': 'lixiang lx',
+    '小鹏': 'xiaopeng xp xpeng',
+    '蔚来': 'weilai wl nio',
+    '吉利': 'jili jl geely',
+    '长安': 'changan ca',
+    '哈弗': 'hafu hf haval',
+    '红旗': 'hongqi hq',
+    '沃尔沃': 'woerwo wew volvo',
+    '雷克萨斯': 'leikesasi lkss lexus',
+}
+
+# 汉字（含车牌省份简称）逐字成词，字母数字连续成词
+_TOKEN_RE = re.compile(r'[\u3400-\u9fff\uf900-\ufaff]|[0-9a-z]+')
+_CJK_RE = re.compile(r'[\u3400-\u9fff\uf900-\ufaff]+')
+_ALNUM_RE = re.compile(r'[0-9a-z]+')
+
+_index_state = {'available': None}
+
+
+def tokenize(text):
+    """把文本切分为检索词列表（小写，汉字逐字）"""
+    return _TOKEN_RE.findall((text or '').lower())
+
+
+def plate_suffixes(license_plate):
+    """车牌字母数字部分的全部后缀（至少2位），用于按尾号检索"""
+    tail = ''.join(_ALNUM_RE.findall((license_plate or '').lower()))
+    return [tail[start:] for start in range(len(tail) - 1)]
+
+
+def pinyin_terms(*texts):
+    """中文文本的拼音检索词：内置品牌别名，以及（安装了 pypinyin 时）全拼和首字母"""
+    terms = []
+    for text in texts:
+        for chinese in _CJK_RE.findall(text or ''):
+            if chinese in BRAND_ALIASES:
+                terms.append(BRAND_ALIASES[chinese])
+            if lazy_pinyin is not None:
+                terms.append(''.join(lazy_pinyin(chinese)))
+                terms.append(''.join(lazy_pinyin(chinese, style=Style.FIRST_LETTER)))
+    return ' '.join(terms)
+
+
+def document(license_plate, brand, model, vehicle_type):
+    """一辆车在索引中的三列内容"""
+    words = ' '.join(tokenize(' '.join(filter(None, [license_plate, brand, model, vehicle_type]))))
+    return words, ' '.join(plate_suffixes(license_plate)), pinyin_terms(brand, model)
+
+
+def match_expression(query):
+    """
+    把用户输入转为 FTS5 查询表达式；每个查询词转为前缀短语，词之间为"与"
+    输入中没有可检索的字符时返回 None
+    """
+    phrases = []
+    for term in query.split():
+        tokens = tokenize(term)
+        if tokens:
+            phrases.append('"{}"*'.format(' '.join(tokens)))
+    return ' AND '.join(phrases) or None
+
+
+def index_available():
+    """当前数据库是否可以使用全文索引（结果按进程缓存）"""
+    if _index_state['available'] is None:
+        available = False
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                available = SEARCH_TABLE in connection.introspection.table_names(cursor)
+        _index_state['available'] = available
+    return _index_state['available']
+
+
+def create_index(schema_editor=None):
+    """创建 FTS5 虚拟表（SQLite 未编译 FTS5 时返回 False）"""
+    conn = schema_editor.connection if schema_editor else connection
+    if conn.vendor != 'sqlite':
+        return False
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+                "words, plate_suffixes, pinyin, tokenize='unicode61', prefix='1 2 3')"
+            )
+    except OperationalError:
+        return False
+    _index_state['available'] = None
+    return True
+
+
+def drop_index(schema_editor=None):
+    conn = schema_editor.connection if schema_editor else connection
+    if conn.vendor == 'sqlite':
+        with conn.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+    _index_state['available'] = None
+
+
+def index_vehicle(vehicle):
+    """写入（或替换）一辆车的索引行"""
+    if not index_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [vehicle.pk])
+        cursor.execute(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, words, plate_suffixes, pinyin) VALUES (%s, %s, %s, %s)',
+            [vehicle.pk, *document(vehicle.license_plate, vehicle.brand, vehicle.model, vehicle.vehicle_type)],
+        )
+
+
+def unindex_vehicle(vehicle_id):
+    """删除一辆车的索引行"""
+    if not index_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [vehicle_id])
+
+
+def rebuild_index(vehicle_model=None, schema_editor=None, batch_size=2000):
+    """清空并按全部车辆重建索引（迁移中传入历史模型），返回索引的车辆数"""
+    if vehicle_model is None:
+        from .models import Vehicle as vehicle_model
+    conn = schema_editor.connection if schema_editor else connection
+    if conn.vendor != 'sqlite':
+        return 0
+
+    rows = vehicle_model.objects.order_by('id').values_list(
+        'id', 'license_plate', 'brand', 'model', 'vehicle_type'
+    )
+    indexed = 0
+    with conn.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        batch = []
+        for vehicle_id, *fields in rows.iterator(chunk_size=batch_size):
+            batch.append((vehicle_id, *document(*fields)))
+            if len(batch) >= batch_size:
+                cursor.executemany(
+                    f'INSERT INTO {SEARCH_TABLE} (rowid, words, plate_suffixes, pinyin) VALUES (%s, %s, %s, %s)',
+                    batch,
+                )
+                indexed += len(batch)
+                batch = []
+        if batch:
+            cursor.executemany(
+                f'INSERT INTO {SEARCH_TABLE} (rowid, words, plate_suffixes, pinyin) VALUES (%s, %s, %s, %s)',
+                batch,
+            )
+            indexed += len(batch)
+        # 合并 FTS5 内部的索引段，提高查询速度
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+    return indexed
+
+
+def search_vehicles(queryset, query, fields=('license_plate', 'brand', 'model', 'vehicle_type')):
+    """
+    在查询集上叠加关键词检索
+    有全文索引时走 FTS5，并对 fields 中的 SUBSTRING_FIELDS 保留包含匹配；没有索引时 fields 全部按 icontains 检索
+    """
+    query = (query or '').strip()
+    if not query:
+        return queryset
+    expression = match_expression(query)
+    if expression is not None and index_available():
+        condition = Q(id__in=RawSQL(
+            f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s', [expression]
+        ))
+        for field in fields:
+            if field in SUBSTRING_FIELDS:
+                condition |= Q(**{f'{field}__icontains': query})
+        return queryset.filter(condition)
+
+    condition = Q()
+    for field in fields:
+        condition |= Q(**{f'{field}__icontains': query})
+    return queryset.filter(condition)
@@ -0,0 +1,33 @@
+"""
+车辆信号处理
+车辆保存或删除后同步全文检索索引（见 vehicles/search.py）。
+车辆增删改后在事务提交时递增 'vehicle' 和该车的缓存标签版本号，筛选项计数、首页统计、订单筛选车辆列表等
+依赖车辆数据的缓存随即失效（见 car_rental_system/cache_tags.py）。
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from car_rental_system.cache_tags import TAG_VEHICLE, register_model, vehicle_tag
+
+from .models import Vehicle
+from .search import index_vehicle, unindex_vehicle
+
+
+# 参与检索的车辆字段
+SEARCH_FIELDS = {'license_plate', 'brand', 'model', 'vehicle_type'}
+
+
+register_model(Vehicle, lambda vehicle: [TAG_VEHICLE, vehicle_tag(vehicle.pk)])
+
+
+@receiver(post_save, sender=Vehicle)
+def vehicle_saved(sender, instance, update_fields=None, **kwargs):
+    """车辆新增或检索字段变化后重建该车的索引行"""
+    changed = None if update_fields is None else set(update_fields)
+    if changed is None or SEARCH_FIELDS & changed:
+        index_vehicle(instance)
+
+
+@receiver(post_delete, sender=Vehicle)
+def vehicle_deleted(sender, instance, **kwargs):
+    unindex_vehicle(instance.pk)
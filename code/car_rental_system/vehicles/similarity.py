@@ -0,0 +1,226 @@
+"""
+车辆相似度离线计算（物品-物品协同过滤）
+把历史订单看作 客户×车辆 的稀疏 0/1 矩阵（客户租过该车即为 1），两车的相似度取两列的余弦相似度：
+    sim(a, b) = 共同租客数(a, b) / sqrt(租客数(a) * 租客数(b))
+共现计数只在同一客户租过的车辆之间累加（稀疏矩阵乘法 AᵀA 的逐行展开），
+计算量取决于每个客户租过的车辆数，而不是车辆总数的平方；
+每个客户只取最近 MAX_VEHICLES_PER_CUSTOMER 辆车，避免个别大客户产生平方级的车辆对。
+每辆车只保留相似度最高的 TOP_K 个邻居，写入 VehicleSimilarity 表：
+- 全量：扫描全部订单，重建整张表（建议每晚运行）
+- 增量：只重算上次计算之后有订单变化的客户所租车辆的邻居列表，
+  其他车辆的分数可能因租客数变化略有偏差，由下一次全量计算修正
+"""
+import heapq
+import math
+import time
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+from django.utils import timezone
+
+from .models import VehicleSimilarity
+
+
+# 计入相似度的订单状态（实际发生租用的订单）
+COUNTED_STATUSES = ('ONGOING', 'OVERDUE', 'COMPLETED')
+
+# 每辆车保留的邻居数
+TOP_K = 20
+
+# 每个客户参与计算的最近租用车辆数上限
+MAX_VEHICLES_PER_CUSTOMER = 50
+
+# 按ID列表过滤/删除时每批的ID数量（SQLite 参数个数有限制）
+ID_BATCH_SIZE = 500
+
+# 批量写入相似度时每批的行数
+WRITE_BATCH_SIZE = 1000
+
+
+def _batched(ids, size=ID_BATCH_SIZE):
+    ids = sorted(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def customer_baskets(customer_ids=None, chunk_size=5000):
+    """
+    流式读取客户租过的车辆，逐个产出 (客户ID, [车辆ID, ...])
+    车辆按最近租用在前去重，最多 MAX_VEHICLES_PER_CUSTOMER 辆；customer_ids 为 None 时读取全部客户
+    """
+    from rentals.models import Rental  # 避免循环导入
+    batches = [None] if customer_ids is None else _batched(customer_ids)
+    for batch in batches:
+        rows = Rental.objects.filter(status__in=COUNTED_STATUSES)
+        if batch is not None:
+            rows = rows.filter(customer_id__in=batch)
+        rows = rows.order_by('customer_id', '-created_at', '-id').values_list('customer_id', 'vehicle_id')
+
+        current, basket, seen = None, [], set()
+        for customer_id, vehicle_id in rows.iterator(chunk_size=chunk_size):
+            if customer_id != current:
+                if len(basket) > 1:
+                    yield current, basket
+                current, basket, seen = customer_id, [], set()
+            if vehicle_id in seen or len(basket) >= MAX_VEHICLES_PER_CUSTOMER:
+                continue
+            seen.add(vehicle_id)
+            basket.append(vehicle_id)
+        if len(basket) > 1:
+            yield current, basket
+
+
+def vehicle_customer_counts():
+    """每辆车的租客数（余弦相似度的分母），一条分组查询"""
+    from rentals.models import Rental  # 避免循环导入
+    return dict(
+        Rental.objects.filter(status__in=COUNTED_STATUSES).order_by().values('vehicle_id').annotate(
+            customers=Count('customer_id', distinct=True)
+        ).values_list('vehicle_id', 'customers')
+    )
+
+
+def count_cooccurrences(baskets, targets=None):
+    """
+    累加共现计数，返回 ({车辆ID: {邻居ID: 共同租客数}}, 处理的客户数)
+    指定 targets 时只累加这些车辆所在的行
+    """
+    co_counts = defaultdict(lambda: defaultdict(int))
+    customers = 0
+    for _, basket in baskets:
+        customers += 1
+        for vehicle_id in basket:
+            if targets is not None and vehicle_id not in targets:
+                continue
+            row = co_counts[vehicle_id]
+            for neighbor_id in basket:
+                if neighbor_id != vehicle_id:
+                    row[neighbor_id] += 1
+    return co_counts, customers
+
+
+def top_neighbors(co_counts, item_counts, top_k=TOP_K):
+    """按余弦相似度为每辆车选出前 top_k 个邻居，逐个产出 (车辆ID, [(相似度, 共同租客数, 邻居ID), ...])"""
+    for vehicle_id, row in co_counts.items():
+        vehicle_customers = item_counts.get(vehicle_id, 0)
+        scored = []
+        for neighbor_id, co_rentals in row.items():
+            norm = vehicle_customers * item_counts.get(neighbor_id, 0)
+            if norm > 0:
+                scored.append((co_rentals / math.sqrt(norm), co_rentals, -neighbor_id))
+        best = heapq.nlargest(top_k, scored)
+        yield vehicle_id, [(score, co_rentals, -neg_id) for score, co_rentals, neg_id in best]
+
+
+def write_neighbors(neighbors, built_at, vehicle_ids=None):
+    """
+    在一个事务中替换相似度：vehicle_ids 为 None 时清空整张表，否则只替换这些车辆的行
+    返回写入的行数
+    """
+    rows = (
+        VehicleSimilarity(
+            vehicle_id=vehicle_id,
+            neighbor_id=neighbor_id,
+            score=score,
+            co_rentals=co_rentals,
+            built_at=built_at,
+        )
+        for vehicle_id, best in neighbors
+        for score, co_rentals, neighbor_id in best
+    )
+    written = 0
+    with transaction.atomic():
+        if vehicle_ids is None:
+            VehicleSimilarity.objects.all().delete()
+        else:
+            for batch in _batched(vehicle_ids):
+                VehicleSimilarity.objects.filter(vehicle_id__in=batch).delete()
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= WRITE_BATCH_SIZE:
+                VehicleSimilarity.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        if batch:
+            VehicleSimilarity.objects.bulk_create(batch)
+            written += len(batch)
+    return written
+
+
+def changed_targets(since):
+    """
+    增量计算的范围：since 之后有订单变化的客户租过的全部车辆（任意状态，
+    包括被取消的订单，其车辆的共现行同样需要扣减），以及需要重新读取的、租过这些车辆的客户
+    返回 (车辆ID集合, 客户ID集合)
+    """
+    from rentals.models import Rental  # 避免循环导入
+    changed_customers = set(
+        Rental.objects.filter(updated_at__gte=since).order_by().values_list('customer_id', flat=True).distinct()
+    )
+    targets = set()
+    for batch in _batched(changed_customers):
+        targets.update(
+            Rental.objects.filter(customer_id__in=batch).order_by().values_list('vehicle_id', flat=True).distinct()
+        )
+    customers = set()
+    for batch in _batched(targets):
+        customers.update(
+            Rental.objects.filter(
+                vehicle_id__in=batch, status__in=COUNTED_STATUSES
+            ).order_by().values_list('customer_id', flat=True).distinct()
+        )
+    return targets, customers
+
+
+def build_similarity(incremental=False, top_k=TOP_K, chunk_size=5000):
+    """
+    计算车辆相似度并写入 VehicleSimilarity
+    incremental=True 且表中已有数据时只重算上次计算之后受影响的车辆，否则全量重建
+    返回 {'mode', 'customers', 'vehicles', 'rows', 'elapsed'}
+    """
+    started = time.monotonic()
+    built_at = timezone.now()
+    since = VehicleSimilarity.objects.aggregate(last=Max('built_at'))['last'] if incremental else None
+
+    if since is None:
+        mode = 'full'
+        targets = None
+        baskets = customer_baskets(chunk_size=chunk_size)
+    else:
+        mode = 'incremental'
+        targets, customers = changed_targets(since)
+        if not targets:
+            return {'mode': mode, 'customers': 0, 'vehicles': 0, 'rows': 0, 'elapsed': time.monotonic() - started}
+        baskets = customer_baskets(customers, chunk_size=chunk_size)
+
+    co_counts, customer_count = count_cooccurrences(baskets, targets)
+    item_counts = vehicle_customer_counts()
+    rows = write_neighbors(top_neighbors(co_counts, item_counts, top_k), built_at, targets)
+    return {
+        'mode': mode,
+        'customers': customer_count,
+        'vehicles': len(co_counts) if targets is None else len(targets),
+        'rows': rows,
+        'elapsed': time.monotonic() - started,
+    }
+
+
+def similar_vehicle_ids(seed_vehicle_ids, exclude_ids=(), limit=6, available_only=True):
+    """
+    按种子车辆的邻居相似度之和排序，返回推荐车辆ID（一条聚合查询）
+    available_only=False 时不过滤车辆状态（用于缓存较长时间的候选列表，展示时再过滤）
+    """
+    if not seed_vehicle_ids:
+        return []
+    rows = VehicleSimilarity.objects.filter(vehicle_id__in=seed_vehicle_ids)
+    if available_only:
+        rows = rows.filter(neighbor__status='AVAILABLE')
+    return list(
+        rows.exclude(
+            neighbor_id__in=set(seed_vehicle_ids) | set(exclude_ids)
+        ).order_by().values('neighbor_id').annotate(
+            total_score=Sum('score')
+        ).order_by('-total_score', 'neighbor_id').values_list('neighbor_id', flat=True)[:limit]
+    )
@@ -1,3 +1,178 @@
+import math
+from datetime import date, timedelta
+from decimal import Decimal
+
 from django.test import TestCase
 
-# Create your tests here.
+from customers.models import Customer
+from rentals.models import Rental
+
+from .facets import compute_facets, filter_signature, price_filter
+from .models import Vehicle, VehicleSimilarity
+from .search import search_vehicles
+from .similarity import build_similarity, similar_vehicle_ids
+
+
+class VehicleSearchTests(TestCase):
+    """全文检索按词前缀匹配，型号另外保留包含匹配"""
+
+    def setUp(self):
+        self.x300 = Vehicle.objects.create(
+            license_plate='京G80001',
+            brand='宝马',
+            model='X300L',
+            vehicle_type='SUV',
+            color='白色',
+            daily_rate=Decimal('500.00'),
+        )
+        self.camry = Vehicle.objects.create(
+            license_plate='京G80002',
+            brand='丰田',
+            model='凯美瑞',
+            vehicle_type='SEDAN',
+            color='黑色',
+            daily_rate=Decimal('260.00'),
+        )
+
+    def search(self, query, **kwargs):
+        return set(search_vehicles(Vehicle.objects.all(), query, **kwargs))
+
+    def test_model_substring(self):
+        self.assertEqual(self.search('300'), {self.x300})
+
+    def test_prefix_and_pinyin(self):
+        self.assertEqual(self.search('宝马'), {self.x300})
+        self.assertEqual(self.search('toyota'), {self.camry})
+        self.assertEqual(self.search('80002'), {self.camry})
+
+    def test_substring_limited_to_requested_fields(self):
+        self.assertEqual(self.search('300', fields=('license_plate', 'brand')), set())
+
+
+class VehicleSimilarityTests(TestCase):
+    """共同租客的余弦相似度：全量计算的分数与排序，增量计算后受影响车辆的邻居与全量结果一致"""
+
+    def setUp(self):
+        self.vehicles = {
+            key: Vehicle.objects.create(
+                license_plate=f'京W0000{index}',
+                brand='吉利',
+                model=f'星瑞{key}',
+                vehicle_type='SEDAN',
+                color='白色',
+                daily_rate=Decimal('150.00'),
+            )
+            for index, key in enumerate('ABCD')
+        }
+        self.customers = [
+            Customer.objects.create(
+                name=f'相似客户{index}',
+                phone=f'1380013900{index}',
+                id_card=f'11010119900101{index:03d}X',
+                license_number=f'LICSIM{index}',
+            )
+            for index in range(4)
+        ]
+        self.offset = 0
+        for customer, keys in zip(self.customers, ['AB', 'AB', 'AC']):
+            self.rent(customer, keys)
+
+    def rent(self, customer, keys):
+        start = date.today() - timedelta(days=200)
+        for key in keys:
+            self.offset += 3
+            Rental.objects.create(
+                customer=customer,
+                vehicle=self.vehicles[key],
+                start_date=start + timedelta(days=self.offset),
+                end_date=start + timedelta(days=self.offset + 1),
+                total_amount=Decimal('300.00'),
+                status='COMPLETED',
+            )
+
+    def neighbors(self, key):
+        return [
+            (neighbor_id, round(score, 6), co_rentals)
+            for neighbor_id, score, co_rentals in VehicleSimilarity.objects.filter(
+                vehicle=self.vehicles[key]
+            ).order_by('-score', 'neighbor_id').values_list('neighbor_id', 'score', 'co_rentals')
+        ]
+
+    def test_full_build_scores(self):
+        build_similarity()
+        a, b, c = self.vehicles['A'], self.vehicles['B'], self.vehicles['C']
+        self.assertEqual(self.neighbors('A'), [
+            (b.pk, round(2 / math.sqrt(3 * 2), 6), 2),
+            (c.pk, round(1 / math.sqrt(3 * 1), 6), 1),
+        ])
+        self.assertEqual(self.neighbors('D'), [])
+        self.assertEqual(similar_vehicle_ids([a.pk]), [b.pk, c.pk])
+        self.assertEqual(similar_vehicle_ids([b.pk]), [a.pk])
+
+    def test_incremental_matches_full_for_changed_vehicles(self):
+        build_similarity()
+        self.rent(self.customers[3], 'CD')
+        result = build_similarity(incremental=True)
+        self.assertEqual(result['mode'], 'incremental')
+        incremental = {key: self.neighbors(key) for key in 'CD'}
+
+        build_similarity()
+        self.assertEqual(incremental, {key: self.neighbors(key) for key in 'CD'})
+        self.assertEqual(incremental['D'], [(self.vehicles['C'].pk, round(1 / math.sqrt(2), 6), 1)])
+
+
+class VehicleFacetTests(TestCase):
+    """一条分组查询得出的分面计数与逐项 COUNT 一致：每个分面套用其他分面的条件、不套用自身条件"""
+
+    def setUp(self):
+        for index, (brand, vehicle_type, seats, rate) in enumerate([
+            ('宝马', 'SUV', 5, '500.00'),
+            ('宝马', 'SEDAN', 5, '300.00'),
+            ('丰田', 'SEDAN', 7, '150.00'),
+            ('丰田', 'SUV', 5, '800.00'),
+            ('奥迪', 'SEDAN', 5, '350.00'),
+        ]):
+            Vehicle.objects.create(
+                license_plate=f'京Y0000{index}',
+                brand=brand,
+                model='测试',
+                vehicle_type=vehicle_type,
+                seats=seats,
+                color='白色',
+                daily_rate=Decimal(rate),
+            )
+
+    def options(self, facet):
+        return {option['value']: option['count'] for option in facet if option['count']}
+
+    def test_counts_match_per_option_queries(self):
+        price = price_filter(price_range='200-400')
+        with self.assertNumQueries(1):
+            facets = compute_facets(Vehicle.objects.all(), brand='宝马', seats=5, price=price, price_range='200-400')
+
+        base = Vehicle.objects.all()
+        self.assertEqual(self.options(facets['brands']), {
+            brand: base.filter(price, brand=brand, seats=5).count()
+            for brand in ('宝马', '奥迪')
+        })
+        self.assertEqual(self.options(facets['types']), {'SEDAN': 1})
+        self.assertEqual(self.options(facets['seats']), {5: 1})
+        self.assertEqual(
+            {bucket['value']: bucket['count'] for bucket in facets['price_buckets']},
+            {'-200': 0, '200-400': 1, '400-700': 1, '700-': 0},
+        )
+        self.assertEqual(facets['total'], base.filter(price, brand='宝马', seats=5).count())
+
+    def test_selected_option_kept_with_zero_count(self):
+        facets = compute_facets(Vehicle.objects.all(), brand='宝马', vehicle_type='MPV')
+        self.assertIn({'value': 'MPV', 'count': 0, 'selected': True}, facets['types'])
+        self.assertEqual(facets['total'], 0)
+
+    def test_signature_normalized(self):
+        self.assertEqual(
+            filter_signature('home', {'q': '  宝马  X5 ', 'brand': '', 'seats': 5}),
+            filter_signature('home', {'seats': '5', 'q': '宝马 x5'}),
+        )
+        self.assertNotEqual(
+            filter_signature('home', {'q': '宝马'}), filter_signature('vehicle_list', {'q': '宝马'})
+        )
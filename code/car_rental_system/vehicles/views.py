@@ -1,38 +1,31 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.http import HttpResponse, HttpResponseBadRequest
 from django.core.paginator import Paginator
-from django.db.models import Q, Count
+from django.db.models import Q
 from django.contrib import messages
 from django.views.decorators.http import require_http_methods
 from django.utils.decorators import method_decorator
 from django.views.generic import ListView
+from car_rental_system.dashboard import get_snapshot
 from .models import Vehicle
+from .facets import get_facets, parse_seats, price_filter
+from .search import search_vehicles
 from .forms import VehicleForm
 
 
 def index(request):
     """车辆管理首页 - 优化版本"""
-    # 使用单个聚合查询优化统计信息
-    vehicle_counts = Vehicle.objects.aggregate(
-        total=Count('id'),
-        available=Count('id', filter=Q(status='AVAILABLE')),
-        rented=Count('id', filter=Q(status='RENTED')),
-        maintenance=Count('id', filter=Q(status='MAINTENANCE')),
-    )
-    
-    total_vehicles = vehicle_counts['total'] or 0
-    available_vehicles = vehicle_counts['available'] or 0
-    rented_vehicles = vehicle_counts['rented'] or 0
-    maintenance_vehicles = vehicle_counts['maintenance'] or 0
+    # 统计信息读取仪表板统计快照（见 car_rental_system/dashboard.py）
+    vehicle_stats = get_snapshot().vehicle_stats
     
     # 获取最近添加的车辆
     recent_vehicles = Vehicle.objects.all()[:5]
     
     context = {
-        'total_vehicles': total_vehicles,
-        'available_vehicles': available_vehicles,
-        'rented_vehicles': rented_vehicles,
-        'maintenance_vehicles': maintenance_vehicles,
+        'total_vehicles': vehicle_stats['total'],
+        'available_vehicles': vehicle_stats['available'],
+        'rented_vehicles': vehicle_stats['rented'],
+        'maintenance_vehicles': vehicle_stats['maintenance'],
         'recent_vehicles': recent_vehicles,
     }
     
@@ -54,16 +47,25 @@ def vehicle_list(request):
         'color', 'seats', 'daily_rate', 'status', 'created_at'
     )
     
-    # 获取座位数筛选参数
+    # 获取座位数、租金区间筛选参数
     seats_filter = request.GET.get('seats', '')
+    price_range = request.GET.get('price_range', '')
+    seats = parse_seats(seats_filter)
+    price_condition = price_filter(price_range=price_range)
     
     # 搜索功能
     if query:
-        vehicles = vehicles.filter(
-            Q(license_plate__icontains=query) |
-            Q(brand__icontains=query) |
-            Q(model__icontains=query)
-        )
+        # 全文索引检索（车牌前缀/尾号、中文品牌任意片段、品牌拼音），其他筛选条件叠加在结果上
+        vehicles = search_vehicles(vehicles, query, fields=('license_plate', 'brand', 'model'))
+    
+    if status_filter:
+        vehicles = vehicles.filter(status=status_filter)
+    
+    # 筛选项计数：在品牌/车型/座位数/租金筛选前的查询集上一条分组查询得出，按筛选条件缓存
+    facets = get_facets('vehicle_list', vehicles, {
+        'q': query, 'status': status_filter, 'brand': brand_filter, 'type': type_filter,
+        'seats': seats, 'price_range': price_range,
+    }, brand=brand_filter, vehicle_type=type_filter, seats=seats, price=price_condition, price_range=price_range)
     
     # 筛选功能
     if brand_filter:
@@ -72,64 +74,26 @@ def vehicle_list(request):
     if type_filter:
         vehicles = vehicles.filter(vehicle_type=type_filter)
     
-    if status_filter:
-        vehicles = vehicles.filter(status=status_filter)
+    if seats is not None:
+        vehicles = vehicles.filter(seats=seats)
     
-    # 座位数筛选（只有在字段存在时才执行）
-    if seats_filter:
-        try:
-            seats = int(seats_filter)
-            # 尝试使用seats字段筛选，如果字段不存在会抛出异常
-            vehicles = vehicles.filter(seats=seats)
-        except (ValueError, Exception):
-            # 如果转换失败或字段不存在，忽略筛选
-            pass
-    
-    # 优化：只在需要时获取筛选选项（延迟加载）
-    # 使用缓存或只在首次加载时获取
-    from django.core.cache import cache
-    cache_key_brands = 'vehicle_brands_list'
-    cache_key_types = 'vehicle_types_list'
-    
-    brands = cache.get(cache_key_brands)
-    if brands is None:
-        brands = list(Vehicle.objects.values_list('brand', flat=True).distinct().order_by('brand'))
-        cache.set(cache_key_brands, brands, 300)  # 缓存5分钟
-    
-    types = cache.get(cache_key_types)
-    if types is None:
-        types = list(Vehicle.objects.values_list('vehicle_type', flat=True).distinct().order_by('vehicle_type'))
-        cache.set(cache_key_types, types, 300)  # 缓存5分钟
+    if price_condition is not None:
+        vehicles = vehicles.filter(price_condition)
     
     # 分页 - 每页10条，先排序再分页
     vehicles = vehicles.order_by('-created_at')
     paginator = Paginator(vehicles, 10)
     vehicles_page = paginator.get_page(page)
     
-    # 获取座位数选项（使用缓存）
-    cache_key_seats = 'vehicle_seats_list'
-    seats_options = cache.get(cache_key_seats)
-    if seats_options is None:
-        try:
-            # 检查字段是否存在（如果迁移未应用，会抛出异常）
-            seats_values = list(Vehicle.objects.values_list('seats', flat=True))
-            seats_options = sorted({seat for seat in seats_values if seat})
-            cache.set(cache_key_seats, seats_options, 300)  # 缓存5分钟
-        except Exception:
-            # 如果字段不存在（迁移未应用），使用空列表
-            seats_options = []
-            cache.set(cache_key_seats, seats_options, 300)
-    
     context = {
         'vehicles': vehicles_page,
-        'brands': brands,
-        'types': types,
-        'seats_options': seats_options,
+        'facets': facets,
         'query': query,
         'brand_filter': brand_filter,
         'type_filter': type_filter,
         'status_filter': status_filter,
         'seats_filter': seats_filter,
+        'price_range': price_range,
     }
     
     return render(request, 'vehicles/vehicle_list.html', context)
@@ -202,11 +166,6 @@ def vehicle_create(request):
         form = VehicleForm(request.POST)
         if form.is_valid():
             vehicle = form.save()
-            # 清除相关缓存
-            from django.core.cache import cache
-            cache.delete('vehicle_brands_list')
-            cache.delete('vehicle_types_list')
-            cache.delete('rental_filter_vehicles')
             
             messages.success(request, f'车辆 {vehicle.license_plate} 添加成功！')
             return redirect('vehicles:vehicle_detail', pk=vehicle.pk)
@@ -231,11 +190,6 @@ def vehicle_update(request, pk):
         form = VehicleForm(request.POST, instance=vehicle)
         if form.is_valid():
             vehicle = form.save()
-            # 清除相关缓存
-            from django.core.cache import cache
-            cache.delete('vehicle_brands_list')
-            cache.delete('vehicle_types_list')
-            cache.delete('rental_filter_vehicles')
             
             messages.success(request, f'车辆 {vehicle.license_plate} 更新成功！')
             return redirect('vehicles:vehicle_detail', pk=vehicle.pk)
@@ -269,12 +223,6 @@ def vehicle_delete(request, pk):
         license_plate = vehicle.license_plate
         vehicle.delete()
         
-        # 清除相关缓存
-        from django.core.cache import cache
-        cache.delete('vehicle_brands_list')
-        cache.delete('vehicle_types_list')
-        cache.delete('rental_filter_vehicles')
-        
         messages.success(request, f'车辆 {license_plate} 删除成功！')
         return redirect('vehicles:vehicle_list')
     
@@ -5,15 +5,19 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Count, Sum, Q, Avg
-from django.utils import timezone
-from datetime import date, timedelta
-from decimal import Decimal
+from django.core.cache import cache
+from django.db.models import Q
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, quote_etag
+import hashlib
 import json
 
+from car_rental_system.cache_tags import TAG_RENTAL, TAG_VEHICLE, tagged_key
+from car_rental_system.dashboard import get_snapshot
 from vehicles.models import Vehicle
-from customers.models import Customer
+from rentals.metrics import MetricsQueryError, parse_query, time_series
 from rentals.models import Rental
+from rentals.popularity import top as popularity_top
 from accounts.models import Review
 
 
@@ -49,47 +53,8 @@ def dashboard(request):
         messages.error(request, '访问被拒绝：您没有管理员权限。')
         return redirect('accounts:home')  # 普通用户跳转到用户主页
     
-    # 获取统计数据
-    today = date.today()
-    
-    # 车辆统计
-    total_vehicles = Vehicle.objects.count()
-    available_vehicles = Vehicle.objects.filter(status='AVAILABLE').count()
-    rented_vehicles = Vehicle.objects.filter(status='RENTED').count()
-    maintenance_vehicles = Vehicle.objects.filter(status='MAINTENANCE').count()
-    
-    # 客户统计
-    total_customers = Customer.objects.count()
-    vip_customers = Customer.objects.filter(member_level='VIP').count()
-    regular_customers = total_customers - vip_customers
-    
-    # 订单统计
-    total_rentals = Rental.objects.count()
-    ongoing_rentals = Rental.objects.filter(status='ONGOING').count()
-    pending_rentals = Rental.objects.filter(status='PENDING').count()
-    overdue_rentals = Rental.objects.filter(status='OVERDUE').count()
-    completed_rentals = Rental.objects.filter(status='COMPLETED').count()
-    active_rentals = ongoing_rentals + pending_rentals
-    
-    # 财务统计（本月、今日、总收入）
-    month_start = today.replace(day=1)
-    month_revenue = Rental.objects.filter(
-        created_at__gte=month_start,
-        status='COMPLETED'
-    ).aggregate(total=Sum('total_amount'))['total'] or Decimal('0.00')
-    
-    today_revenue = Rental.objects.filter(
-        created_at__date=today,
-        status='COMPLETED'
-    ).aggregate(total=Sum('total_amount'))['total'] or Decimal('0.00')
-    
-    total_revenue = Rental.objects.filter(
-        status='COMPLETED'
-    ).aggregate(total=Sum('total_amount'))['total'] or Decimal('0.00')
-    
-    # 本周新增订单
-    week_start = today - timedelta(days=today.weekday())
-    week_new_rentals = Rental.objects.filter(created_at__gte=week_start).count()
+    # 统计数据：读取缓存的统计快照，过期时返回旧快照并在后台刷新（见 car_rental_system/dashboard.py）
+    snapshot = get_snapshot()
     
     # 最近活动（最近5条订单）
     recent_rentals = Rental.objects.select_related(
@@ -99,72 +64,88 @@ def dashboard(request):
     # 车辆状态列表
     vehicle_status = Vehicle.objects.all()[:10]
     
-    # 近6个月收入趋势（用于图表）
-    monthly_revenue_data = []
-    monthly_labels = []
-    for i in range(5, -1, -1):
-        month_date = today - timedelta(days=i*30)
-        month_start_calc = month_date.replace(day=1)
-        if i == 0:
-            month_end = today
-        else:
-            next_month = month_start_calc.replace(day=28) + timedelta(days=4)
-            month_end = next_month - timedelta(days=next_month.day)
-        
-        month_total = Rental.objects.filter(
-            created_at__gte=month_start_calc,
-            created_at__lte=month_end,
-            status='COMPLETED'
-        ).aggregate(total=Sum('total_amount'))['total'] or Decimal('0.00')
-        
-        monthly_revenue_data.append(float(month_total))
-        monthly_labels.append(month_start_calc.strftime('%Y-%m'))
+    # 热度排行（时间衰减热度，按索引只读取前5名）
+    popular_vehicle_rows = popularity_top('VEHICLE', 5)
+    popular_vehicle_map = Vehicle.objects.only('id', 'license_plate', 'brand', 'model').in_bulk(
+        [int(key) for key, _, _ in popular_vehicle_rows]
+    )
+    popular_vehicles = [
+        {'vehicle': popular_vehicle_map[int(key)], 'score': score, 'rental_count': rental_count}
+        for key, score, rental_count in popular_vehicle_rows if int(key) in popular_vehicle_map
+    ]
+    popular_types = [
+        {'name': key, 'score': score, 'rental_count': rental_count}
+        for key, score, rental_count in popularity_top('VEHICLE_TYPE', 5)
+    ]
+    popular_stores = [
+        {'name': key, 'score': score, 'rental_count': rental_count}
+        for key, score, rental_count in popularity_top('STORE', 5)
+    ]
     
     context = {
-        # 车辆统计（匹配模板格式）
-        'vehicle_stats': {
-            'total': total_vehicles,
-            'available': available_vehicles,
-            'rented': rented_vehicles,
-            'maintenance': maintenance_vehicles,
-        },
-        
-        # 客户统计（匹配模板格式）
-        'customer_stats': {
-            'total': total_customers,
-            'vip': vip_customers,
-            'regular': regular_customers,
-        },
-        
-        # 订单统计（匹配模板格式）
-        'rental_stats': {
-            'total': total_rentals,
-            'active': active_rentals,
-            'ongoing': ongoing_rentals,
-            'pending': pending_rentals,
-            'completed': completed_rentals,
-            'overdue': overdue_rentals,
-        },
-        
-        # 财务统计（匹配模板格式）
-        'revenue_stats': {
-            'total': total_revenue,
-            'monthly': month_revenue,
-            'today': today_revenue,
-        },
+        # 车辆、客户、订单、财务统计（匹配模板格式）
+        'vehicle_stats': snapshot.vehicle_stats,
+        'customer_stats': snapshot.customer_stats,
+        'rental_stats': snapshot.rental_stats,
+        'revenue_stats': snapshot.revenue_stats,
+        'snapshot_built_at': snapshot.built_at,
         
         # 活动数据
         'recent_rentals': recent_rentals,
         'vehicle_status': vehicle_status,
         
+        # 热度排行
+        'popular_vehicles': popular_vehicles,
+        'popular_types': popular_types,
+        'popular_stores': popular_stores,
+        
         # 图表数据
-        'monthly_revenue_data': json.dumps(monthly_revenue_data),
-        'monthly_labels': json.dumps(monthly_labels),
+        'monthly_revenue_data': json.dumps(snapshot.monthly_revenue_data),
+        'monthly_labels': json.dumps(snapshot.monthly_labels),
     }
     
     return render(request, 'dashboard.html', context)
 
 
+# 指标接口结果的缓存时间（秒）和浏览器可直接复用的时间（秒）
+METRICS_CACHE_TIMEOUT = 600
+METRICS_MAX_AGE = 60
+
+
+def metrics_api(request):
+    """
+    经营指标时间序列接口（管理员）
+    参数：series=revenue（指标）、grain=day|week|month、from=YYYY-MM-DD、to=YYYY-MM-DD、group_by=store|type|brand（可选）
+    按自然日/周/月分桶（见 rentals/metrics.py）；响应带 ETag，由查询参数和订单/车辆数据的缓存标签版本号生成，
+    数据未变化时直接返回 304。
+    """
+    if not request.user.is_authenticated or not request.user.is_staff:
+        return JsonResponse({'error': '没有管理员权限'}, status=403)
+    try:
+        series, grain, start, end, group_by = parse_query(request.GET)
+    except MetricsQueryError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    # 汇总和订单数据变化时递增 rental 标签；按品牌分组还依赖车辆的品牌
+    tags = [TAG_RENTAL, TAG_VEHICLE] if group_by == 'brand' else [TAG_RENTAL]
+    cache_key = tagged_key(f'metrics:{series}:{grain}:{start}:{end}:{group_by or ""}', tags)
+    etag = quote_etag(hashlib.md5(cache_key.encode()).hexdigest())
+    
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+    
+    data = cache.get(cache_key)
+    if data is None:
+        data = time_series(series, grain, start, end, group_by)
+        cache.set(cache_key, data, METRICS_CACHE_TIMEOUT)
+    
+    response = JsonResponse(data)
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, max_age=METRICS_MAX_AGE)
+    return response
+
+
 # 错误处理视图
 def page_not_found(request, exception):
     """404 错误页面"""